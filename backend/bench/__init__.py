@@ -0,0 +1 @@
+# Benchmark harness (load test + microbenchmarks)
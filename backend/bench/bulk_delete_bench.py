@@ -0,0 +1,169 @@
+"""
+Xoá nhiều bài: từng request DELETE /api/track/{id} so với một DELETE /api/tracks.
+
+Khởi động app với stand-ins (như loadtest), seed `--songs` bài cho mỗi cách (audio, lrc và
+`--hls-segments` file HLS mỗi bài), rồi xoá hết bằng hai cách. Mỗi lần xoá blob trên GCS stand-in
+chờ `--latency` giây và lỗi với xác suất `--error-rate`: blob lỗi phải nằm trong hàng đợi thử lại.
+
+Đo tổng thời gian, số bài / giây. Kiểm tra: không còn document nào, mọi blob đã xoá hoặc đang chờ
+thử lại, và một lượt retry_due (GCS hết lỗi) xoá nốt các blob đó; sai thì exit code 1.
+
+Usage:
+    uv run python -m backend.bench.bulk_delete_bench
+    uv run python -m backend.bench.bulk_delete_bench --songs 300 --latency 0.03 --error-rate 0.05 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import httpx
+
+from backend.bench.loadtest import BackgroundServer, find_free_port
+from backend.bench.standins import FaultInjector, LocalStorage, install_faults, install_standins, seed_catalog
+
+
+def seed(storage, count, segments, prefix):
+    """seed_catalog + gói HLS giả (`segments` blob) cho mỗi bài. Returns {song id: [blob, ...]}."""
+    from backend.utils.blob_cleanup import song_blobs
+    from backend.utils.gcs import GCS_BUCKET_NAME
+    from backend.utils.mongodb import get_song_by_id, update_song_metadata
+
+    songs = {}
+    for song_id in seed_catalog(storage, song_count=count, audio_bytes=16 * 1024):
+        hls_blobs = [f"hls/{prefix}-{song_id}/seg{i:03d}.ts" for i in range(segments)]
+        for blob in hls_blobs:
+            storage.upload_bytes(GCS_BUCKET_NAME, b"\0" * 1024, blob)
+        update_song_metadata(song_id, {"hls": {"blobs": hls_blobs, "duration": 10.0 * segments}})
+        songs[song_id] = song_blobs(get_song_by_id(song_id))
+    return songs
+
+
+async def delete_one_by_one(client, song_ids):
+    started = time.perf_counter()
+    statuses = [(await client.delete(f"/api/track/{song_id}")).status_code for song_id in song_ids]
+    return {"seconds": time.perf_counter() - started, "requests": len(song_ids),
+            "ok": all(status == 200 for status in statuses)}
+
+
+async def delete_bulk(client, song_ids, batch_size):
+    started = time.perf_counter()
+    ok, requests, queued = True, 0, 0
+    for i in range(0, len(song_ids), batch_size):
+        response = await client.request("DELETE", "/api/tracks", json={"ids": song_ids[i:i + batch_size]})
+        requests += 1
+        ok = ok and response.status_code == 200 and response.json()["deleted"] == len(song_ids[i:i + batch_size])
+        if response.status_code == 200:
+            queued += response.json()["queued_blobs"]
+    return {"seconds": time.perf_counter() - started, "requests": requests, "ok": ok, "queued_blobs": queued}
+
+
+def leftovers(storage, songs):
+    """(số document còn lại, blob còn trên storage nhưng không có trong hàng đợi, blob còn trên storage)."""
+    from backend.utils.gcs import GCS_BUCKET_NAME
+    from backend.utils.mongodb import get_pending_blob_deletes, get_songs_by_ids
+
+    queued = {entry["blob"] for entry in get_pending_blob_deletes()}
+    remaining = [blob for blobs in songs.values() for blob in blobs
+                 if os.path.exists(storage._path(GCS_BUCKET_NAME, blob))]
+    return len(get_songs_by_ids(list(songs))), [blob for blob in remaining if blob not in queued], remaining
+
+
+async def run_client(base_url, storage, batches, args):
+    faults = FaultInjector(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+        for name, songs in batches.items():
+            install_faults(storage, gcs=faults)
+            errors_before = faults.errors
+            try:
+                if name == "one_by_one":
+                    result = await delete_one_by_one(client, list(songs))
+                else:
+                    result = await delete_bulk(client, list(songs), args.batch_size)
+            finally:
+                install_faults(storage)
+            result["blob_errors"] = faults.errors - errors_before
+            results[name] = result
+    return results
+
+
+def run(args):
+    os.environ.setdefault("RATE_LIMITS", "false")
+    os.environ.setdefault("LIVE_UPDATES", "false")
+    os.environ.setdefault("BLOB_DELETE_RETRY", "false")   # retry_due được gọi tay sau khi xoá
+    os.environ.setdefault("BLOB_DELETE_RETRY_BASE", "0")
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    main, storage = install_standins(LocalStorage(base_url=base_url))
+    from backend.utils.blob_cleanup import retry_due
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        batches = {
+            "one_by_one": seed(storage, args.songs, args.hls_segments, "seq"),
+            "bulk": seed(storage, args.songs, args.hls_segments, "bulk"),
+        }
+        with BackgroundServer(main.app, port):
+            results = asyncio.run(run_client(base_url, storage, batches, args))
+        checks = {name: leftovers(storage, songs) for name, songs in batches.items()}
+        retried, still_failing = retry_due(limit=0)
+        after_retry = {name: leftovers(storage, songs) for name, songs in batches.items()}
+
+    report = {"songs": args.songs, "blobs_per_song": 2 + args.hls_segments, "results": {}}
+    for name, result in results.items():
+        documents, lost, _ = checks[name]
+        result["seconds"] = round(result["seconds"], 2)
+        result["songs_per_second"] = round(args.songs / result["seconds"], 1) if result["seconds"] else None
+        result["documents_left"] = documents
+        result["unqueued_blobs_left"] = len(lost)
+        result["blobs_left_after_retry"] = len(after_retry[name][2])
+        result["verified"] = (result["ok"] and documents == 0 and not lost and not after_retry[name][2])
+        report["results"][name] = result
+    report["retry"] = {"deleted": retried, "still_failing": still_failing}
+    report["config"] = {
+        "latency_s": args.latency,
+        "error_rate": args.error_rate,
+        "batch_size": args.batch_size,
+        "delete_concurrency": int(os.getenv("GCS_DELETE_CONCURRENCY", "10")),
+    }
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-track deletes vs DELETE /api/tracks with slow, flaky storage")
+    parser.add_argument("--songs", type=int, default=100)
+    parser.add_argument("--hls-segments", type=int, default=8, help="HLS blobs per song (plus audio and lrc)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per blob delete")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Chance a blob delete fails")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("MAX_BULK_DELETE", "500")))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['songs']} songs x {report['blobs_per_song']} blobs, "
+              f"{args.latency * 1000:.0f} ms / {args.error_rate:.0%} errors per blob delete")
+        for name, r in report["results"].items():
+            print(f"{name:>10}: {r['seconds']}s ({r['songs_per_second']} songs/s, {r['requests']} requests), "
+                  f"{r['blob_errors']} blob errors, verified={r['verified']}")
+        print(f"     retry: {report['retry']['deleted']} queued blob(s) deleted, "
+              f"{report['retry']['still_failing']} still failing")
+    sys.exit(0 if all(r["verified"] for r in report["results"].values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Kiểm tra cache nhiều process (giống uvicorn --workers N).
+
+N reader processes đọc qua TieredCache (L1 + SQLite shared tier), một writer
+process tăng version trong "database" (file SQLite riêng) rồi invalidate tag.
+Một read bắt đầu sau khi invalidation đã xong mà vẫn thấy version cũ => stale.
+
+Usage:
+    uv run python -m backend.bench.cache_consistency --workers 4 --duration 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from backend.utils.cache import SQLiteSharedStore, TieredCache
+
+
+def _truth(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def _read_truth(conn, key):
+    row = conn.execute("SELECT version FROM kv WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def reader(cache_dir, truth_path, keys, duration, seed, results):
+    cache = TieredCache(shared=SQLiteSharedStore(cache_dir))
+    conn = _truth(truth_path)
+    rng = random.Random(seed)
+    reads = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        key = rng.choice(keys)
+        started = time.monotonic()
+        value = cache.get_or_set(f"value:{key}", lambda: _read_truth(conn, key), ttl=60, tags=[f"key:{key}"])
+        reads.append((started, key, value))
+    results.put({"reads": reads, "stats": cache.stats()})
+
+
+def writer(cache_dir, truth_path, keys, duration, interval, seed, results):
+    cache = TieredCache(shared=SQLiteSharedStore(cache_dir))
+    conn = _truth(truth_path)
+    rng = random.Random(seed)
+    writes = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        key = rng.choice(keys)
+        conn.execute("UPDATE kv SET version = version + 1 WHERE key = ?", (key,))
+        version = _read_truth(conn, key)
+        cache.invalidate(f"key:{key}")
+        writes.append((time.monotonic(), key, version))
+        time.sleep(interval)
+    results.put({"writes": writes})
+
+
+def check(reads, writes):
+    """Count reads that returned a version older than one already invalidated."""
+    by_key = {}
+    for done, key, version in writes:
+        by_key.setdefault(key, []).append((done, version))
+    stale = 0
+    for started, key, value in reads:
+        committed = [v for done, v in by_key.get(key, ()) if done < started]
+        if committed and value < max(committed):
+            stale += 1
+    return stale
+
+
+def run(workers=4, duration=5.0, key_count=50, write_interval=0.01, seed=0):
+    cache_dir = tempfile.mkdtemp(prefix="tunify-cache-check-")
+    truth_path = f"{cache_dir}/truth.sqlite3"
+    keys = [f"k{i}" for i in range(key_count)]
+    conn = _truth(truth_path)
+    conn.execute("CREATE TABLE kv (key TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO kv VALUES (?, 0)", [(k,) for k in keys])
+    conn.close()
+    SQLiteSharedStore(cache_dir)  # tạo schema trước khi các process chạy song song
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=reader, args=(cache_dir, truth_path, keys, duration, seed + i, results))
+        for i in range(workers)
+    ]
+    processes.append(ctx.Process(target=writer, args=(cache_dir, truth_path, keys, duration, write_interval, seed, results)))
+    for p in processes:
+        p.start()
+    outputs = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+
+    writes = next(o["writes"] for o in outputs if "writes" in o)
+    readers = [o for o in outputs if "reads" in o]
+    all_reads = [r for o in readers for r in o["reads"]]
+    total_l1_hits = sum(o["stats"]["l1_hits"] for o in readers)
+    total_shared_hits = sum(o["stats"]["shared_hits"] for o in readers)
+    return {
+        "workers": workers,
+        "duration_s": duration,
+        "keys": key_count,
+        "reads": len(all_reads),
+        "writes": len(writes),
+        "stale_reads": check(all_reads, writes),
+        "l1_hit_ratio": round(total_l1_hits / len(all_reads), 4) if all_reads else None,
+        "shared_hit_ratio": round(total_shared_hits / len(all_reads), 4) if all_reads else None,
+        "overall_hit_ratio": round((total_l1_hits + total_shared_hits) / len(all_reads), 4) if all_reads else None,
+        "per_worker": [o["stats"] for o in readers],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process cache consistency and hit-ratio check")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--keys", type=int, default=50)
+    parser.add_argument("--write-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    report = run(args.workers, args.duration, args.keys, args.write_interval)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["stale_reads"] else 0)
+
+
+if __name__ == "__main__":
+    main()
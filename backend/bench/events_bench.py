@@ -0,0 +1,206 @@
+"""
+Ingestion play / skip / seek qua POST /api/events (backend/utils/play_events.py).
+
+Khởi động app với stand-ins (như loadtest), `--clients` client gửi liên tục các lô `--batch` event
+ngẫu nhiên trong `--duration` giây. MongoDB stand-in chậm `--mongo-latency` giây mỗi lệnh (như
+Atlas), buffer flush mỗi `--flush-interval` giây. Đo event / giây mà một worker nhận, latency của
+request và số lệnh ghi MongoDB so với số event.
+
+Sau đó là pha sự cố: MongoDB lỗi hoàn toàn, client gửi tiếp cho tới khi buffer đầy và server trả 503,
+rồi MongoDB hồi phục. Kiểm tra sau khi tắt server (lifespan flush lần cuối): tổng bộ đếm trong
+play_stats bằng đúng số event đã được nhận (202), không event nào mất hay bị đếm hai lần; sai thì
+exit code 1. Client chạy cùng process (và GIL) với server, nên số event / giây là cận dưới.
+
+Usage:
+    uv run python -m backend.bench.events_bench
+    uv run python -m backend.bench.events_bench --clients 16 --batch 100 --duration 10 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import httpx
+
+from backend.bench.loadtest import BackgroundServer, find_free_port, percentile
+from backend.bench.standins import FaultInjector, LocalStorage, install_faults, install_standins, mongo_timeout, seed_catalog
+
+EVENT_WEIGHTS = {"play": 5, "skip": 3, "seek": 2}
+
+
+def make_batch(rng, song_ids, size):
+    kinds = rng.choices(list(EVENT_WEIGHTS), list(EVENT_WEIGHTS.values()), k=size)
+    return [{"type": kind, "song_id": rng.choice(song_ids), "position": round(rng.uniform(0, 240), 1)}
+            for kind in kinds]
+
+
+async def post_until(client, song_ids, batch_size, deadline, seed, stop_on_reject=False):
+    """Gửi lô liên tục tới deadline. Returns (số event được nhận, số lô bị từ chối, latency ms các request)."""
+    rng = random.Random(seed)
+    accepted, rejected, latencies = 0, 0, []
+    while time.perf_counter() < deadline:
+        batch = make_batch(rng, song_ids, batch_size)
+        started = time.perf_counter()
+        response = await client.post("/api/events", json={"events": batch})
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code == 202:
+            accepted += response.json()["accepted"]
+        elif response.status_code == 503:
+            rejected += 1
+            if stop_on_reject:
+                break
+            await asyncio.sleep(0.05)
+        else:
+            raise RuntimeError(f"POST /api/events: HTTP {response.status_code} {response.text}")
+    return accepted, rejected, latencies
+
+
+async def run_client(base_url, storage, song_ids, args):
+    from backend.core import main
+    from backend.utils.mongodb import breaker
+
+    # Breaker mở trong pha sự cố: cho half-open sau một khoảng flush thay vì 30s
+    breaker.reset()
+    breaker.reset_timeout = args.flush_interval
+
+    limits = httpx.Limits(max_connections=args.clients * 2, max_keepalive_connections=args.clients * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        # Pha tải: MongoDB chậm nhưng chạy
+        install_faults(storage, mongodb=FaultInjector(latency=args.mongo_latency))
+        started = time.perf_counter()
+        deadline = started + args.duration
+        results = await asyncio.gather(*(
+            post_until(client, song_ids, args.batch, deadline, args.seed + i) for i in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - started
+        load_stats = main.play_events.stats()
+
+        # Pha sự cố: MongoDB lỗi, gửi tới khi buffer đầy (503)
+        install_faults(storage, mongodb=FaultInjector(error_rate=1.0, error=mongo_timeout))
+        outage = await post_until(client, song_ids, args.batch, time.perf_counter() + 60, args.seed + args.clients,
+                                  stop_on_reject=True)
+        install_faults(storage)
+        # MongoDB hồi phục: buffer flush, request lại được nhận
+        recovery = await post_until(client, song_ids, args.batch, time.perf_counter() + 2 * args.flush_interval + 1,
+                                    args.seed + args.clients + 1)
+
+    latencies = sorted(ms for _, _, samples in results for ms in samples)
+    return {
+        "seconds": elapsed,
+        "accepted": sum(accepted for accepted, _, _ in results),
+        "rejected_batches": sum(rejected for _, rejected, _ in results),
+        "requests": len(latencies),
+        "latency_ms": {"p50": round(percentile(latencies, 50), 3), "p95": round(percentile(latencies, 95), 3),
+                       "p99": round(percentile(latencies, 99), 3)},
+        "buffer": load_stats,
+        "outage": {"accepted": outage[0], "rejected_batches": outage[1]},
+        "recovery": {"accepted": recovery[0], "rejected_batches": recovery[1]},
+    }
+
+
+def recorded_events():
+    from backend.utils.mongodb import PLAY_STATS_COLLECTION_NAME, get_collection
+
+    return sum(doc.get("plays", 0) + doc.get("skips", 0) + doc.get("seeks", 0)
+               for doc in get_collection(PLAY_STATS_COLLECTION_NAME).find({}))
+
+
+def run(args):
+    os.environ.setdefault("RATE_LIMITS", "false")
+    os.environ.setdefault("LIVE_UPDATES", "false")
+    os.environ.setdefault("BLOB_DELETE_RETRY", "false")
+    os.environ.setdefault("URL_SWEEPER", "false")
+    os.environ["PLAY_EVENTS_FLUSH_INTERVAL"] = str(args.flush_interval)
+    os.environ["PLAY_EVENTS_QUEUE_SIZE"] = str(args.queue_size)
+    os.environ["MAX_EVENTS_PER_BATCH"] = str(max(args.batch, 500))
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    main, storage = install_standins(LocalStorage(base_url=base_url))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        song_ids = seed_catalog(storage, song_count=args.songs, audio_bytes=1024)
+        with BackgroundServer(main.app, port):
+            result = asyncio.run(run_client(base_url, storage, song_ids, args))
+        final = main.play_events.stats()
+        recorded = recorded_events()
+
+    accepted = result["accepted"] + result["outage"]["accepted"] + result["recovery"]["accepted"]
+    buffer = result["buffer"]
+    report = {
+        "load": {
+            "clients": args.clients,
+            "batch": args.batch,
+            "seconds": round(result["seconds"], 2),
+            "events": result["accepted"],
+            "events_per_second": round(result["accepted"] / result["seconds"], 1),
+            "requests": result["requests"],
+            "rejected_batches": result["rejected_batches"],
+            "latency_ms": result["latency_ms"],
+            "flushes": buffer["flushes"],
+            "mongo_writes": buffer["writes"],
+            "events_per_write": round(buffer["flushed"] / buffer["writes"], 1) if buffer["writes"] else None,
+            "last_flush_ms": buffer["last_flush_ms"],
+        },
+        "outage": {**result["outage"], "recovery": result["recovery"]},
+        "verification": {
+            "accepted": accepted,
+            "recorded": recorded,
+            "pending_after_shutdown": final["pending"],
+            "backpressure": result["outage"]["rejected_batches"] > 0 and result["recovery"]["accepted"] > 0,
+        },
+        "config": {
+            "songs": args.songs,
+            "mongo_latency_s": args.mongo_latency,
+            "flush_interval_s": args.flush_interval,
+            "queue_size": args.queue_size,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+    }
+    check = report["verification"]
+    check["ok"] = check["recorded"] == accepted and check["pending_after_shutdown"] == 0 and check["backpressure"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched play-event ingestion: throughput, backpressure, no lost events")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=50, help="Events per request")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--songs", type=int, default=200)
+    parser.add_argument("--mongo-latency", type=float, default=0.05, help="Seconds per MongoDB call")
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--queue-size", type=int, default=20_000, help="PLAY_EVENTS_QUEUE_SIZE")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        load, outage, check = report["load"], report["outage"], report["verification"]
+        print(f"load: {load['events']} events in {load['seconds']}s = {load['events_per_second']} events/s "
+              f"({load['clients']} clients x {load['batch']} events/request), "
+              f"request p50 {load['latency_ms']['p50']} ms / p95 {load['latency_ms']['p95']} ms")
+        print(f"mongo: {load['mongo_writes']} bulk writes in {load['flushes']} flushes "
+              f"({load['events_per_write']} events/write, last flush {load['last_flush_ms']} ms)")
+        print(f"outage: {outage['accepted']} events buffered before 503, "
+              f"{outage['recovery']['accepted']} accepted after recovery")
+        print(f"verification: {check['recorded']} recorded / {check['accepted']} accepted, "
+              f"{check['pending_after_shutdown']} pending after shutdown, ok={check['ok']}")
+    sys.exit(0 if report["verification"]["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
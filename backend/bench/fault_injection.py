@@ -0,0 +1,198 @@
+"""
+Benchmark circuit breakers + fallback khi một dependency chậm hoặc sập.
+
+Khởi động app với stand-ins (như loadtest), làm nóng cache (blob path, lyrics dự phòng),
+xoá các entry cache chính (giả lập đã hết TTL) rồi gắn FaultInjector vào một dependency:
+mỗi call chờ `--latency` giây rồi lỗi (down) hoặc thành công (slow). Mỗi scenario chạy
+`--requests` request (mỗi request một bài khác nhau, `--concurrency` song song) hai lần:
+breakers tắt và bật.
+
+Scenarios:
+- mongodb-down / mongodb-slow: GET /api/audio/{id} -> ký lại signed URL từ blob path đã cache
+- gcs-down: GET /api/lyrics/{id} -> lyrics dự phòng (`lyrics:stale:`)
+- gemini-down: POST /api/robot-comment -> MAMCHAN_FALLBACK_MESSAGE
+
+Usage:
+    uv run python -m backend.bench.fault_injection
+    uv run python -m backend.bench.fault_injection --scenario mongodb-down --latency 5 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+
+import httpx
+
+from backend.bench.loadtest import BackgroundServer, find_free_port, percentile
+from backend.bench.standins import FaultInjector, LocalStorage, install_faults, install_standins, mongo_timeout, seed_catalog
+
+SCENARIOS = {
+    "mongodb-down": {"dependency": "mongodb", "endpoint": "audio", "error_rate": 1.0},
+    "mongodb-slow": {"dependency": "mongodb", "endpoint": "audio", "error_rate": 0.0},
+    "gcs-down": {"dependency": "gcs", "endpoint": "lyrics", "error_rate": 1.0},
+    "gemini-down": {"dependency": "gemini", "endpoint": "robot", "error_rate": 1.0},
+}
+
+
+def send(client, endpoint, song_id):
+    if endpoint == "audio":
+        return client.get(f"/api/audio/{song_id}")
+    if endpoint == "lyrics":
+        return client.get(f"/api/lyrics/{song_id}")
+    return client.post("/api/robot-comment", json={"song_title": f"Bench Song {song_id}"})
+
+
+async def run_requests(base_url, endpoint, song_ids, requests, concurrency):
+    records = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    status = (await send(client, endpoint, song_ids[i % len(song_ids)])).status_code
+                except httpx.HTTPError:
+                    status = None
+                records.append(((time.perf_counter() - started) * 1000, status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return records, time.perf_counter() - started
+
+
+async def warm(base_url, song_ids):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        for song_id in song_ids:
+            await client.get(f"/api/audio/{song_id}")
+            await client.get(f"/api/lyrics/{song_id}")
+
+
+def expire_primary_entries(song_ids):
+    """Xoá signed URL / lyrics đã cache để request phải gọi dependency (như khi TTL hết)."""
+    from backend.utils.cache import get_cache
+
+    cache = get_cache()
+    for song_id in song_ids:
+        for key in (f"url:{song_id}:gcs_audio_path", f"url:{song_id}:gcs_lrc_path",
+                    f"lyrics:{song_id}", f"lyrics:body:{song_id}"):
+            cache.delete(key)
+
+
+def fallback_count(dependency):
+    from backend.utils.metrics import get_metrics
+
+    counters = get_metrics().snapshot()["counters"].get("dependency_fallbacks", [])
+    return sum(c["value"] for c in counters if c.get("dependency") == dependency)
+
+
+def summarize(records, elapsed):
+    latencies = sorted(ms for ms, _ in records)
+    statuses = {}
+    for _, status in records:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "status": statuses,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(latencies[-1], 1),
+        },
+    }
+
+
+def run_scenario(name, base_url, storage, song_ids, requests, concurrency, latency, breakers_enabled, reset_timeout):
+    from backend.utils.breaker import _breakers
+
+    scenario = SCENARIOS[name]
+    dependency = scenario["dependency"]
+    for breaker in _breakers.values():
+        breaker.reset()
+        breaker.enabled = breakers_enabled
+        breaker.reset_timeout = reset_timeout
+
+    expire_primary_entries(song_ids)
+    error = mongo_timeout if dependency == "mongodb" else None
+    faults = FaultInjector(latency=latency, error_rate=scenario["error_rate"], error=error)
+    install_faults(storage, **{dependency: faults})
+    fallbacks_before = fallback_count(dependency)
+    try:
+        records, elapsed = asyncio.run(run_requests(base_url, scenario["endpoint"], song_ids, requests, concurrency))
+    finally:
+        install_faults(storage)
+
+    report = summarize(records, elapsed)
+    report["dependency_calls"] = faults.calls
+    report["fallbacks"] = fallback_count(dependency) - fallbacks_before
+    report["breaker"] = _breakers[dependency].stats()
+    return report
+
+
+def run(scenarios=None, requests=200, concurrency=20, latency=2.0, reset_timeout=5.0):
+    os.environ.setdefault("RATE_LIMITS", "false")    # đo breaker, không đo rate limiter
+    os.environ.setdefault("LIVE_UPDATES", "false")   # watcher polling cũng sẽ dính fault
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    main, storage = install_standins(LocalStorage(base_url=base_url))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        song_ids = seed_catalog(storage, requests, audio_bytes=1024)
+
+    results = {}
+    with BackgroundServer(main.app, port), contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(warm(base_url, song_ids))
+        for name in scenarios or SCENARIOS:
+            results[name] = {
+                mode: run_scenario(name, base_url, storage, song_ids, requests, concurrency, latency, enabled, reset_timeout)
+                for mode, enabled in (("breakers_off", False), ("breakers_on", True))
+            }
+
+    return {
+        "config": {
+            "requests": requests,
+            "concurrency": concurrency,
+            "injected_latency_s": latency,
+            "reset_timeout_s": reset_timeout,
+        },
+        "scenarios": results,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure circuit breakers and fallbacks under injected dependency faults")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Repeatable; default: all")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per run (one song each)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds each faulty dependency call takes")
+    parser.add_argument("--reset-timeout", type=float, default=5.0, help="Breaker open -> half-open delay")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.scenario, args.requests, args.concurrency, args.latency, args.reset_timeout)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, modes in report["scenarios"].items():
+        print(name)
+        for mode, result in modes.items():
+            breaker = result["breaker"]
+            print(f"  {mode:13s} {result['elapsed_s']:6.2f}s  latency {result['latency_ms']}  status {result['status']}")
+            print(f"  {'':13s} dependency calls {result['dependency_calls']}, fallbacks {result['fallbacks']}, "
+                  f"breaker opened {breaker['times_opened']}x, rejected {breaker['rejected']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark acoustic fingerprinting (backend/utils/fingerprint.py).
+
+Audio là "bài hát" tổng hợp (chuỗi nốt có hoà âm + nhiễu), không cần file hay ffmpeg:
+- throughput: thời gian fingerprint một track FINGERPRINT_SECONDS giây (một process và process pool)
+- accuracy: bản "re-encode" của mỗi track (đổi gain, lọc thấp, thêm nhiễu, lệch thời gian,
+  thêm khoảng lặng đầu bài) phải tìm lại được bài gốc; track không có trong index thì không
+- query: index `--tracks` bài (các bài thật ở trên + bài giả chỉ có key ngẫu nhiên), đo latency
+  của match() (lookup + vote + xác nhận BER) và bộ nhớ của index
+
+Usage:
+    uv run python -m backend.bench.fingerprint_bench
+    uv run python -m backend.bench.fingerprint_bench --tracks 100000 --songs 30 --json
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backend.bench.loadtest import percentile
+from backend.utils.fingerprint import (
+    FINGERPRINT_SECONDS, INDEX_SAMPLE, SAMPLE_RATE, WEAK_BITS, FingerprintIndex, compute_fingerprint, match,
+    sample_keys
+)
+
+
+def synth_track(seed, seconds=FINGERPRINT_SECONDS):
+    """Chuỗi nốt 0.2-0.6s, mỗi nốt 3 hoà âm với envelope tắt dần, cộng nhiễu nền nhỏ."""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    audio = np.zeros(total, dtype=np.float32)
+    pos = 0
+    while pos < total:
+        length = min(int(rng.uniform(0.2, 0.6) * SAMPLE_RATE), total - pos)
+        t = np.arange(length, dtype=np.float32) / SAMPLE_RATE
+        base = 110 * 2 ** (rng.integers(0, 36) / 12)
+        note = sum(np.sin(2 * np.pi * base * h * t) / h for h in (1, 2, 3))
+        audio[pos:pos + length] = note * np.exp(-t * rng.uniform(1, 6)) * rng.uniform(0.3, 1.0)
+        pos += length
+    audio += rng.normal(0, 0.01, total).astype(np.float32)
+    return audio / np.abs(audio).max()
+
+
+def reencode(audio, seed):
+    """Giả lập bản encode khác: gain, lọc thấp nhẹ, nhiễu ~30 dB, lệch vài chục ms + khoảng lặng đầu."""
+    rng = np.random.default_rng(seed)
+    out = np.convolve(audio, [0.25, 0.5, 0.25], mode="same") * rng.uniform(0.5, 0.9)
+    out += rng.normal(0, 0.03 * out.std(), len(out))
+    lead = np.zeros(int(rng.uniform(0.0, 0.8) * SAMPLE_RATE) + int(rng.integers(0, 400)), dtype=np.float32)
+    return np.concatenate([lead, out]).astype(np.float32)[:len(audio)]
+
+
+def fake_docs(count, frames, seed):
+    """Bài giả cho index lớn: chỉ có các key đã sample (ngẫu nhiên), không có fingerprint đầy đủ."""
+    rng = np.random.default_rng(seed)
+    per_track = max(1, frames // INDEX_SAMPLE)
+    keys = (rng.integers(1, 2 ** 32 // INDEX_SAMPLE, (count, per_track), dtype=np.uint64) * INDEX_SAMPLE).astype(np.uint32)
+    positions = np.sort(rng.integers(0, frames, (count, per_track)), axis=1).astype(np.uint16)
+    for i in range(count):
+        yield {"_id": f"fake{i}", "keys": keys[i].tobytes(), "positions": positions[i].tobytes()}
+
+
+def measure_throughput(tracks, workers):
+    started = time.perf_counter()
+    fingerprints = [compute_fingerprint(audio) for audio in tracks]
+    serial = time.perf_counter() - started
+    result = {
+        "tracks": len(tracks),
+        "track_seconds": FINGERPRINT_SECONDS,
+        "serial_ms_per_track": round(serial / len(tracks) * 1000, 1),
+        "serial_x_realtime": round(FINGERPRINT_SECONDS * len(tracks) / serial, 1),
+    }
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(compute_fingerprint, tracks[:workers]))   # khởi động workers
+            started = time.perf_counter()
+            list(pool.map(compute_fingerprint, tracks))
+            pooled = time.perf_counter() - started
+        result["pool_workers"] = workers
+        result["pool_tracks_per_s"] = round(len(tracks) / pooled, 2)
+    return fingerprints, result
+
+
+def run(tracks=100_000, songs=20, workers=None):
+    workers = workers or os.cpu_count() or 1
+    originals = [synth_track(i) for i in range(songs)]
+    fingerprints, throughput = measure_throughput(originals, workers)
+
+    stored = {f"song{i}": values for i, values in enumerate(fingerprints)}
+    docs = [{"_id": song_id, "keys": k.tobytes(), "positions": p.tobytes()}
+            for song_id, (k, p) in ((song_id, sample_keys(v)) for song_id, v in stored.items())]
+    frames = len(fingerprints[0])
+
+    index = FingerprintIndex()
+    started = time.perf_counter()
+    index.load(list(fake_docs(max(0, tracks - songs), frames, seed=1)) + docs)
+    build_s = time.perf_counter() - started
+
+    latencies, found, bers, false_positives = [], 0, [], 0
+    for i in range(songs):
+        values, weak = compute_fingerprint(reencode(originals[i], seed=1000 + i), weak_bits=WEAK_BITS)
+        started = time.perf_counter()
+        matches = match(index, values, weak, stored.get)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if matches and matches[0]["song_id"] == f"song{i}":
+            found += 1
+            bers.append(matches[0]["ber"])
+
+    # Track không có trong index: không được báo trùng
+    for i in range(songs):
+        values, weak = compute_fingerprint(synth_track(10_000 + i), weak_bits=WEAK_BITS)
+        started = time.perf_counter()
+        false_positives += bool(match(index, values, weak, stored.get))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    return {
+        "throughput": throughput,
+        "index": {
+            "tracks": len(index),
+            "build_s": round(build_s, 2),
+            **index.stats(),
+            "mb": round(index.stats()["bytes"] / 1e6, 1),
+        },
+        "query_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "accuracy": {
+            "reencodes_found": f"{found}/{songs}",
+            "match_ber_mean": round(float(np.mean(bers)), 3) if bers else None,
+            "false_positives": f"{false_positives}/{songs}",
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint throughput and duplicate lookup at catalog scale")
+    parser.add_argument("--tracks", type=int, default=100_000, help="Tracks in the index (mostly synthetic keys)")
+    parser.add_argument("--songs", type=int, default=20, help="Synthesized songs to fingerprint and query")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: cpu count)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.tracks, args.songs, args.workers)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    t, i, q, a = report["throughput"], report["index"], report["query_ms"], report["accuracy"]
+    print(f"fingerprint: {t['serial_ms_per_track']} ms / {t['track_seconds']:.0f}s track ({t['serial_x_realtime']}x realtime)"
+          + (f", pool {t['pool_tracks_per_s']} tracks/s ({t['pool_workers']} workers)" if "pool_workers" in t else ""))
+    print(f"index: {i['tracks']} tracks, {i['entries']} entries, {i['mb']} MB, built in {i['build_s']}s")
+    print(f"query: p50 {q['p50']} ms, p95 {q['p95']} ms, max {q['max']} ms")
+    print(f"re-encodes found {a['reencodes_found']} (mean BER {a['match_ber_mean']}), false positives {a['false_positives']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+So sánh time-to-first-audio và seek latency: redirect tới cả file (/api/audio/{id})
+và HLS (/api/audio/{id}/hls/...).
+
+Request chạy thật qua HTTP tới app (stand-ins như loadtest). Thời gian truyền trên
+mạng chậm được mô hình hóa: mỗi request cộng thêm RTT, mỗi byte tốn bytes*8/bandwidth.
+
+- redirect: GET /api/audio/{id} (302) rồi Range request đủ `--buffer` giây audio
+  (seek: Range request từ byte offset tương ứng, URL đã có sẵn)
+- hls: master + media playlist + segment đầu tiên của variant chọn theo bandwidth
+  (seek: tải segment chứa vị trí seek, playlist đã có sẵn)
+
+Usage:
+    uv run python -m backend.bench.hls_bench
+    uv run python -m backend.bench.hls_bench --duration 300 --bitrate 192 --json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import httpx
+
+from backend.bench.loadtest import BackgroundServer, find_free_port
+from backend.bench.standins import LocalStorage, install_standins, make_mp3, seed_catalog
+
+# (bandwidth kbps, RTT ms)
+LINKS = {
+    "3g": (1600, 150),
+    "4g": (12000, 50),
+    "wifi": (50000, 15),
+}
+
+SEEK_POSITIONS = (30.0, 120.0, 200.0)
+
+
+class ModeledClient:
+    """httpx client that adds a modeled network cost to every request."""
+
+    def __init__(self, client, bandwidth_kbps, rtt_ms):
+        self.client = client
+        self.bandwidth_kbps = bandwidth_kbps
+        self.rtt_ms = rtt_ms
+        self.elapsed_ms = 0.0
+        self.requests = 0
+        self.bytes = 0
+
+    def get(self, url, **kwargs):
+        start = time.perf_counter()
+        response = self.client.get(url, **kwargs)
+        server_ms = (time.perf_counter() - start) * 1000
+        size = len(response.content)
+        self.requests += 1
+        self.bytes += size
+        self.elapsed_ms += server_ms + self.rtt_ms + size * 8 / self.bandwidth_kbps
+        return response
+
+    def report(self):
+        return {"ms": round(self.elapsed_ms, 1), "requests": self.requests, "kbytes": round(self.bytes / 1024, 1)}
+
+
+def redirect_first_audio(client, base_url, song_id, bitrate, buffer_seconds):
+    response = client.get(f"{base_url}/api/audio/{song_id}", follow_redirects=False)
+    url = response.headers["location"]
+    end = int(bitrate * 1000 / 8 * buffer_seconds)
+    client.get(url, headers={"Range": f"bytes=0-{end - 1}"})
+    return url
+
+
+def redirect_seek(client, url, position, bitrate, buffer_seconds):
+    start = int(bitrate * 1000 / 8 * position)
+    end = start + int(bitrate * 1000 / 8 * buffer_seconds)
+    client.get(url, headers={"Range": f"bytes={start}-{end - 1}"})
+
+
+def _parse_master(text):
+    variants = []
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            bandwidth = int(line.split("BANDWIDTH=")[1].split(",")[0])
+            variants.append((bandwidth, lines[i + 1].strip()))
+    return sorted(variants)
+
+
+def _parse_media(text):
+    segments = []
+    duration = None
+    for line in text.splitlines():
+        if line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.strip() and not line.startswith("#"):
+            segments.append((duration, line.strip()))
+    return segments
+
+
+def hls_first_audio(client, base_url, song_id, bandwidth_kbps):
+    master_url = f"{base_url}/api/audio/{song_id}/hls/master.m3u8"
+    variants = _parse_master(client.get(master_url).text)
+    # ABR đơn giản: variant cao nhất dưới 80% bandwidth, không có thì lấy variant thấp nhất
+    fitting = [v for v in variants if v[0] <= bandwidth_kbps * 1000 * 0.8]
+    bandwidth, uri = (fitting or variants)[-1 if fitting else 0]
+    segments = _parse_media(client.get(httpx.URL(master_url).join(uri)).text)
+    client.get(segments[0][1])
+    return segments, bandwidth
+
+
+def hls_seek(client, segments, position):
+    elapsed = 0.0
+    for duration, url in segments:
+        if elapsed + duration > position:
+            client.get(url)
+            return
+        elapsed += duration
+    client.get(segments[-1][1])
+
+
+def run(duration=240.0, bitrate=128, buffer_seconds=2.0, links=None, segment_seconds=None):
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    main, storage = install_standins(LocalStorage(base_url=base_url))
+
+    from backend.utils import hls
+    from backend.utils.gcs import GCS_BUCKET_NAME
+    from backend.utils.mongodb import get_song_by_id
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        song_id = seed_catalog(storage, 1, audio=make_mp3(duration, bitrate))[0]
+
+    song = get_song_by_id(song_id)
+    source = storage._path(GCS_BUCKET_NAME, song["gcs_audio_blob"])
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        package = hls.package_song(song_id, source, "mp3", segment_seconds or hls.HLS_SEGMENT_SECONDS)
+    package_ms = (time.perf_counter() - started) * 1000
+
+    report = {
+        "track": {"duration_s": duration, "bitrate_kbps": bitrate, "buffer_s": buffer_seconds},
+        "package": {
+            "packager": package["packager"],
+            "segment_seconds": package["segment_seconds"],
+            "variants": [v["name"] for v in package["variants"]],
+            "files": len(package["blobs"]),
+            "ms": round(package_ms, 1),
+        },
+        "links": {},
+    }
+
+    with BackgroundServer(main.app, port), httpx.Client(timeout=30.0) as http:
+        for name in links or LINKS:
+            bandwidth_kbps, rtt_ms = LINKS[name]
+
+            first = ModeledClient(http, bandwidth_kbps, rtt_ms)
+            url = redirect_first_audio(first, base_url, song_id, bitrate, buffer_seconds)
+            seeks = []
+            for position in SEEK_POSITIONS:
+                seek = ModeledClient(http, bandwidth_kbps, rtt_ms)
+                redirect_seek(seek, url, position, bitrate, buffer_seconds)
+                seeks.append(seek.elapsed_ms)
+            redirect = {"first_audio": first.report(), "seek_ms": [round(ms, 1) for ms in seeks]}
+
+            first = ModeledClient(http, bandwidth_kbps, rtt_ms)
+            segments, variant_bandwidth = hls_first_audio(first, base_url, song_id, bandwidth_kbps)
+            seeks = []
+            for position in SEEK_POSITIONS:
+                seek = ModeledClient(http, bandwidth_kbps, rtt_ms)
+                hls_seek(seek, segments, position)
+                seeks.append(seek.elapsed_ms)
+            report["links"][name] = {
+                "bandwidth_kbps": bandwidth_kbps,
+                "rtt_ms": rtt_ms,
+                "redirect": redirect,
+                "hls": {
+                    "variant_bandwidth": variant_bandwidth,
+                    "first_audio": first.report(),
+                    "seek_ms": [round(ms, 1) for ms in seeks],
+                },
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-first-audio and seek latency: redirect vs HLS")
+    parser.add_argument("--duration", type=float, default=240.0, help="Synthetic track length (seconds)")
+    parser.add_argument("--bitrate", type=int, default=128, help="Synthetic MP3 bitrate (kbps)")
+    parser.add_argument("--buffer", type=float, default=2.0, help="Seconds of audio a progressive player buffers before playing")
+    parser.add_argument("--segment-seconds", type=float, help="HLS segment length (default: HLS_SEGMENT_SECONDS)")
+    parser.add_argument("--link", action="append", choices=sorted(LINKS), help="Link profile(s) to model")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.duration, args.bitrate, args.buffer, args.link, args.segment_seconds)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    package = report["package"]
+    print(f"Packaged {report['track']['duration_s']:.0f}s @ {report['track']['bitrate_kbps']}kbps "
+          f"with {package['packager']} ({package['segment_seconds']:g}s segments): {package['files']} files in {package['ms']} ms ({', '.join(package['variants'])})")
+    print(f"\n{'link':<6} {'path':<9} {'first audio':>12} {'req':>4} {'KB':>8} {'seek (ms)':>24}")
+    for name, link in report["links"].items():
+        for path in ("redirect", "hls"):
+            row = link[path]
+            first = row["first_audio"]
+            seeks = " / ".join(f"{ms:.0f}" for ms in row["seek_ms"])
+            print(f"{name:<6} {path:<9} {first['ms']:>10.1f}ms {first['requests']:>4} {first['kbytes']:>8.1f} {seeks:>24}")
+
+
+if __name__ == "__main__":
+    main()
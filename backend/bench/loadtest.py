@@ -0,0 +1,297 @@
+"""
+Load test cho các hot path của backend.
+
+Khởi động backend.core.main:app (uvicorn, in-process) với in-memory Mongo,
+local storage và fake Gemini, rồi chạy N virtual users theo một load profile
+và in kết quả p50/p95/p99 + throughput dạng JSON.
+
+Usage:
+    uv run python -m backend.bench.loadtest --users 20 --duration 15
+    uv run python -m backend.bench.loadtest --mix songs=1,audio=4,lyrics=4 --out result.json
+    uv run python -m backend.bench.loadtest --users 20 --abusers 10   # playback latency khi bị spam robot/import
+
+Mỗi virtual user gửi X-Forwarded-For riêng (uvicorn tin proxy headers từ 127.0.0.1),
+nên rate limit theo client áp cho từng user như với client thật. Response 429 / 503
+của limiter được đếm riêng là `rejected`.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import socket
+import threading
+import time
+
+import httpx
+
+from backend.bench.standins import LocalStorage, install_standins, make_lrc, seed_catalog
+
+# Trọng số mỗi action trong một play session (sau khi user đã load playlist)
+PROFILES = {
+    "play-session": {"songs": 0.5, "audio": 4, "lyrics": 4, "robot": 0.5, "import": 0.05},
+    "browse": {"songs": 4, "audio": 1, "lyrics": 1},
+    "playback-only": {"audio": 1, "lyrics": 1},
+    "import-heavy": {"songs": 1, "import": 1},
+    "listening": {"audio": 1, "lyrics": 1, "events": 2},
+}
+
+# Abuser: spam các endpoint đắt, không nghỉ
+ABUSE_MIX = {"robot": 1, "import": 1}
+REJECTED_STATUSES = (429, 503)
+
+ENDPOINT_NAMES = {
+    "songs": "GET /api/songs",
+    "audio": "GET /api/audio/{id}",
+    "lyrics": "GET /api/lyrics/{id}",
+    "robot": "POST /api/robot-comment",
+    "import": "POST /api/import-track",
+    "events": "POST /api/events",
+}
+
+# Số event play / skip / seek mỗi request POST /api/events
+EVENTS_PER_REQUEST = 20
+
+
+def parse_mix(value):
+    """Parse 'songs=1,audio=4' into a weight dict."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINT_NAMES:
+            raise argparse.ArgumentTypeError(f"Unknown action '{name}'. Choose from {sorted(ENDPOINT_NAMES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile on an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Build the per-endpoint latency/throughput report from raw samples."""
+    endpoints = {}
+    total_errors = 0
+    for action, records in samples.items():
+        latencies = sorted(ms for ms, _ in records)
+        rejected = sum(1 for _, status in records if status in REJECTED_STATUSES)
+        errors = sum(1 for _, status in records if status is None or status >= 400) - rejected
+        total_errors += errors
+        endpoints[ENDPOINT_NAMES[action]] = {
+            "count": len(records),
+            "errors": errors,
+            "rejected": rejected,
+            "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "p99": round(percentile(latencies, 99), 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "max": round(latencies[-1], 3),
+            },
+        }
+    total = sum(len(records) for records in samples.values())
+    return {
+        "duration_s": round(elapsed, 3),
+        "total_requests": total,
+        "errors": total_errors,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """Run a uvicorn server for the app in a daemon thread."""
+
+    def __init__(self, app, port):
+        import uvicorn
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 15
+        while not self.server.started:
+            if time.time() > deadline or not self.thread.is_alive():
+                raise RuntimeError("uvicorn did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def user_address(index):
+    """Distinct client address per virtual user (sent as X-Forwarded-For)."""
+    return f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+
+
+async def run_user(client, base_url, song_ids, mix, deadline, samples, rng, think_time, address=None):
+    actions = list(mix)
+    weights = [mix[a] for a in actions]
+    import_seq = 0
+    headers = {"X-Forwarded-For": address} if address else None
+    # Payload tạo một lần cho mỗi user: client chạy chung CPU với server, không để nó ăn vào số đo
+    robot_body = {"song_title": "Bench Song", "lyrics": make_lrc(line_count=20)}
+    import_audio = os.urandom(64 * 1024)
+    import_lyrics = make_lrc(line_count=30).encode("utf-8")
+
+    async def timed(action, coro):
+        start = time.perf_counter()
+        status = None
+        try:
+            response = await coro
+            status = response.status_code
+        except httpx.HTTPError:
+            pass
+        samples.setdefault(action, []).append(((time.perf_counter() - start) * 1000.0, status))
+
+    # Mỗi session bắt đầu bằng việc load playlist
+    if "songs" in mix:
+        await timed("songs", client.get(f"{base_url}/api/songs", headers=headers))
+
+    while time.perf_counter() < deadline:
+        action = rng.choices(actions, weights)[0]
+        song_id = rng.choice(song_ids)
+        if action == "songs":
+            await timed(action, client.get(f"{base_url}/api/songs", headers=headers))
+        elif action == "audio":
+            await timed(action, client.get(f"{base_url}/api/audio/{song_id}", headers=headers))
+        elif action == "lyrics":
+            await timed(action, client.get(f"{base_url}/api/lyrics/{song_id}", headers=headers))
+        elif action == "robot":
+            await timed(action, client.post(f"{base_url}/api/robot-comment", json=robot_body, headers=headers))
+        elif action == "events":
+            events = [{"type": rng.choice(("play", "skip", "seek")), "song_id": rng.choice(song_ids),
+                       "position": round(rng.uniform(0, 240), 1)} for _ in range(EVENTS_PER_REQUEST)]
+            await timed(action, client.post(f"{base_url}/api/events", json={"events": events}, headers=headers))
+        elif action == "import":
+            import_seq += 1
+            name = f"Import{id(rng) % 100000}_{import_seq}"
+            files = {
+                "sound_file": (f"{name}.mp3", import_audio, "audio/mpeg"),
+                "lyrics_file": (f"{name}.lrc", import_lyrics, "text/plain"),
+            }
+            await timed(action, client.post(
+                f"{base_url}/api/import-track", data={"title": name}, files=files, headers=headers
+            ))
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+
+async def drive(base_url, song_ids, mix, users, duration, think_time, seed, abusers=0):
+    samples = {}
+    abuse_samples = {}
+    connections = (users + abusers) * 2
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=60.0, follow_redirects=False) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(
+            *(
+                run_user(client, base_url, song_ids, mix, deadline, samples, random.Random(seed + i), think_time,
+                         address=user_address(i))
+                for i in range(users)
+            ),
+            *(
+                run_user(client, base_url, song_ids, ABUSE_MIX, deadline, abuse_samples,
+                         random.Random(seed + users + i), 0.0, address=user_address(users + i))
+                for i in range(abusers)
+            ),
+        )
+        elapsed = time.perf_counter() - start
+    return samples, abuse_samples, elapsed
+
+
+def run_load_test(users=10, duration=10.0, mix=None, songs=50, think_time=0.0, gemini_latency=0.0, seed=0, abusers=0):
+    """Start the app with stand-ins, run the load profile and return the report dict."""
+    mix = mix or PROFILES["play-session"]
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    storage = LocalStorage(base_url=base_url)
+    main, storage = install_standins(storage=storage, gemini_latency=gemini_latency)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        song_ids = seed_catalog(storage, song_count=songs)
+
+    os.environ["BACKEND_URL"] = base_url
+    with BackgroundServer(main.app, port), contextlib.redirect_stdout(io.StringIO()):
+        samples, abuse_samples, elapsed = asyncio.run(
+            drive(base_url, song_ids, mix, users, duration, think_time, seed, abusers)
+        )
+
+    report = summarize(samples, elapsed)
+    if abusers:
+        report["abuse"] = summarize(abuse_samples, elapsed)
+    report["config"] = {
+        "users": users,
+        "duration_s": duration,
+        "mix": mix,
+        "songs": songs,
+        "think_time_s": think_time,
+        "gemini_latency_s": gemini_latency,
+        "seed": seed,
+        "abusers": abusers,
+    }
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Tunify backend with in-memory stand-ins")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="Test duration in seconds")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="play-session")
+    parser.add_argument("--mix", type=parse_mix, help="Override profile weights, e.g. songs=1,audio=4,lyrics=4")
+    parser.add_argument("--songs", type=int, default=50, help="Number of songs to seed")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between actions (seconds)")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="Simulated Gemini latency (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--abusers", type=int, default=0, help="Extra users spamming robot-comment and import-track")
+    parser.add_argument("--out", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        users=args.users,
+        duration=args.duration,
+        mix=args.mix or PROFILES[args.profile],
+        songs=args.songs,
+        think_time=args.think_time,
+        gemini_latency=args.gemini_latency,
+        seed=args.seed,
+        abusers=args.abusers,
+    )
+    report["config"]["profile"] = None if args.mix else args.profile
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
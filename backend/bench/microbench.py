@@ -0,0 +1,192 @@
+"""
+Microbenchmarks cho các hàm thuần trong backend.
+
+Chạy bằng timeit (không cần thêm dependency), so sánh với baseline đã commit
+trong backend/bench/baselines/microbench.json.
+
+Usage:
+    uv run python -m backend.bench.microbench                 # in kết quả JSON
+    uv run python -m backend.bench.microbench --compare       # so với baseline, exit 1 nếu chậm hơn ngưỡng
+    uv run python -m backend.bench.microbench --save          # ghi đè baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from backend.bench.payloads import lyrics_payload, song_list_payload
+from backend.bench.standins import LocalStorage, make_lrc
+from backend.utils.lyrics_search import LyricsIndex, lyrics_lines
+from backend.utils.responses import compress, dumps, orjson
+from backend.utils.utils import fold_text, normalize_song_name, parse_lrc_content
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "microbench.json")
+
+SAMPLE_TITLES = [
+    "Cause I Love You",
+    "Con Mưa Tình Yêu",
+    "Em Không Quay Về",
+    "  Người Lạ Ơi   ",
+    "Đừng Làm Trái Tim Anh Đau",
+]
+
+
+def _gcs_signing_bench():
+    """
+    backend.utils.gcs.generate_signed_url with a throwaway RSA service
+    account, so the real V4 signing path is measured without network
+    access. Returns None if the Google libraries are not installed.
+    """
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from backend.utils import gcs
+    except ImportError:
+        return None
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode("ascii")
+    gcs.GCS_SERVICE_ACCOUNT_JSON = json.dumps({
+        "type": "service_account",
+        "project_id": "bench",
+        "private_key_id": "bench",
+        "private_key": pem,
+        "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    })
+    return lambda: gcs.generate_signed_url("bench-bucket", "sounds/BenchSong.mp3")
+
+
+def _lyrics_index(song_count=2500, line_count=40):
+    """Index 100k dòng LRC tổng hợp. make_lrc chỉ có ~30 từ nên mỗi từ nằm trong ~1/4 số dòng: trường hợp xấu nhất cho search."""
+    index = LyricsIndex()
+    for i in range(song_count):
+        index.add(f"song{i}", lyrics_lines(parse_lrc_content(make_lrc(line_count=line_count, seed=i))))
+    return index
+
+
+def build_benchmarks():
+    """Return {name: callable} for every benchmark available in this environment."""
+    lrc_small = make_lrc(line_count=30)
+    lrc_large = make_lrc(line_count=400)
+    storage = LocalStorage(root=tempfile.gettempdir(), base_url="http://127.0.0.1:8000")
+    songs_500 = song_list_payload(500)
+    lyrics_body = dumps(lyrics_payload(400))
+    lyrics_40 = lyrics_lines(parse_lrc_content(make_lrc(line_count=40)))
+    lyrics_index = _lyrics_index()
+
+    benches = {
+        "parse_lrc_content[30 lines]": lambda: parse_lrc_content(lrc_small),
+        "parse_lrc_content[400 lines]": lambda: parse_lrc_content(lrc_large),
+        "normalize_song_name[5 titles]": lambda: [normalize_song_name(t) for t in SAMPLE_TITLES],
+        "fold_text[5 titles]": lambda: [fold_text(t) for t in SAMPLE_TITLES],
+        "lyrics_index_add[40 lines]": lambda: LyricsIndex().add("song", lyrics_40),
+        "lyrics_search[100k lines, phrase]": lambda: lyrics_index.search("nhớ mong chờ đợi"),
+        "lyrics_search[100k lines, prefix]": lambda: lyrics_index.search("tình đầ"),
+        "sign_url[local hmac]": lambda: storage.generate_signed_url("bench-bucket", "sounds/BenchSong.mp3"),
+        # Tên kèm encoder để baseline orjson không bị so với json stdlib
+        f"json_encode[500 songs, {'orjson' if orjson else 'stdlib'}]": lambda: dumps(songs_500),
+        "gzip_dynamic[lyrics 400 lines]": lambda: compress(lyrics_body, "gzip"),
+    }
+    gcs_sign = _gcs_signing_bench()
+    if gcs_sign is not None:
+        benches["sign_url[gcs v4]"] = gcs_sign
+    return benches
+
+
+def measure(func, rounds=7):
+    """Time func with timeit; returns per-call statistics in microseconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    per_call = [t / number * 1e6 for t in timer.repeat(repeat=rounds, number=number)]
+    return {
+        "min_us": round(min(per_call), 3),
+        "median_us": round(statistics.median(per_call), 3),
+        "mean_us": round(statistics.fmean(per_call), 3),
+        "stdev_us": round(statistics.stdev(per_call), 3) if len(per_call) > 1 else 0.0,
+        "rounds": rounds,
+        "calls_per_round": number,
+    }
+
+
+def run(selected=None, rounds=7):
+    results = {}
+    for name, func in build_benchmarks().items():
+        if selected and not any(s in name for s in selected):
+            continue
+        results[name] = measure(func, rounds=rounds)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    Compare against the baseline using the fastest round, which is the
+    least noisy statistic on shared machines. Returns (rows, regressed).
+    """
+    rows = []
+    regressed = False
+    for name, stats in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base:
+            rows.append({"benchmark": name, "min_us": stats["min_us"], "baseline_us": None, "change_pct": None})
+            continue
+        change = (stats["min_us"] - base["min_us"]) / base["min_us"] * 100.0
+        is_regression = change > threshold
+        regressed = regressed or is_regression
+        rows.append({
+            "benchmark": name,
+            "min_us": stats["min_us"],
+            "baseline_us": base["min_us"],
+            "change_pct": round(change, 1),
+            "regression": is_regression,
+        })
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for backend hot functions")
+    parser.add_argument("-k", dest="selected", action="append", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--save", action="store_true", help="Overwrite the committed baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the committed baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=25.0, help="Allowed slowdown in percent")
+    args = parser.parse_args()
+
+    current = run(selected=args.selected, rounds=args.rounds)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressed = compare(current, baseline, args.threshold)
+        print(json.dumps({"threshold_pct": args.threshold, "results": rows}, indent=2, ensure_ascii=False))
+        sys.exit(1 if regressed else 0)
+
+    print(json.dumps(current, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Bytes-on-wire và encode time cho các JSON payload lớn.
+
+So sánh đường mặc định của FastAPI (jsonable_encoder + JSONResponse) với
+FastJSONResponse (orjson nếu có), và kích thước sau gzip / br ở mức nén động
+(mỗi request), mức nén tĩnh (precompress, trả một lần rồi cache) và brotli 11
+(dùng cho lyrics, có và không có ?schedule=1).
+
+Usage:
+    uv run python -m backend.bench.payloads
+    uv run python -m backend.bench.payloads --songs 2000 --json
+"""
+
+import argparse
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.bench.standins import make_lrc
+from backend.utils import responses
+from backend.utils.utils import build_lyric_schedule, parse_lrc_content
+
+
+def song_list_payload(song_count):
+    backend_url = "https://tunify-backend.onrender.com"
+    songs = []
+    for i in range(song_count):
+        song_id = f"6799abc123def{i:07d}"
+        songs.append({
+            "id": song_id,
+            "title": f"Bench Song {i} - Người Lạ Ơi",
+            "audioUrl": f"{backend_url}/api/audio/{song_id}",
+            "audioFormat": "mp3",
+            "hasLyrics": True,
+            "hlsUrl": f"{backend_url}/api/audio/{song_id}/hls/master.m3u8" if i % 2 else None,
+        })
+    return {"songs": songs, "total": len(songs)}
+
+
+def lyrics_payload(line_count, schedule=False):
+    lyrics = parse_lrc_content(make_lrc(line_count=line_count))
+    payload = {"songId": "6799abc123def4560000000", "lyrics": lyrics}
+    if schedule:
+        payload["schedule"] = build_lyric_schedule(lyrics)
+    return payload
+
+
+def _time_us(func):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return round(min(timer.repeat(repeat=5, number=number)) / number * 1e6, 1)
+
+
+def measure_payload(content):
+    default_body = JSONResponse(jsonable_encoder(content)).body
+    fast_body = responses.dumps(content)
+    row = {
+        "encode_us": {
+            "fastapi_default": _time_us(lambda: JSONResponse(jsonable_encoder(content)).body),
+            "fast_json": _time_us(lambda: responses.FastJSONResponse(content).body),
+        },
+        "bytes": {
+            "fastapi_default": len(default_body),
+            "fast_json": len(fast_body),
+        },
+        "compress_us": {},
+    }
+    for encoding in responses.available_encodings():
+        for mode, static in (("dynamic", False), ("static", True)):
+            name = f"{encoding}_{mode}"
+            row["bytes"][name] = len(responses.compress(fast_body, encoding, static=static))
+            row["compress_us"][name] = _time_us(lambda: responses.compress(fast_body, encoding, static=static))
+        if encoding == "br":
+            row["bytes"]["br_max"] = len(responses.compress(fast_body, "br", brotli_quality=responses.MAX_BROTLI_QUALITY))
+            row["compress_us"]["br_max"] = _time_us(
+                lambda: responses.compress(fast_body, "br", brotli_quality=responses.MAX_BROTLI_QUALITY)
+            )
+    return row
+
+
+def run(song_count=500, lyric_lines=(60, 400)):
+    payloads = {f"songs[{song_count}]": song_list_payload(song_count)}
+    for lines in lyric_lines:
+        payloads[f"lyrics[{lines} lines]"] = lyrics_payload(lines)
+        payloads[f"lyrics+schedule[{lines} lines]"] = lyrics_payload(lines, schedule=True)
+    return {
+        "orjson": responses.orjson is not None,
+        "brotli": responses.brotli is not None,
+        "payloads": {name: measure_payload(content) for name, content in payloads.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON encode time and bytes-on-wire for large payloads")
+    parser.add_argument("--songs", type=int, default=500)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.songs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"orjson: {'yes' if report['orjson'] else 'no (stdlib json)'}, brotli: {'yes' if report['brotli'] else 'no'}")
+    for name, row in report["payloads"].items():
+        print(f"\n{name}")
+        encode = row["encode_us"]
+        print(f"  encode  fastapi default {encode['fastapi_default']:>10.1f} us   fast json {encode['fast_json']:>10.1f} us")
+        for variant, size in row["bytes"].items():
+            cost = row["compress_us"].get(variant)
+            cost = f"{cost:>10.1f} us" if cost is not None else ""
+            print(f"  {variant:<16} {size:>9} B  {cost}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Kiểm tra query plan của các query trong backend/utils/mongodb.py bằng explain().
+
+Chạy với MongoDB thật (MONGODB_USER / MONGODB_PASSWORD trong .env): tạo index bằng
+ensure_indexes(), lấy một bài có audio làm document mẫu rồi explain từng query trong
+repository_queries(). Thoát với code 1 khi có query phải scan cả collection (COLLSCAN)
+hoặc danh sách bài hát không còn là covered query (phải đọc document).
+
+Usage:
+    uv run python -m backend.bench.query_plans
+    uv run python -m backend.bench.query_plans --json
+"""
+
+import argparse
+import json
+import sys
+
+# Các query phải được trả thẳng từ index, không đọc document
+COVERED_QUERIES = {"get_song_list"}
+
+
+def plan_stages(plan):
+    """Tên các stage trong một plan (cả dạng classic và SBE: winningPlan.queryPlan)."""
+    plan = plan.get("queryPlan", plan)
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages += plan_stages(child)
+    return stages
+
+
+def index_names(plan):
+    plan = plan.get("queryPlan", plan)
+    names = [plan["indexName"]] if "indexName" in plan else []
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            names += index_names(child)
+    return names
+
+
+def summarize(explain):
+    winning = explain["queryPlanner"]["winningPlan"]
+    stats = explain.get("executionStats", {})
+    stages = plan_stages(winning)
+    return {
+        "stages": stages,
+        "indexes": index_names(winning),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+        "collscan": "COLLSCAN" in stages,
+        "covered": "COLLSCAN" not in stages and "FETCH" not in stages and stats.get("totalDocsExamined") == 0,
+    }
+
+
+def problems(name, summary):
+    found = []
+    if summary["collscan"]:
+        found.append(f"{name}: collection scan")
+    if name in COVERED_QUERIES and not summary["covered"]:
+        found.append(f"{name}: not covered (docs examined: {summary['docs_examined']})")
+    return found
+
+
+def run():
+    from backend.utils.mongodb import ensure_indexes, get_collection, repository_queries
+
+    indexes = ensure_indexes()
+    collection = get_collection()
+    sample = collection.find_one({"gcs_audio_blob": {"$ne": None}}) or collection.find_one({})
+    if sample is None:
+        raise SystemExit("Collection is empty: import at least one track first")
+
+    plans = {}
+    for name, cursor in repository_queries(collection, sample).items():
+        plans[name] = summarize(cursor.explain())
+    return {
+        "indexes": indexes,
+        "sample_id": str(sample["_id"]),
+        "plans": plans,
+        "problems": [p for name, summary in plans.items() for p in problems(name, summary)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explain every repository query and fail on collection scans")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Indexes: {', '.join(report['indexes'])}")
+        for name, summary in report["plans"].items():
+            flags = "covered" if summary["covered"] else ("COLLSCAN" if summary["collscan"] else "index")
+            print(f"  {name:18s} {flags:8s} {' <- '.join(reversed(summary['stages']))}  "
+                  f"keys {summary['keys_examined']}, docs {summary['docs_examined']}, returned {summary['returned']}")
+        for problem in report["problems"]:
+            print(f"❌ {problem}")
+    sys.exit(1 if report["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
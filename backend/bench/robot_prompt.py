@@ -0,0 +1,98 @@
+"""
+Kích thước request / prompt của /api/robot-comment: client gửi cả lời bài hát (cách cũ) so với
+chỉ gửi song_id để server dựng prompt từ lyrics_digest (cách mới).
+
+Đo bytes của request body, số token ước lượng (estimate_tokens) của prompt và thời gian tính
+digest cho vài dạng bài: ngắn, điệp khúc lặp nhiều lần, bài rất dài, lời không xuống dòng.
+Kiểm tra giới hạn: prompt mới không vượt quá template + tên bài + --tokens; vượt thì exit code 1.
+
+Usage:
+    uv run python -m backend.bench.robot_prompt
+    uv run python -m backend.bench.robot_prompt --tokens 200 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from backend.bench.standins import make_lrc
+from backend.utils.prompts import generate_mamchan_prompt
+from backend.utils.utils import estimate_tokens, lyrics_digest, parse_lrc_content
+
+TITLE = "Bench Song - Người Lạ Ơi"
+
+
+def with_chorus(verse_lines, chorus_lines, repeats, seed=0):
+    """Lời có điệp khúc: verse rồi điệp khúc, lặp `repeats` lần (như một bài thật)."""
+    verse = [line["text"] for line in parse_lrc_content(make_lrc(verse_lines * repeats, seed=seed))[:-1]]
+    chorus = [line["text"] for line in parse_lrc_content(make_lrc(chorus_lines, seed=seed + 7))[:-1]]
+    lines = []
+    for i in range(repeats):
+        lines += verse[i * verse_lines:(i + 1) * verse_lines] + chorus
+    return lines
+
+
+def cases():
+    return {
+        "short": [line["text"] for line in parse_lrc_content(make_lrc(12))[:-1]],
+        "chorus_x4": with_chorus(8, 6, 4),
+        "long": with_chorus(30, 10, 5, seed=3),
+        "one_line": [" ".join(line["text"] for line in parse_lrc_content(make_lrc(200))[:-1])],
+        "empty": [],
+    }
+
+
+def run(max_tokens):
+    rows, violations = [], []
+    template_chars = len(generate_mamchan_prompt(TITLE, "x")) - 1
+    for name, lines in cases().items():
+        text = "\n".join(lines)
+        old_body = json.dumps({"song_title": TITLE, "lyrics": text or None}, ensure_ascii=False)
+        new_body = json.dumps({"song_id": "6799abc123def0000001", "song_title": TITLE}, ensure_ascii=False)
+
+        digest = lyrics_digest(lines, max_tokens)
+        timer = timeit.Timer(lambda: lyrics_digest(lines, max_tokens))
+        loops, _ = timer.autorange()
+        digest_us = min(timer.repeat(5, loops)) / loops * 1e6
+
+        old_prompt = generate_mamchan_prompt(TITLE, text)
+        new_prompt = generate_mamchan_prompt(TITLE, digest)
+        limit = estimate_tokens(" " * template_chars) + max_tokens
+        if estimate_tokens(digest) > max_tokens or estimate_tokens(new_prompt) > limit:
+            violations.append(name)
+        rows.append({
+            "case": name,
+            "lines": len(lines),
+            "request_bytes": {"old": len(old_body.encode()), "new": len(new_body.encode())},
+            "prompt_tokens": {"old": estimate_tokens(old_prompt), "new": estimate_tokens(new_prompt), "limit": limit},
+            "digest_lines": digest.count("\n") + 1 if digest else 0,
+            "digest_us": round(digest_us, 1),
+        })
+    return {"max_tokens": max_tokens, "results": rows, "violations": violations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Robot comment request and prompt size, old vs lyric digest")
+    parser.add_argument("--tokens", type=int, default=int(os.getenv("ROBOT_LYRICS_TOKENS", "300")),
+                        help="Lyric digest budget (ROBOT_LYRICS_TOKENS)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.tokens)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        for row in report["results"]:
+            b, p = row["request_bytes"], row["prompt_tokens"]
+            print(f"{row['case']:>10}: {row['lines']:>3} lines -> {row['digest_lines']:>3} | "
+                  f"request {b['old']:>6} -> {b['new']} B | prompt ~{p['old']:>5} -> {p['new']:>4} tokens "
+                  f"(limit {p['limit']}) | digest {row['digest_us']} µs")
+        if report["violations"]:
+            print(f"prompt over budget: {', '.join(report['violations'])}")
+    sys.exit(1 if report["violations"] else 0)
+
+
+if __name__ == "__main__":
+    main()
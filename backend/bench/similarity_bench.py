@@ -0,0 +1,165 @@
+"""
+Benchmark gợi ý bài tương tự (backend/utils/similarity.py) ở quy mô catalog.
+
+Catalog tổng hợp: `--topics` chủ đề, mỗi chủ đề có bộ từ riêng; title và lyrics của một bài
+lấy từ bộ từ của chủ đề đó trộn với từ chung (ai cũng dùng). Bài "liên quan" là bài cùng chủ đề,
+nên precision@k = tỉ lệ kết quả cùng chủ đề với bài query.
+
+Đo: thời gian build + bộ nhớ của index, latency của similar() (một bài), throughput của
+similar_many() (batch), latency của add / remove (import / xoá một bài) và precision@k.
+
+Usage:
+    uv run python -m backend.bench.similarity_bench
+    uv run python -m backend.bench.similarity_bench --tracks 100000 --queries 200 --json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+import numpy as np
+
+from backend.bench.loadtest import percentile
+from backend.utils.similarity import SIMILARITY_FEATURES, SimilarityIndex
+
+SYLLABLES = ["anh", "em", "yeu", "mua", "nang", "gio", "troi", "dem", "mo", "xa", "nho", "thuong",
+             "bien", "song", "pho", "hoa", "la", "tim", "ngay", "mai", "chieu", "sao", "trang", "duong"]
+
+
+def vocabulary(rng, size):
+    return [rng.choice(SYLLABLES) + rng.choice(SYLLABLES) + str(rng.randrange(1000)) for _ in range(size)]
+
+
+def synth_catalog(tracks, topics, seed=0):
+    """(song_id, title, lines, version) và chủ đề của mỗi bài."""
+    rng = random.Random(seed)
+    common = vocabulary(rng, 400)
+    topic_words = [vocabulary(rng, 60) for _ in range(topics)]
+    songs, labels = [], []
+    for i in range(tracks):
+        topic = rng.randrange(topics)
+        words = topic_words[topic]
+        title = " ".join(rng.choice(words if rng.random() < 0.5 else common) for _ in range(rng.randint(2, 5)))
+        lines = []
+        if rng.random() < 0.9:   # ~10% bài không có lyrics
+            for n in range(rng.randint(20, 50)):
+                text = " ".join(rng.choice(words if rng.random() < 0.3 else common) for _ in range(rng.randint(5, 9)))
+                lines.append([5.0 + n * 3.5, text])
+        songs.append((f"song{i}", title, lines, None))
+        labels.append(topic)
+    return songs, labels
+
+
+def precision(results, labels, query):
+    if not results:
+        return 0.0
+    topic = labels[int(query[4:])]
+    return sum(labels[int(r["song_id"][4:])] == topic for r in results) / len(results)
+
+
+def run(tracks=100_000, topics=2000, queries=200, k=10, batch=64, features=SIMILARITY_FEATURES):
+    songs, labels = synth_catalog(tracks, topics)
+
+    index = SimilarityIndex(features)
+    started = time.perf_counter()
+    index.load(songs)
+    build_s = time.perf_counter() - started
+
+    rng = random.Random(1)
+    query_ids = [f"song{rng.randrange(tracks)}" for _ in range(queries)]
+    latencies, precisions = [], []
+    for song_id in query_ids:
+        started = time.perf_counter()
+        results = index.similar(song_id, k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        precisions.append(precision(results, labels, song_id))
+    latencies.sort()
+
+    batch_ids = query_ids[:batch]
+    started = time.perf_counter()
+    index.similar_many(batch_ids, k=k)
+    batch_s = time.perf_counter() - started
+
+    # Import / xoá một bài (incremental, không build lại)
+    add_ms, remove_ms = [], []
+    extra, _ = synth_catalog(50, topics, seed=2)
+    for song_id, title, lines, version in extra:
+        started = time.perf_counter()
+        index.add(f"new-{song_id}", title, lines, version)
+        add_ms.append((time.perf_counter() - started) * 1000)
+    for song_id, *_ in extra:
+        started = time.perf_counter()
+        index.remove(f"new-{song_id}")
+        remove_ms.append((time.perf_counter() - started) * 1000)
+
+    # Baseline: chọn ngẫu nhiên k bài
+    random_precision = np.mean([
+        precision([{"song_id": f"song{rng.randrange(tracks)}"} for _ in range(k)], labels, song_id)
+        for song_id in query_ids
+    ])
+
+    return {
+        "index": {
+            "tracks": len(index),
+            "topics": topics,
+            "build_s": round(build_s, 2),
+            "features_per_song": features,
+            "entries": index.stats()["entries"],
+            "mb": round(index.stats()["bytes"] / 1e6, 1),
+        },
+        "similar_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "similar_many": {
+            "batch": len(batch_ids),
+            "ms": round(batch_s * 1000, 1),
+            "ms_per_song": round(batch_s * 1000 / len(batch_ids), 2),
+        },
+        "update_ms": {
+            "add_p50": round(percentile(sorted(add_ms), 50), 3),
+            "remove_p50": round(percentile(sorted(remove_ms), 50), 3),
+        },
+        "quality": {
+            f"precision_at_{k}": round(float(np.mean(precisions)), 3),
+            "random_baseline": round(float(random_precision), 3),
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-songs latency and quality at catalog scale")
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--topics", type=int, default=2000, help="Song clusters in the synthetic catalog")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=64, help="Songs per similar_many() call")
+    parser.add_argument("--features", type=int, default=SIMILARITY_FEATURES, help="Features kept per song")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.tracks, args.topics, args.queries, args.k, args.batch, args.features)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    i, s, b, u, q = (report[key] for key in ("index", "similar_ms", "similar_many", "update_ms", "quality"))
+    print(f"index: {i['tracks']} tracks, {i['features_per_song']} features/song, {i['entries']} entries, "
+          f"{i['mb']} MB, built in {i['build_s']}s")
+    print(f"similar: p50 {s['p50']} ms, p95 {s['p95']} ms, max {s['max']} ms")
+    print(f"similar_many: {b['batch']} songs in {b['ms']} ms ({b['ms_per_song']} ms/song)")
+    print(f"add p50 {u['add_p50']} ms, remove p50 {u['remove_p50']} ms")
+    print(f"precision@{args.k}: {q[f'precision_at_{args.k}']} (random {q['random_baseline']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Catalog snapshot (backend/utils/snapshot.py) so với build index trong memory như worker đọc MongoDB.
+
+Catalog tổng hợp `--songs` bài, mỗi bài `--lines` dòng lyrics (2000 từ, phân bố Zipf). Đo:
+- MongoDB path: LyricsIndex.load() từ các document lyrics_lines đã có sẵn trong memory (chưa tính
+  thời gian query Atlas, nên đây là cận dưới của thời gian worker sẵn sàng)
+- snapshot: export (build + ghi file), kích thước file, thời gian mở (mmap) trong process này và
+  trong một process mới (mở + search đầu tiên), danh sách bài, lyrics một bài và latency search
+Kiểm tra: danh sách bài, lyrics và kết quả search từ snapshot giống hệt bản build từ document
+(index tham chiếu load theo cùng thứ tự bài); khác thì exit code 1.
+
+Usage:
+    uv run python -m backend.bench.snapshot_bench
+    uv run python -m backend.bench.snapshot_bench --songs 50000 --lines 40 --json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from backend.bench.loadtest import percentile
+from backend.utils.lyrics_search import LyricsIndex
+from backend.utils.snapshot import CatalogSnapshot, build_snapshot, write_snapshot
+from backend.utils.utils import LYRICS_END_SENTINEL
+
+SYLLABLES = ("anh em yêu thương nhớ mong chờ đợi ngày mai nắng mưa gió trời xanh biển sâu tình đầu phố cũ "
+             "đêm dài con tim lặng im hoa sữa mùa thu sông núi đồi trăng vàng quê mẹ bạn xa").split()
+
+
+def vocabulary(rng, size):
+    """`size` từ (âm tiết đơn và từ ghép hai âm tiết), xếp ngẫu nhiên để dùng theo phân bố Zipf."""
+    words = SYLLABLES + [a + b for a in SYLLABLES for b in SYLLABLES if a != b]
+    rng.shuffle(words)
+    return words[:size]
+
+
+COLD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from backend.utils.snapshot import CatalogSnapshot
+imported = time.perf_counter()
+snapshot = CatalogSnapshot(sys.argv[1])
+opened = time.perf_counter()
+snapshot.lyrics_index().search(sys.argv[2])
+searched = time.perf_counter()
+snapshot.songs()
+listed = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "open_ms": (opened - imported) * 1000,
+                  "first_search_ms": (searched - opened) * 1000, "song_list_ms": (listed - searched) * 1000}))
+"""
+
+
+def synth_catalog(song_count, line_count, seed=0):
+    """(songs như get_song_list, {song id: document lyrics_lines})."""
+    rng = random.Random(seed)
+    words = vocabulary(rng, 2000)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    songs, docs = [], {}
+    for i in range(song_count):
+        song_id = f"{i:024x}"
+        has_lyrics = rng.random() < 0.9
+        songs.append({
+            "_id": song_id,
+            "title": " ".join(rng.choices(words, weights, k=rng.randint(2, 5))).title(),
+            "audio_format": rng.choice(["mp3", "m4a"]),
+            "has_lyrics": has_lyrics,
+            "gcs_audio_blob": f"sounds/Song{i:06d}.mp3",
+            "gcs_lrc_blob": f"lyrics/Song{i:06d}.lrc" if has_lyrics else None,
+            **({"hls": {"duration": 180.0 + i % 60}} if i % 3 == 0 else {}),
+        })
+        if has_lyrics:
+            lines = [[round(5.0 + n * 3.5, 2), " ".join(rng.choices(words, weights, k=rng.randint(5, 9)))]
+                     for n in range(line_count)]
+            docs[song_id] = {"_id": song_id, "lines": lines, "version": 1000.0 + i}
+    return songs, docs
+
+
+def timed_ms(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def latencies(fn, inputs):
+    samples = []
+    for value in inputs:
+        started = time.perf_counter()
+        fn(value)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"p50": round(percentile(samples, 50), 3), "p95": round(percentile(samples, 95), 3)}
+
+
+def run(args):
+    songs, docs = synth_catalog(args.songs, args.lines)
+    rng = random.Random(1)
+    # Query là một đoạn 1-3 từ liên tiếp lấy từ lời của một bài (như người dùng nhớ một câu)
+    lyric_lines = [line[1].split() for doc in list(docs.values())[:1000] for line in doc["lines"]]
+    queries = []
+    for _ in range(args.queries):
+        line = rng.choice(lyric_lines)
+        start = rng.randrange(len(line))
+        queries.append(" ".join(line[start:start + rng.randint(1, 3)]))
+    queries += [q[:-1] for q in queries[:args.queries // 4]]   # từ cuối đang gõ dở (prefix)
+    sample_ids = [rng.choice(songs)["_id"] for _ in range(args.queries)]
+
+    # MongoDB path: index build trong memory (không tính query)
+    reference = LyricsIndex()
+    ordered_docs = [docs[song["_id"]] for song in songs if song["_id"] in docs]
+    _, index_build_ms = timed_ms(reference.load, ordered_docs)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="tunify-snapshot-"), "catalog.tsnap")
+    data, build_ms = timed_ms(build_snapshot, songs, docs)
+    _, write_ms = timed_ms(write_snapshot, path, data)
+    snapshot, open_ms = timed_ms(CatalogSnapshot, path)
+    listed, list_ms = timed_ms(snapshot.songs)
+    index, index_ms = timed_ms(snapshot.lyrics_index)
+
+    cold = json.loads(subprocess.run(
+        [sys.executable, "-c", COLD_SCRIPT, path, queries[0]],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    ).stdout)
+
+    mismatches = []
+    if listed != [{"gcs_lrc_blob": None, **song} if "gcs_lrc_blob" not in song else song for song in songs]:
+        mismatches.append("songs")
+    for song_id in sample_ids:
+        expected = None
+        if song_id in docs:
+            expected = [{"time": t, "text": text} for t, text in docs[song_id]["lines"]]
+            expected.append({"time": LYRICS_END_SENTINEL, "text": ""})
+        if snapshot.lyrics(song_id) != expected:
+            mismatches.append(f"lyrics:{song_id}")
+            break
+    for query in queries:
+        if index.search(query, limit=args.limit) != reference.search(query, limit=args.limit):
+            mismatches.append(f"search:{query}")
+            break
+
+    return {
+        "catalog": {"songs": args.songs, "lyric_lines": snapshot.header["lines"], "terms": snapshot.header["terms"]},
+        "in_memory_index": {
+            "build_ms": round(index_build_ms, 1),
+            "search_ms": latencies(lambda q: reference.search(q, limit=args.limit), queries),
+        },
+        "snapshot": {
+            "export_ms": round(build_ms + write_ms, 1),
+            "file_mb": round(os.path.getsize(path) / 1e6, 2),
+            "open_ms": round(open_ms, 3),
+            "song_list_ms": round(list_ms, 1),
+            "index_ms": round(index_ms, 3),
+            "search_ms": latencies(lambda q: index.search(q, limit=args.limit), queries),
+            "lyrics_ms": latencies(snapshot.lyrics, sample_ids),
+            "fresh_process": {key: round(value, 2) for key, value in cold.items()},
+        },
+        "mismatches": mismatches,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped catalog snapshot vs in-memory lyrics index")
+    parser.add_argument("--songs", type=int, default=10_000)
+    parser.add_argument("--lines", type=int, default=40, help="Lyric lines per song")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20, help="Results per search")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        c, m, s = report["catalog"], report["in_memory_index"], report["snapshot"]
+        cold = s["fresh_process"]
+        print(f"catalog: {c['songs']} songs, {c['lyric_lines']} lyric lines, {c['terms']} terms")
+        print(f"in-memory index: built in {m['build_ms']} ms (plus the MongoDB query), "
+              f"search p50 {m['search_ms']['p50']} ms / p95 {m['search_ms']['p95']} ms")
+        print(f"snapshot: {s['file_mb']} MB exported in {s['export_ms']} ms, opened in {s['open_ms']} ms, "
+              f"song list {s['song_list_ms']} ms, search p50 {s['search_ms']['p50']} ms / p95 {s['search_ms']['p95']} ms, "
+              f"lyrics p50 {s['lyrics_ms']['p50']} ms")
+        print(f"fresh process: import {cold['import_ms']} ms, open {cold['open_ms']} ms, "
+              f"first search {cold['first_search_ms']} ms, song list {cold['song_list_ms']} ms")
+        if report["mismatches"]:
+            print(f"mismatch: {', '.join(report['mismatches'])}")
+    sys.exit(1 if report["mismatches"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Resumable upload (/api/uploads) so với một request multipart (/api/import-track) khi mạng chập chờn.
+
+Khởi động app với stand-ins (như loadtest) rồi import cùng một file audio bằng hai cách:
+- multipart: một request; bị cắt kết nối ở `--cut-at` (phần trăm file) thì gửi lại từ đầu
+- resumable: tạo session, PUT các chunk `--chunk-mb`, finalize rồi import với sound_upload_id.
+  Mỗi chunk bị cắt kết nối giữa chừng với xác suất `--drop-rate` (client hỏi lại offset rồi gửi
+  tiếp) và mất response với xác suất `--lost-rate` (client gửi lại cả chunk, server bỏ qua phần
+  đã có); GCS stand-in lỗi 503 với xác suất `--storage-error-rate` và luôn lỗi ở PUT thứ hai
+  (sau khi đã lưu một đoạn), để chắc chắn có lần đẩy lên storage phải chạy tiếp từ byte đã lưu.
+
+Đo tổng thời gian, số byte client đã gửi và thời gian từ byte cuối tới khi import xong (phần việc
+không chồng được lên lúc truyền). Kiểm tra blob trên storage giống hệt file gốc (sha256) và
+document trỏ đúng blob, và storage đã lỗi ít nhất một lần; sai thì exit code 1.
+
+Usage:
+    uv run python -m backend.bench.upload_bench
+    uv run python -m backend.bench.upload_bench --size-mb 60 --chunk-mb 4 --drop-rate 0.3 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import httpx
+
+from backend.bench.loadtest import BackgroundServer, find_free_port
+from backend.bench.standins import FaultInjector, LocalStorage, install_faults, install_standins, make_mp3
+
+PIECE = 64 * 1024
+
+
+class Interrupted(Exception):
+    pass
+
+
+def body(data, progress, cut_at=None):
+    """Async body gửi theo từng PIECE; cut_at: cắt kết nối sau chừng ấy byte."""
+    async def stream():
+        sent = 0
+        while sent < len(data):
+            if cut_at is not None and sent >= cut_at:
+                raise Interrupted()
+            piece = data[sent:sent + PIECE]
+            sent += len(piece)
+            progress["bytes"] += len(piece)
+            progress["last_byte"] = time.perf_counter()
+            yield piece
+    return stream()
+
+
+async def multipart_import(client, audio, filename, cut_at):
+    """Một request multipart; lần đầu bị cắt ở cut_at byte thì gửi lại cả file."""
+    progress = {"bytes": 0, "last_byte": None}
+    boundary = "tunify-bench"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nBench upload\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"sound_file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: audio/mpeg\r\n\r\n").encode()
+    payload = head + audio + f"\r\n--{boundary}--\r\n".encode()
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}", "Content-Length": str(len(payload))}
+
+    started = time.perf_counter()
+    for attempt_cut in (cut_at, None):
+        try:
+            response = await client.post("/api/import-track", content=body(payload, progress, attempt_cut), headers=headers)
+            break
+        except (Interrupted, httpx.HTTPError):
+            continue
+    finished = time.perf_counter()
+    return {
+        "status": response.status_code,
+        "song_id": response.json().get("mongodb_id"),
+        "seconds": finished - started,
+        "bytes_sent": progress["bytes"],
+        "after_last_byte_ms": (finished - progress["last_byte"]) * 1000,
+    }
+
+
+async def resumable_import(client, audio, filename, chunk_size, drop_rate, lost_rate, rng):
+    progress = {"bytes": 0, "last_byte": None}
+    stats = {"drops": 0, "lost_responses": 0, "retries": 0}
+    started = time.perf_counter()
+    session = (await client.post("/api/uploads", json={"filename": filename, "size": len(audio)})).json()
+    upload_id = session["upload_id"]
+
+    offset = 0
+    while offset < len(audio):
+        chunk = audio[offset:offset + chunk_size]
+        cut_at = rng.randrange(1, len(chunk)) if rng.random() < drop_rate else None
+        try:
+            response = await client.put(
+                f"/api/uploads/{upload_id}", params={"offset": offset},
+                content=body(chunk, progress, cut_at), headers={"Content-Length": str(len(chunk))},
+            )
+        except (Interrupted, httpx.HTTPError):
+            stats["drops"] += 1
+            await asyncio.sleep(0.05)   # server nhận http.disconnect rồi mới thả lock của session
+            offset = (await client.get(f"/api/uploads/{upload_id}")).json()["offset"]
+            continue
+        if response.status_code == 409:
+            stats["retries"] += 1
+            await asyncio.sleep(0.05)
+            offset = response.json()["detail"]["offset"]
+            continue
+        response.raise_for_status()
+        if rng.random() < lost_rate:
+            # Không biết chunk đã tới chưa: gửi lại cả chunk từ offset cũ
+            stats["lost_responses"] += 1
+            continue
+        offset = response.json()["offset"]
+
+    while True:
+        response = await client.post(f"/api/uploads/{upload_id}/finalize",
+                                     json={"sha256": hashlib.sha256(audio).hexdigest()})
+        if response.status_code != 503:
+            break
+        stats["retries"] += 1
+        await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+    response.raise_for_status()
+    response = await client.post("/api/import-track", data={"title": "Bench upload", "sound_upload_id": upload_id})
+    finished = time.perf_counter()
+    return {
+        "status": response.status_code,
+        "song_id": response.json().get("mongodb_id"),
+        "seconds": finished - started,
+        "bytes_sent": progress["bytes"],
+        "after_last_byte_ms": (finished - progress["last_byte"]) * 1000,
+        **stats,
+    }
+
+
+def verify(storage, song_id, audio):
+    """Blob của bài vừa import giống hệt file gốc."""
+    from backend.utils.gcs import GCS_BUCKET_NAME
+    from backend.utils.mongodb import get_song_by_id
+
+    song = get_song_by_id(song_id) if song_id else None
+    if not song or not song.get("gcs_audio_blob"):
+        return False
+    with open(storage._path(GCS_BUCKET_NAME, song["gcs_audio_blob"]), "rb") as f:
+        return hashlib.sha256(f.read()).digest() == hashlib.sha256(audio).digest()
+
+
+async def run_client(base_url, storage, audio, args):
+    rng = random.Random(args.seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        multipart = await multipart_import(client, audio, "bench-multipart.mp3", int(len(audio) * args.cut_at / 100))
+        faults = FaultInjector(error_rate=args.storage_error_rate, seed=args.seed, fail_calls={2})
+        install_faults(storage, gcs=faults)
+        try:
+            resumable = await resumable_import(
+                client, audio, "bench-resumable.mp3", int(args.chunk_mb * 1024 * 1024),
+                args.drop_rate, args.lost_rate, rng,
+            )
+        finally:
+            install_faults(storage)
+        resumable["storage_errors"] = faults.errors
+        resumable["storage_puts"] = faults.calls
+    return multipart, resumable
+
+
+def run(args):
+    os.environ.setdefault("RATE_LIMITS", "false")
+    os.environ.setdefault("LIVE_UPDATES", "false")
+    os.environ.setdefault("HLS_PACKAGING", "false")   # chỉ đo upload
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    main, storage = install_standins(LocalStorage(base_url=base_url))
+    audio = make_mp3(duration=args.size_mb * 1024 * 1024 * 8 / 128_000)
+
+    with BackgroundServer(main.app, port), contextlib.redirect_stdout(io.StringIO()):
+        multipart, resumable = asyncio.run(run_client(base_url, storage, audio, args))
+
+    report = {"size_bytes": len(audio), "results": {}}
+    for name, result in (("multipart", multipart), ("resumable", resumable)):
+        result["verified"] = result["status"] == 200 and verify(storage, result.pop("song_id"), audio)
+        result["seconds"] = round(result["seconds"], 2)
+        result["after_last_byte_ms"] = round(result["after_last_byte_ms"], 1)
+        result["bytes_sent_ratio"] = round(result["bytes_sent"] / len(audio), 2)
+        report["results"][name] = result
+    # Upload phải chạy tiếp sau lỗi storage: blob đúng dù đã có PUT bị 503
+    resumable["verified"] = resumable["verified"] and resumable["storage_errors"] > 0
+    report["config"] = {
+        "chunk_mb": args.chunk_mb,
+        "cut_at_pct": args.cut_at,
+        "drop_rate": args.drop_rate,
+        "lost_rate": args.lost_rate,
+        "storage_error_rate": args.storage_error_rate,
+    }
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable vs multipart track upload under dropped connections")
+    parser.add_argument("--size-mb", type=float, default=40)
+    parser.add_argument("--chunk-mb", type=float, default=4)
+    parser.add_argument("--cut-at", type=float, default=90, help="Multipart: percent of the file sent before the cut")
+    parser.add_argument("--drop-rate", type=float, default=0.3, help="Resumable: chance a chunk is cut mid-way")
+    parser.add_argument("--lost-rate", type=float, default=0.1, help="Resumable: chance a chunk response is lost")
+    parser.add_argument("--storage-error-rate", type=float, default=0.2, help="Chance a storage chunk PUT fails (503)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"file: {report['size_bytes'] / 1e6:.1f} MB")
+        for name, r in report["results"].items():
+            extra = (f", {r['drops']} drops, {r['lost_responses']} lost responses, {r['storage_errors']} storage errors"
+                     if name == "resumable" else "")
+            print(f"{name:>10}: {r['seconds']}s, sent {r['bytes_sent_ratio']}x the file, "
+                  f"{r['after_last_byte_ms']} ms after the last byte, verified={r['verified']}{extra}")
+    sys.exit(0 if all(r["verified"] for r in report["results"].values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
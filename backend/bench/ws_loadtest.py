@@ -0,0 +1,228 @@
+"""
+Load test cho karaoke lyric sync (/ws/session/{id}).
+
+Khởi động app với stand-ins (như loadtest), mở 1 host và N follower trong cùng một
+session. Host gửi vị trí phát mỗi `--update-interval` giây; lyrics của bài được thay
+bằng LRC dày (`--line-spacing`) để có nhiều event đổi dòng.
+
+Đo:
+- connect: thời gian tới khi nhận `welcome`
+- state fan-out: lúc follower nhận event `state` trừ server_time của event
+  (client và server cùng máy nên cùng đồng hồ)
+- line margin: `at` của event `line` trừ lúc follower nhận được; dương = tới trước
+  khi dòng bắt đầu (server gửi sớm LINE_LEAD_MS)
+- resync: số lần queue của follower bị đầy. `--slow` follower chỉ đọc socket mỗi
+  `--slow-interval` giây để mô phỏng client chậm
+
+Client và server chạy chung một process nên số đo gồm cả thời gian tranh GIL;
+trên máy nhiều core, chạy server riêng sẽ cho latency thấp hơn.
+
+Usage:
+    uv run python -m backend.bench.ws_loadtest
+    uv run python -m backend.bench.ws_loadtest --followers 2000 --slow 50 --duration 20 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+
+import httpx
+from websockets.asyncio.client import connect
+
+from backend.bench.loadtest import BackgroundServer, find_free_port, percentile
+from backend.bench.standins import LocalStorage, install_standins, make_lrc, seed_catalog
+
+CONNECT_CONCURRENCY = 100
+
+
+def _latency_summary(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+class Follower:
+    def __init__(self, url, slow_interval=None):
+        self.url = url
+        self.slow_interval = slow_interval
+        self.connect_ms = None
+        self.state_ms = []
+        self.line_margin_ms = []
+        self.lines = 0
+        self.resyncs = 0
+
+    def handle(self, message):
+        received = time.time() * 1000
+        event = json.loads(message)
+        if event["type"] == "state":
+            self.state_ms.append(received - event["server_time"])
+        elif event["type"] == "line":
+            self.lines += 1
+            self.line_margin_ms.append(event["at"] - received)
+        elif event["type"] == "resync":
+            self.resyncs += 1
+
+    async def connect(self, stack):
+        started = time.perf_counter()
+        # max_queue nhỏ: follower chậm không đọc thì TCP đầy thật, server phải tự bảo vệ
+        websocket = await stack.enter_async_context(connect(self.url, max_queue=4, open_timeout=60))
+        await websocket.recv()
+        self.connect_ms = (time.perf_counter() - started) * 1000
+        return websocket
+
+    async def listen(self, websocket, deadline):
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return
+            if self.slow_interval:
+                await asyncio.sleep(min(self.slow_interval, timeout))
+                # Đọc hết những gì đang có rồi lại ngủ
+                while True:
+                    try:
+                        self.handle(await asyncio.wait_for(websocket.recv(), 0.001))
+                    except asyncio.TimeoutError:
+                        break
+                continue
+            try:
+                self.handle(await asyncio.wait_for(websocket.recv(), timeout))
+            except asyncio.TimeoutError:
+                return
+
+
+async def run_host(url, song_id, deadline, update_interval, start_position=4.0):
+    # make_lrc bắt đầu dòng đầu ở 5.0s: host vào bài từ 4.0s để có event ngay
+    async with connect(url) as websocket:
+        await websocket.recv()
+        started = time.monotonic() - start_position
+        sent = 0
+        while time.monotonic() < deadline:
+            await websocket.send(json.dumps({
+                "type": "position",
+                "song_id": song_id,
+                "position": time.monotonic() - started,
+                "playing": True,
+                "rtt": 0,
+            }))
+            sent += 1
+            await asyncio.sleep(update_interval)
+        return sent
+
+
+async def drive(base_url, song_id, followers, slow, duration, update_interval, slow_interval):
+    ws_url = base_url.replace("http://", "ws://") + "/ws/session/loadtest"
+    clients = [Follower(f"{ws_url}?role=follower", slow_interval if i < slow else None) for i in range(followers)]
+
+    async with contextlib.AsyncExitStack() as stack:
+        semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+        async def open_follower(client):
+            async with semaphore:
+                return await client.connect(stack)
+
+        started = time.perf_counter()
+        sockets = await asyncio.gather(*(open_follower(c) for c in clients))
+        connect_elapsed = time.perf_counter() - started
+
+        deadline = time.monotonic() + duration
+        listeners = [asyncio.create_task(c.listen(ws, deadline + 1.0)) for c, ws in zip(clients, sockets)]
+        updates = await run_host(f"{ws_url}?role=host", song_id, deadline, update_interval)
+
+        async with httpx.AsyncClient() as http:
+            hub_stats = (await http.get(f"{base_url}/api/debug/karaoke")).json()
+        await asyncio.gather(*listeners)
+
+    return clients, connect_elapsed, updates, hub_stats
+
+
+def run(followers=500, slow=0, duration=10.0, update_interval=1.0, line_spacing=0.5, slow_interval=2.0):
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    main, storage = install_standins(LocalStorage(base_url=base_url))
+
+    from backend.utils.gcs import GCS_BUCKET_NAME
+    from backend.utils.mongodb import get_song_by_id
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        song_id = seed_catalog(storage, 1)[0]
+    lrc = make_lrc(line_count=int(duration / line_spacing) + 20, spacing=line_spacing)
+    storage.upload_bytes(GCS_BUCKET_NAME, lrc.encode("utf-8"), get_song_by_id(song_id)["gcs_lrc_blob"])
+
+    with BackgroundServer(main.app, port), contextlib.redirect_stdout(io.StringIO()):
+        clients, connect_elapsed, updates, hub_stats = asyncio.run(
+            drive(base_url, song_id, followers, slow, duration, update_interval, slow_interval)
+        )
+
+    fast = clients[slow:]
+    return {
+        "config": {
+            "followers": followers,
+            "slow_followers": slow,
+            "duration_s": duration,
+            "update_interval_s": update_interval,
+            "line_spacing_s": line_spacing,
+            "line_lead_ms": main.karaoke_hub.line_lead_ms,
+            "queue_size": main.karaoke_hub.queue_size,
+        },
+        "connect": {
+            "elapsed_s": round(connect_elapsed, 2),
+            "latency_ms": _latency_summary([c.connect_ms for c in clients]),
+        },
+        "host_updates": updates,
+        "state_fanout_ms": _latency_summary([ms for c in fast for ms in c.state_ms]),
+        "line_margin_ms": _latency_summary([ms for c in fast for ms in c.line_margin_ms]),
+        "lines_per_follower": round(sum(c.lines for c in fast) / len(fast), 1) if fast else 0,
+        "late_lines": sum(1 for c in fast for ms in c.line_margin_ms if ms < 0),
+        "resyncs": {
+            "fast_followers": sum(c.resyncs for c in fast),
+            "slow_followers": sum(c.resyncs for c in clients[:slow]),
+        },
+        "hub": hub_stats,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the karaoke lyric sync WebSocket fan-out")
+    parser.add_argument("--followers", type=int, default=500)
+    parser.add_argument("--slow", type=int, default=0, help="How many followers read their socket only every --slow-interval seconds")
+    parser.add_argument("--slow-interval", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--update-interval", type=float, default=1.0, help="Seconds between host position updates")
+    parser.add_argument("--line-spacing", type=float, default=0.5, help="Seconds between lyric lines")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.followers, args.slow, args.duration, args.update_interval, args.line_spacing, args.slow_interval)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    config = report["config"]
+    print(f"{config['followers']} followers ({config['slow_followers']} slow), {config['duration_s']:g}s, "
+          f"host update every {config['update_interval_s']:g}s, line every {config['line_spacing_s']:g}s")
+    print(f"connect: {report['connect']['elapsed_s']}s total, {report['connect']['latency_ms']}")
+    print(f"state fan-out (ms): {report['state_fanout_ms']}")
+    print(f"line margin (ms, lead {config['line_lead_ms']}): {report['line_margin_ms']}")
+    print(f"lines/follower: {report['lines_per_follower']}, late lines: {report['late_lines']}")
+    print(f"resyncs: {report['resyncs']}, hub: {report['hub']}")
+
+
+if __name__ == "__main__":
+    main()
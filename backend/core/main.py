@@ -1,29 +1,416 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Request, Query, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.requests import ClientDisconnect
+from typing import Literal, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import math
 import os
+import shutil
 import tempfile
-import httpx
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Các module utils không tạo client (MongoDB/GCS/Gemini) lúc import;
+# client được tạo ở lần dùng đầu tiên hoặc prewarm trong lifespan.
 try:
     from backend.utils.mongodb import (
-        get_all_songs, get_song_by_id, update_song_metadata, delete_song_by_id
+        get_all_songs, get_song_list, get_song_by_id, update_song_metadata, delete_song_by_id,
+        get_songs_by_ids, delete_songs_by_ids,
+        ping as ping_mongodb, ensure_indexes, breaker as mongo_breaker
+    )
+    from backend.utils.gcs import (
+        generate_signed_url, GCS_BUCKET_NAME, delete_file, get_storage_client,
+        signed_url_ttl, signed_url_expires_at, SIGNED_URL_EXPIRATION, fetch_blob, upload_chunk
+    )
+    from backend.utils.utils import parse_lrc_content, build_lyric_schedule, lyrics_digest
+    from backend.utils.gemini import generate_robot_comment, get_client as get_gemini_client
+    from backend.utils.live import SongCollectionWatcher, LibraryEventBroker
+    from backend.utils.url_sweeper import (
+        STORE_SIGNED_URLS, URL_SWEEPER, SignedUrlSweeper, signed_url_fields, stored_signed_url
+    )
+    from backend.utils.hls import (
+        HLS_PACKAGING, PLAYLIST_CONTENT_TYPE, package_audio, publish_package, delete_package,
+        get_packager_pool, shutdown_packager_pool, master_playlist, segment_uris
+    )
+    from backend.utils.transcode import (
+        QUALITIES, transcoding_available, transcode_ladder, publish_renditions, delete_renditions,
+        choose_rendition
+    )
+    from backend.utils.blob_cleanup import (
+        BLOB_DELETE_RETRY, SONG_BLOB_PROJECTION, BlobDeleteRetrier, delete_blobs, song_blobs
     )
-    from backend.utils.gcs import generate_signed_url, GCS_BUCKET_NAME, delete_file
-    from backend.utils.utils import parse_lrc_content
-    from backend.utils.gemini import generate_robot_comment
 except ImportError:
     pass
 
-app = FastAPI(title="Music Player API", version="1.0.0")
+from backend.utils.breaker import CircuitOpenError, breakers_snapshot
+from backend.utils.cache import get_cache, song_tag, invalidate_song, invalidate_songs, SONGS_TAG
+from backend.utils.responses import (
+    FastJSONResponse, CompressionMiddleware, dumps, precompress, precompressed_response, MAX_BROTLI_QUALITY
+)
+from backend.utils.fingerprint import (
+    fingerprinting_available, fingerprint_file, find_duplicates, ensure_loaded as load_fingerprint_index,
+    get_fingerprint_index, index_song as index_fingerprint, unindex_song as unindex_fingerprint,
+    forget_songs as forget_fingerprints,
+    refresh_song as refresh_fingerprint, mark_stale as mark_fingerprint_index_stale
+)
+from backend.utils.karaoke import KaraokeHub
+from backend.utils.limits import AdmissionMiddleware, ConcurrencyGate, RoutePolicy
+from backend.utils.lyrics_search import (
+    ensure_loaded as load_lyrics_index, index_song, unindex_song, refresh_song, mark_stale as mark_lyrics_index_stale,
+    forget_songs as forget_lyrics
+)
+from backend.utils.metrics import MetricsMiddleware, get_metrics
+from backend.utils.play_events import PLAY_EVENTS, PlayEventBuffer, PlayEventsFull
+from backend.utils.snapshot import (
+    CATALOG_SNAPSHOT, SnapshotOverlay, SnapshotRefresher, changed_songs, get_snapshot, song_entry
+)
+from backend.utils.similarity import (
+    MAX_SIMILAR, similarity_available, similar as similar_songs, get_similarity_index,
+    ensure_loaded as load_similarity_index, refresh_song as refresh_similarity, unindex_song as unindex_similarity,
+    mark_stale as mark_similarity_index_stale
+)
+from backend.utils.tracing import TracingMiddleware, mark_error
+from backend.utils.uploads import (
+    UPLOAD_CHUNK_SIZE, UploadBusyError, UploadNotFoundError, UploadOffsetError,
+    create_session as create_upload_file, load_session as load_upload, save_session as save_upload,
+    write_chunk as write_upload_chunk, push_to_storage, finalize as finalize_upload_session,
+    discard as discard_upload, expired_sessions as expired_uploads, received as received_bytes,
+    spool_path, status as upload_status
+)
+from backend.utils.profiler import (
+    FORMATS as PROFILE_FORMATS, MAX_PROFILE_SECONDS, PROFILE_INTERVAL_MS, ProfilerBusyError, ProfilerMiddleware,
+    check_token, get_request_profile, list_request_profiles, profile_process, profiling_enabled
+)
 
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 IMPORT_PASSWORD = os.getenv("IMPORT_PASSWORD", "Bavinh2704!@#")
+PREWARM_CLIENTS = os.getenv("PREWARM_CLIENTS", "false").lower() in ("1", "true", "yes")
+# Tạo các index MongoDB khai báo trong backend/utils/mongodb.py (INDEXES) lúc startup
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "true").lower() in ("1", "true", "yes")
+
+# Cache TTLs (giây)
+SONG_LIST_CACHE_TTL = int(os.getenv("SONG_LIST_CACHE_TTL", "300"))
+LYRICS_CACHE_TTL = int(os.getenv("LYRICS_CACHE_TTL", "86400"))
+SIGNED_URL_REFRESH_MARGIN = 120           # Làm mới signed URL trước khi hết hạn 2 phút
+UNKNOWN_EXPIRY_URL_CACHE_TTL = 60         # URL không đọc được expiry: chỉ cache ngắn
+# Bản dự phòng khi MongoDB / GCS lỗi: blob path (để ký lại signed URL local) và lyrics đã parse
+STALE_CACHE_TTL = int(os.getenv("STALE_CACHE_TTL", "604800"))
+
+# Theo dõi collection bài hát (change stream / polling) và push event qua SSE
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "true").lower() in ("1", "true", "yes")
+SSE_HEARTBEAT_INTERVAL = 15.0
+
+# Số bài tối đa trả về trong một session bundle (/api/session/next)
+MAX_SESSION_PREFETCH = 10
+
+# Số bài tối đa trả về khi tìm theo lời bài hát (/api/search/lyrics)
+MAX_LYRICS_SEARCH_RESULTS = 50
+
+# Lời bài hát trong prompt của robot Mắm Chan: bản rút gọn (lyrics_digest) tối đa ROBOT_LYRICS_TOKENS token
+ROBOT_LYRICS_TOKENS = int(os.getenv("ROBOT_LYRICS_TOKENS", "300"))
+MAX_ROBOT_TITLE_CHARS = 200
+
+# Số bài tối đa trong một request DELETE /api/tracks
+MAX_BULK_DELETE = int(os.getenv("MAX_BULK_DELETE", "500"))
+
+# Số event tối đa trong một request POST /api/events
+MAX_EVENTS_PER_BATCH = int(os.getenv("MAX_EVENTS_PER_BATCH", "500"))
+
+# Rate limit (request / phút, burst) theo client và giới hạn đồng thời cho upload / Gemini
+RATE_LIMITS = os.getenv("RATE_LIMITS", "true").lower() in ("1", "true", "yes")
+ROBOT_RATE_PER_MINUTE = int(os.getenv("ROBOT_RATE_PER_MINUTE", "10"))
+ROBOT_GLOBAL_RATE_PER_MINUTE = int(os.getenv("ROBOT_GLOBAL_RATE_PER_MINUTE", "60"))   # quota Gemini
+IMPORT_RATE_PER_MINUTE = int(os.getenv("IMPORT_RATE_PER_MINUTE", "6"))
+VERIFY_PASSWORD_RATE_PER_MINUTE = int(os.getenv("VERIFY_PASSWORD_RATE_PER_MINUTE", "5"))
+EVENTS_RATE_PER_MINUTE = int(os.getenv("EVENTS_RATE_PER_MINUTE", "60"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "2"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+_http_client = None
+
+
+def get_http_client():
+    """Shared httpx.AsyncClient (keep-alive tới GCS), tạo ở lần dùng đầu tiên."""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient()
+    return _http_client
+
+
+def prewarm_clients():
+    """Create the MongoDB, GCS and Gemini clients before the first request needs them."""
+    for name, warm in (("MongoDB", ping_mongodb), ("GCS", get_storage_client), ("Gemini", get_gemini_client)):
+        try:
+            warm()
+            print(f"✅ Prewarmed {name} client")
+        except Exception as e:
+            print(f"Warning: Could not prewarm {name} client: {e}")
+
+
+def bootstrap_indexes():
+    try:
+        print(f"✅ MongoDB indexes: {', '.join(ensure_indexes())}")
+    except Exception as e:
+        print(f"Warning: Could not ensure MongoDB indexes: {e}")
+
+
+def get_backend_url():
+    backend_url = os.getenv('BACKEND_URL')
+    if not backend_url:
+        host = os.getenv('BACKEND_HOST', '127.0.0.1')
+        port = os.getenv('BACKEND_PORT', '8000')
+        backend_url = f"http://{host}:{port}"
+    return backend_url
+
+
+def song_summary(song: dict, backend_url: str):
+    """Song item như trong response của /api/songs"""
+    song_id = song["_id"]
+    return {
+        "id": song_id,
+        "title": song.get("title", "Unknown"),
+        "audioUrl": f"{backend_url}/api/audio/{song_id}",
+        "audioFormat": song.get("audio_format"),
+        "hasLyrics": song.get("has_lyrics", False),
+        "hlsUrl": f"{backend_url}/api/audio/{song_id}/hls/master.m3u8" if song.get("hls") else None
+    }
+
+
+library_events = LibraryEventBroker()
+
+
+def preload_lyrics_index():
+    try:
+        load_lyrics_index()
+    except Exception as e:
+        print(f"Warning: Could not load lyrics index: {e}")
+
+
+def sync_lyrics_index(change_type: str, song_id: Optional[str]):
+    """Cập nhật lyrics search index khi bài hát được import / update / xoá ở worker khác."""
+    if change_type == "reset":
+        mark_lyrics_index_stale()
+        return
+    try:
+        refresh_song(song_id)
+    except Exception as e:
+        print(f"Warning: Could not refresh lyrics index for {song_id}: {e}")
+
+
+def preload_fingerprint_index():
+    try:
+        load_fingerprint_index()
+    except Exception as e:
+        print(f"Warning: Could not load fingerprint index: {e}")
+
+
+def sync_fingerprint_index(change_type: str, song_id: Optional[str]):
+    """Cập nhật fingerprint index khi bài hát được import / đổi audio / xoá ở worker khác."""
+    if change_type == "reset":
+        mark_fingerprint_index_stale()
+        return
+    try:
+        refresh_fingerprint(song_id)
+    except Exception as e:
+        print(f"Warning: Could not refresh fingerprint index for {song_id}: {e}")
+
+
+def preload_similarity_index():
+    try:
+        load_similarity_index()
+    except Exception as e:
+        print(f"Warning: Could not load similarity index: {e}")
+
+
+def sync_similarity_index(change_type: str, song_id: Optional[str]):
+    """Cập nhật index bài tương tự khi bài hát được import / đổi title, lyrics / xoá ở worker khác."""
+    if change_type == "reset":
+        mark_similarity_index_stale()
+        return
+    try:
+        refresh_similarity(song_id)
+    except Exception as e:
+        print(f"Warning: Could not refresh similarity index for {song_id}: {e}")
+
+
+def handle_library_change(change_type: str, song_id: Optional[str], song: Optional[dict]):
+    """Called by the song watcher: invalidate caches and push the change to SSE clients."""
+    if CATALOG_SNAPSHOT:
+        # Snapshot chưa có thay đổi này: đè lên danh sách bài tới lần refresh kế tiếp
+        if change_type == "reset" or (change_type != "remove" and not song):
+            catalog_overlay.mark_stale()
+        else:
+            catalog_overlay.record(song_id, song_entry(song) if song else None)
+    invalidate_song(song_id)
+    sync_lyrics_index(change_type, song_id)
+    sync_fingerprint_index(change_type, song_id)
+    if similarity_available():
+        sync_similarity_index(change_type, song_id)
+    event = {"type": change_type}
+    if song_id:
+        event["id"] = song_id
+    if song:
+        event["song"] = song_summary(song, get_backend_url())
+    library_events.publish(event)
+
+
+# Giữ reference tới các task xử lý audio (HLS, transcode) đang chạy nền
+_media_tasks = set()
+
+
+def media_jobs_enabled():
+    return HLS_PACKAGING or transcoding_available()
+
+
+async def audio_is_current(song_id: str, audio_blob: str):
+    """Bài vẫn còn và chưa đổi file audio kể từ lúc job bắt đầu"""
+    song = await run_in_threadpool(get_song_by_id, song_id)
+    if song and song.get("gcs_audio_blob") == audio_blob:
+        return song
+    return None
+
+
+async def package_track(song_id: str, source_path: str, audio_format: str, audio_blob: str):
+    """Đóng gói HLS (process pool), upload segment + playlist lên GCS và lưu vào song document."""
+    out_dir = tempfile.mkdtemp(prefix="tunify-hls-")
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(get_packager_pool(), package_audio, source_path, out_dir, audio_format)
+        hls = await run_in_threadpool(publish_package, song_id, out_dir, result)
+
+        # Bài đã bị xóa hoặc đổi file audio trong lúc đóng gói: package này không còn dùng
+        song = await audio_is_current(song_id, audio_blob)
+        if not song:
+            await run_in_threadpool(delete_package, hls)
+            return
+        await run_in_threadpool(update_song_metadata, song_id, {"hls": hls})
+        if song.get("hls"):
+            await run_in_threadpool(delete_package, song["hls"])
+        print(f"✅ HLS packaged {song_id}: {len(hls['variants'])} variant(s), {hls['duration']}s ({hls['packager']})")
+    except Exception as e:
+        print(f"Warning: HLS packaging failed for {song_id}: {e}")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+async def transcode_track(song_id: str, source_path: str, audio_blob: str):
+    """Transcode ladder (process pool), upload renditions lên GCS và lưu vào song document."""
+    out_dir = tempfile.mkdtemp(prefix="tunify-transcode-")
+    try:
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(get_packager_pool(), transcode_ladder, source_path, out_dir)
+        renditions = await run_in_threadpool(publish_renditions, song_id, out_dir, results)
+
+        song = await audio_is_current(song_id, audio_blob)
+        if not song:
+            await run_in_threadpool(delete_renditions, renditions)
+            return
+        await run_in_threadpool(update_song_metadata, song_id, {"renditions": renditions})
+        if song.get("renditions"):
+            await run_in_threadpool(delete_renditions, song["renditions"])
+        sizes = ", ".join(f"{r['name']} {r['bytes'] // 1024}KB" for r in renditions)
+        print(f"✅ Transcoded {song_id}: {sizes}")
+    except Exception as e:
+        print(f"Warning: Transcoding failed for {song_id}: {e}")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+async def process_audio(song_id: str, source_path: str, audio_format: str, audio_blob: str):
+    """Chạy các job xử lý audio song song cho một bài vừa upload, rồi xóa file tạm source_path."""
+    try:
+        jobs = []
+        if HLS_PACKAGING:
+            jobs.append(package_track(song_id, source_path, audio_format, audio_blob))
+        if transcoding_available():
+            jobs.append(transcode_track(song_id, source_path, audio_blob))
+        await asyncio.gather(*jobs)
+    finally:
+        os.unlink(source_path)
+
+
+def schedule_audio_processing(song_id: str, source_path: str, audio_format: str, audio_blob: str):
+    task = asyncio.create_task(process_audio(song_id, source_path, audio_format, audio_blob))
+    _media_tasks.add(task)
+    task.add_done_callback(_media_tasks.discard)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PREWARM_CLIENTS:
+        # Chạy nền để không chặn startup (server nhận request ngay)
+        threading.Thread(target=prewarm_clients, name="prewarm-clients", daemon=True).start()
+    if ENSURE_INDEXES:
+        threading.Thread(target=bootstrap_indexes, name="mongo-indexes", daemon=True).start()
+    # Build lyrics search index nền (một query tới collection lyrics_lines); snapshot đã có sẵn index
+    if not CATALOG_SNAPSHOT:
+        threading.Thread(target=preload_lyrics_index, name="lyrics-index", daemon=True).start()
+    if fingerprinting_available():
+        threading.Thread(target=preload_fingerprint_index, name="fingerprint-index", daemon=True).start()
+    if similarity_available():
+        threading.Thread(target=preload_similarity_index, name="similarity-index", daemon=True).start()
+    watcher = None
+    if LIVE_UPDATES:
+        watcher = SongCollectionWatcher(handle_library_change)
+        watcher.start()
+    if STORE_SIGNED_URLS and URL_SWEEPER:
+        url_sweeper.start()
+    if BLOB_DELETE_RETRY:
+        blob_delete_retrier.start()
+    if CATALOG_SNAPSHOT:
+        # Map file đã có ngay (vài ms), export / tải bản mới ở nền
+        load_catalog_snapshot()
+        snapshot_refresher.start()
+    if PLAY_EVENTS:
+        play_events.start()
+    yield
+    if PLAY_EVENTS:
+        # Flush lần cuối các event chưa ghi
+        play_events.stop()
+    url_sweeper.stop()
+    blob_delete_retrier.stop()
+    snapshot_refresher.stop()
+    if watcher is not None:
+        watcher.stop()
+    shutdown_packager_pool()
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+app = FastAPI(title="Music Player API", version="1.0.0", lifespan=lifespan)
+
+upload_gate = ConcurrencyGate("upload", UPLOAD_CONCURRENCY, max_wait=2.0, retry_after=10)
+llm_gate = ConcurrencyGate("llm", LLM_CONCURRENCY, max_wait=1.0, retry_after=5)
+
+# Trong CORS (response 429 / 503 vẫn có CORS headers), từ chối trước khi đọc body upload
+app.add_middleware(
+    AdmissionMiddleware,
+    enabled=RATE_LIMITS,
+    policies=[
+        RoutePolicy("POST", "/api/robot-comment", per_client=(ROBOT_RATE_PER_MINUTE, 5),
+                    global_rate=(ROBOT_GLOBAL_RATE_PER_MINUTE, 10), gate=llm_gate),
+        RoutePolicy("POST", "/api/import-track", per_client=(IMPORT_RATE_PER_MINUTE, 3), gate=upload_gate),
+        RoutePolicy("PUT", "/api/track/{song_id}", per_client=(IMPORT_RATE_PER_MINUTE, 3), gate=upload_gate),
+        RoutePolicy("DELETE", "/api/tracks", per_client=(IMPORT_RATE_PER_MINUTE, 3)),
+        RoutePolicy("POST", "/api/events", per_client=(EVENTS_RATE_PER_MINUTE, 10)),
+        RoutePolicy("POST", "/api/uploads", per_client=(IMPORT_RATE_PER_MINUTE, 3)),
+        RoutePolicy("PUT", "/api/uploads/{upload_id}", gate=upload_gate),
+        RoutePolicy("POST", "/api/verify-import-password", per_client=(VERIFY_PASSWORD_RATE_PER_MINUTE, 5)),
+    ],
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +420,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / br cho các response JSON lớn (route đã nén sẵn thì middleware bỏ qua)
+app.add_middleware(CompressionMiddleware)
+
+# Ngoài cùng: đo latency mọi request, kể cả request bị limiter từ chối
+app.add_middleware(MetricsMiddleware)
+
+# Profile các request có header X-Profile (chỉ cài khi có ADMIN_TOKEN)
+if profiling_enabled():
+    app.add_middleware(ProfilerMiddleware)
+
+# Ngoài cùng: request ID (X-Request-ID) cho mọi response, trace + span khi đặt TRACE_EXPORT
+app.add_middleware(TracingMiddleware)
+
 
 @app.get("/")
 async def root():
@@ -44,46 +444,274 @@ async def root():
 async def debug_songs():
     """Debug endpoint to check raw MongoDB data"""
     try:
-        songs_from_db = get_all_songs()
-        return {"songs": songs_from_db, "total": len(songs_from_db)}
+        songs_from_db = await run_in_threadpool(get_all_songs)
+        return FastJSONResponse({"songs": songs_from_db, "total": len(songs_from_db)})
+    except Exception as e:
+        return FastJSONResponse({"error": str(e)})
+
+
+@app.get("/api/metrics")
+async def get_metrics_snapshot():
+    """Latency theo route, số request bị limiter từ chối, concurrency gates và circuit breakers (của worker này)"""
+    return get_metrics().snapshot()
+
+
+get_metrics().register_gauge("gates", lambda: {gate.name: gate.stats() for gate in (upload_gate, llm_gate)})
+get_metrics().register_gauge("breakers", breakers_snapshot)
+
+
+def require_admin(token: Optional[str]):
+    """Các endpoint /api/admin/*: 404 khi chưa đặt ADMIN_TOKEN, 401 khi sai token"""
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not check_token(token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def profile_response(profile, fmt: str):
+    if fmt == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    if fmt == "speedscope":
+        return FastJSONResponse(profile.speedscope(), headers={
+            "Content-Disposition": f'attachment; filename="{profile.id}.speedscope.json"'
+        })
+    return FastJSONResponse(profile.summary())
+
+
+@app.get("/api/admin/profile")
+async def profile_worker(
+    seconds: float = Query(default=10, gt=0, le=MAX_PROFILE_SECONDS),
+    format: str = Query(default="collapsed", pattern=f"^({'|'.join(PROFILE_FORMATS)})$"),
+    idle: bool = Query(default=False),
+    interval_ms: float = Query(default=PROFILE_INTERVAL_MS, ge=1, le=100),
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """Sample stack mọi thread của worker này trong `seconds` giây (collapsed stacks / speedscope JSON)"""
+    require_admin(x_admin_token)
+    try:
+        profile = await profile_process(seconds, interval_ms, idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profile_response(profile, format)
+
+
+@app.get("/api/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(default=None)):
+    """Các request đã profile gần đây (gửi kèm header X-Profile: <ADMIN_TOKEN>)"""
+    require_admin(x_admin_token)
+    return {"profiles": list_request_profiles()}
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query(default="collapsed", pattern=f"^({'|'.join(PROFILE_FORMATS)})$"),
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """Profile của một request (id trong response header X-Profile-Id)"""
+    require_admin(x_admin_token)
+    profile = get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile_response(profile, format)
+
+
+@app.exception_handler(StarletteHTTPException)
+async def traced_http_exception_handler(request: Request, exc: StarletteHTTPException):
+    """Handler mặc định của FastAPI; lỗi 5xx được ghi kèm detail vào trace của request"""
+    if exc.status_code >= 500:
+        mark_error(f"HTTP {exc.status_code}: {exc.detail}")
+    return await http_exception_handler(request, exc)
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Dependency đang bị ngắt (breaker open) và route không có fallback: 503 ngay"""
+    return FastJSONResponse(
+        {"detail": f"{exc.name} tạm thời không khả dụng, vui lòng thử lại sau"},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+@app.get("/api/debug/cache")
+async def debug_cache():
+    """Debug endpoint to check cache hit ratios"""
+    return get_cache().stats()
+
+
+def get_cached_songs():
+    """
+    Danh sách bài hát từ catalog snapshot (cùng các thay đổi sau lúc export) nếu có, không thì từ
+    MongoDB (chỉ các field cần cho danh sách, covered query), qua cache
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None and not catalog_overlay.stale:
+        return catalog_overlay.songs(snapshot)
+    return get_cache().get_or_set("songs:all", get_song_list, ttl=SONG_LIST_CACHE_TTL, tags=[SONGS_TAG])
+
+
+_catalog_ids = (None, frozenset())
+
+
+def catalog_song_ids():
+    """
+    Tập _id của danh sách bài (get_cached_songs), chỉ build lại khi danh sách đổi.
+    MongoDB lỗi khi cache hết hạn: dùng tập đã build lần trước (nếu có).
+    """
+    global _catalog_ids
+    try:
+        songs = get_cached_songs()
     except Exception as e:
-        return {"error": str(e)}
+        if _catalog_ids[0] is None or not mongo_breaker.unavailable(e):
+            raise
+        return _catalog_ids[1]
+    if _catalog_ids[0] is not songs:
+        _catalog_ids = (songs, frozenset(song["_id"] for song in songs))
+    return _catalog_ids[1]
+
+
+def current_lyrics_index():
+    """Lyrics search index: của catalog snapshot nếu có, không thì build từ MongoDB"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.lyrics_index()
+    return load_lyrics_index()
+
+
+def reload_catalog_snapshot(old, new):
+    """Snapshot mới được map: bỏ cache (body /api/songs, lyrics) của các bài đã đổi."""
+    catalog_overlay.rebase(new)
+    if old is None:
+        invalidate_song()
+        return
+    changed = changed_songs(old, new)
+    if changed:
+        invalidate_songs(changed)
+        library_events.publish({"type": "resync"})
+
+
+catalog_overlay = SnapshotOverlay()
+snapshot_refresher = SnapshotRefresher(on_reload=reload_catalog_snapshot)
+get_metrics().register_gauge(
+    "catalog_snapshot",
+    lambda: {**snapshot_refresher.stats(), "overlay": catalog_overlay.stats()} if CATALOG_SNAPSHOT else None,
+)
+
+
+def load_catalog_snapshot():
+    try:
+        snapshot_refresher.reload()
+    except Exception as e:
+        print(f"Warning: Could not map catalog snapshot {CATALOG_SNAPSHOT}: {e}")
+
+
+def build_songs_body():
+    """Body của /api/songs đã encode + nén sẵn (cache cùng tag với danh sách bài hát)"""
+    backend_url = get_backend_url()
+    songs = [song_summary(song, backend_url) for song in get_cached_songs()]
+    return precompress(dumps({"songs": songs, "total": len(songs)}))
 
 
 @app.get("/api/songs")
-async def get_songs():
-    """Lấy danh sách tất cả bài hát từ MongoDB"""
-    try:
-        songs_from_db = get_all_songs()
-        songs = []
-        
-        backend_url = os.getenv('BACKEND_URL')
-        if not backend_url:
-            host = os.getenv('BACKEND_HOST', '127.0.0.1')
-            port = os.getenv('BACKEND_PORT', '8000')
-            backend_url = f"http://{host}:{port}"
-        
-        for song in songs_from_db:
-            song_id = song["_id"]
-            songs.append({
-                "id": song_id,
-                "title": song.get("title", "Unknown"),
-                "audioUrl": f"{backend_url}/api/audio/{song_id}",
-                "audioFormat": song.get("audio_format"),
-                "hasLyrics": song.get("has_lyrics", False)
-            })
-        
-        return {"songs": songs, "total": len(songs)}
+async def get_songs(request: Request):
+    """Lấy danh sách tất cả bài hát (từ catalog snapshot hoặc MongoDB)"""
+    try:
+        bodies = await run_in_threadpool(
+            get_cache().get_or_set, "songs:body", build_songs_body, SONG_LIST_CACHE_TTL, [SONGS_TAG]
+        )
+        return precompressed_response(request, bodies)
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get songs: {str(e)}")
 
 
+@app.get("/api/songs/events")
+async def song_events(request: Request):
+    """
+    Server-Sent Events: push thay đổi của thư viện (add/update/remove) để client
+    patch state thay vì tải lại toàn bộ /api/songs. Event "resync" nghĩa là client
+    bị tụt lại quá xa và nên fetch lại danh sách.
+    """
+    subscriber = library_events.subscribe()
+    _, queue = subscriber
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"id: {event['seq']}\nevent: song\ndata: {data}\n\n"
+        finally:
+            library_events.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def fallback_signed_url(song_id: str, blob_field: str):
+    """
+    Signed URL khi MongoDB không trả lời: ký lại (local, không gọi mạng) từ blob path
+    đã cache ở lần đọc bài hát gần nhất. None nếu chưa từng đọc bài này.
+    """
+    blob_path = get_cache().get(f"blob:{song_id}:{blob_field}")
+    if not blob_path:
+        return None
+    get_metrics().inc("dependency_fallbacks", dependency="mongodb", fallback="signed_url")
+    return generate_signed_url(GCS_BUCKET_NAME, blob_path)
+
+
+def cache_signed_url(song_id: str, url_field: str, url: str, expires_at: float):
+    """Đưa URL vừa được sweeper ký lại vào cache (request sau không cần đọc MongoDB)."""
+    ttl = expires_at - time.time() - SIGNED_URL_REFRESH_MARGIN
+    if ttl > 0:
+        get_cache().set(f"url:{song_id}:{url_field}", url, ttl=ttl, tags=[song_tag(song_id)])
+
+
+url_sweeper = SignedUrlSweeper(on_refresh=cache_signed_url)
+get_metrics().register_gauge("url_sweeper", url_sweeper.stats)
+blob_delete_retrier = BlobDeleteRetrier()
+get_metrics().register_gauge("blob_delete_retry", blob_delete_retrier.stats)
+play_events = PlayEventBuffer()
+get_metrics().register_gauge("play_events", lambda: play_events.stats() if PLAY_EVENTS else None)
+get_metrics().register_gauge("fingerprints", lambda: get_fingerprint_index().stats() if fingerprinting_available() else None)
+get_metrics().register_gauge("similarity", lambda: get_similarity_index().stats() if similarity_available() else None)
+
+
 async def get_valid_signed_url(song_id: str, url_field: str, blob_field: str):
     """
     Get a valid signed URL for audio or lyrics file.
-    If URL is expired, generate a new one.
+    Served from cache while it has more than SIGNED_URL_REFRESH_MARGIN left;
+    otherwise the stored URL is reused if still valid, or a new one is generated.
+    URL mới chỉ được ghi vào MongoDB khi không có sweeper (sweeper ghi hàng loạt ở lượt sau).
+    MongoDB lỗi / breaker open: ký lại từ blob path đã cache (fallback_signed_url); không có thì
+    lỗi MongoDB được raise nguyên vẹn để route trả 503 (hoặc caller dùng fallback riêng).
     """
-    song = get_song_by_id(song_id)
+    cache = get_cache()
+    cache_key = f"url:{song_id}:{url_field}"
+    cached_url = cache.get(cache_key)
+    if cached_url:
+        return cached_url
+    since_seq = cache.current_seq()
+
+    try:
+        song = await run_in_threadpool(get_song_by_id, song_id)
+    except Exception as e:
+        url = fallback_signed_url(song_id, blob_field) if mongo_breaker.unavailable(e) else None
+        if url is None:
+            raise
+        return url
     
     if not song:
         raise HTTPException(status_code=404, detail="Không tìm thấy bài hát")
@@ -94,58 +722,425 @@ async def get_valid_signed_url(song_id: str, url_field: str, blob_field: str):
     if not blob_path:
         raise HTTPException(status_code=404, detail=f"Không tìm thấy file")
     
-    # Check if URL exists and is still valid
+    tags = [song_tag(song_id)]
+    cache.set(f"blob:{song_id}:{blob_field}", blob_path, ttl=STALE_CACHE_TTL, tags=tags, since_seq=since_seq)
+
+    # Check if URL exists and is still valid (đọc expiry từ URL, chỉ HEAD khi không đọc được)
     if current_url:
-        async with httpx.AsyncClient() as client:
+        ttl = signed_url_ttl(current_url)
+        if ttl is not None:
+            if ttl > SIGNED_URL_REFRESH_MARGIN:
+                cache.set(cache_key, current_url, ttl=ttl - SIGNED_URL_REFRESH_MARGIN, tags=tags, since_seq=since_seq)
+                return current_url
+        else:
             try:
-                response = await client.head(current_url, follow_redirects=True, timeout=10.0)
+                response = await get_http_client().head(current_url, follow_redirects=True, timeout=10.0)
                 if response.status_code == 200:
-                    return current_url, song
+                    cache.set(cache_key, current_url, ttl=UNKNOWN_EXPIRY_URL_CACHE_TTL, tags=tags, since_seq=since_seq)
+                    return current_url
             except Exception:
                 pass
     
     # URL expired or doesn't exist, generate new one
     try:
         new_url = generate_signed_url(GCS_BUCKET_NAME, blob_path)
-        update_song_metadata(song_id, {url_field: new_url})
-        return new_url, song
+        if STORE_SIGNED_URLS and not url_sweeper.running:
+            try:
+                await run_in_threadpool(update_song_metadata, song_id, signed_url_fields(url_field, new_url))
+            except Exception as e:
+                # Lưu URL vào MongoDB chỉ để dùng lại lần sau: URL mới vẫn hợp lệ
+                if not mongo_breaker.unavailable(e):
+                    raise
+                print(f"Warning: Could not store signed URL for {song_id}: {e}")
+        ttl = signed_url_ttl(new_url) or SIGNED_URL_EXPIRATION.total_seconds()
+        cache.set(cache_key, new_url, ttl=ttl - SIGNED_URL_REFRESH_MARGIN, tags=tags, since_seq=since_seq)
+        return new_url
     except Exception as e:
+        if mongo_breaker.unavailable(e):
+            raise
         raise HTTPException(status_code=500, detail=f"Failed to get valid URL: {str(e)}")
 
 
+async def load_lyrics(song_id: str):
+    """
+    Parsed lyrics của một bài (qua cache), tải file LRC từ GCS khi cache miss.
+    GCS / MongoDB lỗi hoặc breaker open: dùng bản `lyrics:stale:` (giữ STALE_CACHE_TTL) nếu có.
+    Có catalog snapshot: đọc thẳng từ snapshot (bài chưa có trong snapshot hoặc đã đổi sau lúc
+    export vẫn đi đường trên).
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None and song_id not in catalog_overlay and not catalog_overlay.stale:
+        lyrics_data = snapshot.lyrics(song_id)
+        if lyrics_data is not None:
+            return lyrics_data
+
+    cache = get_cache()
+    cache_key = f"lyrics:{song_id}"
+    lyrics_data = cache.get(cache_key)
+    if lyrics_data is not None:
+        return lyrics_data
+    since_seq = cache.current_seq()
+
+    try:
+        valid_url = await get_valid_signed_url(song_id, "gcs_lrc_path", "gcs_lrc_blob")
+        response = await fetch_blob(get_http_client(), valid_url)
+    except HTTPException:
+        raise
+    except Exception as e:
+        stale = cache.get(f"lyrics:stale:{song_id}")
+        if stale is None:
+            raise
+        if isinstance(e, CircuitOpenError):
+            dependency = e.name
+        else:
+            dependency = "mongodb" if mongo_breaker.is_failure(e) else "gcs"
+        get_metrics().inc("dependency_fallbacks", dependency=dependency, fallback="lyrics")
+        return stale
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=404, detail="Không thể tải file lời bài hát")
+    
+    lyrics_data = parse_lrc_content(response.text)
+    tags = [song_tag(song_id)]
+    cache.set(cache_key, lyrics_data, ttl=LYRICS_CACHE_TTL, tags=tags, since_seq=since_seq)
+    cache.set(f"lyrics:stale:{song_id}", lyrics_data, ttl=STALE_CACHE_TTL, tags=tags, since_seq=since_seq)
+    return lyrics_data
+
+
 @app.get("/api/lyrics/{song_id}")
-async def get_lyrics(song_id: str):
-    """Lấy lời bài hát từ GCS và parse sang JSON"""
+async def get_lyrics(request: Request, song_id: str, schedule: bool = False):
+    """
+    Lấy lời bài hát từ GCS và parse sang JSON (body encode + nén một lần rồi cache).
+    schedule=1: kèm timing đã tính sẵn cho từng dòng / từ (build_lyric_schedule).
+    """
     try:
-        valid_url, song = await get_valid_signed_url(song_id, "gcs_lrc_path", "gcs_lrc_blob")
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(valid_url, timeout=30.0)
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Không thể tải file lời bài hát")
+        cache = get_cache()
+        cache_key = f"lyrics:body:schedule:{song_id}" if schedule else f"lyrics:body:{song_id}"
+        bodies = cache.get(cache_key)
+        if bodies is None:
+            since_seq = cache.current_seq()
+            lyrics_data = await load_lyrics(song_id)
+            content = {"songId": song_id, "lyrics": lyrics_data}
+            if schedule:
+                content["schedule"] = build_lyric_schedule(lyrics_data)
+            # Brotli 11 tốn vài chục tới vài trăm ms với lyrics dài: chạy ngoài event loop
+            bodies = await run_in_threadpool(precompress, dumps(content), MAX_BROTLI_QUALITY)
+            cache.set(cache_key, bodies, ttl=LYRICS_CACHE_TTL, tags=[song_tag(song_id)], since_seq=since_seq)
+        return precompressed_response(request, bodies)
             
-            lyrics_data = parse_lrc_content(response.text)
-            return {"songId": song_id, "lyrics": lyrics_data}
-            
-    except HTTPException:
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi lấy lyrics: {str(e)}")
 
 
+async def resolve_session_track(song: dict, backend_url: str):
+    """Signed audio URL + lyrics của một bài, chạy song song"""
+    song_id = song["_id"]
+    track = song_summary(song, backend_url)
+
+    async def signed_audio():
+        if not song.get("gcs_audio_blob"):
+            return None
+        return await get_valid_signed_url(song_id, "gcs_audio_path", "gcs_audio_blob")
+
+    async def lyrics():
+        if not song.get("has_lyrics") or not song.get("gcs_lrc_blob"):
+            return None
+        return await load_lyrics(song_id)
+
+    audio_result, lyrics_result = await asyncio.gather(signed_audio(), lyrics(), return_exceptions=True)
+
+    errors = {}
+    if isinstance(audio_result, Exception):
+        errors["audio"] = getattr(audio_result, "detail", str(audio_result))
+        audio_result = None
+    if isinstance(lyrics_result, Exception):
+        errors["lyrics"] = getattr(lyrics_result, "detail", str(lyrics_result))
+        lyrics_result = None
+
+    track["signedAudioUrl"] = audio_result
+    track["signedAudioUrlExpiresAt"] = signed_url_expires_at(audio_result) if audio_result else None
+    track["lyrics"] = lyrics_result
+    if errors:
+        track["errors"] = errors
+    return track
+
+
+@app.get("/api/session/next")
+async def get_session_next(
+    after: Optional[str] = None,
+    n: int = Query(default=3, ge=1, le=MAX_SESSION_PREFETCH)
+):
+    """
+    Session bundle cho n bài tiếp theo sau bài `after` (theo thứ tự playlist, quay vòng):
+    signed audio URL, lyrics đã parse và metadata, để client prefetch trước khi chuyển bài.
+    """
+    try:
+        songs = await run_in_threadpool(get_cached_songs)
+        if not songs:
+            return {"after": after, "tracks": []}
+
+        start = 0
+        if after:
+            index = next((i for i, song in enumerate(songs) if song["_id"] == after), None)
+            if index is None:
+                raise HTTPException(status_code=404, detail="Không tìm thấy bài hát")
+            start = index + 1
+
+        count = min(n, len(songs) - 1 if after else len(songs))
+        upcoming = [songs[(start + i) % len(songs)] for i in range(count)]
+        backend_url = get_backend_url()
+        tracks = await asyncio.gather(*(resolve_session_track(song, backend_url) for song in upcoming))
+        return FastJSONResponse({"after": after, "tracks": tracks})
+
+    except (HTTPException, CircuitOpenError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build session bundle: {str(e)}")
+
+
+# Karaoke nhiều thiết bị: host gửi vị trí phát, follower nhận event đổi dòng lyric
+karaoke_hub = KaraokeHub(load_lyrics=load_lyrics)
+get_metrics().register_gauge("karaoke", karaoke_hub.stats)
+
+
+@app.websocket("/ws/session/{session_id}")
+async def karaoke_session(websocket: WebSocket, session_id: str, role: str = "follower", token: Optional[str] = None):
+    """Lyric sync cho một karaoke session (xem backend/utils/karaoke.py cho protocol)"""
+    await karaoke_hub.serve(websocket, session_id, role, token)
+
+
+@app.get("/api/debug/karaoke")
+async def debug_karaoke():
+    """Debug endpoint: số session / connection đang mở và số lần follower bị resync"""
+    return karaoke_hub.stats()
+
+
+def load_renditions(song_id: str):
+    """(audio_format, renditions) của một bài, qua cache"""
+    def load():
+        song = get_song_by_id(song_id)
+        if not song:
+            return None
+        return {"audio_format": song.get("audio_format"), "renditions": song.get("renditions") or []}
+
+    return get_cache().get_or_set(f"renditions:{song_id}", load, ttl=SONG_LIST_CACHE_TTL, tags=[song_tag(song_id)])
+
+
+async def get_rendition_signed_url(song_id: str, rendition: dict):
+    """Signed URL của một rendition (không lưu vào MongoDB, chỉ cache)"""
+    cache = get_cache()
+    cache_key = f"url:{song_id}:rendition:{rendition['name']}"
+    cached_url = cache.get(cache_key)
+    if cached_url:
+        return cached_url
+    url = generate_signed_url(GCS_BUCKET_NAME, rendition["blob"])
+    ttl = signed_url_ttl(url) or SIGNED_URL_EXPIRATION.total_seconds()
+    cache.set(cache_key, url, ttl=ttl - SIGNED_URL_REFRESH_MARGIN, tags=[song_tag(song_id)])
+    return url
+
+
 @app.get("/api/audio/{song_id}")
-async def get_audio(song_id: str):
-    """Stream audio từ GCS signed URL (supports MP3 and M4A)"""
+async def get_audio(request: Request, song_id: str, quality: str = Query(default="auto")):
+    """
+    Stream audio từ GCS signed URL (supports MP3 and M4A).
+    quality=auto|low|medium|high|original; với auto, rendition được chọn theo header Accept / Save-Data.
+    """
+    if quality not in QUALITIES:
+        raise HTTPException(status_code=400, detail=f"quality phải là một trong: {', '.join(QUALITIES)}")
     try:
-        valid_url, song = await get_valid_signed_url(song_id, "gcs_audio_path", "gcs_audio_blob")
-        return RedirectResponse(url=valid_url, status_code=302)
-    except HTTPException:
+        accept = request.headers.get("accept")
+        save_data = request.headers.get("save-data", "").lower() == "on"
+        rendition = None
+        # Chỉ cần đọc renditions khi client thật sự có yêu cầu (đường mặc định giữ nguyên)
+        if quality in ("low", "medium") or save_data or (accept and "*/*" not in accept):
+            info = await run_in_threadpool(load_renditions, song_id)
+            if info is None:
+                raise HTTPException(status_code=404, detail="Không tìm thấy bài hát")
+            rendition = choose_rendition(info["renditions"], info["audio_format"], quality, accept, save_data)
+
+        if rendition:
+            valid_url = await get_rendition_signed_url(song_id, rendition)
+        else:
+            valid_url = await get_valid_signed_url(song_id, "gcs_audio_path", "gcs_audio_blob")
+        response = RedirectResponse(url=valid_url, status_code=302)
+        response.headers["Vary"] = "Accept, Save-Data"
+        response.headers["X-Audio-Rendition"] = rendition["name"] if rendition else "original"
+        return response
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
+        # MongoDB lỗi trước khi breaker kịp mở (và không có blob path đã cache): 503, không phải bug
+        if mongo_breaker.unavailable(e):
+            raise HTTPException(status_code=503, detail="Database unavailable, try again later",
+                                headers={"Retry-After": "5"})
         raise HTTPException(status_code=500, detail=f"Lỗi khi stream audio: {str(e)}")
 
 
+@app.get("/api/audio/{song_id}/hls/master.m3u8")
+async def get_hls_master(song_id: str):
+    """HLS master playlist: một variant cho mỗi bitrate đã đóng gói"""
+    song = await run_in_threadpool(get_song_by_id, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Không tìm thấy bài hát")
+    if not song.get("hls"):
+        raise HTTPException(status_code=404, detail="Bài hát chưa được đóng gói HLS")
+    return Response(content=master_playlist(song["hls"]["variants"]), media_type=PLAYLIST_CONTENT_TYPE)
+
+
+async def load_hls_variant(song_id: str, variant_name: str):
+    """Media playlist đã ký: mỗi segment là một signed URL, cache đến gần lúc URL hết hạn"""
+    cache = get_cache()
+    cache_key = f"hls:{song_id}:{variant_name}"
+    playlist = cache.get(cache_key)
+    if playlist is not None:
+        return playlist
+    since_seq = cache.current_seq()
+
+    song = await run_in_threadpool(get_song_by_id, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Không tìm thấy bài hát")
+    variant = next((v for v in (song.get("hls") or {}).get("variants", []) if v["name"] == variant_name), None)
+    if not variant:
+        raise HTTPException(status_code=404, detail="Không tìm thấy HLS variant")
+
+    response = await fetch_blob(get_http_client(), generate_signed_url(GCS_BUCKET_NAME, variant["playlist_blob"]))
+    if response.status_code != 200:
+        raise HTTPException(status_code=404, detail="Không thể tải HLS playlist")
+
+    prefix = variant["playlist_blob"].rsplit("/", 1)[0]
+    segments = set(segment_uris(response.text))
+
+    def sign_playlist():
+        return "\n".join(
+            generate_signed_url(GCS_BUCKET_NAME, f"{prefix}/{line.strip()}") if line.strip() in segments else line
+            for line in response.text.splitlines()
+        ) + "\n"
+
+    playlist = await run_in_threadpool(sign_playlist)
+    ttl = SIGNED_URL_EXPIRATION.total_seconds() - SIGNED_URL_REFRESH_MARGIN
+    cache.set(cache_key, playlist, ttl=ttl, tags=[song_tag(song_id)], since_seq=since_seq)
+    return playlist
+
+
+@app.get("/api/audio/{song_id}/hls/{variant_name}/index.m3u8")
+async def get_hls_variant(song_id: str, variant_name: str):
+    """HLS media playlist của một variant, segment trỏ thẳng tới GCS bằng signed URL"""
+    try:
+        playlist = await load_hls_variant(song_id, variant_name)
+        return Response(content=playlist, media_type=PLAYLIST_CONTENT_TYPE)
+    except (HTTPException, CircuitOpenError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi khi lấy HLS playlist: {str(e)}")
+
+
+@app.get("/api/search/lyrics")
+async def search_lyrics(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(default=20, ge=1, le=MAX_LYRICS_SEARCH_RESULTS),
+):
+    """
+    Tìm bài hát theo một câu trong lời (không phân biệt dấu / hoa thường).
+    Mỗi kết quả kèm các dòng khớp và timestamp của dòng để player seek tới.
+    """
+    def search():
+        # Lấy dư để bù các bài có trong index nhưng không còn trong danh sách
+        results = current_lyrics_index().search(q, limit=limit + 10)
+        songs = {song["_id"]: song for song in get_cached_songs()}
+        backend_url = get_backend_url()
+        return [
+            {**song_summary(songs[r["song_id"]], backend_url), "score": r["score"], "matches": r["matches"], "hits": r["hits"]}
+            for r in results if r["song_id"] in songs
+        ][:limit]
+
+    try:
+        results = await run_in_threadpool(search)
+        return FastJSONResponse({"query": q, "results": results, "total": len(results)})
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi khi tìm lyrics: {str(e)}")
+
+
+@app.get("/api/songs/{song_id}/similar")
+async def get_similar_songs(
+    song_id: str,
+    k: int = Query(default=10, ge=1, le=MAX_SIMILAR),
+    exclude: str = Query(default="", max_length=20_000),
+):
+    """
+    Các bài gần với song_id nhất theo title + lyrics (cosine TF-IDF), dùng cho autoplay.
+    `exclude`: danh sách id cách nhau bởi dấu phẩy (ví dụ các bài vừa phát).
+    """
+    if not similarity_available():
+        raise HTTPException(status_code=503, detail="Similar songs need numpy on the backend")
+    excluded = [s for s in exclude.split(",") if s]
+
+    def find():
+        # Lấy dư để bù các bài có trong index nhưng không còn trong danh sách
+        results = similar_songs(song_id, k=k + 10, exclude=excluded)
+        if results is None:
+            return None
+        songs = {song["_id"]: song for song in get_cached_songs()}
+        backend_url = get_backend_url()
+        return [
+            {**song_summary(songs[r["song_id"]], backend_url), "score": r["score"]}
+            for r in results if r["song_id"] in songs
+        ][:k]
+
+    try:
+        results = await run_in_threadpool(find)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi khi tìm bài tương tự: {str(e)}")
+    if results is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    return FastJSONResponse({"id": song_id, "results": results, "total": len(results)})
+
+
+class PlayEvent(BaseModel):
+    type: Literal["play", "skip", "seek"]
+    song_id: str = Field(pattern=r"^[0-9a-f]{24}$")
+    position: float = Field(default=0.0, ge=0, le=86400)   # giây, vị trí lúc skip / seek
+
+
+class PlayEventsRequest(BaseModel):
+    events: list[PlayEvent] = Field(min_length=1, max_length=MAX_EVENTS_PER_BATCH)
+
+
+@app.post("/api/events", status_code=202)
+async def ingest_play_events(request: PlayEventsRequest):
+    """
+    Nhận một lô event play / skip / seek từ player. Event chỉ được cộng vào bộ đếm trong bộ nhớ
+    và ghi vào MongoDB (play_stats) theo lô ở nền (backend/utils/play_events.py).
+    Event của bài không có trong catalog bị bỏ (`dropped`), không tạo document play_stats.
+    Buffer đầy (MongoDB chậm / lỗi) thì từ chối cả lô với 503 + Retry-After.
+    """
+    if not PLAY_EVENTS:
+        raise HTTPException(status_code=404, detail="Play events are disabled")
+    try:
+        known = await run_in_threadpool(catalog_song_ids)
+    except Exception as e:
+        if mongo_breaker.unavailable(e):
+            raise HTTPException(status_code=503, detail="Database unavailable, try again later",
+                                headers={"Retry-After": "5"})
+        raise HTTPException(status_code=500, detail=f"Failed to load song list: {str(e)}")
+    events = [(event.type, event.song_id, event.position) for event in request.events if event.song_id in known]
+    dropped = len(request.events) - len(events)
+    if dropped:
+        get_metrics().inc("play_events_dropped", value=dropped)
+    try:
+        accepted = play_events.add(events)
+    except PlayEventsFull as e:
+        get_metrics().inc("play_events_rejected", value=len(events))
+        raise HTTPException(status_code=503, detail="Event buffer is full, try again later",
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    return {"accepted": accepted, "dropped": dropped}
+
+
 class PasswordVerifyRequest(BaseModel):
     password: str
 
@@ -162,24 +1157,33 @@ async def verify_import_password(request: PasswordVerifyRequest):
 async def delete_track(song_id: str):
     """Delete a track from GCS and MongoDB"""
     try:
-        song = get_song_by_id(song_id)
+        song = await run_in_threadpool(get_song_by_id, song_id)
         if not song:
             raise HTTPException(status_code=404, detail="Track not found")
         
         gcs_audio_blob = song.get("gcs_audio_blob")
         gcs_lrc_blob = song.get("gcs_lrc_blob")
         
-        if gcs_audio_blob:
-            if not delete_file(GCS_BUCKET_NAME, gcs_audio_blob):
-                print(f"Warning: Could not delete audio file: {gcs_audio_blob}")
+        # Xoá song song; blob lỗi được đưa vào hàng đợi thử lại (backend/utils/blob_cleanup.py)
+        _, failed = await run_in_threadpool(delete_blobs, GCS_BUCKET_NAME, song_blobs(song))
+        if failed:
+            print(f"Warning: Could not delete {len(failed)} file(s) of {song_id}, queued for retry")
         
-        if gcs_lrc_blob:
-            if not delete_file(GCS_BUCKET_NAME, gcs_lrc_blob):
-                print(f"Warning: Could not delete LRC file: {gcs_lrc_blob}")
-        
-        if not delete_song_by_id(song_id):
+        if not await run_in_threadpool(delete_song_by_id, song_id):
             raise HTTPException(status_code=500, detail="Failed to delete track from database")
         
+        try:
+            unindex_song(song_id)
+        except Exception as e:
+            print(f"Warning: Could not remove {song_id} from lyrics index: {e}")
+        
+        try:
+            unindex_fingerprint(song_id)
+        except Exception as e:
+            print(f"Warning: Could not remove fingerprint of {song_id}: {e}")
+        
+        forget_deleted_songs([song_id], indexes=False)
+        
         return {
             "success": True,
             "message": "Track deleted successfully",
@@ -194,16 +1198,351 @@ async def delete_track(song_id: str):
         raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
 
 
+def forget_deleted_songs(song_ids, indexes=True):
+    """
+    Bỏ các bài đã xoá khỏi state trong process (index lyrics / fingerprint / similarity, bộ đếm lượt nghe).
+    Document đã xoá rồi nên lỗi ở đây chỉ log, không làm hỏng response.
+    indexes=False: lyrics / fingerprint đã được gỡ riêng (delete_track).
+    """
+    cleanups = [("play counters", play_events.forget)]
+    if indexes:
+        cleanups += [("lyrics index", forget_lyrics), ("fingerprint index", forget_fingerprints)]
+    for name, forget in cleanups:
+        try:
+            forget(song_ids)
+        except Exception as e:
+            print(f"Warning: Could not remove {len(song_ids)} deleted song(s) from {name}: {e}")
+    if similarity_available():
+        for song_id in song_ids:
+            try:
+                unindex_similarity(song_id)
+            except Exception as e:
+                print(f"Warning: Could not remove {song_id} from similarity index: {e}")
+
+
+class DeleteTracksRequest(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=MAX_BULK_DELETE)
+
+
+@app.delete("/api/tracks")
+async def delete_tracks(request: DeleteTracksRequest):
+    """
+    Xoá nhiều bài: đọc các bài bằng một query $in, xoá document bằng một delete_many rồi xoá
+    mọi blob (audio, lrc, HLS, renditions) song song (GCS_DELETE_CONCURRENCY).
+    Blob xoá lỗi không làm hỏng request: được đưa vào hàng đợi thử lại (pending_blob_deletes).
+
+    Trả về kết quả từng bài: status "deleted" / "not_found", số blob đã xoá và các blob
+    đang chờ xoá lại (`queued_blobs`).
+    """
+    ids = list(dict.fromkeys(request.ids))
+    try:
+        songs = await run_in_threadpool(get_songs_by_ids, ids, SONG_BLOB_PROJECTION)
+        if songs:
+            deleted_count = await run_in_threadpool(delete_songs_by_ids, list(songs))
+        else:
+            deleted_count = 0
+    except Exception as e:
+        if mongo_breaker.unavailable(e):
+            raise HTTPException(status_code=503, detail="Database unavailable, try again later",
+                                headers={"Retry-After": "5"})
+        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+
+    # Document đã xoá: blob lỗi từ đây chỉ còn nằm trong hàng đợi thử lại
+    blobs = {song_id: song_blobs(song) for song_id, song in songs.items()}
+    all_blobs = [blob for names in blobs.values() for blob in names]
+    _, failed = await run_in_threadpool(delete_blobs, GCS_BUCKET_NAME, all_blobs)
+
+    if songs:
+        forget_deleted_songs(list(songs))
+
+    results = []
+    for song_id in ids:
+        song = songs.get(song_id)
+        if song is None:
+            results.append({"id": song_id, "status": "not_found"})
+            continue
+        queued = [blob for blob in blobs[song_id] if blob in failed]
+        results.append({
+            "id": song_id,
+            "status": "deleted",
+            "title": song.get("title"),
+            "deleted_blobs": len(blobs[song_id]) - len(queued),
+            "queued_blobs": queued,
+        })
+    get_metrics().inc("tracks_deleted", value=deleted_count)
+    if failed:
+        get_metrics().inc("blob_deletes_queued", value=len(failed))
+    return {
+        "success": True,
+        "deleted": deleted_count,
+        "not_found": len(ids) - len(songs),
+        "queued_blobs": len(failed),
+        "results": results,
+    }
+
+
+def index_uploaded_lyrics(song_id, content: bytes):
+    """Thêm lyrics vừa upload vào search index (lỗi index không làm hỏng import)"""
+    try:
+        index_song(song_id, parse_lrc_content(content.decode("utf-8-sig", errors="replace")))
+    except Exception as e:
+        print(f"Warning: Could not index lyrics of {song_id}: {e}")
+
+
+async def check_duplicate_audio(sound_file: UploadFile, exclude: Optional[str] = None):
+    """
+    Fingerprint file audio vừa upload (process pool) và tìm các bài đã có cùng bản thu.
+    Returns (fingerprint values, duplicates); (None, []) khi không fingerprint được file.
+    """
+    _, file_ext = os.path.splitext(sound_file.filename)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext or ".mp3") as tmp:
+        tmp.write(await sound_file.read())
+        tmp_path = tmp.name
+    await sound_file.seek(0)
+    try:
+        return await find_audio_duplicates(tmp_path, sound_file.filename, exclude)
+    finally:
+        os.unlink(tmp_path)
+
+
+async def find_audio_duplicates(path: str, filename: str, exclude: Optional[str] = None, pending=None):
+    """Như check_duplicate_audio cho một file local; pending: fingerprint đang chạy sẵn (future) nếu có."""
+    try:
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(get_packager_pool(), fingerprint_file, path)
+        values, weak = await pending
+        matches = await run_in_threadpool(find_duplicates, values, weak, exclude)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        print(f"Warning: Could not fingerprint {filename}: {e}")
+        return None, []
+
+    if not matches:
+        return values, []
+    songs = {song["_id"]: song for song in await run_in_threadpool(get_cached_songs)}
+    return values, [
+        {
+            "id": m["song_id"],
+            "title": songs[m["song_id"]].get("title", "Unknown"),
+            "similarity": round(1 - m["ber"], 3),
+            "offsetSeconds": m["offset_s"],
+        }
+        for m in matches if m["song_id"] in songs
+    ]
+
+
+def reject_duplicates(duplicates: list, allow_duplicate: bool):
+    """409 khi file audio trùng bản thu với bài đã có (client gửi lại với allow_duplicate=true để bỏ qua)."""
+    if not duplicates:
+        return
+    get_metrics().inc("duplicate_audio", allowed=str(allow_duplicate).lower())
+    if not allow_duplicate:
+        raise HTTPException(status_code=409, detail={
+            "message": "Bài hát này có vẻ đã có trong thư viện",
+            "duplicates": duplicates,
+        })
+
+
+def update_similarity_index(song_id):
+    """Tính lại vector bài tương tự từ title + lyrics vừa lưu (lỗi không làm hỏng import / update)"""
+    if not similarity_available():
+        return
+    try:
+        refresh_similarity(song_id)
+    except Exception as e:
+        print(f"Warning: Could not update similarity index for {song_id}: {e}")
+
+
+def store_fingerprint(song_id, values):
+    """Lưu fingerprint của file audio mới (lỗi không làm hỏng import / update)"""
+    if values is None:
+        return
+    try:
+        index_fingerprint(song_id, values)
+    except Exception as e:
+        print(f"Warning: Could not store fingerprint of {song_id}: {e}")
+
+
+class UploadCreateRequest(BaseModel):
+    filename: str = Field(max_length=255)
+    size: int
+
+
+class UploadFinalizeRequest(BaseModel):
+    sha256: Optional[str] = Field(default=None, max_length=64)
+
+
+# Trong process: task đẩy spool lên GCS và fingerprint (chạy ngay khi nhận đủ byte) của từng upload
+_upload_pushes = {}
+_upload_analysis = {}
+
+
+async def send_upload_chunk(session_url, data, offset, total):
+    return await upload_chunk(get_http_client(), session_url, data, offset, total)
+
+
+async def push_upload(upload_id: str):
+    try:
+        return await push_to_storage(upload_id, send_upload_chunk)
+    except Exception as e:
+        # Chunk sau / finalize sẽ đẩy tiếp từ byte GCS đã lưu
+        print(f"Warning: Could not push upload {upload_id} to storage: {e}")
+        return None
+
+
+def schedule_upload_push(upload_id: str):
+    """Đẩy phần đã nhận lên GCS ở nền; task đang chạy tự đọc tiếp các chunk mới tới."""
+    task = _upload_pushes.get(upload_id)
+    if task is None or task.done():
+        task = asyncio.create_task(push_upload(upload_id))
+        _upload_pushes[upload_id] = task
+    return task
+
+
+def schedule_upload_analysis(session: dict):
+    """Fingerprint file vừa nhận đủ (process pool) trong lúc phần cuối còn đang lên GCS."""
+    upload_id = session["upload_id"]
+    if fingerprinting_available() and upload_id not in _upload_analysis:
+        loop = asyncio.get_running_loop()
+        _upload_analysis[upload_id] = loop.run_in_executor(get_packager_pool(), fingerprint_file, spool_path(session))
+
+
+def release_upload(session: dict, keep_spool: bool):
+    """Session đã dùng cho import / update: xoá (keep_spool: file spool được giao cho job xử lý audio)."""
+    _upload_pushes.pop(session["upload_id"], None)
+    _upload_analysis.pop(session["upload_id"], None)
+    discard_upload(session, keep_spool=keep_spool)
+
+
+def sweep_expired_uploads():
+    """Xoá các upload session quá UPLOAD_SESSION_TTL chưa được import (kèm blob đã lên GCS)."""
+    for session in expired_uploads():
+        if session["stored"] == session["size"]:
+            delete_file(GCS_BUCKET_NAME, session["blob"])
+        release_upload(session, keep_spool=False)
+
+
+def load_upload_or_404(upload_id: str):
+    try:
+        return load_upload(upload_id)
+    except UploadNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+def take_upload(upload_id: str):
+    """Upload đã finalize để import / update dùng thay cho sound_file."""
+    session = load_upload_or_404(upload_id)
+    if not session["finalized"] or session["stored"] != session["size"]:
+        raise HTTPException(status_code=409, detail="Upload is not finalized")
+    return session
+
+
+@app.post("/api/uploads")
+async def create_upload(request: UploadCreateRequest):
+    """Tạo resumable upload session cho một file audio (protocol ở backend/utils/uploads.py)"""
+    from backend.utils.gcs import create_upload_session
+    
+    await run_in_threadpool(sweep_expired_uploads)
+    try:
+        session = create_upload_file(request.filename, request.size)
+    except ValueError as e:
+        raise HTTPException(status_code=413 if request.size > 0 else 400, detail=str(e))
+    try:
+        session["session_url"] = await run_in_threadpool(
+            create_upload_session, GCS_BUCKET_NAME, session["blob"], session["size"]
+        )
+        save_upload(session)
+    except Exception as e:
+        discard_upload(session)
+        if isinstance(e, CircuitOpenError):
+            raise
+        raise HTTPException(status_code=500, detail=f"Could not start upload: {str(e)}")
+    return {
+        "upload_id": session["upload_id"],
+        "offset": 0,
+        "size": session["size"],
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+    }
+
+
+@app.put("/api/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Nhận một chunk (body là bytes thô) bắt đầu ở `offset`; trả về số byte đã nhận."""
+    session = load_upload_or_404(upload_id)
+    try:
+        position = await write_upload_chunk(session, offset, request.stream())
+    except ClientDisconnect:
+        # Client hỏi lại offset (GET) rồi gửi tiếp
+        return Response(status_code=400)
+    except UploadNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadBusyError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": received_bytes(session)})
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.offset})
+    # Chỉ sau khi ghi chunk thành công (phần nhận dở khi client mất kết nối được đẩy ở chunk sau / finalize)
+    if session["session_url"]:
+        schedule_upload_push(upload_id)
+    if position == session["size"]:
+        schedule_upload_analysis(session)
+    return {"upload_id": upload_id, "offset": position, "size": session["size"]}
+
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Số byte đã nhận (`offset`): client resume từ đây sau khi mất kết nối"""
+    try:
+        return upload_status(load_upload_or_404(upload_id))
+    except UploadNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, request: Optional[UploadFinalizeRequest] = None):
+    """
+    Kết thúc upload: chờ phần còn lại lên GCS, kiểm tra sha256 (nếu client gửi).
+    Sau đó gửi `sound_upload_id` cho /api/import-track hoặc PUT /api/track/{id}.
+    """
+    session = load_upload_or_404(upload_id)
+    if session["finalized"] and session["stored"] == session["size"]:
+        return {"upload_id": upload_id, "size": session["size"], "sha256": session["sha256"]}
+    position = received_bytes(session)
+    if position != session["size"]:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "offset": position})
+    
+    stored = await schedule_upload_push(upload_id)
+    if stored != session["size"]:
+        raise HTTPException(status_code=503, detail="Storage upload did not complete, retry finalize",
+                            headers={"Retry-After": "2"})
+    try:
+        session = await run_in_threadpool(
+            finalize_upload_session, load_upload(upload_id), request.sha256 if request else None
+        )
+    except ValueError as e:
+        # Dữ liệu hỏng: client phải upload lại từ đầu
+        await run_in_threadpool(delete_file, GCS_BUCKET_NAME, session["blob"])
+        release_upload(session, keep_spool=False)
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"upload_id": upload_id, "size": session["size"], "sha256": session["sha256"]}
+
+
 @app.put("/api/track/{song_id}")
 async def update_track(
     song_id: str,
     title: str = Form(default=None),
     sound_file: UploadFile = File(default=None),
-    lyrics_file: UploadFile = File(default=None)
+    lyrics_file: UploadFile = File(default=None),
+    allow_duplicate: bool = Form(default=False),
+    sound_upload_id: str = Form(default=None)
 ):
-    """Update a track's title, sound file (MP3/M4A), and/or lyrics file"""
+    """
+    Update a track's title, sound file (MP3/M4A), and/or lyrics file.
+    sound_upload_id: file audio đã upload qua /api/uploads (thay cho sound_file)
+    """
     try:
-        from backend.utils.gcs import upload_file, delete_file, generate_signed_url, GCS_BUCKET_NAME
+        from backend.utils.gcs import upload_file, delete_file, GCS_BUCKET_NAME
         
         song = get_song_by_id(song_id)
         if not song:
@@ -212,15 +1551,42 @@ async def update_track(
         update_fields = {}
         updated_sound = None
         updated_lyrics = None
+        fingerprint = None
+        sound_upload = take_upload(sound_upload_id) if sound_upload_id else None
         
         if title and title.strip():
             update_fields["title"] = title.strip()
         
-        if sound_file and sound_file.filename:
+        # Kiểm tra trùng trước khi xoá file audio cũ
+        if sound_upload is not None and fingerprinting_available():
+            fingerprint, duplicates = await find_audio_duplicates(
+                spool_path(sound_upload), sound_upload["filename"], song_id,
+                _upload_analysis.get(sound_upload["upload_id"])
+            )
+            reject_duplicates(duplicates, allow_duplicate)
+        elif sound_file and sound_file.filename and fingerprinting_available():
+            fingerprint, duplicates = await check_duplicate_audio(sound_file, exclude=song_id)
+            reject_duplicates(duplicates, allow_duplicate)
+        
+        if sound_upload is not None or (sound_file and sound_file.filename):
             old_audio_blob = song.get("gcs_audio_blob")
             if old_audio_blob:
                 delete_file(GCS_BUCKET_NAME, old_audio_blob)
-            
+            if song.get("hls"):
+                delete_package(song["hls"])
+                update_fields["hls"] = None
+            if song.get("renditions"):
+                delete_renditions(song["renditions"])
+                update_fields["renditions"] = None
+        
+        if sound_upload is not None:
+            # File đã nằm trên GCS (resumable upload): chỉ ghi metadata
+            update_fields["gcs_audio_blob"] = sound_upload["blob"]
+            update_fields.update(stored_signed_url("gcs_audio_path", sound_upload["blob"]))
+            update_fields["audio_format"] = sound_upload["ext"].lstrip(".")
+            updated_sound = sound_upload["filename"]
+            sound_tmp_path = spool_path(sound_upload)
+        elif sound_file and sound_file.filename:
             _, file_ext = os.path.splitext(sound_file.filename)
             if not file_ext:
                 file_ext = ".mp3"
@@ -235,14 +1601,15 @@ async def update_track(
             try:
                 new_audio_blob = f"sounds/{sound_file.filename}"
                 upload_file(GCS_BUCKET_NAME, tmp_path, new_audio_blob)
-                new_audio_url = generate_signed_url(GCS_BUCKET_NAME, new_audio_blob)
                 
                 update_fields["gcs_audio_blob"] = new_audio_blob
-                update_fields["gcs_audio_path"] = new_audio_url
+                update_fields.update(stored_signed_url("gcs_audio_path", new_audio_blob))
                 update_fields["audio_format"] = audio_format
                 updated_sound = sound_file.filename
+                sound_tmp_path = tmp_path
             finally:
-                os.unlink(tmp_path)
+                if not (media_jobs_enabled() and updated_sound):
+                    os.unlink(tmp_path)
         
         if lyrics_file and lyrics_file.filename:
             old_lrc_blob = song.get("gcs_lrc_blob")
@@ -257,17 +1624,29 @@ async def update_track(
             try:
                 new_lrc_blob = f"lyrics/{lyrics_file.filename}"
                 upload_file(GCS_BUCKET_NAME, tmp_path, new_lrc_blob)
-                new_lrc_url = generate_signed_url(GCS_BUCKET_NAME, new_lrc_blob)
                 
                 update_fields["gcs_lrc_blob"] = new_lrc_blob
-                update_fields["gcs_lrc_path"] = new_lrc_url
+                update_fields.update(stored_signed_url("gcs_lrc_path", new_lrc_blob))
                 update_fields["has_lyrics"] = True
                 updated_lyrics = lyrics_file.filename
             finally:
                 os.unlink(tmp_path)
+            
+            # Index trước khi ghi metadata: worker khác đọc lại lyrics_lines khi nhận event update
+            index_uploaded_lyrics(song_id, content)
+        
+        if updated_sound:
+            store_fingerprint(song_id, fingerprint)
         
         if update_fields:
             update_song_metadata(song_id, update_fields)
+            update_similarity_index(song_id)
+        
+        if sound_upload is not None:
+            release_upload(sound_upload, keep_spool=media_jobs_enabled())
+        
+        if media_jobs_enabled() and updated_sound:
+            schedule_audio_processing(song_id, sound_tmp_path, update_fields["audio_format"], update_fields["gcs_audio_blob"])
         
         return {
             "success": True,
@@ -287,14 +1666,35 @@ async def update_track(
 @app.post("/api/import-track")
 async def import_track(
     title: str = Form(...),
-    sound_file: UploadFile = File(...),
-    lyrics_file: UploadFile = File(default=None)
+    sound_file: UploadFile = File(default=None),
+    lyrics_file: UploadFile = File(default=None),
+    allow_duplicate: bool = Form(default=False),
+    sound_upload_id: str = Form(default=None)
 ):
-    """Upload track files (MP3/M4A) to Google Cloud Storage and save metadata to MongoDB"""
+    """
+    Upload track files (MP3/M4A) to Google Cloud Storage and save metadata to MongoDB.
+    sound_upload_id: file audio đã upload qua /api/uploads (thay cho sound_file)
+    """
     try:
-        from backend.utils.gcs import upload_file, generate_signed_url, GCS_BUCKET_NAME
+        from backend.utils.gcs import upload_file, GCS_BUCKET_NAME
         from backend.utils.mongodb import insert_song_metadata, update_song_metadata, SongMetadata
         
+        sound_upload = take_upload(sound_upload_id) if sound_upload_id else None
+        if sound_upload is None and not (sound_file and sound_file.filename):
+            raise HTTPException(status_code=400, detail="sound_file or sound_upload_id is required")
+        
+        # Phát hiện bài trùng (cùng bản thu, khác định dạng / bitrate) trước khi tạo document
+        fingerprint = None
+        if sound_upload is not None and fingerprinting_available():
+            fingerprint, duplicates = await find_audio_duplicates(
+                spool_path(sound_upload), sound_upload["filename"], None,
+                _upload_analysis.get(sound_upload["upload_id"])
+            )
+            reject_duplicates(duplicates, allow_duplicate)
+        elif sound_file and sound_file.filename and fingerprinting_available():
+            fingerprint, duplicates = await check_duplicate_audio(sound_file)
+            reject_duplicates(duplicates, allow_duplicate)
+        
         uploaded_sound = None
         uploaded_lyrics = None
         sound_blob_path = None
@@ -314,7 +1714,13 @@ async def import_track(
         )
         inserted_id = insert_song_metadata(song_metadata)
         
-        if sound_file and sound_file.filename:
+        if sound_upload is not None:
+            # File đã nằm trên GCS (resumable upload): chỉ ghi metadata
+            audio_format = sound_upload["ext"].lstrip(".")
+            sound_blob_path = sound_upload["blob"]
+            uploaded_sound = sound_upload["filename"]
+            sound_tmp_path = spool_path(sound_upload)
+        elif sound_file and sound_file.filename:
             _, file_ext = os.path.splitext(sound_file.filename)
             if not file_ext:
                 file_ext = ".mp3"
@@ -330,8 +1736,10 @@ async def import_track(
                 sound_blob_path = f"sounds/{sound_file.filename}"
                 upload_file(GCS_BUCKET_NAME, tmp_path, sound_blob_path)
                 uploaded_sound = sound_file.filename
+                sound_tmp_path = tmp_path
             finally:
-                os.unlink(tmp_path)
+                if not (media_jobs_enabled() and uploaded_sound):
+                    os.unlink(tmp_path)
         
         if lyrics_file and lyrics_file.filename:
             with tempfile.NamedTemporaryFile(delete=False, suffix=".lrc") as tmp:
@@ -345,22 +1753,33 @@ async def import_track(
                 uploaded_lyrics = lyrics_file.filename
             finally:
                 os.unlink(tmp_path)
+            
+            index_uploaded_lyrics(inserted_id, content)
         
         update_fields = {}
         
         if sound_blob_path:
-            audio_signed_url = generate_signed_url(GCS_BUCKET_NAME, sound_blob_path)
             update_fields["gcs_audio_blob"] = sound_blob_path
-            update_fields["gcs_audio_path"] = audio_signed_url
+            update_fields.update(stored_signed_url("gcs_audio_path", sound_blob_path))
             update_fields["audio_format"] = audio_format
         
         if lyrics_blob_path:
-            lrc_signed_url = generate_signed_url(GCS_BUCKET_NAME, lyrics_blob_path)
             update_fields["gcs_lrc_blob"] = lyrics_blob_path
-            update_fields["gcs_lrc_path"] = lrc_signed_url
+            update_fields.update(stored_signed_url("gcs_lrc_path", lyrics_blob_path))
+        
+        if uploaded_sound:
+            store_fingerprint(inserted_id, fingerprint)
         
         if update_fields:
             update_song_metadata(inserted_id, update_fields)
+        update_similarity_index(inserted_id)
+        
+        if sound_upload is not None:
+            release_upload(sound_upload, keep_spool=media_jobs_enabled())
+        
+        # Đóng gói HLS / transcode chạy nền, response trả về ngay
+        if media_jobs_enabled() and uploaded_sound:
+            schedule_audio_processing(str(inserted_id), sound_tmp_path, audio_format, sound_blob_path)
         
         return {
             "success": True,
@@ -375,20 +1794,68 @@ async def import_track(
             "gcs_lrc_url": update_fields.get("gcs_lrc_path")
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
 class RobotCommentRequest(BaseModel):
+    song_id: Optional[str] = Field(default=None, max_length=64)
     song_title: Optional[str] = None
-    lyrics: Optional[str] = None
+    # Client cũ gửi cả lời bài hát; vẫn nhận nhưng chỉ đưa bản rút gọn vào prompt
+    lyrics: Optional[str] = Field(default=None, max_length=200_000)
+
+
+async def robot_lyrics_digest(song_id: str):
+    """
+    Bản rút gọn lời bài hát cho prompt của robot (tính một lần mỗi bài, cache theo tag của bài).
+    Bài không có file lời: chuỗi rỗng (prompt chỉ dùng tên bài).
+    """
+    cache = get_cache()
+    cache_key = f"robot:digest:{song_id}"
+    digest = cache.get(cache_key)
+    if digest is not None:
+        return digest
+    since_seq = cache.current_seq()
+
+    try:
+        lyrics_data = await load_lyrics(song_id)
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+        lyrics_data = []
+    digest = lyrics_digest(lyrics_data, ROBOT_LYRICS_TOKENS)
+    cache.set(cache_key, digest, ttl=LYRICS_CACHE_TTL, tags=[song_tag(song_id)], since_seq=since_seq)
+    return digest
+
+
+def cached_song_title(song_id: str):
+    return next((song.get("title") for song in get_cached_songs() if song["_id"] == song_id), None)
 
 
 @app.post("/api/robot-comment")
 async def get_robot_comment(request: RobotCommentRequest):
-    """Lấy comment từ Gemini AI cho robot Mắm Chan"""
+    """
+    Lấy comment từ Gemini AI cho robot Mắm Chan.
+    Client gửi song_id; tên bài và lời (bản rút gọn, cache theo bài) do server lấy.
+    """
     try:
-        comment = generate_robot_comment(request.song_title, request.lyrics)
+        song_title, lyrics = request.song_title, None
+        if request.song_id:
+            song_title = await run_in_threadpool(cached_song_title, request.song_id) or song_title
+            try:
+                lyrics = await robot_lyrics_digest(request.song_id)
+            except Exception as e:
+                # Không lấy được lời (GCS / MongoDB lỗi): comment theo tên bài
+                print(f"Error loading lyrics digest for {request.song_id}: {e}")
+        elif request.lyrics:
+            lyrics = lyrics_digest(request.lyrics, ROBOT_LYRICS_TOKENS)
+        if song_title:
+            song_title = song_title[:MAX_ROBOT_TITLE_CHARS]
+
+        # Gọi Gemini là blocking: chạy trong threadpool để không chặn các request khác
+        comment = await run_in_threadpool(generate_robot_comment, song_title, lyrics)
         return {"success": True, "comment": comment}
     except Exception as e:
         return {
@@ -0,0 +1,42 @@
+"""
+Test chạy với stand-ins (backend/bench/standins.py): không cần MongoDB, GCS hay Gemini.
+
+Env phải được set trước khi import backend (các module đọc config lúc import).
+"""
+
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault("RATE_LIMITS", "false")
+os.environ.setdefault("LIVE_UPDATES", "false")
+os.environ.setdefault("BLOB_DELETE_RETRY", "false")
+os.environ.setdefault("URL_SWEEPER", "false")
+os.environ.setdefault("HLS_PACKAGING", "false")
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="tunify-test-cache-"))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="tunify-test-uploads-"))
+
+
+@pytest.fixture(scope="session")
+def standins():
+    """(main, storage): app đã gắn stand-ins, dùng chung cho cả session."""
+    from backend.bench.standins import LocalStorage, install_standins
+
+    return install_standins(LocalStorage(base_url="http://testserver"))
+
+
+@pytest.fixture
+def client(standins, monkeypatch):
+    """
+    TestClient của app. Các request backend tự gửi (signed URL của LocalStorage, đẩy upload
+    lên session URL) đi thẳng vào app qua ASGITransport thay vì mạng.
+    """
+    import httpx
+    from fastapi.testclient import TestClient
+
+    main, _ = standins
+    internal = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://testserver")
+    monkeypatch.setattr(main, "get_http_client", lambda: internal)
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,102 @@
+"""TieredCache / SQLiteSharedStore giữa nhiều process (như các uvicorn workers)."""
+
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+
+from backend.utils.cache import LRUCache, SQLiteSharedStore, TieredCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def in_other_process(directory, code):
+    """Chạy `code` trong một process khác, `store` là SQLiteSharedStore trên cùng thư mục."""
+    script = (
+        "import sys\n"
+        "from backend.utils.cache import SQLiteSharedStore\n"
+        "store = SQLiteSharedStore(sys.argv[1])\n" + code
+    )
+    subprocess.run([sys.executable, "-c", script, str(directory)], cwd=ROOT, check=True, timeout=60)
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def cache(cache_dir):
+    return TieredCache(shared=SQLiteSharedStore(str(cache_dir)))
+
+
+def test_invalidation_in_other_process_drops_l1(cache, cache_dir):
+    cache.set("lyrics:1", ["line"], tags=("song:1",))
+    cache.set("lyrics:2", ["other"], tags=("song:2",))
+    assert cache.get("lyrics:1") == ["line"]   # Giờ nằm ở L1
+
+    in_other_process(cache_dir, "store.invalidate('song:1')")
+
+    assert cache.get("lyrics:1") is None
+    assert cache.get("lyrics:2") == ["other"]
+    assert cache.stats()["invalidation_seq"] == 1
+
+
+def test_value_set_in_other_process_is_shared(cache, cache_dir):
+    in_other_process(cache_dir, "store.set('songs', {'title': 'Bài 1', 'raw': b'\\x00\\xff'}, tags=('songs',))")
+
+    assert cache.get("songs") == {"title": "Bài 1", "raw": b"\x00\xff"}
+
+
+def test_set_after_concurrent_invalidation_is_skipped(cache, cache_dir):
+    since_seq = cache.current_seq()
+    # Process khác sửa bài trong lúc process này đang load giá trị cũ
+    in_other_process(cache_dir, "store.invalidate('song:1')")
+
+    assert cache.set("lyrics:1", ["stale"], tags=("song:1",), since_seq=since_seq) is False
+    assert cache.get("lyrics:1") is None
+    # Tag khác không bị ảnh hưởng
+    assert cache.set("lyrics:2", ["fresh"], tags=("song:2",), since_seq=since_seq) is True
+    assert cache.get("lyrics:2") == ["fresh"]
+
+
+def test_get_or_set_does_not_cache_value_loaded_before_invalidation(cache, cache_dir):
+    def loader():
+        in_other_process(cache_dir, "store.invalidate('song:1')")
+        return ["stale"]
+
+    assert cache.get_or_set("lyrics:1", loader, tags=("song:1",)) == ["stale"]
+    assert cache.get("lyrics:1") is None
+
+
+def test_non_positive_ttl_is_not_cached(cache):
+    assert cache.set("url:1", "https://signed", ttl=0) is False
+    assert cache.set("url:2", "https://signed", ttl=-5) is False
+    assert cache.get("url:1") is None
+    assert cache.get("url:2") is None
+
+    l1 = LRUCache()
+    l1.set("url", "https://signed", ttl=0)
+    assert l1.get("url") is None
+
+
+def test_unencodable_value_stays_in_l1(cache, cache_dir):
+    value = object()
+    assert cache.set("object", value) is True
+    assert cache.get("object") is value
+    assert cache.shared.get("object") is None
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="cần uid (POSIX)")
+def test_world_writable_directory_is_refused(tmp_path):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+    with pytest.raises(PermissionError):
+        SQLiteSharedStore(str(directory))
+
+    private = tmp_path / "private"
+    SQLiteSharedStore(str(private))
+    assert stat.S_IMODE(private.stat().st_mode) == 0o700
@@ -0,0 +1,165 @@
+"""
+INDEXES (backend/utils/mongodb.py) so với các query trong repository_queries().
+
+Không có MongoDB thật: FakeCollection chọn plan theo các luật cơ bản của query planner
+(cần index có field đầu tiên nằm trong filter, $or thì mọi nhánh đều phải có index,
+covered khi filter + projection nằm gọn trong index) rồi trả về explain() cùng dạng
+với MongoDB, để backend/bench/query_plans.py kiểm tra như với server thật.
+"""
+
+import pytest
+from bson import ObjectId
+
+from backend.bench.query_plans import problems, summarize
+from backend.utils import mongodb
+
+ID_INDEX = {"keys": [("_id", 1)], "name": "_id_"}
+
+
+class PlannerError(Exception):
+    pass
+
+
+def sargable(condition):
+    """Predicate dùng được index: equality (kể cả null), range, $in. $ne thì không."""
+    if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+        return any(op in ("$eq", "$lt", "$lte", "$gt", "$gte", "$in") for op in condition)
+    return True
+
+
+class FakeCursor:
+    def __init__(self, indexes, filter, projection):
+        self.indexes = indexes
+        self.filter = filter or {}
+        self.projection = projection
+        self.hinted = None
+
+    def limit(self, count):
+        return self
+
+    def hint(self, index_name):
+        self.hinted = index_name
+        return self
+
+    def _index(self, name):
+        for spec in self.indexes:
+            if spec["name"] == name:
+                return spec
+        raise PlannerError(f"hint provided does not correspond to an existing index: {name}")
+
+    def _choose(self, filter):
+        """Index cho một filter không có $or (None: phải COLLSCAN)."""
+        for spec in self.indexes:
+            leading = spec["keys"][0][0]
+            if leading in filter and sargable(filter[leading]):
+                return spec
+        return None
+
+    def _covered(self, spec):
+        fields = {field for field, _ in spec["keys"]}
+        wanted = set(self.filter)
+        if self.projection is None:
+            return False
+        wanted |= {field for field, include in self.projection.items() if include}
+        if self.projection.get("_id", 1):
+            wanted.add("_id")
+        return wanted <= fields
+
+    def _plan(self):
+        if self.hinted is not None:
+            spec = self._index(self.hinted)
+        elif "$or" in self.filter:
+            branches = [self._choose(branch) for branch in self.filter["$or"]]
+            if None in branches:
+                return {"stage": "COLLSCAN"}
+            scans = [{"stage": "IXSCAN", "indexName": spec["name"]} for spec in branches]
+            return {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": scans}}
+        else:
+            spec = self._choose(self.filter)
+            if spec is None:
+                return {"stage": "COLLSCAN"}
+        scan = {"stage": "IXSCAN", "indexName": spec["name"]}
+        if self._covered(spec):
+            return {"stage": "PROJECTION_COVERED", "inputStage": scan}
+        return {"stage": "FETCH", "inputStage": scan}
+
+    def explain(self):
+        plan = self._plan()
+        covered = plan["stage"] == "PROJECTION_COVERED"
+        return {
+            "queryPlanner": {"winningPlan": plan},
+            "executionStats": {
+                "nReturned": 1,
+                "totalKeysExamined": 0 if plan["stage"] == "COLLSCAN" else 1,
+                "totalDocsExamined": 0 if covered else 1,
+            },
+        }
+
+
+class FakeCollection:
+    def __init__(self, indexes):
+        self.indexes = [ID_INDEX] + list(indexes)
+
+    def find(self, filter=None, projection=None):
+        return FakeCursor(self.indexes, filter, projection)
+
+
+SAMPLE = {
+    "_id": ObjectId(),
+    "title": "Bài mẫu",
+    "gcs_audio_blob": "sounds/sample.mp3",
+    "gcs_lrc_blob": "lyrics/sample.lrc",
+}
+
+
+def plan_problems(indexes):
+    found = []
+    for name, cursor in mongodb.repository_queries(FakeCollection(indexes), SAMPLE).items():
+        try:
+            found += problems(name, summarize(cursor.explain()))
+        except PlannerError as e:
+            found.append(f"{name}: {e}")
+    return found
+
+
+def test_declared_indexes_serve_every_repository_query():
+    assert plan_problems(mongodb.INDEXES[mongodb.COLLECTION_NAME]) == []
+
+
+def test_song_list_is_covered_by_its_index():
+    cursor = mongodb.repository_queries(FakeCollection(mongodb.INDEXES[mongodb.COLLECTION_NAME]), SAMPLE)["get_song_list"]
+    summary = summarize(cursor.explain())
+    assert summary["covered"]
+    assert summary["indexes"] == [mongodb.SONG_LIST_INDEX]
+
+
+@pytest.mark.parametrize("spec", mongodb.INDEXES[mongodb.COLLECTION_NAME], ids=lambda spec: spec["name"])
+def test_every_declared_index_is_needed(spec):
+    remaining = [other for other in mongodb.INDEXES[mongodb.COLLECTION_NAME] if other is not spec]
+    assert plan_problems(remaining)
+
+
+def test_unindexed_query_is_reported():
+    cursor = FakeCollection(mongodb.INDEXES[mongodb.COLLECTION_NAME]).find({"audio_format": "mp3"})
+    assert problems("by_format", summarize(cursor.explain())) == ["by_format: collection scan"]
+
+
+def test_ensure_indexes_creates_every_declared_index(monkeypatch):
+    created = {}
+
+    class RecordingCollection:
+        def __init__(self, name):
+            self.name = name
+
+        def create_index(self, keys, name=None, **options):
+            created.setdefault(self.name, []).append((name, keys))
+            return name
+
+    monkeypatch.setattr(mongodb, "get_collection", RecordingCollection)
+
+    names = mongodb.ensure_indexes()
+
+    declared = [spec["name"] for specs in mongodb.INDEXES.values() for spec in specs]
+    assert names == declared
+    for collection_name, specs in mongodb.INDEXES.items():
+        assert created.get(collection_name, []) == [(spec["name"], spec["keys"]) for spec in specs]
@@ -0,0 +1,101 @@
+"""POST /api/robot-comment theo song_id: prompt được build từ tên bài + lyrics_digest phía server."""
+
+import uuid
+
+import pytest
+
+from backend.bench.standins import make_lrc
+from backend.utils import gemini, mongodb
+from backend.utils.cache import invalidate_song
+from backend.utils.gcs import GCS_BUCKET_NAME
+from backend.utils.prompts import generate_mamchan_prompt
+from backend.utils.utils import estimate_tokens, lyrics_digest, parse_lrc_content
+
+
+@pytest.fixture
+def prompts(standins, monkeypatch):
+    """Các prompt đã gửi cho Gemini (stand-in)."""
+    sent = []
+    models = gemini.get_client().models
+    generate_content = models.generate_content
+
+    def recording(model, contents, **kwargs):
+        sent.append(contents)
+        return generate_content(model, contents, **kwargs)
+
+    monkeypatch.setattr(models, "generate_content", recording)
+    return sent
+
+
+def add_song(storage, title, lrc=None):
+    name = uuid.uuid4().hex[:12]
+    lrc_blob = None
+    if lrc is not None:
+        lrc_blob = f"lyrics/{name}.lrc"
+        storage.upload_bytes(GCS_BUCKET_NAME, lrc.encode("utf-8"), lrc_blob)
+    song = mongodb.SongMetadata(
+        title=title, gcs_audio_blob=f"sounds/{name}.mp3", gcs_lrc_blob=lrc_blob,
+        audio_format="mp3", has_lyrics=lrc is not None,
+    )
+    return str(mongodb.insert_song_metadata(song))
+
+
+def test_prompt_uses_lyrics_digest_of_the_song(standins, client, prompts):
+    main, storage = standins
+    lrc = make_lrc(line_count=200, seed=7)
+    song_id = add_song(storage, "Chạy ngay đi", lrc)
+
+    response = client.post("/api/robot-comment", json={
+        "song_id": song_id,
+        # Bị bỏ qua khi có song_id: tên và lời lấy từ server
+        "song_title": "Tên client gửi",
+        "lyrics": "lời client gửi",
+    })
+
+    assert response.status_code == 200
+    assert response.json()["success"] is True
+    digest = lyrics_digest(parse_lrc_content(lrc), main.ROBOT_LYRICS_TOKENS)
+    assert digest and estimate_tokens(digest) <= main.ROBOT_LYRICS_TOKENS
+    assert prompts == [generate_mamchan_prompt("Chạy ngay đi", digest)]
+
+
+def test_digest_is_cached_until_the_song_changes(standins, client, prompts, monkeypatch):
+    main, storage = standins
+    song_id = add_song(storage, "Lạc trôi", make_lrc(seed=3))
+    loads = []
+    load_lyrics = main.load_lyrics
+
+    async def counting(song_id):
+        loads.append(song_id)
+        return await load_lyrics(song_id)
+
+    monkeypatch.setattr(main, "load_lyrics", counting)
+
+    for _ in range(3):
+        client.post("/api/robot-comment", json={"song_id": song_id})
+    assert loads == [song_id]
+    assert len(set(prompts)) == 1
+
+    invalidate_song(song_id)
+    client.post("/api/robot-comment", json={"song_id": song_id})
+    assert loads == [song_id, song_id]
+
+
+def test_song_without_lyrics_uses_title_only(standins, client, prompts):
+    _, storage = standins
+    song_id = add_song(storage, "Bản nhạc không lời")
+
+    response = client.post("/api/robot-comment", json={"song_id": song_id})
+
+    assert response.json()["success"] is True
+    assert prompts == [generate_mamchan_prompt("Bản nhạc không lời", "")]
+
+
+def test_lyrics_without_song_id_are_digested(client, prompts, standins):
+    main, _ = standins
+    lyrics = "\n".join(["Điệp khúc"] * 3 + [f"Câu {i}" for i in range(500)])
+
+    client.post("/api/robot-comment", json={"song_title": "Bài mới", "lyrics": lyrics})
+
+    assert prompts == [generate_mamchan_prompt("Bài mới", lyrics_digest(lyrics, main.ROBOT_LYRICS_TOKENS))]
+    assert "Điệp khúc (x3)" in prompts[0]
@@ -0,0 +1,134 @@
+"""Resumable upload (/api/uploads): offset, 409, resume sau khi mất kết nối, sha256."""
+
+import asyncio
+import hashlib
+import os
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from backend.bench.standins import make_mp3
+from backend.utils import mongodb, uploads
+from backend.utils.gcs import GCS_BUCKET_NAME
+
+CHUNK = 300 * 1024   # Không chia hết cho 256 KiB: đẩy lên storage phải giữ lại phần dư
+
+
+@pytest.fixture
+def audio():
+    return make_mp3(duration=60.0, seed=1)
+
+
+def create(client, audio, filename="upload.mp3"):
+    response = client.post("/api/uploads", json={"filename": filename, "size": len(audio)})
+    assert response.status_code == 200
+    assert response.json()["offset"] == 0
+    return response.json()["upload_id"]
+
+
+def put(client, upload_id, offset, data):
+    return client.put(f"/api/uploads/{upload_id}", params={"offset": offset}, content=data)
+
+
+def offset_of(client, upload_id):
+    return client.get(f"/api/uploads/{upload_id}").json()["offset"]
+
+
+def test_upload_in_chunks_then_import(standins, client, audio):
+    _, storage = standins
+    upload_id = create(client, audio)
+
+    for start in range(0, len(audio), CHUNK):
+        response = put(client, upload_id, start, audio[start:start + CHUNK])
+        assert response.status_code == 200
+        assert response.json()["offset"] == min(start + CHUNK, len(audio))
+        assert offset_of(client, upload_id) == response.json()["offset"]
+
+    sha256 = hashlib.sha256(audio).hexdigest()
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={"sha256": sha256})
+    assert response.status_code == 200
+    assert response.json()["sha256"] == sha256
+
+    response = client.post("/api/import-track", data={"title": "Resumable", "sound_upload_id": upload_id})
+    assert response.status_code == 200
+    song = mongodb.get_song_by_id(response.json()["mongodb_id"])
+    with open(storage._path(GCS_BUCKET_NAME, song["gcs_audio_blob"]), "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == sha256
+    # Session đã được dùng: không import lại được lần nữa
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+
+
+def test_wrong_offset_is_rejected_with_current_offset(client, audio):
+    upload_id = create(client, audio)
+    assert put(client, upload_id, 0, audio[:CHUNK]).status_code == 200
+
+    response = put(client, upload_id, CHUNK + 10, audio[CHUNK + 10:2 * CHUNK])
+
+    assert response.status_code == 409
+    assert response.json()["detail"]["offset"] == CHUNK
+    assert offset_of(client, upload_id) == CHUNK
+
+
+def test_chunk_past_declared_size_is_rejected(client, audio):
+    upload_id = create(client, audio)
+    assert put(client, upload_id, 0, audio[:CHUNK]).status_code == 200
+
+    response = put(client, upload_id, CHUNK, audio[CHUNK:] + b"extra")
+
+    assert response.status_code == 409
+    assert response.json()["detail"]["offset"] == CHUNK
+    assert offset_of(client, upload_id) == CHUNK
+
+
+def test_resent_chunk_only_appends_missing_bytes(client, audio):
+    upload_id = create(client, audio)
+    assert put(client, upload_id, 0, audio[:CHUNK]).status_code == 200
+
+    # Response của chunk trước bị mất: client gửi lại từ offset cũ, phần đã có bị bỏ qua
+    response = put(client, upload_id, 0, audio[:2 * CHUNK])
+
+    assert response.json()["offset"] == 2 * CHUNK
+    assert put(client, upload_id, 2 * CHUNK, audio[2 * CHUNK:]).json()["offset"] == len(audio)
+    sha256 = hashlib.sha256(audio).hexdigest()
+    assert client.post(f"/api/uploads/{upload_id}/finalize", json={"sha256": sha256}).status_code == 200
+
+
+def test_resume_after_disconnect(client, audio):
+    upload_id = create(client, audio)
+    cut_at = CHUNK // 2 + 123
+
+    async def interrupted():
+        yield audio[:cut_at]
+        raise ClientDisconnect()
+
+    # Mất kết nối giữa chunk: phần đã nhận được giữ lại
+    session = uploads.load_session(upload_id)
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(uploads.write_chunk(session, 0, interrupted()))
+    assert offset_of(client, upload_id) == cut_at
+
+    # Chưa đủ byte thì chưa finalize được
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={})
+    assert response.status_code == 409
+    assert response.json()["detail"]["offset"] == cut_at
+
+    assert put(client, upload_id, cut_at, audio[cut_at:]).json()["offset"] == len(audio)
+    sha256 = hashlib.sha256(audio).hexdigest()
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={"sha256": sha256})
+    assert response.status_code == 200
+    assert response.json()["sha256"] == sha256
+
+
+def test_sha256_mismatch_discards_upload(client, audio):
+    upload_id = create(client, audio)
+    spool = uploads.spool_path(uploads.load_session(upload_id))
+    corrupted = audio[:-1] + bytes([audio[-1] ^ 0xFF])
+    assert put(client, upload_id, 0, corrupted).json()["offset"] == len(audio)
+
+    response = client.post(f"/api/uploads/{upload_id}/finalize",
+                           json={"sha256": hashlib.sha256(audio).hexdigest()})
+
+    assert response.status_code == 422
+    # Dữ liệu hỏng: client phải upload lại từ đầu
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+    assert not os.path.exists(spool)
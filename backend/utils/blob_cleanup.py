@@ -0,0 +1,193 @@
+"""
+Xoá blob trên GCS cho các bài bị xoá, với hàng đợi thử lại cho blob xoá lỗi.
+
+DELETE /api/tracks xoá document trước (một delete_many) rồi mới xoá blob (audio, lrc, HLS,
+renditions) song song qua gcs.delete_files. Blob xoá lỗi (GCS lỗi / breaker open) không làm hỏng
+request: chúng được ghi vào collection `pending_blob_deletes` và BlobDeleteRetrier thử lại ở nền
+với backoff tăng dần (BLOB_DELETE_RETRY_BASE, gấp đôi sau mỗi lần lỗi, tối đa BLOB_DELETE_RETRY_MAX_DELAY).
+Quá BLOB_DELETE_MAX_ATTEMPTS lần thì entry được giữ lại (next_attempt_at = None) để xử lý tay.
+
+Nhiều worker cùng chạy retrier chỉ có thể xoá trùng một blob: xoá blob không còn tồn tại vẫn
+tính là thành công.
+
+Cấu hình:
+    BLOB_DELETE_RETRY=true|false        (default: true)
+    BLOB_DELETE_RETRY_INTERVAL=60       (giây giữa hai lượt)
+    BLOB_DELETE_RETRY_BASE=30           (giây chờ trước lần thử lại đầu tiên)
+    BLOB_DELETE_RETRY_MAX_DELAY=21600
+    BLOB_DELETE_MAX_ATTEMPTS=10
+
+CLI:
+    uv run python -m backend.utils.blob_cleanup --once
+    uv run python -m backend.utils.blob_cleanup --list
+"""
+
+import os
+import random
+import threading
+import time
+
+BLOB_DELETE_RETRY = os.getenv("BLOB_DELETE_RETRY", "true").lower() in ("1", "true", "yes")
+BLOB_DELETE_RETRY_INTERVAL = float(os.getenv("BLOB_DELETE_RETRY_INTERVAL", "60"))
+BLOB_DELETE_RETRY_BASE = float(os.getenv("BLOB_DELETE_RETRY_BASE", "30"))
+BLOB_DELETE_RETRY_MAX_DELAY = float(os.getenv("BLOB_DELETE_RETRY_MAX_DELAY", "21600"))
+BLOB_DELETE_MAX_ATTEMPTS = int(os.getenv("BLOB_DELETE_MAX_ATTEMPTS", "10"))
+RETRY_BATCH_SIZE = 200
+
+
+def song_blobs(song):
+    """Mọi blob của một bài: audio, lrc, các file HLS, các rendition."""
+    blobs = [song.get("gcs_audio_blob"), song.get("gcs_lrc_blob")]
+    blobs += (song.get("hls") or {}).get("blobs", [])
+    blobs += [r.get("blob") for r in song.get("renditions") or []]
+    return [blob for blob in blobs if blob]
+
+
+# Các field cần đọc để liệt kê blob của bài (song_blobs)
+SONG_BLOB_PROJECTION = {"title": 1, "gcs_audio_blob": 1, "gcs_lrc_blob": 1, "hls.blobs": 1, "renditions": 1}
+
+
+def next_attempt_at(attempts, now=None):
+    """Thời điểm thử lại sau `attempts` lần lỗi; None khi đã quá BLOB_DELETE_MAX_ATTEMPTS."""
+    if attempts >= BLOB_DELETE_MAX_ATTEMPTS:
+        return None
+    delay = min(BLOB_DELETE_RETRY_BASE * 2 ** (attempts - 1), BLOB_DELETE_RETRY_MAX_DELAY)
+    return (now or time.time()) + delay * random.uniform(0.9, 1.1)
+
+
+def queue_failed(bucket_name, blob_names, error="delete failed"):
+    """Ghi các blob xoá lỗi lần đầu vào hàng đợi. Returns số blob đã ghi."""
+    from backend.utils.mongodb import queue_blob_deletes
+
+    now = time.time()
+    return queue_blob_deletes([
+        {"bucket": bucket_name, "blob": blob, "attempts": 1, "next_attempt_at": next_attempt_at(1, now), "error": error}
+        for blob in blob_names
+    ])
+
+
+def delete_blobs(bucket_name, blob_names):
+    """
+    Xoá song song các blob; blob lỗi được đưa vào hàng đợi thử lại.
+    Returns (set blob đã xoá, set blob lỗi). Không ghi được hàng đợi (MongoDB lỗi) thì chỉ log.
+    """
+    from backend.utils import gcs
+
+    results = gcs.delete_files(bucket_name, blob_names)
+    deleted = {blob for blob, ok in results.items() if ok}
+    failed = set(results) - deleted
+    if failed:
+        try:
+            queue_failed(bucket_name, sorted(failed))
+        except Exception as e:
+            print(f"Warning: Could not queue {len(failed)} blob(s) for deletion retry: {e}")
+    return deleted, failed
+
+
+def retry_due(limit=RETRY_BATCH_SIZE):
+    """
+    Thử xoá lại các blob tới lượt (một lượt, xoá song song theo bucket).
+    Returns (số blob đã xoá, số blob vẫn lỗi).
+    """
+    from backend.utils import gcs
+    from backend.utils.mongodb import find_due_blob_deletes, queue_blob_deletes, remove_blob_deletes
+
+    now = time.time()
+    entries = find_due_blob_deletes(now, limit)
+    by_bucket = {}
+    for entry in entries:
+        by_bucket.setdefault(entry["bucket"], []).append(entry)
+
+    done, retry = [], []
+    for bucket_name, bucket_entries in by_bucket.items():
+        results = gcs.delete_files(bucket_name, [e["blob"] for e in bucket_entries])
+        for entry in bucket_entries:
+            if results.get(entry["blob"]):
+                done.append(entry["_id"])
+            else:
+                attempts = entry.get("attempts", 0) + 1
+                retry.append({"bucket": bucket_name, "blob": entry["blob"], "attempts": 1,
+                              "next_attempt_at": next_attempt_at(attempts, now), "error": "delete failed"})
+                if attempts >= BLOB_DELETE_MAX_ATTEMPTS:
+                    print(f"Warning: Giving up deleting {bucket_name}/{entry['blob']} after {attempts} attempts")
+    remove_blob_deletes(done)
+    queue_blob_deletes(retry)
+    return len(done), len(retry)
+
+
+class BlobDeleteRetrier:
+    """Background thread running retry_due() every `interval` seconds (với jitter nhỏ giữa các worker)."""
+
+    def __init__(self, interval=BLOB_DELETE_RETRY_INTERVAL):
+        self.interval = interval
+        self.runs = 0
+        self.deleted = 0
+        self.failed = 0
+        self.errors = 0
+        self.last_run_ms = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="blob-delete-retry", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def run_once(self):
+        started = time.perf_counter()
+        try:
+            deleted, failed = retry_due()
+            self.deleted += deleted
+            self.failed += failed
+        except Exception as e:
+            self.errors += 1
+            print(f"Warning: Blob deletion retry failed: {e}")
+        finally:
+            self.runs += 1
+            self.last_run_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval * random.uniform(0.9, 1.1)):
+            self.run_once()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "interval_s": self.interval,
+            "runs": self.runs,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "last_run_ms": self.last_run_ms,
+            "errors": self.errors,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Retry blob deletions that failed when tracks were deleted")
+    parser.add_argument("--once", action="store_true", help="Retry every due blob once and exit")
+    parser.add_argument("--list", action="store_true", help="List queued blobs")
+    args = parser.parse_args()
+
+    if args.list:
+        from backend.utils.mongodb import get_pending_blob_deletes
+
+        for entry in get_pending_blob_deletes():
+            due = entry.get("next_attempt_at")
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(due)) if due else "gave up"
+            print(f"{entry['_id']}  attempts={entry.get('attempts', 0)}  next={when}")
+    elif args.once:
+        started = time.perf_counter()
+        deleted, failed = retry_due(limit=0)
+        print(f"Deleted {deleted} blob(s), {failed} still failing in {(time.perf_counter() - started) * 1000:.0f} ms")
+    else:
+        parser.print_help()
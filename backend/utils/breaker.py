@@ -0,0 +1,230 @@
+"""
+Circuit breaker cho các dependency ngoài (MongoDB, GCS, Gemini).
+
+- closed: gọi bình thường; `failure_threshold` lỗi liên tiếp (hoặc call chậm hơn
+  `slow_call_ms`) thì chuyển sang open. Call mà thời gian tỉ lệ với khối lượng dữ liệu (scan
+  cả collection, upload/download file lớn) dùng `@breaker.protect(slow_call=False)`: chỉ
+  exception được tính, chậm thì không
+- open: fail ngay bằng CircuitOpenError, không chờ timeout của client; sau
+  `reset_timeout` giây thì sang half_open
+- half_open: cho đúng một call thăm dò đi qua; thành công thì đóng lại, lỗi thì mở tiếp
+
+Mỗi module client trong backend/utils tạo breaker của mình bằng get_breaker(name);
+breakers_snapshot() được đăng ký làm gauge trong /api/metrics. Mỗi call qua breaker là một
+tracing span `<breaker> <function>` (xem backend/utils/tracing.py).
+
+Cấu hình:
+    CIRCUIT_BREAKERS=true|false   (default: true)
+    BREAKER_FAILURE_THRESHOLD=5
+    BREAKER_RESET_TIMEOUT=30      (giây)
+"""
+
+import functools
+import os
+import threading
+import time
+
+from backend.utils.metrics import get_metrics
+from backend.utils.tracing import CLIENT, current_span, span
+
+CIRCUIT_BREAKERS = os.getenv("CIRCUIT_BREAKERS", "true").lower() in ("1", "true", "yes")
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the dependency while its breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Thread-safe breaker (call từ threadpool lẫn event loop).
+    is_failure(exc) quyết định exception nào là lỗi của dependency; exception khác
+    (ví dụ ObjectId không hợp lệ) nghĩa là dependency vẫn trả lời bình thường.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 slow_call_ms=None, is_failure=None, enabled=CIRCUIT_BREAKERS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_ms = slow_call_ms
+        self.is_failure = is_failure or (lambda exc: True)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self.calls = 0
+            self.rejected = 0
+            self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def _transition(self, state):
+        self._state = state
+        get_metrics().inc("breaker_transitions", breaker=self.name, state=state)
+        print(f"Circuit breaker {self.name}: {state}")
+
+    def unavailable(self, exc):
+        """True when exc means the dependency is unavailable (breaker open or a counted failure)."""
+        return isinstance(exc, CircuitOpenError) or self.is_failure(exc)
+
+    def before_call(self):
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == OPEN or (state == HALF_OPEN and self._probing):
+                self.rejected += 1
+                retry_after = self.reset_timeout - (now - self._opened_at)
+                raise CircuitOpenError(self.name, max(1.0, retry_after))
+            if state == HALF_OPEN:
+                self._probing = True
+            self.calls += 1
+
+    def record_success(self, started, slow_call=True):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        if slow_call and self.slow_call_ms is not None and elapsed_ms > self.slow_call_ms:
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+                self._transition(OPEN)
+
+    def _release(self):
+        # Call bị huỷ giữa chừng: không có kết quả, chỉ nhả lượt thăm dò
+        with self._lock:
+            self._probing = False
+
+    def _record_exception(self, exc, started, slow_call=True):
+        if self.is_failure(exc):
+            self.record_failure()
+        else:
+            self.record_success(started, slow_call)
+
+    def _span(self, func):
+        name = getattr(func, "__qualname__", None) or getattr(func, "__name__", "call")
+        return span(f"{self.name} {name.replace('.<locals>', '')}", CLIENT, **{"peer.service": self.name})
+
+    def call(self, func, *args, **kwargs):
+        return self._traced_call(func, args, kwargs, True)
+
+    def _traced_call(self, func, args, kwargs, slow_call):
+        if current_span() is None:
+            return self._call(func, args, kwargs, slow_call)
+        with self._span(func):
+            return self._call(func, args, kwargs, slow_call)
+
+    async def acall(self, func, *args, **kwargs):
+        if current_span() is None:
+            return await self._acall(func, *args, **kwargs)
+        with self._span(func):
+            return await self._acall(func, *args, **kwargs)
+
+    def _call(self, func, args, kwargs, slow_call):
+        if not self.enabled:
+            return func(*args, **kwargs)
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record_exception(e, started, slow_call)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self.record_success(started, slow_call)
+        return result
+
+    async def _acall(self, func, *args, **kwargs):
+        if not self.enabled:
+            return await func(*args, **kwargs)
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            self._record_exception(e, started)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self.record_success(started)
+        return result
+
+    def protect(self, func=None, *, slow_call=True):
+        """
+        Decorator: run func through this breaker.
+        slow_call=False: call chậm hơn slow_call_ms không bị tính là lỗi (bulk scan / file lớn).
+        """
+        if func is None:
+            return functools.partial(self.protect, slow_call=slow_call)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self._traced_call(func, args, kwargs, slow_call)
+        return wrapper
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            return {
+                "state": state,
+                "enabled": self.enabled,
+                "consecutive_failures": self._failures,
+                "calls": self.calls,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "open_for_s": round(now - self._opened_at, 1) if state != CLOSED and self._opened_at else None,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **config):
+    """Breaker dùng chung theo tên; config chỉ áp dụng ở lần tạo đầu tiên."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **config)
+        return breaker
+
+
+def breakers_snapshot():
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
@@ -0,0 +1,461 @@
+"""
+Cache dùng chung cho backend: signed URLs, lyrics đã parse, danh sách bài hát.
+
+Hai tầng:
+- LRUCache: in-process, TTL, nhanh nhất
+- SQLiteSharedStore: file SQLite (WAL) dùng chung giữa các uvicorn workers trên cùng máy,
+  kèm một counter trong file mmap để các process biết khi có invalidation mới
+
+Mỗi entry có tags (ví dụ "song:<id>", "songs"). invalidate(*tags) xoá entry ở
+cả hai tầng và ghi log invalidation, các process khác đọc counter mmap ở lần
+get() tiếp theo và xoá L1 tương ứng.
+
+Shared tier lưu value dạng JSON (bytes -> base64), không dùng pickle: file cache không bao giờ
+được thực thi. Thư mục cache được tạo với mode 0700; thư mục / file có sẵn mà không thuộc user
+của process thì bị từ chối (worker chỉ dùng L1). Value không encode được JSON chỉ nằm ở L1.
+
+Cấu hình:
+    CACHE_BACKEND=sqlite|memory   (default: sqlite)
+    CACHE_DIR=~/.cache/tunify-backend
+"""
+
+import base64
+import json
+import mmap
+import os
+import sqlite3
+import stat
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+CACHE_DIR = os.path.expanduser(os.getenv("CACHE_DIR", "~/.cache/tunify-backend"))
+L1_MAXSIZE = int(os.getenv("CACHE_L1_MAXSIZE", "2048"))
+
+# Giữ log invalidation đủ dài để process chậm vẫn bắt kịp; nếu bị tụt quá xa thì xoá toàn bộ L1
+INVALIDATION_LOG_SIZE = 10000
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry TTL and tags."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (value, expires_at, tags)
+        self._tags = {}             # tag -> set(keys)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        """ttl=None: không hết hạn; ttl <= 0 (ví dụ URL sắp hết hạn): không cache."""
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._data)
+
+
+_BYTES_KEY = "__bytes__"
+
+
+def _encode_default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {_BYTES_KEY: base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"{type(value).__name__} is not cacheable in the shared tier")
+
+
+def _decode_object(obj):
+    if len(obj) == 1 and _BYTES_KEY in obj:
+        return base64.b64decode(obj[_BYTES_KEY])
+    return obj
+
+
+def encode_value(value):
+    """Value -> bytes cho shared tier (JSON, bytes thành base64). Raises TypeError nếu không encode được."""
+    return json.dumps(value, default=_encode_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_value(data):
+    return json.loads(data, object_hook=_decode_object)
+
+
+def private_directory(directory):
+    """
+    Tạo (mode 0700) hoặc kiểm tra thư mục cache: phải là thư mục thật thuộc user của process,
+    user khác không ghi được, các file có sẵn trong đó cũng thuộc user này. Raises PermissionError.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return directory   # Windows: không có uid, dựa vào ACL của thư mục user
+    uid = os.getuid()
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != uid:
+        raise PermissionError(f"Cache directory {directory} is not a directory owned by uid {uid}")
+    if stat.S_IMODE(info.st_mode) & 0o022:
+        raise PermissionError(f"Cache directory {directory} is writable by other users")
+    for name in os.listdir(directory):
+        if os.lstat(os.path.join(directory, name)).st_uid != uid:
+            raise PermissionError(f"Cache file {os.path.join(directory, name)} is not owned by uid {uid}")
+    return directory
+
+
+class SQLiteSharedStore:
+    """
+    Shared cache tier backed by a SQLite file plus an 8-byte mmap counter
+    holding the latest invalidation sequence number.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        private_directory(directory)
+        self.path = os.path.join(directory, "cache.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, tags TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entry_tags (
+                tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS invalidations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT, tag TEXT NOT NULL
+            );
+        """)
+
+        counter_path = os.path.join(directory, "invalidation.seq")
+        fd = os.open(counter_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            self._counter = mmap.mmap(fd, 8)
+        finally:
+            os.close(fd)
+
+    def current_seq(self):
+        return struct.unpack_from("<Q", self._counter, 0)[0]
+
+    def get(self, key):
+        """Return (value, expires_at, tags) or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, tags FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, tags = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return decode_value(value), expires_at, tuple(t for t in tags.split("\x1f") if t)
+
+    def set(self, key, value, ttl=None, tags=(), since_seq=None):
+        """
+        Store an entry. If since_seq is given and one of the tags was invalidated
+        after that sequence number, the (now stale) value is not stored.
+        Returns True if stored (ttl <= 0: never). Raises TypeError if value cannot be encoded (encode_value).
+        """
+        if ttl is not None and ttl <= 0:
+            return False
+        expires_at = time.time() + ttl if ttl is not None else None
+        blob = encode_value(value)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if since_seq is not None and tags:
+                    placeholders = ",".join("?" * len(tags))
+                    stale = self._conn.execute(
+                        f"SELECT 1 FROM invalidations WHERE seq > ? AND tag IN ({placeholders}) LIMIT 1",
+                        (since_seq, *tags),
+                    ).fetchone()
+                    if stale:
+                        self._conn.execute("ROLLBACK")
+                        return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires_at, tags) VALUES (?, ?, ?, ?)",
+                    (key, blob, expires_at, "\x1f".join(tags)),
+                )
+                self._conn.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entry_tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags]
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
+            self._conn.execute("COMMIT")
+
+    def invalidate(self, *tags):
+        """Delete every entry carrying one of the tags and publish the invalidation."""
+        if not tags:
+            return self.current_seq()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = None
+                for tag in tags:
+                    self._conn.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag = ?)", (tag,)
+                    )
+                    self._conn.execute("DELETE FROM entry_tags WHERE tag = ?", (tag,))
+                    seq = self._conn.execute("INSERT INTO invalidations (tag) VALUES (?)", (tag,)).lastrowid
+                self._conn.execute("DELETE FROM invalidations WHERE seq <= ?", (seq - INVALIDATION_LOG_SIZE,))
+                # Ghi counter khi vẫn giữ write lock của SQLite => seq luôn tăng dần
+                struct.pack_into("<Q", self._counter, 0, seq)
+                self._conn.execute("COMMIT")
+                return seq
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def invalidations_since(self, seq):
+        """
+        Return (tags, complete, last_seq). complete=False means the log was pruned past seq.
+        last_seq: seq cuối đã commit (counter được ghi trước COMMIT nên có thể lớn hơn).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, tag FROM invalidations WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        complete = bool(rows) and rows[0][0] == seq + 1
+        return {tag for _, tag in rows}, complete, rows[-1][0] if rows else seq
+
+    def prune_expired(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "DELETE FROM entry_tags WHERE key IN (SELECT key FROM entries WHERE expires_at <= ?)", (time.time(),)
+            )
+            self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute("COMMIT")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM entry_tags")
+            self._conn.execute("COMMIT")
+
+
+class TieredCache:
+    """In-process LRU in front of an optional shared store."""
+
+    def __init__(self, shared=None, l1_maxsize=L1_MAXSIZE):
+        self.l1 = LRUCache(maxsize=l1_maxsize)
+        self.shared = shared
+        self._seen_seq = shared.current_seq() if shared else 0
+        self._local_seq = 0
+        self._sync_lock = threading.Lock()
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def current_seq(self):
+        return self.shared.current_seq() if self.shared else self._local_seq
+
+    def _sync(self):
+        """Apply invalidations published by other processes since the last call."""
+        if self.shared is None:
+            return
+        seq = self.shared.current_seq()
+        if seq == self._seen_seq:
+            return
+        with self._sync_lock:
+            if seq == self._seen_seq:
+                return
+            tags, complete, last_seq = self.shared.invalidations_since(self._seen_seq)
+            if last_seq == self._seen_seq:
+                # Invalidation chưa commit: chưa đọc được, lần sau thử lại
+                return
+            if complete:
+                self.l1.invalidate(*tags)
+            else:
+                self.l1.clear()
+            # Chỉ tới seq đã đọc được: phần chưa commit được áp dụng ở lần _sync sau
+            self._seen_seq = last_seq
+
+    def get(self, key, default=None):
+        self._sync()
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.shared is None:
+            return default
+        entry = self.shared.get(key)
+        if entry is None:
+            self.shared_misses += 1
+            return default
+        self.shared_hits += 1
+        value, expires_at, tags = entry
+        ttl = expires_at - time.time() if expires_at is not None else None
+        self.l1.set(key, value, ttl=ttl, tags=tags)
+        return value
+
+    def set(self, key, value, ttl=None, tags=(), since_seq=None):
+        tags = tuple(tags)
+        if ttl is not None and ttl <= 0:
+            # TTL tính ra đã hết (ví dụ ttl - SIGNED_URL_REFRESH_MARGIN): không cache
+            return False
+        stored_shared = False
+        if self.shared is not None:
+            try:
+                if not self.shared.set(key, value, ttl=ttl, tags=tags, since_seq=since_seq):
+                    return False
+                stored_shared = True
+            except TypeError:
+                pass   # Value không encode được JSON: chỉ giữ ở L1
+        if not stored_shared and since_seq is not None and since_seq != self.current_seq():
+            # Bỏ qua set nếu đã có invalidation trong lúc load
+            return False
+        self.l1.set(key, value, ttl=ttl, tags=tags)
+        if self.shared is not None and since_seq is not None and self.shared.current_seq() != since_seq:
+            # Có invalidation chen vào giữa shared.set và l1.set
+            invalidated, complete, _ = self.shared.invalidations_since(since_seq)
+            if not complete or invalidated.intersection(tags):
+                self.l1.delete(key)
+        return True
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        """Return the cached value or call loader() and cache its result."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        since_seq = self.current_seq()
+        value = loader()
+        self.set(key, value, ttl=ttl, tags=tags, since_seq=since_seq)
+        return value
+
+    def delete(self, key):
+        self.l1.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def invalidate(self, *tags):
+        self.l1.invalidate(*tags)
+        if self.shared is not None:
+            self.shared.invalidate(*tags)
+            self._sync()
+        else:
+            self._local_seq += 1
+
+    def clear(self):
+        self.l1.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        l1_total = self.l1.hits + self.l1.misses
+        shared_total = self.shared_hits + self.shared_misses
+        return {
+            "backend": "sqlite" if self.shared is not None else "memory",
+            "l1_size": len(self.l1),
+            "l1_hits": self.l1.hits,
+            "l1_misses": self.l1.misses,
+            "l1_hit_ratio": round(self.l1.hits / l1_total, 4) if l1_total else None,
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "shared_hit_ratio": round(self.shared_hits / shared_total, 4) if shared_total else None,
+            "invalidation_seq": self.current_seq(),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, created on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                shared = None
+                if CACHE_BACKEND == "sqlite":
+                    try:
+                        shared = SQLiteSharedStore(CACHE_DIR)
+                    except (OSError, sqlite3.Error) as e:
+                        print(f"Warning: Could not open shared cache in {CACHE_DIR}, using memory only: {e}")
+                _cache = TieredCache(shared=shared)
+    return _cache
+
+
+def song_tag(song_id):
+    return f"song:{song_id}"
+
+
+# Tag cho danh sách bài hát (/api/songs)
+SONGS_TAG = "songs"
+
+
+def invalidate_song(song_id=None):
+    """Invalidate everything cached for one song plus the song list."""
+    tags = [SONGS_TAG]
+    if song_id is not None:
+        tags.append(song_tag(song_id))
+    get_cache().invalidate(*tags)
+
+
+def invalidate_songs(song_ids):
+    """invalidate_song cho nhiều bài trong một lần invalidate."""
+    get_cache().invalidate(SONGS_TAG, *(song_tag(song_id) for song_id in song_ids))
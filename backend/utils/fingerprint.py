@@ -0,0 +1,505 @@
+"""
+Acoustic fingerprint để phát hiện bài trùng lúc import (cùng bài nhưng mp3 / m4a, bitrate khác).
+
+Fingerprint (kiểu Philips / Haitsma-Kalker): audio được decode bằng ffmpeg thành mono
+SAMPLE_RATE Hz (FINGERPRINT_SECONDS giây đầu), cắt frame FRAME_SIZE mẫu mỗi HOP_SIZE mẫu
+(~23 ms), FFT cả batch frame bằng NumPy rồi lấy năng lượng 33 band log từ 300 tới 2000 Hz.
+Mỗi frame cho một sub-fingerprint 32 bit: bit m = dấu của hiệu năng lượng band m, m+1 giữa
+hai frame liên tiếp. Re-encode chỉ lật một ít bit (bit error rate thấp), bài khác nhau thì ~0.5.
+
+Index (FingerprintIndex): chỉ lưu các sub-fingerprint có value % INDEX_SAMPLE == 0 (~1/64,
+chọn theo nội dung nên không phụ thuộc độ lệch thời gian giữa hai bản) kèm vị trí frame, trong
+các mảng NumPy đã sort. Query thử mỗi frame cùng các biến thể lật WEAK_BITS bit kém tin cậy nhất
+(hiệu năng lượng gần 0, dễ bị lật khi re-encode), lấy các entry trùng key bằng searchsorted rồi
+vote theo (bài, độ lệch vị trí): bản trùng cho nhiều vote ở cùng một độ lệch. Các ứng viên đủ
+vote được xác nhận bằng bit error rate trên toàn bộ fingerprint (collection `fingerprints`).
+
+Cần numpy và ffmpeg (không bắt buộc): thiếu một trong hai thì import bỏ qua bước kiểm tra trùng.
+
+Cấu hình:
+    FINGERPRINTING=true|false      (default: true)
+    FINGERPRINT_SECONDS=120
+    FINGERPRINT_MATCH_BER=0.3      (bit error rate tối đa để coi là cùng một bản thu)
+
+CLI:
+    uv run python -m backend.utils.fingerprint --backfill    # fingerprint các bài đã có
+    uv run python -m backend.utils.fingerprint path/to/file.mp3
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FINGERPRINTING = os.getenv("FINGERPRINTING", "true").lower() in ("1", "true", "yes")
+FINGERPRINT_SECONDS = float(os.getenv("FINGERPRINT_SECONDS", "120"))
+FINGERPRINT_MATCH_BER = float(os.getenv("FINGERPRINT_MATCH_BER", "0.3"))
+
+SAMPLE_RATE = 5512
+FRAME_SIZE = 2048             # ~371 ms
+HOP_SIZE = 128                # ~23 ms
+BANDS = 33                    # 33 band -> 32 bit
+MIN_FREQ, MAX_FREQ = 300, 2000
+FFT_CHUNK = 1024              # Số frame FFT mỗi lần (giới hạn bộ nhớ)
+SILENCE_RATIO = 1e-4          # Frame có năng lượng dưới tỉ lệ này so với frame lớn nhất: value 0
+
+INDEX_SAMPLE = 64             # Index các sub-fingerprint có value % 64 == 0
+WEAK_BITS = 4                 # Query thử 2^4 biến thể mỗi frame
+DELTA_BIN = 2                 # Gộp độ lệch vị trí theo 2 frame (~46 ms) khi vote
+MIN_VOTES = 3                 # Ứng viên cần tối thiểu số vote này mới được kiểm tra BER
+MAX_CANDIDATES = 10
+MIN_OVERLAP_SECONDS = 10      # Hai fingerprint phải chồng nhau ít nhất 10s mới so BER
+COMPACT_RATIO = 0.25          # Build lại index khi >25% entry thuộc bài đã xoá
+MERGE_RATIO = 0.05            # Gộp phần mới thêm vào mảng chính khi vượt 5% (tối thiểu MERGE_MIN)
+MERGE_MIN = 50_000
+
+FRAMES_PER_SECOND = SAMPLE_RATE / HOP_SIZE
+
+
+def numpy_available():
+    return np is not None
+
+
+def fingerprinting_available():
+    """True khi bật FINGERPRINTING và có numpy + ffmpeg."""
+    return FINGERPRINTING and numpy_available() and shutil.which("ffmpeg") is not None
+
+
+def decode_audio(source, seconds=FINGERPRINT_SECONDS):
+    """Decode file / URL thành mono float32 SAMPLE_RATE Hz (tối đa `seconds` giây đầu) bằng ffmpeg."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", source, "-t", str(seconds),
+         "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"],
+        capture_output=True, check=True, timeout=120,
+    )
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768.0
+
+
+_band_cache = {}
+
+
+def _band_edges():
+    """Chỉ số FFT bin bắt đầu của mỗi band (và bin cuối), log-spaced MIN_FREQ..MAX_FREQ."""
+    if "edges" not in _band_cache:
+        freqs = np.geomspace(MIN_FREQ, MAX_FREQ, BANDS + 1)
+        _band_cache["edges"] = np.round(freqs * FRAME_SIZE / SAMPLE_RATE).astype(np.int64)
+        _band_cache["window"] = np.hanning(FRAME_SIZE).astype(np.float32)
+    return _band_cache["edges"], _band_cache["window"]
+
+
+def compute_fingerprint(samples, weak_bits=0):
+    """
+    Mono float32 SAMPLE_RATE Hz -> uint32 sub-fingerprints (một value mỗi HOP_SIZE mẫu).
+    weak_bits > 0: trả về (values, weak) với weak là mask (n, weak_bits) của các bit kém tin cậy nhất.
+    """
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    if len(samples) < FRAME_SIZE + HOP_SIZE:
+        values = np.zeros(0, dtype=np.uint32)
+        return (values, np.zeros((0, weak_bits), dtype=np.uint32)) if weak_bits else values
+    edges, window = _band_edges()
+    frames = sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    energies = np.empty((len(frames), BANDS), dtype=np.float32)
+    for start in range(0, len(frames), FFT_CHUNK):
+        spectrum = np.fft.rfft(frames[start:start + FFT_CHUNK] * window, axis=1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2)[:, edges[0]:edges[-1]]
+        energies[start:start + FFT_CHUNK] = np.add.reduceat(power, edges[:-1] - edges[0], axis=1)
+
+    band_diff = energies[:, :-1] - energies[:, 1:]
+    diff = band_diff[1:] - band_diff[:-1]
+    values = np.packbits(diff > 0, axis=1).view(">u4").ravel().astype(np.uint32)
+
+    # Frame gần như im lặng: bit chỉ là nhiễu, đánh dấu 0 (không được index)
+    loudness = energies.sum(axis=1)[1:]
+    values[loudness < loudness.max() * SILENCE_RATIO] = 0
+    if not weak_bits:
+        return values
+    # Bit 0 là MSB (packbits big-endian)
+    weakest = np.argpartition(np.abs(diff), weak_bits, axis=1)[:, :weak_bits]
+    return values, (np.uint32(1) << (31 - weakest).astype(np.uint32))
+
+
+def fingerprint_file(source, seconds=FINGERPRINT_SECONDS):
+    """Decode + fingerprint một file. Chạy trong process pool. Returns (values, weak) như compute_fingerprint."""
+    return compute_fingerprint(decode_audio(source, seconds), weak_bits=WEAK_BITS)
+
+
+def sample_keys(values):
+    """Các sub-fingerprint được index: (keys uint32, vị trí frame uint16)."""
+    positions = np.flatnonzero((values % INDEX_SAMPLE == 0) & (values != 0))
+    return values[positions], positions.astype(np.uint16)
+
+
+def query_keys(values, weak):
+    """
+    Key để tra index cho một fingerprint cần kiểm tra: mỗi frame và các biến thể lật mọi tổ hợp
+    bit trong `weak`, chỉ giữ biến thể có value % INDEX_SAMPLE == 0. Returns (keys, positions).
+    """
+    count = weak.shape[1]
+    variants = np.repeat(values[:, None], 1 << count, axis=1)                   # (n, 2^count)
+    for bit in range(count):
+        # Cột c lật bit `bit` khi bit đó có trong c
+        variants[:, (np.arange(1 << count) >> bit) & 1 == 1] ^= weak[:, bit:bit + 1]
+    selected = (variants % INDEX_SAMPLE == 0) & (variants != 0) & (values != 0)[:, None]
+    rows, _ = np.nonzero(selected)
+    return variants[selected], rows.astype(np.uint16)
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(values).sum())
+    return int(np.unpackbits(values.view(np.uint8)).sum())
+
+
+def bit_error_rate(a, b, delta):
+    """
+    Tỉ lệ bit khác nhau khi đặt a[i + delta] cạnh b[i] (delta: độ lệch frame, a so với b).
+    1.0 nếu phần chồng nhau ngắn hơn MIN_OVERLAP_SECONDS.
+    """
+    if delta >= 0:
+        a, b = a[delta:], b
+    else:
+        a, b = a, b[-delta:]
+    length = min(len(a), len(b))
+    if length < MIN_OVERLAP_SECONDS * FRAMES_PER_SECOND:
+        return 1.0
+    return _popcount(a[:length] ^ b[:length]) / (32 * length)
+
+
+class FingerprintIndex:
+    """
+    Sorted NumPy arrays (key, slot, position) + một phần "pending" nhỏ cho các bài mới thêm,
+    gộp vào mảng chính khi vượt MERGE_RATIO. Xoá bài chỉ đánh dấu slot, compact khi cần.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        empty = (np.zeros(0, np.uint32), np.zeros(0, np.uint32), np.zeros(0, np.uint16))
+        self._main = empty
+        self._pending = []             # [(keys, slots, positions)] chưa sort
+        self._pending_sorted = empty
+        self._pending_count = 0
+        self._slot_song = []           # slot -> song_id (None = đã xoá)
+        self._alive = bytearray()      # slot -> 1 / 0, đọc bằng np.frombuffer khi query
+        self._slot_entries = []
+        self._slots = {}               # song_id -> slot
+        self._versions = {}
+        self._dead_entries = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def version(self, song_id):
+        return self._versions.get(song_id)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._main[0]) + self._pending_count
+            return {
+                "songs": len(self._slots),
+                "entries": entries - self._dead_entries,
+                "dead_entries": self._dead_entries,
+                "bytes": sum(a.nbytes for a in self._main) + sum(a.nbytes for p in self._pending for a in p),
+            }
+
+    def add(self, song_id, keys, positions, version=None):
+        with self._lock:
+            self._remove(song_id)
+            slot = len(self._slot_song)
+            self._slot_song.append(song_id)
+            self._alive.append(1)
+            self._slot_entries.append(len(keys))
+            self._slots[song_id] = slot
+            self._versions[song_id] = version
+            self._pending.append((
+                np.asarray(keys, dtype=np.uint32),
+                np.full(len(keys), slot, dtype=np.uint32),
+                np.asarray(positions, dtype=np.uint16),
+            ))
+            self._pending_count += len(keys)
+            self._pending_sorted = None
+            if self._pending_count > max(MERGE_MIN, MERGE_RATIO * len(self._main[0])):
+                self._merge()
+
+    def load(self, docs):
+        """Build lại toàn bộ index từ các document fingerprints (keys / positions dạng bytes)."""
+        with self._lock:
+            self._clear()
+            for doc in docs:
+                keys = np.frombuffer(doc["keys"], dtype=np.uint32)
+                positions = np.frombuffer(doc["positions"], dtype=np.uint16)
+                slot = len(self._slot_song)
+                self._slot_song.append(doc["_id"])
+                self._alive.append(1)
+                self._slot_entries.append(len(keys))
+                self._slots[doc["_id"]] = slot
+                self._versions[doc["_id"]] = doc.get("version")
+                self._pending.append((keys, np.full(len(keys), slot, dtype=np.uint32), positions))
+                self._pending_count += len(keys)
+            self._merge()
+
+    def remove(self, song_id):
+        with self._lock:
+            self._remove(song_id)
+            total = len(self._main[0]) + self._pending_count
+            if total and self._dead_entries > COMPACT_RATIO * total:
+                self._compact()
+
+    def _remove(self, song_id):
+        slot = self._slots.pop(song_id, None)
+        self._versions.pop(song_id, None)
+        if slot is not None:
+            self._slot_song[slot] = None
+            self._alive[slot] = 0
+            self._dead_entries += self._slot_entries[slot]
+
+    @staticmethod
+    def _sorted(parts):
+        keys, slots, positions = (np.concatenate([p[i] for p in parts]) for i in range(3))
+        order = np.argsort(keys, kind="stable")
+        return keys[order], slots[order], positions[order]
+
+    def _merge(self):
+        if self._pending:
+            self._main = self._sorted([self._main] + self._pending)
+        self._pending = []
+        self._pending_sorted = None
+        self._pending_count = 0
+
+    def _compact(self):
+        self._merge()
+        alive = np.frombuffer(bytes(self._alive), dtype=bool)
+        keys, slots, positions = self._main
+        keep = alive[slots]
+        # Đánh số lại slot cho các bài còn lại
+        new_slot = np.cumsum(alive, dtype=np.int64) - 1
+        songs = [(song_id, self._versions[song_id], self._slot_entries[slot])
+                 for slot, song_id in enumerate(self._slot_song) if song_id is not None]
+        self._clear()
+        self._main = (keys[keep], new_slot[slots[keep]].astype(np.uint32), positions[keep])
+        for slot, (song_id, version, entries) in enumerate(songs):
+            self._slot_song.append(song_id)
+            self._alive.append(1)
+            self._slot_entries.append(entries)
+            self._slots[song_id] = slot
+            self._versions[song_id] = version
+
+    def _segments(self):
+        if self._pending and self._pending_sorted is None:
+            self._pending_sorted = self._sorted(self._pending)
+        return [self._main] + ([self._pending_sorted] if self._pending else [])
+
+    def candidates(self, keys, positions, limit=MAX_CANDIDATES, min_votes=MIN_VOTES):
+        """
+        Bài có nhiều key trùng ở cùng một độ lệch vị trí.
+        Returns [(song_id, votes, delta)] theo votes giảm dần; delta = vị trí trong bài đó - vị trí trong query.
+        """
+        if len(keys) == 0:
+            return []
+        keys = np.asarray(keys, dtype=np.uint32)
+        positions = np.asarray(positions, dtype=np.int64)
+        with self._lock:
+            found_slots, found_deltas = [], []
+            for seg_keys, seg_slots, seg_positions in self._segments():
+                lo = np.searchsorted(seg_keys, keys, side="left")
+                counts = np.searchsorted(seg_keys, keys, side="right") - lo
+                total = int(counts.sum())
+                if not total:
+                    continue
+                # Mở rộng các khoảng [lo, lo + count) thành danh sách chỉ số (vectorized)
+                query_idx = np.repeat(np.arange(len(keys)), counts)
+                rows = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(total)
+                found_slots.append(seg_slots[rows].astype(np.int64))
+                found_deltas.append(seg_positions[rows].astype(np.int64) - positions[query_idx])
+            if not found_slots:
+                return []
+            slots = np.concatenate(found_slots)
+            deltas = np.concatenate(found_deltas)
+            live = np.frombuffer(self._alive, dtype=bool)[slots]
+            slots, deltas = slots[live], deltas[live]
+
+            span = 1 << 20
+            pairs, votes = np.unique(slots * span + (deltas // DELTA_BIN + span // 2), return_counts=True)
+            pair_slots = pairs // span
+            # Mỗi bài giữ độ lệch có nhiều vote nhất
+            order = np.lexsort((-votes, pair_slots))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = pair_slots[order][1:] != pair_slots[order][:-1]
+            best = order[first]
+            best = best[votes[best] >= min_votes]
+            best = best[np.argsort(-votes[best], kind="stable")][:limit]
+            return [
+                (self._slot_song[int(pair_slots[i])], int(votes[i]), int((pairs[i] % span - span // 2) * DELTA_BIN))
+                for i in best
+            ]
+
+
+def match(index, values, weak, load_values, exclude=None, max_ber=FINGERPRINT_MATCH_BER):
+    """
+    Bài trong index có cùng bản thu với fingerprint (values, weak) của compute_fingerprint.
+    load_values(song_id) -> fingerprint đầy đủ (uint32 ndarray) hoặc None.
+    Returns [{"song_id", "ber", "offset_s", "votes"}] theo ber tăng dần.
+    """
+    keys, positions = query_keys(values, weak)
+    matches = []
+    for song_id, votes, delta in index.candidates(keys, positions):
+        if song_id == exclude:
+            continue
+        stored = load_values(song_id)
+        if stored is None:
+            continue
+        # delta là độ lệch đã gộp theo DELTA_BIN: thử các vị trí lân cận, lấy BER nhỏ nhất
+        ber = min(bit_error_rate(stored, values, delta + shift) for shift in range(-DELTA_BIN, DELTA_BIN + 1))
+        if ber <= max_ber:
+            matches.append({
+                "song_id": song_id,
+                "ber": round(ber, 3),
+                "offset_s": round(delta / FRAMES_PER_SECOND, 2),
+                "votes": votes,
+            })
+    return sorted(matches, key=lambda m: m["ber"])
+
+
+_index = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_fingerprint_index():
+    global _index
+    if _index is None:
+        with _load_lock:
+            if _index is None:
+                _index = FingerprintIndex()
+    return _index
+
+
+def ensure_loaded():
+    """Build index từ MongoDB ở lần dùng đầu tiên (an toàn khi gọi từ nhiều thread)."""
+    global _loaded
+    index = get_fingerprint_index()
+    if _loaded:
+        return index
+    with _load_lock:
+        if not _loaded:
+            from backend.utils.mongodb import get_all_fingerprint_keys
+            started = time.perf_counter()
+            index.load(get_all_fingerprint_keys())
+            _loaded = True
+            print(f"Fingerprint index: {index.stats()} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return index
+
+
+def mark_stale():
+    global _loaded
+    _loaded = False
+
+
+def load_values(song_id):
+    from backend.utils.mongodb import get_fingerprint
+
+    doc = get_fingerprint(song_id)
+    return np.frombuffer(doc["values"], dtype=np.uint32) if doc else None
+
+
+def find_duplicates(values, weak, exclude=None):
+    """Bài đã có trùng bản thu với fingerprint vừa tính (xem match)."""
+    return match(ensure_loaded(), values, weak, load_values, exclude=exclude)
+
+
+def index_song(song_id, values):
+    """Lưu fingerprint của một bài (import / đổi file audio) và cập nhật index của worker này."""
+    from backend.utils.mongodb import upsert_fingerprint
+
+    song_id = str(song_id)
+    keys, positions = sample_keys(values)
+    version = time.time()
+    upsert_fingerprint(song_id, {
+        "values": values.astype("<u4").tobytes(),
+        "keys": keys.astype("<u4").tobytes(),
+        "positions": positions.astype("<u2").tobytes(),
+        "version": version,
+    })
+    if _loaded:
+        get_fingerprint_index().add(song_id, keys, positions, version)
+
+
+def unindex_song(song_id):
+    from backend.utils.mongodb import delete_fingerprint
+
+    song_id = str(song_id)
+    delete_fingerprint(song_id)
+    if _index is not None:
+        _index.remove(song_id)
+
+
+def forget_songs(song_ids):
+    """Bỏ các bài khỏi index của worker này (document fingerprint đã xoá cùng bài, xem delete_songs_by_ids)."""
+    if _index is not None:
+        for song_id in song_ids:
+            _index.remove(str(song_id))
+
+
+def refresh_song(song_id):
+    """Đồng bộ một bài từ MongoDB (worker khác import / đổi audio / xoá bài)."""
+    if not _loaded:
+        return
+    from backend.utils.mongodb import get_fingerprint
+
+    doc = get_fingerprint(song_id, keys_only=True)
+    index = get_fingerprint_index()
+    if doc is None:
+        index.remove(song_id)
+    elif doc.get("version") != index.version(song_id):
+        index.add(song_id, np.frombuffer(doc["keys"], dtype=np.uint32),
+                  np.frombuffer(doc["positions"], dtype=np.uint16), doc.get("version"))
+
+
+def backfill(force=False):
+    """Fingerprint các bài đã có audio nhưng chưa có fingerprint (ffmpeg đọc thẳng signed URL)."""
+    from backend.utils.gcs import GCS_BUCKET_NAME, generate_signed_url
+    from backend.utils.mongodb import get_all_fingerprint_keys, get_song_list
+
+    done_ids = set() if force else {doc["_id"] for doc in get_all_fingerprint_keys()}
+    done = 0
+    for song in get_song_list():
+        if song["_id"] in done_ids or not song.get("gcs_audio_blob"):
+            continue
+        try:
+            values, _ = fingerprint_file(generate_signed_url(GCS_BUCKET_NAME, song["gcs_audio_blob"]))
+            index_song(song["_id"], values)
+            done += 1
+            print(f"✅ {song.get('title')}: {len(values)} frames")
+        except Exception as e:
+            print(f"❌ {song.get('title')}: {e}")
+    return done
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Acoustic fingerprints for duplicate detection")
+    parser.add_argument("file", nargs="?", help="Fingerprint a local file and list likely duplicates")
+    parser.add_argument("--backfill", action="store_true", help="Fingerprint songs imported before fingerprinting existed")
+    parser.add_argument("--force", action="store_true", help="With --backfill: re-fingerprint every song")
+    args = parser.parse_args()
+
+    if not fingerprinting_available():
+        raise SystemExit("Fingerprinting needs numpy and ffmpeg (and FINGERPRINTING=true)")
+    if args.backfill:
+        print(f"Fingerprinted {backfill(force=args.force)} song(s)")
+    if args.file:
+        started = time.perf_counter()
+        values, weak = fingerprint_file(args.file)
+        print(f"{len(values)} frames ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        for duplicate in find_duplicates(values, weak):
+            print(f"  {duplicate['song_id']} ber {duplicate['ber']} offset {duplicate['offset_s']}s votes {duplicate['votes']}")
@@ -1,9 +1,12 @@
 import datetime
 import os
 import json
-from google.cloud import storage
-from google.oauth2 import service_account
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
+from backend.utils.breaker import get_breaker
+from backend.utils.tracing import set_attribute, traced
 
 # Load environment variables
 load_dotenv()
@@ -12,35 +15,82 @@ load_dotenv()
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "vinhnb-tunify")
 GCS_SERVICE_ACCOUNT_JSON = os.getenv("GCS_SERVICE_ACCOUNT_JSON", "{}")
 
+# Thời hạn của signed URL
+SIGNED_URL_EXPIRATION = datetime.timedelta(minutes=15)
+
+# Timeout (giây) khi tải file từ GCS qua signed URL; tải / upload chậm hơn GCS_SLOW_CALL_MS
+# thì circuit breaker tính là lỗi (trừ upload_file / download_if_changed: chậm theo kích thước file)
+GCS_TIMEOUT = float(os.getenv("GCS_TIMEOUT", "10"))
+GCS_SLOW_CALL_MS = 5000
+# Timeout của một lần PUT vào resumable upload session (upload_chunk)
+GCS_UPLOAD_TIMEOUT = float(os.getenv("GCS_UPLOAD_TIMEOUT", "30"))
+# Số request xoá blob chạy song song (delete_files); connection pool của client GCS giữ 10 kết nối
+GCS_DELETE_CONCURRENCY = int(os.getenv("GCS_DELETE_CONCURRENCY", "10"))
+
+breaker = get_breaker("gcs", slow_call_ms=GCS_SLOW_CALL_MS)
+
+# google.cloud.storage import rất nặng -> chỉ import ở lần dùng đầu tiên.
+# Credentials và client được cache lại thay vì tạo mới mỗi lần gọi.
+_credentials = None
+_project_id = None
+_storage_client = None
+_client_lock = threading.Lock()
+
 def get_credentials():
-    """Get service account credentials from environment variable JSON."""
-    service_account_info = json.loads(GCS_SERVICE_ACCOUNT_JSON)
-    credentials = service_account.Credentials.from_service_account_info(service_account_info)
-    return credentials, service_account_info.get("project_id")
+    """Get (cached) service account credentials from environment variable JSON."""
+    global _credentials, _project_id
+    if _credentials is None:
+        with _client_lock:
+            if _credentials is None:
+                from google.oauth2 import service_account
+                service_account_info = json.loads(GCS_SERVICE_ACCOUNT_JSON)
+                _project_id = service_account_info.get("project_id")
+                _credentials = service_account.Credentials.from_service_account_info(service_account_info)
+    return _credentials, _project_id
 
 def get_storage_client():
-    """Create a GCS storage client from environment variable JSON."""
-    credentials, project_id = get_credentials()
-    return storage.Client(credentials=credentials, project=project_id)
+    """Return the shared GCS storage client, creating it on first use."""
+    global _storage_client
+    if _storage_client is None:
+        credentials, project_id = get_credentials()
+        with _client_lock:
+            if _storage_client is None:
+                from google.cloud import storage
+                _storage_client = storage.Client(credentials=credentials, project=project_id)
+    return _storage_client
 
+def content_type_for(destination_blob_name):
+    """
+    Tự động xác định loại nội dung (ví dụ: audio/mpeg cho file mp3)
+    Điều này giúp việc streaming nhạc sau này mượt mà hơn
+    """
+    content_type = None
+    if destination_blob_name.endswith('.mp3'):
+        content_type = 'audio/mpeg'
+    elif destination_blob_name.endswith('.lrc'):
+        content_type = 'text/plain'
+    elif destination_blob_name.endswith('.m3u8'):
+        content_type = 'application/vnd.apple.mpegurl'
+    elif destination_blob_name.endswith('.ts'):
+        content_type = 'video/mp2t'
+    elif destination_blob_name.endswith('.m4a'):
+        content_type = 'audio/mp4'
+    elif destination_blob_name.endswith('.ogg'):
+        content_type = 'audio/ogg'
+    return content_type
+
+@breaker.protect(slow_call=False)
 def upload_file(bucket_name, source_file_path, destination_blob_name):
     """
     Upload một file từ máy local lên Google Cloud Storage.
     """
-    # Khởi tạo client từ environment variable
+    # Lấy client dùng chung
     storage_client = get_storage_client()
     
     # Lấy bucket và tạo một đối tượng blob mới
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
-
-    # Tự động xác định loại nội dung (ví dụ: audio/mpeg cho file mp3)
-    # Điều này giúp việc streaming nhạc sau này mượt mà hơn
-    content_type = None
-    if destination_blob_name.endswith('.mp3'):
-        content_type = 'audio/mpeg'
-    elif destination_blob_name.endswith('.lrc'):
-        content_type = 'text/plain'
+    content_type = content_type_for(destination_blob_name)
 
     print(f"Đang upload file {source_file_path} lên GCS với tên {destination_blob_name}...")
     
@@ -50,11 +100,47 @@ def upload_file(bucket_name, source_file_path, destination_blob_name):
     print(f"✅ Upload thành công!")
     return blob.name
 
+@breaker.protect
+def create_upload_session(bucket_name, destination_blob_name, size):
+    """
+    Mở một GCS resumable upload session cho file `size` bytes.
+    Trả về session URL: worker nào cũng PUT tiếp được (upload_chunk), không cần credentials.
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(destination_blob_name)
+    return blob.create_resumable_upload_session(content_type=content_type_for(destination_blob_name), size=size)
+
+async def upload_chunk(http_client, session_url, data, offset, total, timeout=GCS_UPLOAD_TIMEOUT):
+    """
+    PUT bytes [offset, offset + len(data)) vào resumable upload session (qua circuit breaker).
+    Trừ đoạn cuối, len(data) phải là bội số của 256 KiB. Returns số byte GCS đã lưu.
+    """
+    headers = {"Content-Range": f"bytes {offset}-{offset + len(data) - 1}/{total}"}
+
+    async def put():
+        response = await http_client.put(session_url, content=data, headers=headers, timeout=timeout)
+        set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    response = await breaker.acall(put)
+    if response.status_code in (200, 201):
+        return total
+    if response.status_code == 308:
+        # "Range: bytes=0-N": GCS đã lưu N + 1 byte đầu
+        committed = response.headers.get("range")
+        return int(committed.rsplit("-", 1)[1]) + 1 if committed else 0
+    response.raise_for_status()
+    raise RuntimeError(f"Unexpected resumable upload response {response.status_code}")
+
 def delete_file(bucket_name, blob_name):
     """
     Xóa một file khỏi Google Cloud Storage.
+    File không còn tồn tại (đã xoá ở lần trước) cũng tính là thành công.
     """
-    # 1. Khởi tạo client (giống như việc bạn cầm chìa khóa vào kho)
+    from google.api_core.exceptions import NotFound
+
+    # 1. Lấy client dùng chung (giống như việc bạn cầm chìa khóa vào kho)
     storage_client = get_storage_client()
     
     # 2. Xác định cái thùng (bucket) chứa file
@@ -65,28 +151,71 @@ def delete_file(bucket_name, blob_name):
 
     print(f"Đang tiến hành xóa file {blob_name} khỏi bucket {bucket_name}...")
 
+    def delete():
+        try:
+            blob.delete()
+        except NotFound:
+            print(f"File {blob_name} không còn tồn tại")
+
     # 4. Thực hiện lệnh xóa
     try:
-        blob.delete()
+        breaker.call(delete)
         print(f"✅ Xóa file thành công!")
         return True
     except Exception as e:
         print(f"❌ Có lỗi xảy ra khi xóa file: {e}")
         return False
 
+def delete_files(bucket_name, blob_names, max_workers=None):
+    """
+    Xóa nhiều file song song (tối đa GCS_DELETE_CONCURRENCY request cùng lúc, client dùng chung).
+    Returns {blob_name: True/False}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    blob_names = list(dict.fromkeys(blob_names))
+    if not blob_names:
+        return {}
+    workers = min(max_workers or GCS_DELETE_CONCURRENCY, len(blob_names))
+    # delete_file tra theo tên module lúc gọi (benchmark thay bằng stand-in)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gcs-delete") as pool:
+        results = pool.map(lambda blob_name: delete_file(bucket_name, blob_name), blob_names)
+        return dict(zip(blob_names, results))
+
+@breaker.protect(slow_call=False)
+def download_if_changed(bucket_name, blob_name, destination, generation=None):
+    """
+    Tải blob về `destination` (atomic) nếu generation trên GCS khác `generation`.
+    Returns generation mới, hoặc None khi không đổi / blob chưa có.
+    """
+    blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+    if blob is None or blob.generation == generation:
+        return None
+    tmp_path = f"{destination}.{os.getpid()}.part"
+    blob.download_to_filename(tmp_path, if_generation_match=blob.generation)
+    os.replace(tmp_path, destination)
+    return blob.generation
+
+@breaker.protect
+def download_text(bucket_name, blob_name):
+    """Tải nội dung text (UTF-8) của một file trên GCS."""
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    return blob.download_as_text(encoding="utf-8")
+
+@traced("gcs generate_signed_url")
 def generate_signed_url(bucket_name, blob_name):
     """Tạo một Signed URL để truy cập file riêng tư trong thời gian ngắn."""
     
-    # Get credentials and storage client
-    credentials, project_id = get_credentials()
-    storage_client = storage.Client(credentials=credentials, project=project_id)
+    # Ký URL hoàn toàn local bằng private key, không cần gọi mạng
+    credentials, _ = get_credentials()
+    storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
 
     # Tạo Signed URL (V4)
     url = blob.generate_signed_url(
         version="v4",
-        expiration=datetime.timedelta(minutes=15),
+        expiration=SIGNED_URL_EXPIRATION,
         method="GET",
         credentials=credentials,
     )
@@ -94,6 +223,48 @@ def generate_signed_url(bucket_name, blob_name):
     return url
 
 
+async def fetch_blob(http_client, url, timeout=GCS_TIMEOUT):
+    """
+    GET một signed URL qua circuit breaker của GCS (httpx.AsyncClient dùng chung).
+    Lỗi 5xx / timeout tính là lỗi của GCS; 4xx được trả về cho caller tự xử lý.
+    """
+    async def get():
+        response = await http_client.get(url, timeout=timeout)
+        set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    return await breaker.acall(get)
+
+
+def signed_url_expires_at(url):
+    """
+    Đọc thời điểm hết hạn (epoch seconds) từ query string của signed URL.
+    Hỗ trợ V4 (X-Goog-Date + X-Goog-Expires), V2 (Expires) và URL có `expires`.
+    Trả về None nếu không xác định được.
+    """
+    if not url:
+        return None
+    try:
+        query = {k.lower(): v[0] for k, v in parse_qs(urlparse(url).query).items()}
+        if "x-goog-date" in query and "x-goog-expires" in query:
+            signed_at = datetime.datetime.strptime(query["x-goog-date"], "%Y%m%dT%H%M%SZ")
+            signed_at = signed_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+            return signed_at + int(query["x-goog-expires"])
+        if "expires" in query:
+            return float(query["expires"])
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+def signed_url_ttl(url):
+    """Số giây còn lại trước khi signed URL hết hạn (None nếu không xác định được)."""
+    expires_at = signed_url_expires_at(url)
+    return expires_at - time.time() if expires_at is not None else None
+
+
 if __name__ == "__main__":
     # --- CẤU HÌNH TEST ---
     FILE_NAME = "sounds/MatKetNoi.mp3"  # Tên file trên GCS sau khi upload
@@ -1,17 +1,40 @@
-from google import genai
 from typing import Optional
 import os
+import threading
 from dotenv import load_dotenv
 from backend.utils.prompts import generate_mamchan_prompt, MAMCHAN_FALLBACK_MESSAGE
+from backend.utils.breaker import get_breaker
+from backend.utils.metrics import get_metrics
 
 load_dotenv()
 
-# Khởi tạo Gemini client
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Gemini client được tạo lazy (google.genai import chậm và báo lỗi ngay nếu thiếu API key)
+_client = None
+_client_lock = threading.Lock()
 
 # Model mặc định
 DEFAULT_MODEL = "gemini-2.0-flash"
 
+# Timeout mỗi request tới Gemini (ms)
+GEMINI_TIMEOUT_MS = int(os.getenv("GEMINI_TIMEOUT_MS", "20000"))
+
+# Gemini lỗi liên tục (hết quota, sập) thì trả MAMCHAN_FALLBACK_MESSAGE ngay thay vì chờ timeout
+breaker = get_breaker("gemini")
+
+
+def get_client():
+    """Return the shared Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_options={"timeout": GEMINI_TIMEOUT_MS},
+                )
+    return _client
+
 
 def generate_robot_comment(song_title: Optional[str] = None, lyrics: Optional[str] = None) -> str:
     """
@@ -19,7 +42,7 @@ def generate_robot_comment(song_title: Optional[str] = None, lyrics: Optional[st
     
     Args:
         song_title: Tên bài hát đang phát (optional)
-        lyrics: Toàn bộ lời bài hát (optional)
+        lyrics: Lời bài hát, bản rút gọn từ lyrics_digest (optional)
     
     Returns:
         Một câu comment ngắn gọn, hài hước
@@ -27,7 +50,8 @@ def generate_robot_comment(song_title: Optional[str] = None, lyrics: Optional[st
     try:
         prompt = generate_mamchan_prompt(song_title, lyrics)
 
-        response = client.models.generate_content(
+        response = breaker.call(
+            get_client().models.generate_content,
             model=DEFAULT_MODEL,
             contents=prompt,
         )
@@ -38,7 +62,8 @@ def generate_robot_comment(song_title: Optional[str] = None, lyrics: Optional[st
     
     except Exception as e:
         print(f"Error generating robot comment: {e}")
-        # Fallback message nếu API lỗi
+        # Fallback message nếu API lỗi (hoặc breaker đang mở)
+        get_metrics().inc("dependency_fallbacks", dependency="gemini", fallback="robot_comment")
         return MAMCHAN_FALLBACK_MESSAGE
 
 
@@ -53,7 +78,8 @@ def generate_custom_response(prompt: str) -> Optional[str]:
         Response từ Gemini
     """
     try:
-        response = client.models.generate_content(
+        response = breaker.call(
+            get_client().models.generate_content,
             model=DEFAULT_MODEL,
             contents=prompt,
         )
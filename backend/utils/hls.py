@@ -0,0 +1,389 @@
+"""
+HLS packaging cho audio.
+
+Cắt mỗi track thành các segment ngắn (mặc định 6s) + playlist, để client bắt đầu
+phát / seek chỉ cần tải một segment nhỏ thay vì byte range lớn của cả file.
+
+- Có ffmpeg: transcode sang AAC ở mỗi bitrate trong HLS_BITRATES (MPEG-TS segments).
+- Không có ffmpeg: fallback pure-Python cho MP3, cắt theo frame boundary
+  (HLS packed audio, một variant ở bitrate gốc). M4A cần ffmpeg.
+
+Việc cắt chạy trong process pool (CPU-bound); upload và cập nhật MongoDB chạy ở
+process chính qua publish_package().
+
+Layout trên storage (package_id đổi mỗi lần đóng gói, để bản mới không ghi đè
+segment mà client đang phát):
+    hls/{song_id}/{package_id}/{variant}/index.m3u8
+    hls/{song_id}/{package_id}/{variant}/seg_00000.ts|.mp3
+
+Usage (backfill các bài đã có):
+    uv run python -m backend.utils.hls --all
+    uv run python -m backend.utils.hls --song-id 6799abc123def456
+"""
+
+import math
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+HLS_PACKAGING = os.getenv("HLS_PACKAGING", "true").lower() in ("1", "true", "yes")
+HLS_SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+HLS_BITRATES = [int(b) for b in os.getenv("HLS_BITRATES", "64,128").split(",") if b.strip()]
+HLS_WORKERS = int(os.getenv("HLS_WORKERS", "2"))
+HLS_PREFIX = "hls"
+
+PLAYLIST_NAME = "index.m3u8"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# MP3 frame parsing (fallback packager)
+# ---------------------------------------------------------------------------
+
+# Layer III bitrate (kbps) theo bitrate index
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG-2 / 2.5
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+
+def _parse_mp3_header(data, pos):
+    """Return (frame_length, samples, sample_rate, bitrate_kbps) or None if no Layer III frame at pos."""
+    if pos + 4 > len(data):
+        return None
+    header = int.from_bytes(data[pos:pos + 4], "big")
+    if (header >> 21) & 0x7FF != 0x7FF:
+        return None
+    version = (header >> 19) & 0x3
+    layer = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0x3
+    padding = (header >> 9) & 0x1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index]
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    if version == 3:
+        return 144000 * bitrate // sample_rate + padding, 1152, sample_rate, bitrate
+    return 72000 * bitrate // sample_rate + padding, 576, sample_rate, bitrate
+
+
+def _skip_id3(data):
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def iter_mp3_frames(data):
+    """Yield (offset, length, duration_seconds, bitrate_kbps) for each MP3 frame, resyncing over junk."""
+    pos = _skip_id3(data)
+    first = True
+    while pos < len(data):
+        frame = _parse_mp3_header(data, pos)
+        if frame is None or pos + frame[0] > len(data):
+            pos = data.find(b"\xff", pos + 1)
+            if pos == -1:
+                return
+            continue
+        length, samples, sample_rate, bitrate = frame
+        # Frame Xing/Info đầu file chỉ chứa metadata VBR, không phải audio
+        if first and (b"Xing" in data[pos:pos + 64] or b"Info" in data[pos:pos + 64]):
+            first = False
+            pos += length
+            continue
+        first = False
+        yield pos, length, samples / sample_rate, bitrate
+        pos += length
+
+
+def _id3_timestamp(seconds):
+    """ID3 PRIV tag với MPEG-TS timestamp (90kHz) mà HLS packed audio yêu cầu ở đầu mỗi segment."""
+    owner = b"com.apple.streaming.transportStreamTimestamp\x00"
+    payload = owner + struct.pack(">Q", int(round(seconds * 90000)) & 0x1FFFFFFFF)
+    frame = b"PRIV" + _syncsafe(len(payload)) + b"\x00\x00" + payload
+    return b"ID3\x04\x00\x00" + _syncsafe(len(frame)) + frame
+
+
+def _syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def media_playlist(segments, segment_seconds):
+    """Build a VOD media playlist from [(uri, duration_seconds)]."""
+    target = max([segment_seconds] + [d for _, d in segments])
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{math.ceil(target)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for uri, duration in segments:
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(uri)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def master_playlist(variants, playlist_uri=None):
+    """
+    Build a master playlist. playlist_uri(variant) returns the URI of each
+    variant playlist (default: relative "{name}/index.m3u8").
+    """
+    playlist_uri = playlist_uri or (lambda v: f"{v['name']}/{PLAYLIST_NAME}")
+    lines = ["#EXTM3U"]
+    for variant in sorted(variants, key=lambda v: v["bandwidth"]):
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={variant["bandwidth"]},CODECS="{variant["codecs"]}"')
+        lines.append(playlist_uri(variant))
+    return "\n".join(lines) + "\n"
+
+
+def segment_uris(playlist):
+    """Segment URIs of a media playlist, in order."""
+    return [line.strip() for line in playlist.splitlines() if line.strip() and not line.startswith("#")]
+
+
+def package_mp3(source_path, out_dir, segment_seconds=HLS_SEGMENT_SECONDS):
+    """Pure-Python packager: split an MP3 at frame boundaries without re-encoding."""
+    with open(source_path, "rb") as f:
+        data = f.read()
+
+    frames = list(iter_mp3_frames(data))
+    if not frames:
+        raise ValueError("No MPEG Layer III frames found")
+
+    variant_dir = os.path.join(out_dir, "source")
+    os.makedirs(variant_dir, exist_ok=True)
+
+    segments = []
+    start_time = 0.0
+    elapsed = 0.0
+    chunk = []
+    total_bytes = 0
+    for offset, length, duration, _ in frames:
+        chunk.append(data[offset:offset + length])
+        elapsed += duration
+        total_bytes += length
+        if elapsed - start_time >= segment_seconds:
+            segments.append(_write_mp3_segment(variant_dir, len(segments), start_time, chunk, elapsed - start_time))
+            start_time, chunk = elapsed, []
+    if chunk:
+        segments.append(_write_mp3_segment(variant_dir, len(segments), start_time, chunk, elapsed - start_time))
+
+    with open(os.path.join(variant_dir, PLAYLIST_NAME), "w") as f:
+        f.write(media_playlist(segments, segment_seconds))
+
+    bandwidth = int(total_bytes * 8 / elapsed) if elapsed else 0
+    return {
+        "packager": "mp3-split",
+        "duration": round(elapsed, 3),
+        "segment_seconds": segment_seconds,
+        "variants": [{"name": "source", "bandwidth": bandwidth, "codecs": "mp4a.40.34", "segments": len(segments)}],
+    }
+
+
+def _write_mp3_segment(variant_dir, index, start_time, frames, duration):
+    name = f"seg_{index:05d}.mp3"
+    with open(os.path.join(variant_dir, name), "wb") as f:
+        f.write(_id3_timestamp(start_time))
+        f.write(b"".join(frames))
+    return name, duration
+
+
+def package_ffmpeg(source_path, out_dir, bitrates=None, segment_seconds=HLS_SEGMENT_SECONDS):
+    """Transcode to AAC at each bitrate (kbps) and segment with ffmpeg's HLS muxer."""
+    bitrates = bitrates or HLS_BITRATES
+    variants = []
+    for kbps in bitrates:
+        name = f"{kbps}k"
+        variant_dir = os.path.join(out_dir, name)
+        os.makedirs(variant_dir, exist_ok=True)
+        subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-i", source_path, "-vn", "-map", "0:a:0",
+                "-c:a", "aac", "-b:a", f"{kbps}k", "-ac", "2",
+                "-f", "hls", "-hls_time", str(segment_seconds),
+                "-hls_playlist_type", "vod",
+                "-hls_segment_filename", os.path.join(variant_dir, "seg_%05d.ts"),
+                os.path.join(variant_dir, PLAYLIST_NAME),
+            ],
+            check=True,
+            capture_output=True,
+        )
+        with open(os.path.join(variant_dir, PLAYLIST_NAME)) as f:
+            playlist = f.read()
+        duration = sum(float(line[len("#EXTINF:"):].split(",")[0])
+                       for line in playlist.splitlines() if line.startswith("#EXTINF:"))
+        variants.append({
+            "name": name,
+            "bandwidth": kbps * 1000,
+            "codecs": "mp4a.40.2",
+            "segments": len(segment_uris(playlist)),
+        })
+    return {"packager": "ffmpeg", "duration": round(duration, 3), "segment_seconds": segment_seconds, "variants": variants}
+
+
+def package_audio(source_path, out_dir, audio_format="mp3", bitrates=None, segment_seconds=HLS_SEGMENT_SECONDS):
+    """
+    Package one track into out_dir. Chạy trong process pool.
+    Dùng ffmpeg nếu có, nếu không thì fallback cắt MP3 theo frame.
+    """
+    if shutil.which("ffmpeg"):
+        return package_ffmpeg(source_path, out_dir, bitrates, segment_seconds)
+    if audio_format == "mp3":
+        return package_mp3(source_path, out_dir, segment_seconds)
+    raise RuntimeError(f"Cần ffmpeg để đóng gói HLS cho định dạng {audio_format}")
+
+
+# ---------------------------------------------------------------------------
+# Process pool + publish
+# ---------------------------------------------------------------------------
+
+def get_packager_pool():
+    """Process pool dùng chung cho việc đóng gói (tạo ở lần dùng đầu tiên)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: không fork process đang chạy thread của uvicorn / pymongo
+                _pool = ProcessPoolExecutor(max_workers=HLS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_packager_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def hls_prefix(song_id, package_id):
+    return f"{HLS_PREFIX}/{song_id}/{package_id}"
+
+
+def publish_package(song_id, out_dir, result, bucket_name=None):
+    """
+    Upload the packaged files through the storage layer and return the `hls`
+    field to store on the song document.
+    """
+    from backend.utils import gcs
+
+    bucket_name = bucket_name or gcs.GCS_BUCKET_NAME
+    prefix = hls_prefix(song_id, uuid.uuid4().hex[:12])
+    blobs = []
+    variants = []
+    for variant in result["variants"]:
+        variant_dir = os.path.join(out_dir, variant["name"])
+        with open(os.path.join(variant_dir, PLAYLIST_NAME)) as f:
+            segments = segment_uris(f.read())
+        # Segment trước, playlist sau: playlist chỉ xuất hiện khi đủ segment
+        for name in segments + [PLAYLIST_NAME]:
+            blob_name = f"{prefix}/{variant['name']}/{name}"
+            gcs.upload_file(bucket_name, os.path.join(variant_dir, name), blob_name)
+            blobs.append(blob_name)
+        variants.append({
+            "name": variant["name"],
+            "bandwidth": variant["bandwidth"],
+            "codecs": variant["codecs"],
+            "playlist_blob": f"{prefix}/{variant['name']}/{PLAYLIST_NAME}",
+        })
+    return {
+        "packager": result["packager"],
+        "duration": result["duration"],
+        "segment_seconds": result["segment_seconds"],
+        "variants": variants,
+        "blobs": blobs,
+    }
+
+
+def delete_package(hls, bucket_name=None):
+    """Delete every blob of a song's HLS package. Returns the number of blobs that failed."""
+    from backend.utils import gcs
+
+    bucket_name = bucket_name or gcs.GCS_BUCKET_NAME
+    failed = 0
+    for blob_name in (hls or {}).get("blobs", []):
+        if not gcs.delete_file(bucket_name, blob_name):
+            failed += 1
+    return failed
+
+
+def package_song(song_id, source_path, audio_format="mp3", segment_seconds=HLS_SEGMENT_SECONDS):
+    """Package + publish + lưu vào MongoDB, đồng bộ (dùng cho backfill CLI)."""
+    import tempfile
+    from backend.utils.mongodb import update_song_metadata
+
+    out_dir = tempfile.mkdtemp(prefix="tunify-hls-")
+    try:
+        result = package_audio(source_path, out_dir, audio_format, segment_seconds=segment_seconds)
+        hls = publish_package(song_id, out_dir, result)
+        update_song_metadata(song_id, {"hls": hls})
+        return hls
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def download_original(song):
+    """Tải file audio gốc của một bài về file tạm (dùng cho backfill). Caller xóa file."""
+    import tempfile
+    import httpx
+    from backend.utils import gcs
+
+    url = gcs.generate_signed_url(gcs.GCS_BUCKET_NAME, song["gcs_audio_blob"])
+    suffix = "." + (song.get("audio_format") or "mp3")
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        with httpx.stream("GET", url, timeout=120.0) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                tmp.write(chunk)
+    return tmp.name
+
+
+def main():
+    import argparse
+    from backend.utils.mongodb import get_all_songs, get_song_by_id
+
+    parser = argparse.ArgumentParser(description="Package existing songs as HLS")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--song-id", action="append", help="Song id to package (repeatable)")
+    group.add_argument("--all", action="store_true", help="Package every song that has no HLS package yet")
+    parser.add_argument("--force", action="store_true", help="Re-package songs that already have one")
+    args = parser.parse_args()
+
+    songs = [get_song_by_id(i) for i in args.song_id] if args.song_id else get_all_songs()
+    for song in songs:
+        if not song or not song.get("gcs_audio_blob"):
+            continue
+        if song.get("hls") and not args.force:
+            print(f"⏭️  {song['title']}: đã có HLS")
+            continue
+        source_path = download_original(song)
+        try:
+            hls = package_song(song["_id"], source_path, song.get("audio_format") or "mp3")
+            delete_package(song.get("hls"))
+            print(f"✅ {song['title']}: {len(hls['variants'])} variant(s), {hls['duration']}s ({hls['packager']})")
+        except Exception as e:
+            print(f"❌ {song['title']}: {e}")
+        finally:
+            os.unlink(source_path)
+
+
+if __name__ == "__main__":
+    main()
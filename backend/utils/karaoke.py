@@ -0,0 +1,289 @@
+"""
+Karaoke session: đồng bộ lời bài hát giữa nhiều thiết bị qua WebSocket.
+
+Một host (màn hình đang phát nhạc) gửi vị trí phát lên server; server giữ state của
+session, tự lên lịch event đổi dòng lyric và fan-out tới tất cả follower. Mỗi event
+mang server timestamp (`at` = lúc dòng bắt đầu, theo đồng hồ server) và được gửi sớm
+LINE_LEAD_MS, follower bù độ lệch đồng hồ (ước lượng bằng ping/pong) rồi hiển thị
+đúng lúc, nên host và điện thoại của người hát không bị trôi.
+
+Host đầu tiên của session nhận `host_token` trong welcome; connection `role=host` sau đó chỉ
+thay được host khi gửi kèm `token` đó (ví dụ reload trang), không thì vào với vai follower.
+
+Protocol (JSON, thời gian tính bằng ms epoch theo đồng hồ server, vị trí bằng giây):
+  client -> server
+    {"type": "ping", "t0": <client ms>}
+    {"type": "position", "song_id": str, "position": s, "playing": bool, "rtt": ms}   (chỉ host)
+  server -> client
+    {"type": "welcome", "session", "role", "server_time", "state", "line", "host_token"?}   (host_token: chỉ host)
+    {"type": "pong", "t0", "server_time"}
+    {"type": "state", "state": {"song_id", "position", "playing", "server_time"}}
+    {"type": "line", "song_id", "index", "text", "time", "at"}
+    {"type": "resync", "state", "line"}     (queue của connection bị đầy, các event cũ bị bỏ)
+    {"type": "role", "role": "follower"}    (có host mới vào thay)
+
+Hub chạy trong một process: với nhiều uvicorn workers, client của cùng một session
+phải vào cùng worker (sticky session ở load balancer).
+"""
+
+import asyncio
+import bisect
+import hmac
+import json
+import math
+import re
+import secrets
+import time
+
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+QUEUE_SIZE = 64            # Số message chờ tối đa mỗi connection
+LINE_LEAD_MS = 250         # Gửi event đổi dòng sớm hơn lúc dòng bắt đầu
+MAX_SESSION_ID_LENGTH = 64
+ROLES = ("host", "follower")
+
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def server_now():
+    return time.time() * 1000
+
+
+def valid_session_id(session_id):
+    return 0 < len(session_id) <= MAX_SESSION_ID_LENGTH and bool(_SESSION_ID_PATTERN.match(session_id))
+
+
+class SessionConnection:
+    """One WebSocket with a bounded outgoing queue drained by its own writer task."""
+
+    def __init__(self, websocket, role, queue_size=QUEUE_SIZE):
+        self.websocket = websocket
+        self.role = role
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, text, resync=None):
+        """Queue a message; when the queue is full, drop the backlog and queue a single resync."""
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.dropped += 1
+            if resync is not None:
+                self.queue.put_nowait(resync())
+            return
+        self.queue.put_nowait(text)
+
+    async def writer(self):
+        while True:
+            text = await self.queue.get()
+            await self.websocket.send_text(text)
+
+
+class KaraokeSession:
+    def __init__(self, session_id, hub):
+        self.id = session_id
+        self.hub = hub
+        self.host = None
+        self.host_token = None   # Cấp cho host đầu tiên, cần để thay host sau đó
+        self.connections = set()
+        self.state = None
+        self.line = None
+        self._lyrics_song = None
+        self._line_times = []
+        self._lyrics = []
+        self._clock_task = None
+        self._update_lock = asyncio.Lock()
+
+    # -- membership -------------------------------------------------------
+
+    def join(self, connection, token=None):
+        """Thêm connection; role=host không có host_token đúng (session đã có host_token) thì thành follower."""
+        if connection.role == "host":
+            if self.host_token is None:
+                self.host_token = secrets.token_urlsafe(16)
+            elif not hmac.compare_digest(str(token or ""), self.host_token):
+                connection.role = "follower"
+        if connection.role == "host":
+            if self.host is not None:
+                # Host mới (ví dụ reload trang) thay host cũ, host cũ thành follower
+                self.host.role = "follower"
+                self.host.offer(json.dumps({"type": "role", "role": "follower"}))
+            self.host = connection
+        self.connections.add(connection)
+
+    def leave(self, connection):
+        self.connections.discard(connection)
+        if self.host is connection:
+            self.host = None
+
+    def close(self):
+        if self._clock_task is not None:
+            self._clock_task.cancel()
+            self._clock_task = None
+
+    # -- state ------------------------------------------------------------
+
+    def position_at(self, at):
+        """Playback position (seconds) at server time `at` (ms) according to the host's last update."""
+        if not self.state:
+            return None
+        if not self.state["playing"]:
+            return self.state["position"]
+        return self.state["position"] + (at - self.state["server_time"]) / 1000
+
+    def _line_event(self, index):
+        line = self._lyrics[index]
+        start = self.state["server_time"] + (line["time"] - self.state["position"]) * 1000
+        return {
+            "type": "line",
+            "song_id": self.state["song_id"],
+            "index": index,
+            "text": line["text"],
+            "time": line["time"],
+            "at": round(start, 1),
+        }
+
+    def _current_index(self, at):
+        position = self.position_at(at)
+        if position is None or not self._line_times:
+            return None
+        index = bisect.bisect_right(self._line_times, position) - 1
+        return index if index >= 0 else None
+
+    def resync_message(self):
+        return json.dumps({"type": "resync", "state": self.state, "line": self.line, "server_time": server_now()})
+
+    def broadcast(self, message):
+        """Encode once, offer to every connection."""
+        text = json.dumps(message, ensure_ascii=False)
+        for connection in list(self.connections):
+            connection.offer(text, self.resync_message)
+
+    async def update(self, song_id, position, playing, received_at):
+        async with self._update_lock:
+            if song_id != self._lyrics_song:
+                try:
+                    lyrics = await self.hub.load_lyrics(song_id)
+                except Exception as e:
+                    print(f"Warning: Karaoke session {self.id} không tải được lyrics {song_id}: {e}")
+                    lyrics = []
+                self._lyrics = [l for l in lyrics if l["time"] < 9999]  # bỏ dòng sentinel cuối
+                self._line_times = [l["time"] for l in self._lyrics]
+                self._lyrics_song = song_id
+                self.line = None
+
+            self.state = {
+                "song_id": song_id,
+                "position": position,
+                "playing": playing,
+                "server_time": round(received_at, 1),
+            }
+            self.broadcast({"type": "state", "state": self.state, "server_time": server_now()})
+
+            if self._clock_task is not None:
+                self._clock_task.cancel()
+            self._clock_task = asyncio.create_task(self._run_clock())
+
+    async def _run_clock(self):
+        """Broadcast line changes LINE_LEAD_MS before each line starts, until paused or out of lines."""
+        # Tính cả lead: dòng sắp bắt đầu trong LINE_LEAD_MS có thể đã được gửi trước đó
+        index = self._current_index(server_now() + self.hub.line_lead_ms)
+        if index is not None and (self.line is None or self.line["index"] != index
+                                  or self.line["song_id"] != self.state["song_id"]):
+            # Seek / đổi bài: gửi ngay dòng hiện tại
+            self.line = self._line_event(index)
+            self.broadcast(self.line)
+        if not self.state["playing"]:
+            return
+
+        next_index = 0 if index is None else index + 1
+        while next_index < len(self._lyrics):
+            event = self._line_event(next_index)
+            delay = (event["at"] - self.hub.line_lead_ms - server_now()) / 1000
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.line = event
+            self.broadcast(event)
+            next_index += 1
+
+
+class KaraokeHub:
+    """
+    Fan-out hub cho /ws/session/{id}. load_lyrics(song_id) là coroutine trả về
+    lyrics đã parse (list {"time", "text"}).
+    """
+
+    def __init__(self, load_lyrics, queue_size=QUEUE_SIZE, line_lead_ms=LINE_LEAD_MS):
+        self.load_lyrics = load_lyrics
+        self.queue_size = queue_size
+        self.line_lead_ms = line_lead_ms
+        self.sessions = {}
+        self.dropped = 0
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "connections": sum(len(s.connections) for s in self.sessions.values()),
+            "hosts": sum(1 for s in self.sessions.values() if s.host is not None),
+            "dropped": self.dropped + sum(c.dropped for s in self.sessions.values() for c in s.connections),
+        }
+
+    async def serve(self, websocket, session_id, role, token=None):
+        if role not in ROLES or not valid_session_id(session_id):
+            await websocket.close(code=1008)
+            return
+        await websocket.accept()
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = KaraokeSession(session_id, self)
+        connection = SessionConnection(websocket, role, self.queue_size)
+        session.join(connection, token)
+        welcome = {
+            "type": "welcome",
+            "session": session_id,
+            "role": connection.role,
+            "server_time": server_now(),
+            "state": session.state,
+            "line": session.line,
+        }
+        if connection.role == "host":
+            welcome["host_token"] = session.host_token
+        connection.offer(json.dumps(welcome, ensure_ascii=False))
+        writer = asyncio.create_task(connection.writer())
+
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if not isinstance(message, dict):
+                    raise TypeError("message must be a JSON object")
+                message_type = message.get("type")
+                if message_type == "ping":
+                    connection.offer(json.dumps({"type": "pong", "t0": message.get("t0"), "server_time": server_now()}))
+                elif message_type == "position" and connection.role == "host":
+                    position = float(message["position"])
+                    rtt = float(message.get("rtt") or 0)
+                    if not math.isfinite(position) or not math.isfinite(rtt):
+                        raise ValueError("position and rtt must be finite")
+                    # Bù nửa RTT: vị trí được đo trước khi tới server
+                    rtt = min(max(rtt, 0.0), 5000.0)
+                    await session.update(
+                        str(message["song_id"]),
+                        position,
+                        bool(message.get("playing", True)),
+                        server_now() - rtt / 2,
+                    )
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        except (KeyError, TypeError, ValueError, json.JSONDecodeError):
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.close(code=1003)
+        finally:
+            # Chờ writer dừng hẳn (và lấy lỗi send nếu có) trước khi rời session
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+            self.dropped += connection.dropped
+            session.leave(connection)
+            if not session.connections:
+                session.close()
+                self.sessions.pop(session_id, None)
@@ -0,0 +1,406 @@
+"""
+Thư viện nhạc lấy từ backend API cho runalone.py (desktop / kiosk player), cache trên đĩa.
+
+- RemoteLibrary: danh sách bài từ /api/songs; audio (/api/audio/{id}?quality=original, theo
+  redirect tới GCS) và lyrics (/api/lyrics/{id}) được tải vào DiskCache rồi phát từ file local
+- DiskCache: LRU giới hạn theo tổng dung lượng (LIBRARY_CACHE_MB). Ghi atomic (file tạm cùng
+  thư mục, fsync, os.replace), metadata mỗi entry có sha256 / size / etag. Entry được kiểm tra
+  sha256 ở lần đọc đầu tiên trong process: file hỏng bị xoá và tải lại. Khi tải audio, MD5 trong
+  header x-goog-hash của GCS (nếu có) phải khớp với nội dung đã tải.
+- Bài đã có trong cache được phát ngay, không cần mạng; sau LIBRARY_REVALIDATE_SECONDS thì hỏi
+  lại bằng If-None-Match (GCS trả 304 nếu file không đổi: không tải lại). Mất mạng thì dùng bản
+  trong cache.
+- prefetch(songs): thread nền tải trước các bài sắp phát để chuyển bài không phải chờ.
+
+Cấu hình:
+    LIBRARY_CACHE_DIR=~/.cache/tunify
+    LIBRARY_CACHE_MB=2048
+    LIBRARY_PREFETCH=2               (số bài tải trước)
+    LIBRARY_REVALIDATE_SECONDS=3600
+
+CLI:
+    uv run python -m backend.utils.library_cache --url http://127.0.0.1:8000 --warm
+    uv run python -m backend.utils.library_cache --stats
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+LIBRARY_CACHE_DIR = os.path.expanduser(os.getenv("LIBRARY_CACHE_DIR", "~/.cache/tunify"))
+LIBRARY_CACHE_MB = float(os.getenv("LIBRARY_CACHE_MB", "2048"))
+LIBRARY_PREFETCH = int(os.getenv("LIBRARY_PREFETCH", "2"))
+LIBRARY_REVALIDATE_SECONDS = float(os.getenv("LIBRARY_REVALIDATE_SECONDS", "3600"))
+
+CHUNK_SIZE = 64 * 1024
+META_SUFFIX = ".meta.json"
+PART_SUFFIX = ".part"
+SONGS_KEY = "songs.json"
+
+
+class ChecksumError(ValueError):
+    """Nội dung tải về không khớp size / MD5 mà server báo."""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def goog_md5(header):
+    """MD5 (hex) trong header `x-goog-hash: crc32c=...,md5=...` của GCS, hoặc None."""
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name == "md5" and value:
+            return base64.b64decode(value).hex()
+    return None
+
+
+def _write_atomic(path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=PART_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class DiskCache:
+    """LRU trên đĩa: `<key>` là dữ liệu, `<key>.meta.json` là metadata (mtime = lần dùng cuối)."""
+
+    def __init__(self, root=LIBRARY_CACHE_DIR, max_bytes=LIBRARY_CACHE_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corrupt = 0
+        self._lock = threading.Lock()
+        self._verified = set()
+        self._pinned = set()
+        os.makedirs(root, exist_ok=True)
+        # File tạm của lần chạy trước bị ngắt giữa chừng
+        for name in os.listdir(root):
+            if name.endswith(PART_SUFFIX):
+                os.unlink(os.path.join(root, name))
+
+    def _paths(self, key):
+        path = os.path.join(self.root, re.sub(r"[^\w.-]", "_", key))
+        return path, path + META_SUFFIX
+
+    def get(self, key):
+        """(path, meta) của entry còn nguyên vẹn, hoặc None."""
+        path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if key not in self._verified:
+            if not os.path.exists(path) or os.path.getsize(path) != meta.get("size") or file_sha256(path) != meta.get("sha256"):
+                print(f"Warning: Cached {key} is corrupt, discarding it")
+                self.corrupt += 1
+                self.misses += 1
+                self.delete(key)
+                return None
+            self._verified.add(key)
+        os.utime(meta_path)
+        self.hits += 1
+        return path, meta
+
+    def put_stream(self, key, chunks, meta=None, expected_size=None, expected_md5=None):
+        """Ghi các chunk vào file tạm, kiểm tra size / MD5, rồi thay entry cũ (atomic). Returns path."""
+        path, meta_path = self._paths(key)
+        sha256, md5, size = hashlib.sha256(), hashlib.md5(), 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=PART_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            if expected_size is not None and size != expected_size:
+                raise ChecksumError(f"{key}: got {size} bytes, expected {expected_size}")
+            if expected_md5 is not None and md5.hexdigest() != expected_md5:
+                raise ChecksumError(f"{key}: MD5 mismatch")
+            # Dữ liệu trước, metadata sau: bị ngắt ở giữa thì sha256 cũ không khớp -> tải lại
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        _write_atomic(meta_path, json.dumps({
+            **(meta or {}), "size": size, "sha256": sha256.hexdigest(), "stored_at": time.time(),
+        }).encode("utf-8"))
+        self._verified.add(key)
+        self.evict()
+        return path
+
+    def put_bytes(self, key, data: bytes, meta=None):
+        return self.put_stream(key, [data], meta)
+
+    def update_meta(self, key, **fields):
+        path, meta_path = self._paths(key)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta.update(fields)
+        _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def delete(self, key):
+        self._verified.discard(key)
+        for p in self._paths(key):
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+
+    def pin(self, keys):
+        """Các entry không bị evict (bài đang phát / sắp phát)."""
+        with self._lock:
+            self._pinned = set(keys)
+
+    def entries(self):
+        """[(last_used, size, key)] của mọi entry."""
+        result = []
+        for name in os.listdir(self.root):
+            if not name.endswith(META_SUFFIX):
+                continue
+            meta_path = os.path.join(self.root, name)
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    size = json.load(f).get("size", 0)
+                result.append((os.path.getmtime(meta_path), size, name[:-len(META_SUFFIX)]))
+            except (OSError, ValueError):
+                continue
+        return result
+
+    def evict(self):
+        """Xoá các entry dùng lâu nhất cho tới khi tổng dung lượng <= max_bytes."""
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in self._pinned:
+                    continue
+                self.delete(key)
+                self.evictions += 1
+                total -= size
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "root": self.root,
+            "entries": len(entries),
+            "mb": round(sum(size for _, size, _ in entries) / 1e6, 1),
+            "max_mb": round(self.max_bytes / 1e6, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "corrupt": self.corrupt,
+        }
+
+
+class RemoteLibrary:
+    """Playlist + audio + lyrics từ backend API, phát từ DiskCache."""
+
+    def __init__(self, base_url, cache=None, prefetch=LIBRARY_PREFETCH, revalidate=LIBRARY_REVALIDATE_SECONDS,
+                 client=None):
+        import httpx
+
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache or DiskCache()
+        self.prefetch_count = prefetch
+        self.revalidate = revalidate
+        self.client = client or httpx.Client(follow_redirects=True, timeout=httpx.Timeout(10.0, read=60.0))
+        self.downloads = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+        # Danh sách bài luôn được giữ để chạy được khi mất mạng
+        self.cache.pin([SONGS_KEY])
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.client.close()
+
+    def songs(self):
+        """Danh sách bài (item của /api/songs); mất mạng thì dùng danh sách đã cache."""
+        import httpx
+
+        try:
+            response = self.client.get(f"{self.base_url}/api/songs")
+            response.raise_for_status()
+            songs = response.json()["songs"]
+            self.cache.put_bytes(SONGS_KEY, json.dumps(songs).encode("utf-8"))
+            return songs
+        except httpx.HTTPError as e:
+            cached = self.cache.get(SONGS_KEY)
+            if cached is None:
+                raise
+            print(f"Warning: Could not load /api/songs ({e}), using the cached song list")
+            with open(cached[0], encoding="utf-8") as f:
+                return json.load(f)
+
+    @staticmethod
+    def audio_key(song):
+        return f"audio-{song['id']}.{song.get('audioFormat') or 'mp3'}"
+
+    @staticmethod
+    def lyrics_key(song):
+        return f"lyrics-{song['id']}.json"
+
+    def audio_path(self, song):
+        """File audio local của bài (tải nếu chưa có trong cache)."""
+        return self._get(self.audio_key(song), f"{self.base_url}/api/audio/{song['id']}?quality=original")
+
+    def lyrics(self, song):
+        """Lyrics đã parse ([{time, text}], như parse_lrc của runalone) hoặc None nếu bài không có lyrics."""
+        if not song.get("hasLyrics"):
+            return None
+        path = self._get(self.lyrics_key(song), f"{self.base_url}/api/lyrics/{song['id']}")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["lyrics"]
+
+    def similar(self, song, exclude=(), k=1):
+        """Bài tương tự (item như /api/songs) từ /api/songs/{id}/similar; [] khi mất mạng / backend không hỗ trợ."""
+        import httpx
+
+        try:
+            response = self.client.get(
+                f"{self.base_url}/api/songs/{song['id']}/similar",
+                params={"k": k, "exclude": ",".join(exclude)},
+            )
+            response.raise_for_status()
+            return response.json()["results"]
+        except httpx.HTTPError as e:
+            print(f"Warning: Could not load similar songs ({e})")
+            return []
+
+    def prefetch(self, songs):
+        """Tải trước audio + lyrics của các bài sắp phát (thread nền), giữ chúng khỏi bị evict."""
+        keys = [SONGS_KEY]
+        for song in songs:
+            jobs = [(self.audio_key(song), f"{self.base_url}/api/audio/{song['id']}?quality=original")]
+            if song.get("hasLyrics"):
+                jobs.append((self.lyrics_key(song), f"{self.base_url}/api/lyrics/{song['id']}"))
+            for key, url in jobs:
+                keys.append(key)
+                self._executor.submit(self._prefetch_one, key, url)
+        self.cache.pin(keys)
+
+    def _prefetch_one(self, key, url):
+        try:
+            self._get(key, url)
+        except Exception as e:
+            print(f"Warning: Prefetch of {key} failed: {e}")
+
+    def _get(self, key, url):
+        """Một lần tải cho mỗi key: caller khác (prefetch / phát) chờ chung kết quả."""
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            path = self._fetch(key, url)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, key, url):
+        import httpx
+
+        cached = self.cache.get(key)
+        now = time.time()
+        if cached is not None and now - cached[1].get("validated_at", 0) < self.revalidate:
+            return cached[0]
+
+        headers = {}
+        if cached is not None and cached[1].get("etag"):
+            headers["If-None-Match"] = cached[1]["etag"]
+        try:
+            with self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    self.not_modified += 1
+                    self.cache.update_meta(key, validated_at=now)
+                    return cached[0]
+                response.raise_for_status()
+                encoded = "content-encoding" in response.headers
+                length = response.headers.get("content-length")
+                path = self.cache.put_stream(
+                    key,
+                    response.iter_bytes(CHUNK_SIZE),
+                    {"etag": response.headers.get("etag"), "validated_at": now},
+                    expected_size=int(length) if length and not encoded else None,
+                    expected_md5=None if encoded else goog_md5(response.headers.get("x-goog-hash")),
+                )
+                self.downloads += 1
+                return path
+        except httpx.HTTPError as e:
+            if cached is None:
+                raise
+            print(f"Warning: Could not revalidate {key} ({e}), using the cached copy")
+            return cached[0]
+
+    def stats(self):
+        return {**self.cache.stats(), "downloads": self.downloads, "not_modified": self.not_modified}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or warm the runalone remote library cache")
+    parser.add_argument("--url", default=os.getenv("BACKEND_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--list", action="store_true", help="List the remote catalog")
+    parser.add_argument("--warm", action="store_true", help="Download every song into the cache")
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+
+    if args.stats and not (args.list or args.warm):
+        print(json.dumps(DiskCache().stats(), indent=2))
+        raise SystemExit(0)
+
+    library = RemoteLibrary(args.url)
+    try:
+        songs = library.songs()
+        if args.list:
+            for song in songs:
+                cached = library.cache.get(library.audio_key(song)) is not None
+                print(f"{'●' if cached else '○'} {song['id']}  {song['title']}")
+        if args.warm:
+            started = time.perf_counter()
+            for song in songs:
+                library.audio_path(song)
+                library.lyrics(song)
+            print(f"Warmed {len(songs)} song(s) in {time.perf_counter() - started:.1f}s")
+        if args.stats:
+            print(json.dumps(library.stats(), indent=2))
+    finally:
+        library.close()
@@ -0,0 +1,225 @@
+"""
+Rate limiting và admission control cho các endpoint tốn tài nguyên.
+
+- TokenBucket / RateLimiter: token bucket theo key (client IP), giữ tối đa
+  MAX_TRACKED_CLIENTS key gần nhất
+- ConcurrencyGate: giới hạn số request chạy đồng thời (upload, gọi LLM), chờ tối đa
+  max_wait giây rồi từ chối
+- AdmissionMiddleware: áp RoutePolicy theo method + path trước khi request tới route
+  (upload bị từ chối trước khi body được đọc), trả 429 (vượt rate của client) / 503 (vượt
+  giới hạn chung hoặc quá tải) kèm Retry-After và đếm vào metrics. Mọi limiter được kiểm tra
+  trước khi lấy token: request bị từ chối không tốn token của limiter nào
+
+Client được nhận diện bằng địa chỉ trong ASGI scope. Sau reverse proxy (Render, ...)
+đặt FORWARDED_ALLOW_IPS để uvicorn thay địa chỉ đó bằng IP thật từ X-Forwarded-For.
+"""
+
+import asyncio
+import collections
+import math
+import re
+import time
+
+from starlette.responses import JSONResponse
+
+from backend.utils.metrics import get_metrics
+
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def wait(self, now=None):
+        """Seconds until a token is available (0 when one is available now); does not consume it."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        """Consume one token. Returns 0 when allowed, otherwise seconds until a token is available."""
+        retry_after = self.wait(now)
+        if not retry_after:
+            self.tokens -= 1
+        return retry_after
+
+    def refund(self):
+        """Trả lại token của request bị từ chối ở bước sau."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class RateLimiter:
+    """One token bucket per key (`rate` tokens/s, `burst` capacity)."""
+
+    def __init__(self, rate, burst, max_keys=MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = collections.OrderedDict()
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_keys:
+                # Bỏ client lâu nhất không gửi request (bucket của nó gần như đã đầy lại)
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def wait(self, key):
+        return self._bucket(key).wait()
+
+    def take(self, key):
+        return self._bucket(key).take()
+
+    def refund(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.refund()
+
+
+class ConcurrencyGate:
+    """Bounded concurrency with a short admission wait and a bounded wait queue."""
+
+    def __init__(self, name, limit, max_wait=0.0, max_waiting=None, retry_after=5):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self.max_waiting = limit if max_waiting is None else max_waiting
+        self.retry_after = retry_after
+        self.in_use = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        """True when a slot was taken; False when the gate is full (caller should shed the request)."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        elif self.max_wait <= 0 or self.waiting >= self.max_waiting:
+            return False
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        self.in_use += 1
+        return True
+
+    def release(self):
+        self.in_use -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"limit": self.limit, "in_use": self.in_use, "waiting": self.waiting}
+
+
+class RoutePolicy:
+    """
+    Admission rules for one route.
+    per_client / global_rate: (requests per minute, burst) hoặc None; gate: ConcurrencyGate hoặc None.
+    """
+
+    def __init__(self, method, path, per_client=None, global_rate=None, gate=None):
+        self.method = method
+        self.path = path
+        self.pattern = re.compile("^" + re.sub(r"\{[^/]+\}", "[^/]+", path) + "$")
+        self.client_limiter = RateLimiter(per_client[0] / 60, per_client[1]) if per_client else None
+        self.global_limiter = RateLimiter(global_rate[0] / 60, global_rate[1], max_keys=1) if global_rate else None
+        self.gate = gate
+
+    @property
+    def name(self):
+        return f"{self.method} {self.path}"
+
+    def matches(self, method, path):
+        return method == self.method and self.pattern.match(path) is not None
+
+
+def client_key(scope):
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _reject(status_code, detail, retry_after):
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying RoutePolicy rules before the request reaches the route."""
+
+    def __init__(self, app, policies=(), enabled=True, metrics=None):
+        self.app = app
+        self.policies = list(policies)
+        self.enabled = enabled
+        self.metrics = metrics or get_metrics()
+
+    async def _shed(self, scope, receive, send, policy, reason, status_code, detail, retry_after):
+        # Request bị từ chối không qua router: ghi route template để metrics gộp đúng route
+        scope["admission_route"] = policy.path
+        self.metrics.inc("admission_rejected", route=policy.name, reason=reason)
+        await _reject(status_code, detail, retry_after)(scope, receive, send)
+
+    def _find(self, scope):
+        for policy in self.policies:
+            if policy.matches(scope["method"], scope["path"]):
+                return policy
+        return None
+
+    async def __call__(self, scope, receive, send):
+        policy = self._find(scope) if self.enabled and scope["type"] == "http" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        # (limiter, key): kiểm tra hết rồi mới lấy token, không await ở giữa
+        limiters = []
+        if policy.client_limiter is not None:
+            limiters.append((policy.client_limiter, client_key(scope)))
+        if policy.global_limiter is not None:
+            limiters.append((policy.global_limiter, "*"))
+        for limiter, key in limiters:
+            retry_after = limiter.wait(key)
+            if retry_after:
+                # Vượt rate của client: 429; vượt giới hạn chung (quota chung của server): 503
+                if limiter is policy.client_limiter:
+                    await self._shed(scope, receive, send, policy, "rate_limited", 429,
+                                       "Quá nhiều request, vui lòng thử lại sau", retry_after)
+                else:
+                    await self._shed(scope, receive, send, policy, "global_rate_limited", 503,
+                                       "Server đang bận, vui lòng thử lại sau", retry_after)
+                return
+        for limiter, key in limiters:
+            limiter.take(key)
+
+        gate = policy.gate
+        if gate is not None and not await gate.acquire():
+            for limiter, key in limiters:
+                limiter.refund(key)
+            await self._shed(scope, receive, send, policy, "overloaded", 503,
+                               "Server đang bận, vui lòng thử lại sau", gate.retry_after)
+            return
+
+        self.metrics.inc("admission_accepted", route=policy.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if gate is not None:
+                gate.release()
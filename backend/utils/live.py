@@ -0,0 +1,214 @@
+"""
+Live library updates.
+
+- SongCollectionWatcher: thread theo dõi collection bài hát bằng MongoDB change stream;
+  nếu không hỗ trợ (không phải replica set, hoặc stand-in) thì fallback sang polling.
+  Polling chỉ dành cho stand-ins / dev (Atlas luôn có change stream): mỗi lượt đọc các bài có
+  `updated_at` mới hơn mốc đã thấy (mongodb.py ghi field này khi sửa metadata) và đếm số
+  document để phát hiện bài bị xoá; chỉ khi số đó lệch mới đọc lại danh sách id. Thêm / sửa
+  document không qua các hàm trong mongodb.py (không có updated_at) thì có thể bị sót.
+- LibraryEventBroker: fan-out các event add/update/remove tới các subscriber asyncio
+  (mỗi subscriber là một kết nối Server-Sent Events).
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+
+from backend.utils.mongodb import get_collection, object_ids, SIGNED_URL_FIELDS
+
+POLL_INTERVAL = 2.0
+# Đọc lùi lại chừng này giây so với mốc updated_at: write stamp trước nhưng commit sau (hoặc ở
+# worker lệch đồng hồ) không bị sót
+POLL_CLOCK_MARGIN = 5.0
+
+# Projection cho polling: bỏ các field signed URL (đổi liên tục, client không cần biết)
+_POLL_PROJECTION = {field: 0 for field in SIGNED_URL_FIELDS}
+
+
+class ChangeStreamUnsupported(Exception):
+    """Raised when the collection cannot be watched with a change stream."""
+
+
+class SongCollectionWatcher:
+    """
+    Watch the song collection and call on_change(change_type, song_id, song)
+    with change_type in {"add", "update", "remove", "reset"}.
+    on_change runs on the watcher thread.
+    """
+
+    def __init__(self, on_change, poll_interval=POLL_INTERVAL):
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._resume_token = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="song-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self.mode = "change_stream"
+                self._watch_change_stream()
+                backoff = 1.0
+            except ChangeStreamUnsupported as e:
+                print(f"Change streams không khả dụng ({e}), chuyển sang polling mỗi {self.poll_interval}s")
+                self.mode = "polling"
+                self._poll_loop()
+                return
+            except Exception as e:
+                print(f"Warning: Song watcher error: {e}, retry sau {backoff:.0f}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _watch_change_stream(self):
+        collection = get_collection()
+        if not hasattr(collection, "watch"):
+            raise ChangeStreamUnsupported("collection has no watch()")
+
+        from pymongo.errors import OperationFailure
+        try:
+            with collection.watch(
+                full_document="updateLookup",
+                resume_after=self._resume_token,
+                max_await_time_ms=1000,
+            ) as stream:
+                while not self._stop.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    self._resume_token = stream.resume_token
+                    self._handle_change(change)
+        except OperationFailure as e:
+            # 40573: $changeStream chỉ chạy trên replica set / sharded cluster
+            if e.code == 40573 or "replica set" in str(e):
+                raise ChangeStreamUnsupported(str(e))
+            raise
+
+    def _handle_change(self, change):
+        operation = change.get("operationType")
+        document_key = change.get("documentKey") or {}
+        song_id = str(document_key["_id"]) if "_id" in document_key else None
+        song = change.get("fullDocument")
+        if song is not None:
+            song["_id"] = str(song["_id"])
+
+        if operation == "insert":
+            self.on_change("add", song_id, song)
+        elif operation == "update":
+            description = change.get("updateDescription") or {}
+            fields = set(description.get("updatedFields") or {}) | set(description.get("removedFields") or [])
+            if fields and fields <= SIGNED_URL_FIELDS:
+                return
+            self.on_change("update", song_id, song)
+        elif operation == "replace":
+            self.on_change("update", song_id, song)
+        elif operation == "delete":
+            self.on_change("remove", song_id, None)
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self._resume_token = None
+            self.on_change("reset", None, None)
+
+    @staticmethod
+    def _poll_versions():
+        """{song id: updated_at} của mọi bài (chỉ đọc hai field)."""
+        return {str(doc["_id"]): doc.get("updated_at") for doc in get_collection().find({}, {"updated_at": 1})}
+
+    def _poll_changes(self, versions):
+        """Một lượt polling; versions ({song id: updated_at} đã thấy) được cập nhật tại chỗ."""
+        collection = get_collection()
+        high_water = max((v for v in versions.values() if v is not None), default=0.0)
+        for song in collection.find({"updated_at": {"$gt": high_water - POLL_CLOCK_MARGIN}}, _POLL_PROJECTION):
+            song["_id"] = str(song["_id"])
+            song_id = song["_id"]
+            if song_id not in versions:
+                versions[song_id] = song["updated_at"]
+                self.on_change("add", song_id, song)
+            elif versions[song_id] != song["updated_at"]:
+                versions[song_id] = song["updated_at"]
+                self.on_change("update", song_id, song)
+
+        if collection.count_documents({}) == len(versions):
+            return
+        # Có bài bị xoá (hoặc thêm mà không có updated_at): đọc lại danh sách id
+        current = self._poll_versions()
+        for song_id in versions.keys() - current.keys():
+            del versions[song_id]
+            self.on_change("remove", song_id, None)
+        added = list(current.keys() - versions.keys())
+        if added:
+            for song in collection.find({"_id": {"$in": object_ids(added)}}, _POLL_PROJECTION):
+                song["_id"] = str(song["_id"])
+                versions[song["_id"]] = song.get("updated_at")
+                self.on_change("add", song["_id"], song)
+
+    def _poll_loop(self):
+        versions = None
+        while not self._stop.is_set():
+            try:
+                if versions is None:
+                    versions = self._poll_versions()
+                else:
+                    self._poll_changes(versions)
+            except Exception as e:
+                print(f"Warning: Song polling error: {e}")
+            self._stop.wait(self.poll_interval)
+
+
+class LibraryEventBroker:
+    """Thread-safe publisher, asyncio subscribers with bounded queues."""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (loop, queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event):
+        """Publish from any thread. Slow subscribers get a single 'resync' event instead."""
+        event = {"seq": next(self._ids), "ts": time.time(), **event}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # Event loop đã đóng
+                self.unsubscribe((loop, queue))
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            # Client quá chậm: bỏ các event đang chờ, bảo client tải lại toàn bộ danh sách
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"seq": event["seq"], "ts": event["ts"], "type": "resync"})
+            return
+        queue.put_nowait(event)
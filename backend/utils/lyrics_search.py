@@ -0,0 +1,335 @@
+"""
+Full-text search trên lời bài hát, trả về dòng khớp kèm timestamp để player seek tới.
+
+- fold_text (utils.py): bỏ dấu như normalize_song_name (thêm đ -> d), lowercase, bỏ dấu câu
+- LyricsIndex: inverted index trong process. Mỗi dòng lyrics có một line id tăng dần;
+  postings của mỗi term là array('I') các line id (4 byte/entry, luôn sorted vì chỉ append).
+  Xoá / cập nhật một bài chỉ đánh dấu slot của bài là None, postings được build lại khi
+  số dòng đã xoá vượt COMPACT_RATIO
+- Dòng đã parse của mỗi bài được lưu trong collection `lyrics_lines` lúc import / update,
+  worker mới build index bằng một query thay vì tải lại từng file LRC từ GCS
+
+Query: các từ đầy đủ + từ cuối match theo prefix (đang gõ dở). Ứng viên lấy từ postings ngắn
+nhất rồi kiểm tra từng dòng: dòng chứa nguyên cụm từ xếp trên dòng chỉ chứa đủ các từ.
+
+CLI:
+    uv run python -m backend.utils.lyrics_search --backfill    # index các bài import trước khi có search
+    uv run python -m backend.utils.lyrics_search "em oi"
+"""
+
+import bisect
+import heapq
+import threading
+import time
+from array import array
+
+from backend.utils.utils import fold_text, LYRICS_END_SENTINEL
+
+COMPACT_RATIO = 0.25        # Build lại postings khi >25% số dòng thuộc bài đã xoá
+MAX_PREFIX_TERMS = 64       # Số term tối đa mở rộng từ prefix của từ cuối
+PHRASE_SCORE, WORDS_SCORE = 2, 1
+
+
+def lyrics_lines(lyrics):
+    """Parsed lyrics (parse_lrc_content) -> [[time, text], ...] không có dòng sentinel cuối."""
+    return [[line["time"], line["text"]] for line in lyrics if line["time"] < LYRICS_END_SENTINEL]
+
+
+class LyricsIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._postings = {}             # term -> array('I') line ids
+        self._vocab = None              # sorted terms cho prefix search, build lại khi có term mới
+        self._line_slot = array('I')    # line id -> slot của bài
+        self._line_no = array('I')      # line id -> vị trí dòng trong lyrics của bài
+        self._line_time = array('d')
+        self._line_text = []
+        self._line_folded = []          # " em oi ha noi " (có space hai đầu để match nguyên từ)
+        self._slot_song = []            # slot -> song_id (None = đã xoá)
+        self._slot_lines = []           # slot -> số dòng đã index
+        self._slots = {}                # song_id -> slot
+        self._versions = {}             # song_id -> version của document lyrics_lines
+        self._dead_lines = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def version(self, song_id):
+        return self._versions.get(song_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "songs": len(self._slots),
+                "lines": len(self._line_slot) - self._dead_lines,
+                "dead_lines": self._dead_lines,
+                "terms": len(self._postings),
+                "postings": sum(len(p) for p in self._postings.values()),
+            }
+
+    def add(self, song_id, lines, version=None):
+        """Index (hoặc index lại) một bài. lines: [[time, text], ...]"""
+        with self._lock:
+            self._remove(song_id)
+            slot = len(self._slot_song)
+            self._slot_song.append(song_id)
+            self._slots[song_id] = slot
+            self._versions[song_id] = version
+            count = 0
+            for line_no, (line_time, text) in enumerate(lines):
+                folded = fold_text(text)
+                if not folded:
+                    continue
+                line_id = len(self._line_slot)
+                self._line_slot.append(slot)
+                self._line_no.append(line_no)
+                self._line_time.append(line_time)
+                self._line_text.append(text)
+                self._line_folded.append(f" {folded} ")
+                for term in set(folded.split()):
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = array('I')
+                        self._vocab = None
+                    postings.append(line_id)
+                count += 1
+            self._slot_lines.append(count)
+
+    def remove(self, song_id):
+        with self._lock:
+            self._remove(song_id)
+            if self._dead_lines > COMPACT_RATIO * len(self._line_slot):
+                self._compact()
+
+    def _remove(self, song_id):
+        slot = self._slots.pop(song_id, None)
+        self._versions.pop(song_id, None)
+        if slot is None:
+            return
+        self._slot_song[slot] = None
+        self._dead_lines += self._slot_lines[slot]
+
+    def _compact(self):
+        songs = {}
+        for line_id, slot in enumerate(self._line_slot):
+            song_id = self._slot_song[slot]
+            if song_id is not None:
+                songs.setdefault(song_id, []).append(line_id)
+        live = [
+            (song_id, self._versions[song_id], self._lines_of(line_ids))
+            for song_id, line_ids in songs.items()
+        ]
+        # Bài không có dòng nào có chữ vẫn được giữ (để version vẫn đúng)
+        empty = [(song_id, self._versions[song_id]) for song_id in self._slots if song_id not in songs]
+        self._clear()
+        for song_id, version, lines in live:
+            self.add(song_id, lines, version)
+        for song_id, version in empty:
+            self.add(song_id, [], version)
+
+    def _lines_of(self, line_ids):
+        # Giữ line_no gốc: chèn dòng rỗng vào các vị trí đã bị bỏ qua lúc index
+        lines = []
+        for line_id in line_ids:
+            while len(lines) < self._line_no[line_id]:
+                lines.append([0.0, ""])
+            lines.append([self._line_time[line_id], self._line_text[line_id]])
+        return lines
+
+    def load(self, docs):
+        """Build lại toàn bộ index từ các document lyrics_lines."""
+        with self._lock:
+            self._clear()
+            for doc in docs:
+                self.add(doc["_id"], doc.get("lines") or [], doc.get("version"))
+
+    def _prefix_postings(self, prefix):
+        if self._vocab is None:
+            self._vocab = sorted(self._postings)
+        start = bisect.bisect_left(self._vocab, prefix)
+        lists = []
+        for term in self._vocab[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            lists.append(self._postings[term])
+        if len(lists) <= 1:
+            return lists[0] if lists else None
+        return set().union(*lists)
+
+    def search(self, query, limit=20, hits_per_song=3):
+        """
+        Returns [{"song_id", "score", "matches", "hits": [{"line", "time", "text"}]}],
+        bài có dòng khớp nguyên cụm đứng trước, rồi tới bài có nhiều dòng khớp hơn
+        (hoà thì bài có dòng khớp sớm hơn trong index).
+        """
+        words = fold_text(query).split()
+        if not words:
+            return []
+        *full_words, last = words
+        phrase = " " + " ".join(words)
+
+        with self._lock:
+            candidate_lists = []
+            for word in full_words:
+                postings = self._postings.get(word)
+                if postings is None:
+                    return []
+                candidate_lists.append(postings)
+            prefix_postings = self._prefix_postings(last)
+            if prefix_postings is None:
+                return []
+            candidate_lists.append(prefix_postings)
+
+            # Giao các postings bằng set (chạy trong C), bắt đầu từ list ngắn nhất
+            candidate_lists.sort(key=len)
+            candidates = set(candidate_lists[0])
+            for postings in candidate_lists[1:]:
+                candidates.intersection_update(postings)
+
+            # slot -> ([line khớp nguyên cụm], [line chỉ khớp đủ từ])
+            by_slot = {}
+            line_slot, slot_song, line_folded = self._line_slot, self._slot_song, self._line_folded
+            for line_id in candidates:
+                slot = line_slot[line_id]
+                if slot_song[slot] is None:
+                    continue
+                hits = by_slot.get(slot)
+                if hits is None:
+                    hits = by_slot[slot] = ([], [])
+                # Query một từ: dòng ứng viên luôn có một từ bắt đầu bằng `last`, tức là khớp nguyên cụm
+                hits[0 if not full_words or phrase in line_folded[line_id] else 1].append(line_id)
+
+            # Chỉ dựng response cho `limit` bài đứng đầu
+            def rank(item):
+                phrase_hits, word_hits = item[1]
+                return (not phrase_hits, -(len(phrase_hits) + len(word_hits)), min(phrase_hits or word_hits))
+
+            results = []
+            for slot, (phrase_hits, word_hits) in heapq.nsmallest(limit, by_slot.items(), key=rank):
+                top = (sorted(phrase_hits) + sorted(word_hits))[:hits_per_song]
+                results.append({
+                    "song_id": slot_song[slot],
+                    "score": PHRASE_SCORE if phrase_hits else WORDS_SCORE,
+                    "matches": len(phrase_hits) + len(word_hits),
+                    "hits": [
+                        {
+                            "line": self._line_no[line_id],
+                            "time": round(self._line_time[line_id], 3),
+                            "text": self._line_text[line_id],
+                        }
+                        for line_id in top
+                    ],
+                })
+            return results
+
+
+_index = LyricsIndex()
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_lyrics_index():
+    return _index
+
+
+def ensure_loaded():
+    """Build index từ MongoDB ở lần dùng đầu tiên (an toàn khi gọi từ nhiều thread)."""
+    global _loaded
+    if _loaded:
+        return _index
+    with _load_lock:
+        if not _loaded:
+            from backend.utils.mongodb import get_all_lyrics_lines
+            started = time.perf_counter()
+            _index.load(get_all_lyrics_lines())
+            _loaded = True
+            print(f"Lyrics index: {_index.stats()} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return _index
+
+
+def mark_stale():
+    """Build lại toàn bộ ở lần search tiếp theo (collection bị drop / change stream reset)."""
+    global _loaded
+    _loaded = False
+
+
+def index_song(song_id, lyrics):
+    """Lưu dòng lyrics của một bài (import / update) và cập nhật index của worker này."""
+    from backend.utils.mongodb import upsert_lyrics_lines
+    song_id = str(song_id)
+    lines = lyrics_lines(lyrics)
+    version = time.time()
+    upsert_lyrics_lines(song_id, lines, version)
+    _index.add(song_id, lines, version)
+
+
+def unindex_song(song_id):
+    from backend.utils.mongodb import delete_lyrics_lines
+    song_id = str(song_id)
+    delete_lyrics_lines(song_id)
+    _index.remove(song_id)
+
+
+def forget_songs(song_ids):
+    """Bỏ các bài khỏi index của worker này (document lyrics_lines đã xoá cùng bài, xem delete_songs_by_ids)."""
+    for song_id in song_ids:
+        _index.remove(str(song_id))
+
+
+def refresh_song(song_id):
+    """
+    Đồng bộ một bài từ MongoDB (khi worker khác import / update / xoá bài).
+    Không làm gì nếu index chưa load hoặc version không đổi.
+    """
+    if not _loaded:
+        return
+    from backend.utils.mongodb import get_lyrics_lines
+    doc = get_lyrics_lines(song_id)
+    if doc is None:
+        _index.remove(song_id)
+    elif doc.get("version") != _index.version(song_id):
+        _index.add(song_id, doc.get("lines") or [], doc.get("version"))
+
+
+def backfill(force=False):
+    """Index các bài có lyrics nhưng chưa có document lyrics_lines (tải LRC từ GCS)."""
+    from backend.utils.gcs import GCS_BUCKET_NAME, download_text
+    from backend.utils.mongodb import get_song_list, get_all_lyrics_lines
+    from backend.utils.utils import parse_lrc_content
+
+    indexed = set() if force else {doc["_id"] for doc in get_all_lyrics_lines()}
+    done = 0
+    for song in get_song_list():
+        if song["_id"] in indexed or not song.get("gcs_lrc_blob"):
+            continue
+        try:
+            lyrics = parse_lrc_content(download_text(GCS_BUCKET_NAME, song["gcs_lrc_blob"]))
+            index_song(song["_id"], lyrics)
+            done += 1
+            print(f"✅ {song.get('title')}: {len(lyrics) - 1} dòng")
+        except Exception as e:
+            print(f"❌ {song.get('title')}: {e}")
+    return done
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lyrics search index")
+    parser.add_argument("query", nargs="?", help="Search the index and print the hits")
+    parser.add_argument("--backfill", action="store_true", help="Index songs imported before lyrics search existed")
+    parser.add_argument("--force", action="store_true", help="With --backfill: re-index every song")
+    args = parser.parse_args()
+
+    if args.backfill:
+        print(f"Indexed {backfill(force=args.force)} song(s)")
+    if args.query:
+        started = time.perf_counter()
+        results = ensure_loaded().search(args.query)
+        print(f"{len(results)} bài ({(time.perf_counter() - started) * 1000:.1f} ms)")
+        for result in results:
+            for hit in result["hits"]:
+                print(f"  {result['song_id']} [{hit['time']:7.2f}s] {hit['text']}")
@@ -0,0 +1,140 @@
+"""
+Metrics trong process: counter có label và latency theo route.
+
+- get_metrics(): registry dùng chung (mỗi worker một registry riêng)
+- MetricsMiddleware: ghi latency + status của mỗi request theo route template
+  (`/api/audio/{song_id}`, không phải path thật) vào một cửa sổ trượt
+- /api/metrics trả về snapshot(): p50/p95/p99 theo route, counter (ví dụ request bị
+  limiter từ chối) và các gauge đăng ký thêm (concurrency gates, ...)
+"""
+
+import collections
+import math
+import threading
+import time
+
+LATENCY_WINDOW = 2048   # Số request gần nhất giữ lại cho mỗi route
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class Metrics:
+    def __init__(self, latency_window=LATENCY_WINDOW):
+        self.latency_window = latency_window
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._latency = {}
+        self._requests = collections.Counter()
+        self._gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe_request(self, route, status, ms):
+        with self._lock:
+            window = self._latency.get(route)
+            if window is None:
+                window = self._latency[route] = collections.deque(maxlen=self.latency_window)
+            window.append(ms)
+            self._requests[(route, f"{status // 100}xx")] += 1
+
+    def register_gauge(self, name, func):
+        """func() -> JSON-serializable value, evaluated on every snapshot."""
+        self._gauges[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            windows = {route: sorted(values) for route, values in self._latency.items()}
+            requests = dict(self._requests)
+            counters = dict(self._counters)
+
+        routes = {}
+        for route, values in windows.items():
+            statuses = {status: n for (r, status), n in requests.items() if r == route}
+            routes[route] = {
+                "count": sum(statuses.values()),
+                "status": statuses,
+                "latency_ms": {
+                    "window": len(values),
+                    "p50": round(_percentile(values, 50), 2),
+                    "p95": round(_percentile(values, 95), 2),
+                    "p99": round(_percentile(values, 99), 2),
+                    "max": round(values[-1], 2),
+                },
+            }
+
+        grouped = {}
+        for (name, labels), value in sorted(counters.items()):
+            grouped.setdefault(name, []).append({**dict(labels), "value": value})
+
+        gauges = {}
+        for name, func in self._gauges.items():
+            try:
+                gauges[name] = func()
+            except Exception as e:
+                gauges[name] = {"error": str(e)}
+
+        return {
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "routes": routes,
+            "counters": grouped,
+            "gauges": gauges,
+        }
+
+
+_metrics = None
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def route_template(scope):
+    """Route path template set by the router (or by AdmissionMiddleware), or a fixed label for unmatched paths."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("admission_route") or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency (tới hết body) và status class theo route."""
+
+    def __init__(self, app, metrics=None):
+        self.app = app
+        self.metrics = metrics or get_metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                                for name, value in message.get("headers", ()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # SSE stream sống cả phiên: không tính vào latency
+            if not streaming:
+                self.metrics.observe_request(
+                    f"{scope['method']} {route_template(scope)}", status, (time.perf_counter() - started) * 1000
+                )
@@ -0,0 +1,238 @@
+"""
+Ghi nhận play / skip / seek từ player (POST /api/events) theo kiểu write-behind.
+
+Player gửi event theo lô. Request không chạm MongoDB: PlayEventBuffer chỉ cộng event vào bộ đếm
+của từng bài trong bộ nhớ worker (plays, skips, seeks, skip_seconds, last_played_at). Thread nền
+flush mỗi PLAY_EVENTS_FLUSH_INTERVAL giây (sớm hơn khi đã gom PLAY_EVENTS_FLUSH_AT event) bằng một
+bulk_write không thứ tự: mỗi bài một UpdateOne upsert `$inc` vào collection `play_stats`
+(_id = song id). Số lần ghi MongoDB tỉ lệ với số bài được nghe trong một khoảng flush, không phải
+số event.
+
+Backpressure: số event chưa flush tối đa PLAY_EVENTS_QUEUE_SIZE. Lô làm vượt giới hạn bị từ chối
+cả lô (PlayEventsFull -> 503 + Retry-After) và client gửi lại sau. Flush lỗi (MongoDB lỗi / breaker
+open) thì bộ đếm được cộng lại vào buffer: không mất event, buffer đầy dần cho tới khi MongoDB
+trở lại. Một chunk lỗi giữa chừng có thể đã được ghi một phần, nên khi thử lại có thể đếm trùng.
+
+Lúc shutdown (lifespan) buffer được flush lần cuối. Worker bị kill thì mất tối đa một khoảng flush;
+MongoDB vẫn lỗi lúc shutdown thì các event chưa ghi bị mất (chỉ được log).
+
+Cấu hình:
+    PLAY_EVENTS=true|false            (default: true)
+    PLAY_EVENTS_FLUSH_INTERVAL=10     (giây)
+    PLAY_EVENTS_FLUSH_AT=5000         (flush sớm khi đã gom chừng này event)
+    PLAY_EVENTS_QUEUE_SIZE=100000     (event chưa flush tối đa)
+
+CLI:
+    uv run python -m backend.utils.play_events --top 20
+"""
+
+import os
+import random
+import threading
+import time
+
+PLAY_EVENTS = os.getenv("PLAY_EVENTS", "true").lower() in ("1", "true", "yes")
+PLAY_EVENTS_FLUSH_INTERVAL = float(os.getenv("PLAY_EVENTS_FLUSH_INTERVAL", "10"))
+PLAY_EVENTS_FLUSH_AT = int(os.getenv("PLAY_EVENTS_FLUSH_AT", "5000"))
+PLAY_EVENTS_QUEUE_SIZE = int(os.getenv("PLAY_EVENTS_QUEUE_SIZE", "100000"))
+FLUSH_BATCH_SIZE = 1000   # UpdateOne mỗi bulk_write
+RETRY_AFTER = 5.0         # giây, khi buffer đầy
+
+# Vị trí trong bộ đếm của một bài
+PLAYS, SKIPS, SEEKS, SKIP_SECONDS, LAST_PLAYED_AT = range(5)
+
+
+class PlayEventsFull(Exception):
+    """Buffer đã đầy (MongoDB chậm / lỗi): client gửi lại sau retry_after giây."""
+
+    def __init__(self, retry_after):
+        super().__init__("Play event buffer is full")
+        self.retry_after = retry_after
+
+
+def counter_fields(counter):
+    """Bộ đếm trong buffer -> fields cho increment_play_stats."""
+    return {
+        "plays": counter[PLAYS],
+        "skips": counter[SKIPS],
+        "seeks": counter[SEEKS],
+        "skip_seconds": round(counter[SKIP_SECONDS], 3),
+        "last_played_at": counter[LAST_PLAYED_AT] or None,
+    }
+
+
+class PlayEventBuffer:
+    """Bộ đếm play / skip / seek theo bài, giới hạn số event chưa flush, flush bằng thread nền."""
+
+    def __init__(self, capacity=PLAY_EVENTS_QUEUE_SIZE, flush_interval=PLAY_EVENTS_FLUSH_INTERVAL,
+                 flush_at=PLAY_EVENTS_FLUSH_AT, batch_size=FLUSH_BATCH_SIZE):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_at = flush_at
+        self.batch_size = batch_size
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.writes = 0
+        self.errors = 0
+        self.last_flush_ms = None
+        self._counters = {}   # song id -> [plays, skips, seeks, skip_seconds, last_played_at]
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def add(self, events, now=None):
+        """
+        Cộng một lô event [(type, song id, position), ...] vào bộ đếm. Cả lô được nhận hoặc bị từ chối.
+        Returns số event đã nhận. Raises PlayEventsFull khi buffer không còn chỗ.
+        """
+        now = now or time.time()
+        with self._lock:
+            if self._pending + len(events) > self.capacity:
+                self.rejected += len(events)
+                self._wake.set()
+                # Buffer đầy thì flush ngay: client chỉ cần chờ một lần ghi
+                raise PlayEventsFull(min(self.flush_interval, RETRY_AFTER))
+            counters = self._counters
+            for kind, song_id, position in events:
+                counter = counters.get(song_id)
+                if counter is None:
+                    counter = counters[song_id] = [0, 0, 0, 0.0, 0.0]
+                if kind == "play":
+                    counter[PLAYS] += 1
+                    counter[LAST_PLAYED_AT] = now
+                elif kind == "skip":
+                    counter[SKIPS] += 1
+                    counter[SKIP_SECONDS] += position or 0.0
+                else:
+                    counter[SEEKS] += 1
+            self._pending += len(events)
+            self.accepted += len(events)
+            if self._pending >= self.flush_at:
+                self._wake.set()
+        return len(events)
+
+    def forget(self, song_ids):
+        """Bỏ bộ đếm chưa flush của các bài vừa bị xoá (không ghi lại document play_stats)."""
+        with self._lock:
+            for song_id in song_ids:
+                counter = self._counters.pop(str(song_id), None)
+                if counter is not None:
+                    self._pending -= counter[PLAYS] + counter[SKIPS] + counter[SEEKS]
+
+    def _merge(self, items):
+        """Cộng lại các bộ đếm chưa ghi được (flush lỗi)."""
+        with self._lock:
+            for song_id, old in items:
+                counter = self._counters.get(song_id)
+                if counter is None:
+                    self._counters[song_id] = old
+                else:
+                    for i in (PLAYS, SKIPS, SEEKS, SKIP_SECONDS):
+                        counter[i] += old[i]
+                    counter[LAST_PLAYED_AT] = max(counter[LAST_PLAYED_AT], old[LAST_PLAYED_AT])
+                self._pending += old[PLAYS] + old[SKIPS] + old[SEEKS]
+
+    def flush(self):
+        """
+        Ghi mọi bộ đếm đang có bằng bulk_write (FLUSH_BATCH_SIZE bài mỗi lần). Returns số event đã ghi.
+        Lỗi: phần chưa ghi được cộng lại vào buffer rồi raise.
+        """
+        from backend.utils.mongodb import increment_play_stats
+
+        with self._flush_lock:
+            with self._lock:
+                counters, self._counters = self._counters, {}
+                self._pending = 0
+            if not counters:
+                return 0
+            started = time.perf_counter()
+            items = list(counters.items())
+            written = 0
+            try:
+                for start in range(0, len(items), self.batch_size):
+                    chunk = items[start:start + self.batch_size]
+                    increment_play_stats([(song_id, counter_fields(counter)) for song_id, counter in chunk])
+                    self.writes += 1
+                    written += sum(c[PLAYS] + c[SKIPS] + c[SEEKS] for _, c in chunk)
+            except Exception:
+                self._merge(items[start:])
+                raise
+            finally:
+                self.flushed += written
+                self.flushes += 1
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+            return written
+
+    def run_once(self):
+        try:
+            self.flush()
+        except Exception as e:
+            self.errors += 1
+            print(f"Warning: Could not flush play events ({self._pending} pending): {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="play-events", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Dừng thread nền rồi flush lần cuối (shutdown)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self.run_once()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Jitter nhỏ để các worker không cùng ghi một lúc
+            self._wake.wait(self.flush_interval * random.uniform(0.9, 1.1))
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "pending": self._pending,
+            "songs": len(self._counters),
+            "capacity": self.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show play statistics recorded from /api/events")
+    parser.add_argument("--top", type=int, default=20, help="Most played songs")
+    args = parser.parse_args()
+
+    from backend.utils.mongodb import get_song_list, get_top_play_stats
+
+    titles = {song["_id"]: song.get("title") for song in get_song_list()}
+    for stats in get_top_play_stats(args.top):
+        skips = stats.get("skips", 0)
+        average = f"{stats.get('skip_seconds', 0) / skips:.0f}s" if skips else "-"
+        print(f"{stats.get('plays', 0):>8} plays {skips:>6} skips (avg {average:>5}) {stats.get('seeks', 0):>6} seeks  "
+              f"{titles.get(stats['_id'], stats['_id'])}")
@@ -0,0 +1,354 @@
+"""
+Sampling profiler bật theo yêu cầu, để xem thời gian của một request chậm nằm ở đâu.
+
+Một thread nền đọc stack của các thread khác (sys._current_frames) mỗi PROFILE_INTERVAL_MS
+và gộp các stack giống nhau. Không dùng sys.setprofile nên code được profile chạy bình thường;
+chi phí chỉ có khi đang profile. Không đặt ADMIN_TOKEN thì middleware không được cài và các
+endpoint /api/admin/* trả 404.
+
+- Cả process trong N giây: GET /api/admin/profile?seconds=10 (header X-Admin-Token)
+- Một request: gửi request kèm header `X-Profile: <ADMIN_TOKEN>`, response có `X-Profile-Id`,
+  lấy kết quả ở GET /api/admin/profiles/{id}. Thread event loop chỉ được sample khi đang chạy
+  task của request đó; các AnyIO worker thread (run_in_threadpool) được sample khi đang chạy code
+  của backend (có thể lẫn công việc của request khác chạy cùng lúc).
+
+Output: `collapsed` (một dòng `thread;frame;...;frame count` mỗi stack, dùng cho flamegraph.pl /
+speedscope / inferno), `speedscope` (file JSON mở ở https://www.speedscope.app) hoặc `json`
+(top function theo self time).
+
+Cấu hình:
+    ADMIN_TOKEN=...              (không đặt: tắt profiler)
+    PROFILE_INTERVAL_MS=5
+
+CLI (lấy profile cả process từ server đang chạy):
+    uv run python -m backend.utils.profiler --seconds 10 --out profile.speedscope.json
+"""
+
+import asyncio
+import collections
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+MAX_PROFILE_SECONDS = 60
+MAX_STACK_DEPTH = 128
+KEEP_REQUEST_PROFILES = 20
+FORMATS = ("collapsed", "speedscope", "json")
+
+# Frame lá của một thread đang chờ (không làm gì): bỏ qua trừ khi idle=True
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+}
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PROJECT_DIR = os.path.dirname(_BACKEND_DIR)
+
+
+def profiling_enabled():
+    return bool(ADMIN_TOKEN)
+
+
+def check_token(token):
+    return profiling_enabled() and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _label(code):
+    """(function, file, line) của một code object; file tương đối với project hoặc site-packages."""
+    path = code.co_filename
+    if path.startswith(_PROJECT_DIR):
+        path = os.path.relpath(path, _PROJECT_DIR)
+    elif "site-packages" in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    else:
+        path = os.path.basename(path)
+    return (getattr(code, "co_qualname", code.co_name), path, code.co_firstlineno)
+
+
+class Profile:
+    """Các stack đã gộp: (thread, frame gốc -> frame lá) -> số sample."""
+
+    def __init__(self, name, interval_ms=PROFILE_INTERVAL_MS):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.interval_ms = interval_ms
+        self.started_at = time.time()
+        self.duration_s = 0.0
+        self.stacks = collections.Counter()
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def info(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_s": round(self.duration_s, 3),
+            "interval_ms": self.interval_ms,
+            "samples": self.samples,
+        }
+
+    def collapsed(self):
+        lines = [
+            ";".join([thread] + [f"{name} ({path}:{line})" for name, path, line in frames]) + f" {count}"
+            for (thread, frames), count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self):
+        """Speedscope file format: một sampled profile cho mỗi thread."""
+        frame_index, frames = {}, []
+        by_thread = collections.defaultdict(list)
+        for (thread, stack), count in self.stacks.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexes.append(frame_index[frame])
+            by_thread[thread].append((indexes, count))
+
+        interval = self.interval_ms / 1000
+        profiles = []
+        for thread, stacks in sorted(by_thread.items()):
+            total = sum(count for _, count in stacks) * interval
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": [indexes for indexes, _ in stacks],
+                "weights": [count * interval for _, count in stacks],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "tunify-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def summary(self, top=30):
+        """Top function theo self time (frame lá) và total time (có mặt trong stack)."""
+        self_counts, total_counts = collections.Counter(), collections.Counter()
+        for (_, stack), count in self.stacks.items():
+            if not stack:
+                continue
+            self_counts[stack[-1]] += count
+            for frame in set(stack):
+                total_counts[frame] += count
+        samples = self.samples or 1
+
+        def rows(counter):
+            return [
+                {"function": name, "file": f"{path}:{line}", "samples": count, "pct": round(100 * count / samples, 1)}
+                for (name, path, line), count in counter.most_common(top)
+            ]
+
+        return {**self.info(), "self": rows(self_counts), "total": rows(total_counts)}
+
+    def render(self, fmt):
+        if fmt == "collapsed":
+            return self.collapsed()
+        if fmt == "speedscope":
+            return self.speedscope()
+        return self.summary()
+
+
+class Sampler:
+    """
+    Thread nền sample stack của các thread khác mỗi interval_ms.
+    select(thread_id, thread_name, frame) -> tên thread để ghi vào profile, hoặc None để bỏ qua.
+    """
+
+    def __init__(self, profile, select, interval_ms=PROFILE_INTERVAL_MS):
+        self.profile = profile
+        self.select = select
+        self.interval = interval_ms / 1000
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.profile.duration_s = time.perf_counter() - self._started
+        return self.profile
+
+    def _stack(self, frame):
+        labels, stack = self._labels, []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _label(code)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if not frames.keys() <= names.keys():
+                # Thread mới (ví dụ worker thread vừa được tạo cho request)
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                thread = self.select(ident, names.get(ident) or str(ident), frame)
+                if thread is not None:
+                    self.profile.stacks[(thread, self._stack(frame))] += 1
+            # Không giữ reference tới frame của thread khác giữa hai lần sample
+            frames = frame = None
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def _runs_backend_code(frame):
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(_BACKEND_DIR):
+            return True
+        frame = frame.f_back
+    return False
+
+
+_process_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+async def profile_process(seconds, interval_ms=PROFILE_INTERVAL_MS, idle=False):
+    """Sample mọi thread trong `seconds` giây (mỗi worker chỉ một profile cả process cùng lúc)."""
+    if not _process_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A process profile is already running")
+    try:
+        loop_thread = threading.get_ident()
+
+        def select(ident, name, frame):
+            if not idle and _is_idle(frame):
+                return None
+            return "event-loop" if ident == loop_thread else name
+
+        sampler = Sampler(Profile(f"process {seconds:g}s", interval_ms), select, interval_ms).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile = sampler.stop()
+        return profile
+    finally:
+        _process_lock.release()
+
+
+_request_profiles = collections.OrderedDict()
+
+
+def get_request_profile(profile_id):
+    return _request_profiles.get(profile_id)
+
+
+def list_request_profiles():
+    return [profile.info() for profile in reversed(_request_profiles.values())]
+
+
+def _keep(profile):
+    _request_profiles[profile.id] = profile
+    while len(_request_profiles) > KEEP_REQUEST_PROFILES:
+        _request_profiles.popitem(last=False)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware: profile các request có header `X-Profile: <ADMIN_TOKEN>`."""
+
+    def __init__(self, app, interval_ms=PROFILE_INTERVAL_MS):
+        self.app = app
+        self.interval_ms = interval_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = next((value.decode("latin-1") for key, value in scope["headers"] if key == b"x-profile"), None)
+        if token is None or not check_token(token):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        loop_thread = threading.get_ident()
+
+        def select(ident, name, frame):
+            if ident == loop_thread:
+                return "event-loop" if asyncio.current_task(loop) is task else None
+            if name.startswith("AnyIO worker thread") and _runs_backend_code(frame):
+                return name
+            return None
+
+        profile = Profile(f"{scope['method']} {scope['path']}", self.interval_ms)
+        sampler = Sampler(profile, select, self.interval_ms).start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _keep(sampler.stop())
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    import httpx
+
+    parser = argparse.ArgumentParser(description="Fetch a whole-process sampling profile from a running backend")
+    parser.add_argument("--url", default=os.getenv("BACKEND_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--format", choices=FORMATS, default="speedscope")
+    parser.add_argument("--idle", action="store_true", help="Keep samples of threads that are only waiting")
+    parser.add_argument("--out", help="Write to this file instead of stdout")
+    args = parser.parse_args()
+
+    response = httpx.get(
+        f"{args.url}/api/admin/profile",
+        params={"seconds": args.seconds, "format": args.format, "idle": str(args.idle).lower()},
+        headers={"X-Admin-Token": ADMIN_TOKEN},
+        timeout=args.seconds + 30,
+    )
+    response.raise_for_status()
+    body = response.text if args.format == "collapsed" else json.dumps(response.json(), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(body)
+        print(f"Wrote {args.out}")
+    else:
+        print(body)
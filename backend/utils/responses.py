@@ -0,0 +1,178 @@
+"""
+Fast JSON + nén response.
+
+- FastJSONResponse: encode bằng orjson nếu có cài (optional), không thì json stdlib
+  dạng compact. Route trả thẳng response này để bỏ qua jsonable_encoder của FastAPI.
+- CompressionMiddleware: gzip / br (br cần package `brotli`) theo Accept-Encoding,
+  chỉ nén body >= COMPRESSION_MIN_SIZE; bỏ qua streaming response (SSE, file) và
+  response đã có Content-Encoding.
+- precompress() / precompressed_response(): encode + nén một lần ở mức nén cao,
+  lưu vào cache, mỗi request chỉ chọn bản phù hợp với Accept-Encoding.
+"""
+
+import gzip
+import json
+import os
+
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Nén động (mỗi request) dùng mức vừa phải; precompress chỉ trả một lần nên nén kỹ hơn.
+# Brotli 10-11 chậm hơn 9 cỡ 10-50 lần: chỉ đáng cho payload ít đổi (lyrics, cache 24h),
+# không đáng cho danh sách bài hát (build lại mỗi lần thư viện thay đổi).
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 4
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 9
+MAX_BROTLI_QUALITY = 11
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/vnd.apple.mpegurl",
+    "text/",
+)
+
+
+def dumps(content) -> bytes:
+    """Encode content as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when available."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding, available=None):
+    """Pick the best content-coding from an Accept-Encoding header, or None for identity."""
+    available = available_encodings() if available is None else available
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+    best, best_q = None, 0.0
+    # `available` theo thứ tự ưu tiên của server (br trước gzip), cùng q thì giữ thứ tự đó
+    for coding in available:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, static: bool = False, brotli_quality: int = None) -> bytes:
+    if encoding == "br":
+        if brotli_quality is None:
+            brotli_quality = STATIC_BROTLI_QUALITY if static else DYNAMIC_BROTLI_QUALITY
+        return brotli.compress(body, quality=brotli_quality)
+    if encoding == "gzip":
+        # mtime=0: cùng input cho cùng output (cache / ETag ổn định)
+        return gzip.compress(body, compresslevel=STATIC_GZIP_LEVEL if static else DYNAMIC_GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def precompress(body: bytes, brotli_quality: int = STATIC_BROTLI_QUALITY):
+    """Return {"identity": body, "gzip": ..., "br": ...}; only identity when body is below the threshold."""
+    bodies = {"identity": body}
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        for encoding in available_encodings():
+            bodies[encoding] = compress(body, encoding, static=True, brotli_quality=brotli_quality)
+    return bodies
+
+
+def precompressed_response(request, bodies, media_type="application/json", headers=None):
+    """Serve the variant of a precompress() result that matches the request's Accept-Encoding."""
+    encoding = negotiate_encoding(
+        request.headers.get("accept-encoding"),
+        [e for e in available_encodings() if e in bodies],
+    )
+    response = Response(content=bodies[encoding or "identity"], media_type=media_type, headers=headers)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if len(bodies) > 1:
+        response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def _compressible(content_type):
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware: gzip / br for single-chunk responses above the size threshold."""
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not _compressible(headers.get("content-type", ""))
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
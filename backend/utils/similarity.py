@@ -0,0 +1,517 @@
+"""
+Gợi ý bài tương tự (autoplay khi hết playlist, /api/songs/{id}/similar).
+
+Mỗi bài là một vector TF-IDF thưa của title (từ + char 3-gram) và lyrics (từ + cặp từ liền nhau),
+text đã fold_text nên không phân biệt dấu / hoa thường. Feature được hash (không cần lưu từ điển),
+df được đếm trong một bảng hash 1 << IDF_BITS ô; feature chỉ có ở một bài (df = 1) bị bỏ vì không
+giúp so khớp bài nào khác. Mỗi bài chỉ giữ SIMILARITY_FEATURES feature có trọng số lớn nhất rồi
+L2-normalize, nên cosine của hai bài là tích vô hướng của hai vector đã cắt.
+
+Các vector nằm trong một ma trận thưa dạng mảng NumPy đã sort theo feature (key, slot, weight) như
+FingerprintIndex: top-k của một bài là searchsorted các feature của nó, nhân trọng số, cộng theo bài
+bằng bincount rồi argpartition; similar_many làm việc đó cho nhiều bài trong một lượt. Import / update
+/ xoá chỉ thêm vào phần pending hoặc đánh dấu slot (gộp / compact khi đủ lớn). IDF của bài mới dùng
+df hiện tại; khi số bài thêm / sửa / xoá vượt REBUILD_RATIO số bài lúc build, index được build lại
+từ MongoDB trong thread nền và thay thế index cũ khi xong.
+
+Cần numpy (không bắt buộc): thiếu numpy thì /api/songs/{id}/similar trả 503.
+
+Cấu hình:
+    SIMILARITY=true|false          (default: true)
+    SIMILARITY_FEATURES=32         (số feature giữ lại mỗi bài)
+
+CLI:
+    uv run python -m backend.utils.similarity <song_id> [-k 10]
+"""
+
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from backend.utils.utils import fold_text
+
+SIMILARITY = os.getenv("SIMILARITY", "true").lower() in ("1", "true", "yes")
+SIMILARITY_FEATURES = int(os.getenv("SIMILARITY_FEATURES", "32"))
+
+IDF_BITS = 22
+IDF_MASK = (1 << IDF_BITS) - 1
+TITLE_WEIGHT = 0.35           # Trọng số feature của title so với lyrics (title ngắn nhưng nhiều char 3-gram)
+REBUILD_RATIO = 0.2
+LOAD_CHUNK = 2048             # Số bài mỗi lượt extract_features khi build
+QUERY_CHUNK = 16              # Số bài mỗi lượt bincount trong similar_many
+COMPACT_RATIO = 0.25
+MERGE_RATIO = 0.05
+MERGE_MIN = 50_000
+MAX_SIMILAR = 50
+
+# Salt tách các loại feature (cùng một từ trong title và trong lyrics là hai feature khác nhau)
+_TITLE_WORD, _TITLE_CHAR, _LYRICS_WORD, _LYRICS_BIGRAM = (
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93
+)
+
+
+def numpy_available():
+    return np is not None
+
+
+def similarity_available():
+    return SIMILARITY and numpy_available()
+
+
+def _mix(keys):
+    """Finalizer của splitmix64: trộn đều bit của key (ô df và key lưu trong index lấy từ các bit khác nhau)."""
+    keys = keys ^ (keys >> np.uint64(30))
+    keys = keys * np.uint64(0xBF58476D1CE4E5B9)
+    keys = keys ^ (keys >> np.uint64(27))
+    keys = keys * np.uint64(0x94D049BB133111EB)
+    return keys ^ (keys >> np.uint64(31))
+
+
+def _hash_words(words, count):
+    return np.fromiter(map(hash, words), dtype=np.int64, count=count).view(np.uint64)
+
+
+def _title_tokens(title):
+    words = fold_text(title or "").split()
+    grams = [padded[i:i + 3] for padded in (f"_{word}_" for word in words) for i in range(len(padded) - 2)]
+    return words, grams
+
+
+def _run_starts(changed, length):
+    """Vị trí bắt đầu của mỗi đoạn giá trị giống nhau trong mảng đã sort (changed: a[1:] != a[:-1])."""
+    if not length:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate([[True], changed]))
+
+
+def extract_features(songs):
+    """
+    Feature của nhiều bài một lượt (ít lần gọi NumPy): songs là list (title, lines).
+    Returns (owner, block, keys, counts): mỗi feature khác nhau của một bài là một phần tử,
+    owner = vị trí bài trong songs, block = 0 (title: từ + char 3-gram) / 1 (lyrics: từ + cặp từ).
+    """
+    title_words, title_grams, lyrics_words = [], [], []
+    title_lengths, gram_lengths, lyrics_lengths = [], [], []
+    for title, lines in songs:
+        words, grams = _title_tokens(title)
+        title_words.extend(words)
+        title_grams.extend(grams)
+        title_lengths.append(len(words))
+        gram_lengths.append(len(grams))
+        words = fold_text(" ".join(text for _, text in lines or ())).split()
+        lyrics_words.extend(words)
+        lyrics_lengths.append(len(words))
+
+    songs_range = np.arange(len(songs), dtype=np.int64)
+    lyrics_owner = np.repeat(songs_range, lyrics_lengths)
+    lyrics_hashes = _hash_words(lyrics_words, len(lyrics_words))
+    # Cặp từ liền nhau trong cùng một bài
+    same_song = lyrics_owner[:-1] == lyrics_owner[1:]
+    bigrams = (lyrics_hashes[:-1] * np.uint64(0x100000001B3) + lyrics_hashes[1:])[same_song]
+
+    keys = _mix(np.concatenate([
+        _hash_words(title_words, len(title_words)) ^ np.uint64(_TITLE_WORD),
+        _hash_words(title_grams, len(title_grams)) ^ np.uint64(_TITLE_CHAR),
+        lyrics_hashes ^ np.uint64(_LYRICS_WORD),
+        bigrams ^ np.uint64(_LYRICS_BIGRAM),
+    ]))
+    owner = np.concatenate([
+        np.repeat(songs_range, title_lengths), np.repeat(songs_range, gram_lengths),
+        lyrics_owner, lyrics_owner[:-1][same_song],
+    ])
+    block = np.concatenate([
+        np.zeros(len(title_words) + len(title_grams), dtype=np.int64),
+        np.ones(len(lyrics_words) + len(bigrams), dtype=np.int64),
+    ])
+
+    # Gộp feature trùng trong cùng (bài, block) thành số lần xuất hiện: sort theo một key 64 bit gộp cả ba
+    order = np.argsort(keys ^ _mix((owner * 2 + block).astype(np.uint64) + np.uint64(1)))
+    owner, block, keys = owner[order], block[order], keys[order]
+    starts = _run_starts((owner[1:] != owner[:-1]) | (block[1:] != block[:-1]) | (keys[1:] != keys[:-1]), len(keys))
+    counts = np.diff(np.append(starts, len(keys))).astype(np.float32)
+    return owner[starts], block[starts], keys[starts], counts
+
+
+class SimilarityIndex:
+    """
+    Ma trận thưa (feature, slot, weight) sort theo feature + một phần "pending" nhỏ cho các bài mới
+    thêm (như FingerprintIndex). Mỗi slot còn giữ vector đã cắt của bài để làm query.
+    """
+
+    def __init__(self, features=SIMILARITY_FEATURES):
+        self.features = features
+        self._lock = threading.RLock()
+        self._df = np.zeros(1 << IDF_BITS, dtype=np.int32)
+        self._documents = 0       # Số bài đã cộng vào df
+        self._built_songs = 0     # Số bài lúc build (load) gần nhất
+        self._changes = 0
+        self._clear()
+
+    def _clear(self):
+        empty = (np.zeros(0, np.uint32), np.zeros(0, np.uint32), np.zeros(0, np.float32))
+        self._main = empty
+        self._pending = []             # [(keys, slots, weights)] chưa sort
+        self._pending_sorted = empty
+        self._pending_count = 0
+        self._slot_song = []           # slot -> song_id (None = đã xoá)
+        self._slot_vectors = []        # slot -> (keys, weights) của bài
+        self._alive = bytearray()      # slot -> 1 / 0, đọc bằng np.frombuffer khi query
+        self._slots = {}               # song_id -> slot
+        self._versions = {}
+        self._dead_entries = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, song_id):
+        return song_id in self._slots
+
+    def version(self, song_id):
+        return self._versions.get(song_id)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._main[0]) + self._pending_count
+            return {
+                "songs": len(self._slots),
+                "entries": entries - self._dead_entries,
+                "dead_entries": self._dead_entries,
+                # Mỗi entry: (key, slot, weight) trong ma trận + (key, weight) trong vector của slot
+                "bytes": entries * 20 + self._df.nbytes,
+            }
+
+    def needs_rebuild(self):
+        """
+        IDF đã lệch nhiều: số bài thêm / sửa / xoá từ lúc build vượt REBUILD_RATIO. Vector của bài
+        cũ không được cập nhật khi một feature của nó bắt đầu xuất hiện ở bài mới (df 1 -> 2).
+        """
+        return self._changes > REBUILD_RATIO * self._built_songs
+
+    def _count_df(self, features, song_count):
+        """Cộng df: mỗi ô df tính một lần mỗi bài, dù feature xuất hiện ở cả title và lyrics."""
+        owner, _, keys, _ = features
+        cells = np.sort((owner << IDF_BITS) | (keys & np.uint64(IDF_MASK)).astype(np.int64))
+        cells = np.sort(cells[_run_starts(cells[1:] != cells[:-1], len(cells))] & IDF_MASK)
+        starts = _run_starts(cells[1:] != cells[:-1], len(cells))
+        self._df[cells[starts]] += np.diff(np.append(starts, len(cells))).astype(np.int32)
+        self._documents += song_count
+
+    def vectorize(self, features, song_count):
+        """
+        Vector đã cắt của song_count bài: list (keys, weights), chia cho norm của vector đầy đủ
+        nên tích vô hướng hai vector đã cắt xấp xỉ (nhỏ hơn) cosine thật.
+        Trọng số = sublinear tf * idf, feature của title nhân thêm TITLE_WEIGHT.
+        """
+        owner, block, keys, counts = features
+        df = self._df[(keys & np.uint64(IDF_MASK)).astype(np.int64)]
+        weights = (1 + np.log(counts)) * (np.log((1 + self._documents) / (1 + df)) + 1)
+        weights[block == 0] *= TITLE_WEIGHT
+        norms = np.sqrt(np.bincount(owner, weights=weights ** 2, minlength=song_count))
+
+        # Giữ `features` feature lớn nhất mỗi bài, ưu tiên feature đã có ở bài khác (df > 1): feature
+        # chỉ có ở bài này chưa khớp được bài nào, chỉ lấp chỗ trống (để khớp các bài import sau)
+        order = np.argsort(-weights, kind="stable")
+        order = order[np.argsort(df[order] <= 1, kind="stable")]
+        order = order[np.argsort(owner[order], kind="stable")]
+        owner, keys, weights = owner[order], keys[order], weights[order]
+        first = np.searchsorted(owner, np.arange(song_count))
+        keep = np.arange(len(owner)) - first[owner] < self.features
+        owner, keys, weights = owner[keep], (keys[keep] >> np.uint64(32)).astype(np.uint32), weights[keep]
+        weights = weights / norms[owner]
+        bounds = np.searchsorted(owner, np.arange(1, song_count))
+        return list(zip(np.split(keys, bounds), np.split(weights.astype(np.float32), bounds)))
+
+    def _insert(self, song_id, keys, weights, version):
+        self._remove(song_id)
+        slot = len(self._slot_song)
+        self._slot_song.append(song_id)
+        self._slot_vectors.append((keys, weights))
+        self._alive.append(1)
+        self._slots[song_id] = slot
+        self._versions[song_id] = version
+        self._pending.append((keys, np.full(len(keys), slot, dtype=np.uint32), weights))
+        self._pending_count += len(keys)
+        self._pending_sorted = None
+
+    def load(self, songs):
+        """
+        songs: list (song_id, title, lines, version). Hai lượt theo từng LOAD_CHUNK bài:
+        đếm df cho cả thư viện rồi mới tính vector (IDF đúng cho mọi bài).
+        """
+        chunks = [songs[i:i + LOAD_CHUNK] for i in range(0, len(songs), LOAD_CHUNK)]
+        for chunk in chunks:
+            self._count_df(extract_features([(title, lines) for _, title, lines, _ in chunk]), len(chunk))
+        with self._lock:
+            self._clear()
+            for chunk in chunks:
+                vectors = self.vectorize(extract_features([(title, lines) for _, title, lines, _ in chunk]), len(chunk))
+                for (song_id, _, _, version), (keys, weights) in zip(chunk, vectors):
+                    self._insert(song_id, keys, weights, version)
+            self._merge()
+            self._built_songs = len(self._slots)
+
+    def add(self, song_id, title, lines, version=None):
+        features = extract_features([(title, lines)])
+        with self._lock:
+            if song_id not in self._slots:
+                self._count_df(features, 1)
+            (keys, weights), = self.vectorize(features, 1)
+            self._insert(song_id, keys, weights, version)
+            self._changes += 1
+            if self._pending_count > max(MERGE_MIN, MERGE_RATIO * len(self._main[0])):
+                self._merge()
+
+    def remove(self, song_id):
+        with self._lock:
+            if song_id in self._slots:
+                self._changes += 1
+            self._remove(song_id)
+            total = len(self._main[0]) + self._pending_count
+            if total and self._dead_entries > COMPACT_RATIO * total:
+                self._compact()
+
+    def _remove(self, song_id):
+        slot = self._slots.pop(song_id, None)
+        self._versions.pop(song_id, None)
+        if slot is not None:
+            self._slot_song[slot] = None
+            self._alive[slot] = 0
+            self._dead_entries += len(self._slot_vectors[slot][0])
+
+    @staticmethod
+    def _sorted(parts):
+        keys, slots, weights = (np.concatenate([p[i] for p in parts]) for i in range(3))
+        order = np.argsort(keys, kind="stable")
+        return keys[order], slots[order], weights[order]
+
+    def _merge(self):
+        if self._pending:
+            self._main = self._sorted([self._main] + self._pending)
+        self._pending = []
+        self._pending_sorted = None
+        self._pending_count = 0
+
+    def _compact(self):
+        self._merge()
+        alive = np.frombuffer(bytes(self._alive), dtype=bool)
+        keys, slots, weights = self._main
+        keep = alive[slots]
+        # Đánh số lại slot cho các bài còn lại
+        new_slot = np.cumsum(alive, dtype=np.int64) - 1
+        songs = [(song_id, self._versions[song_id], self._slot_vectors[slot])
+                 for slot, song_id in enumerate(self._slot_song) if song_id is not None]
+        self._clear()
+        self._main = (keys[keep], new_slot[slots[keep]].astype(np.uint32), weights[keep])
+        for slot, (song_id, version, vector) in enumerate(songs):
+            self._slot_song.append(song_id)
+            self._slot_vectors.append(vector)
+            self._alive.append(1)
+            self._slots[song_id] = slot
+            self._versions[song_id] = version
+
+    def _segments(self):
+        if self._pending and self._pending_sorted is None:
+            self._pending_sorted = self._sorted(self._pending)
+        return [self._main] + ([self._pending_sorted] if self._pending else [])
+
+    def _scores(self, vectors):
+        """Cosine của mỗi vector query với mọi slot: mảng (len(vectors), số slot)."""
+        slot_count = len(self._slot_song)
+        keys = np.concatenate([k for k, _ in vectors])
+        weights = np.concatenate([w for _, w in vectors]).astype(np.float64)
+        query = np.repeat(np.arange(len(vectors)), [len(k) for k, _ in vectors])
+        scores = np.zeros(len(vectors) * slot_count)
+        for seg_keys, seg_slots, seg_weights in self._segments():
+            lo = np.searchsorted(seg_keys, keys, side="left")
+            counts = np.searchsorted(seg_keys, keys, side="right") - lo
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Mở rộng các khoảng [lo, lo + count) thành danh sách chỉ số (vectorized)
+            rows = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(total)
+            scores += np.bincount(
+                np.repeat(query, counts) * slot_count + seg_slots[rows],
+                weights=np.repeat(weights, counts) * seg_weights[rows],
+                minlength=len(scores),
+            )
+        scores = scores.reshape(len(vectors), slot_count)
+        scores[:, ~np.frombuffer(self._alive, dtype=bool)] = -np.inf
+        return scores
+
+    def _top(self, scores, k, min_score):
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"song_id": self._slot_song[i], "score": round(float(scores[i]), 4)}
+            for i in top if scores[i] > min_score
+        ]
+
+    def similar(self, song_id, k=10, exclude=(), min_score=0.0):
+        """Top-k bài có cosine lớn nhất với song_id (không gồm chính nó và các bài trong exclude)."""
+        with self._lock:
+            slot = self._slots.get(song_id)
+            if slot is None:
+                return None
+            scores = self._scores([self._slot_vectors[slot]])[0]
+            scores[slot] = -np.inf
+            excluded = [self._slots[s] for s in exclude if s in self._slots]
+            if excluded:
+                scores[excluded] = -np.inf
+            return self._top(scores, k, min_score)
+
+    def similar_many(self, song_ids, k=10, min_score=0.0):
+        """Như similar() cho nhiều bài: {song_id: results}, mỗi lượt QUERY_CHUNK bài."""
+        with self._lock:
+            queries = [(s, self._slots[s]) for s in song_ids if s in self._slots]
+            results = {}
+            for start in range(0, len(queries), QUERY_CHUNK):
+                chunk = queries[start:start + QUERY_CHUNK]
+                scores = self._scores([self._slot_vectors[slot] for _, slot in chunk])
+                scores[np.arange(len(chunk)), [slot for _, slot in chunk]] = -np.inf
+                for (song_id, _), row in zip(chunk, scores):
+                    results[song_id] = self._top(row, k, min_score)
+            return results
+
+
+_index = None
+_loaded = False
+_load_lock = threading.Lock()
+_rebuilding = False
+_pending = set()
+
+
+def get_similarity_index():
+    global _index
+    if _index is None:
+        with _load_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    return _index
+
+
+def _catalog():
+    """(song_id, title, lines, version) của mọi bài: title từ danh sách bài, lyrics từ lyrics_lines."""
+    from backend.utils.mongodb import get_all_lyrics_lines, get_song_list
+    lyrics = {doc["_id"]: doc for doc in get_all_lyrics_lines()}
+    songs = []
+    for song in get_song_list():
+        doc = lyrics.get(song["_id"]) or {}
+        songs.append((song["_id"], song.get("title", ""), doc.get("lines") or [],
+                      (song.get("title"), doc.get("version"))))
+    return songs
+
+
+def _build():
+    index = SimilarityIndex()
+    started = time.perf_counter()
+    index.load(_catalog())
+    print(f"Similarity index: {index.stats()} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return index
+
+
+def ensure_loaded():
+    """Build index từ MongoDB ở lần dùng đầu tiên (an toàn khi gọi từ nhiều thread)."""
+    global _index, _loaded
+    if _loaded:
+        return _index
+    with _load_lock:
+        if not _loaded:
+            _index = _build()
+            _loaded = True
+    return _index
+
+
+def mark_stale():
+    global _loaded
+    _loaded = False
+
+
+def _rebuild():
+    global _index, _rebuilding
+    try:
+        index = _build()
+        with _load_lock:
+            _index = index
+            pending = list(_pending)
+            _pending.clear()
+        # Bài thay đổi trong lúc build: đọc lại để không mất thay đổi
+        for song_id in pending:
+            refresh_song(song_id)
+    except Exception as e:
+        print(f"Warning: Could not rebuild similarity index: {e}")
+    finally:
+        _rebuilding = False
+
+
+def maybe_rebuild():
+    """Build lại index trong thread nền khi IDF đã lệch nhiều (xem SimilarityIndex.needs_rebuild)."""
+    global _rebuilding
+    if not _loaded or _rebuilding or not _index.needs_rebuild():
+        return False
+    with _load_lock:
+        if _rebuilding:
+            return False
+        _rebuilding = True
+    threading.Thread(target=_rebuild, name="similarity-rebuild", daemon=True).start()
+    return True
+
+
+def similar(song_id, k=10, exclude=()):
+    """Top-k bài tương tự; None nếu bài không có trong index."""
+    results = ensure_loaded().similar(str(song_id), k=k, exclude=set(exclude))
+    maybe_rebuild()
+    return results
+
+
+def refresh_song(song_id):
+    """
+    Đồng bộ một bài từ MongoDB (import / update / xoá ở worker này hoặc worker khác).
+    Không làm gì nếu index chưa load hoặc title + version lyrics không đổi.
+    """
+    if not _loaded:
+        return
+    from backend.utils.mongodb import get_lyrics_lines, get_song_by_id
+    song_id = str(song_id)
+    if _rebuilding:
+        _pending.add(song_id)
+    index = _index
+    song = get_song_by_id(song_id)
+    if song is None:
+        index.remove(song_id)
+        return
+    doc = get_lyrics_lines(song_id) or {}
+    version = (song.get("title"), doc.get("version"))
+    if version != index.version(song_id):
+        index.add(song_id, song.get("title", ""), doc.get("lines") or [], version)
+
+
+def unindex_song(song_id):
+    if _index is not None:
+        _index.remove(str(song_id))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Songs similar to a given song")
+    parser.add_argument("song_id")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if not similarity_available():
+        raise SystemExit("Similarity needs numpy (and SIMILARITY=true)")
+    index = ensure_loaded()
+    titles = {song_id: title for song_id, title, _, _ in _catalog()}
+    started = time.perf_counter()
+    results = index.similar(args.song_id, k=args.k)
+    print(f"{titles.get(args.song_id, args.song_id)} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+    for result in results or []:
+        print(f"  {result['score']:.3f} {result['song_id']} {titles.get(result['song_id'], '')}")
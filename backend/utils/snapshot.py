@@ -0,0 +1,699 @@
+"""
+Catalog snapshot: danh sách bài hát, lyrics đã parse và lyrics search index trong một file nhị phân
+chỉ đọc, được memory-map (mmap) thay vì đọc từ MongoDB.
+
+Worker chạy với CATALOG_SNAPSHOT=<file> phục vụ /api/songs, /api/lyrics và /api/search/lyrics
+hoàn toàn từ file này (không query MongoDB, không tải LRC từ GCS): mở file chỉ là đọc header,
+dữ liệu được OS nạp theo trang khi dùng nên startup mất vài ms kể cả với catalog lớn, và các
+worker trên cùng máy dùng chung page cache. Bài chưa có trong snapshot (vừa import) vẫn đi đường
+cũ (MongoDB / GCS).
+
+Thay đổi sau lúc export (import / update / xoá, nhận qua SongCollectionWatcher) được ghi vào
+SnapshotOverlay và đè lên danh sách bài của snapshot; lyrics của các bài đó đi đường cũ. Search
+vẫn dùng index của snapshot (kết quả chỉ gồm các bài còn trong danh sách) nên lời của bài mới / vừa
+sửa chỉ tìm được sau lần refresh kế tiếp. Watcher mất dấu (reset) thì danh sách được đọc từ MongoDB
+tới khi snapshot mới được map.
+
+Layout (little-endian, các section căn 8 byte, dùng trực tiếp qua memoryview.cast):
+    MAGIC | u32 độ dài header | header JSON | section...
+    - bảng chuỗi: `<name>.offsets` (Q, n + 1) + `<name>.data` (utf-8 nối liền)
+    - bài hát (thứ tự như get_song_list): id, title, audio_format, gcs_audio_blob, gcs_lrc_blob,
+      flags (B), hls_duration (d), lyrics_version (d), song_lines (Q: khoảng dòng của từng bài),
+      id_order (I: vị trí các bài theo id đã sort, để tìm bài bằng bisect)
+    - dòng lyrics: line_time (d), line_text, line_folded (" text đã fold " như LyricsIndex),
+      line_slot (I), line_no (I)
+    - search index: terms (sorted) + postings (I, line id) + postings_offsets (Q)
+Search dùng lại LyricsIndex.search trên các view của file (SnapshotLyricsIndex), nên kết quả giống
+hệt index build từ MongoDB.
+
+Refresh: SnapshotRefresher định kỳ (CATALOG_SNAPSHOT_REFRESH giây) export lại từ MongoDB
+(CATALOG_SNAPSHOT_EXPORT=true, thường chỉ một worker / cron) và upload lên GCS
+(CATALOG_SNAPSHOT_BLOB), hoặc tải bản mới từ GCS khi generation đổi (replica), rồi map file mới
+khi file trên đĩa thay đổi. File được ghi atomic (os.replace): mapping cũ vẫn đọc được tới khi
+không còn ai dùng.
+
+Cấu hình:
+    CATALOG_SNAPSHOT=/var/lib/tunify/catalog.tsnap   (không đặt: tắt)
+    CATALOG_SNAPSHOT_BLOB=snapshots/catalog.tsnap     (optional)
+    CATALOG_SNAPSHOT_EXPORT=false
+    CATALOG_SNAPSHOT_REFRESH=300
+
+CLI:
+    uv run python -m backend.utils.snapshot --export catalog.tsnap [--upload]
+    uv run python -m backend.utils.snapshot --info catalog.tsnap
+    uv run python -m backend.utils.snapshot --search "em oi" catalog.tsnap
+"""
+
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
+from array import array
+
+from backend.utils.lyrics_search import LyricsIndex, lyrics_lines
+from backend.utils.utils import LYRICS_END_SENTINEL, fold_text
+
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "")
+CATALOG_SNAPSHOT_BLOB = os.getenv("CATALOG_SNAPSHOT_BLOB", "")
+CATALOG_SNAPSHOT_EXPORT = os.getenv("CATALOG_SNAPSHOT_EXPORT", "false").lower() in ("1", "true", "yes")
+CATALOG_SNAPSHOT_REFRESH = float(os.getenv("CATALOG_SNAPSHOT_REFRESH", "300"))
+
+MAGIC = b"TUNSNAP1"
+FORMAT_VERSION = 1
+ALIGN = 8
+
+# flags của từng bài
+HAS_LYRICS, HAS_HLS, HAS_LINES = 1, 2, 4
+NULL_FLAGS = {"title": 8, "audio_format": 16, "gcs_audio_blob": 32, "gcs_lrc_blob": 64}
+SONG_STRING_FIELDS = list(NULL_FLAGS)
+
+
+class SnapshotError(ValueError):
+    """File không phải snapshot hoặc khác format."""
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def _string_table(values):
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = array("Q", [0])
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    return offsets, b"".join(encoded)
+
+
+def build_snapshot(songs, lyrics_docs, created_at=None):
+    """
+    Bytes của một snapshot.
+    songs: kết quả get_song_list (thứ tự được giữ); lyrics_docs: {song id: document lyrics_lines}.
+    """
+    sections = {}
+
+    def add_strings(name, values):
+        offsets, data = _string_table(values)
+        sections[f"{name}.offsets"] = offsets
+        sections[f"{name}.data"] = data
+
+    ids = [str(song["_id"]) for song in songs]
+    add_strings("id", ids)
+    flags = array("B")
+    hls_duration = array("d")
+    lyrics_version = array("d")
+    for song in songs:
+        flag = HAS_LYRICS if song.get("has_lyrics") else 0
+        duration = (song.get("hls") or {}).get("duration")
+        if duration:
+            flag |= HAS_HLS
+        for field in SONG_STRING_FIELDS:
+            if song.get(field) is None:
+                flag |= NULL_FLAGS[field]
+        doc = lyrics_docs.get(str(song["_id"]))
+        if doc is not None:
+            flag |= HAS_LINES
+        flags.append(flag)
+        hls_duration.append(float(duration or 0.0))
+        lyrics_version.append(float((doc or {}).get("version") or 0.0))
+    for field in SONG_STRING_FIELDS:
+        add_strings(field, [song.get(field) or "" for song in songs])
+    sections["flags"] = flags
+    sections["hls_duration"] = hls_duration
+    sections["lyrics_version"] = lyrics_version
+    sections["id_order"] = array("I", sorted(range(len(ids)), key=ids.__getitem__))
+
+    # Dòng lyrics + inverted index (cùng cách tách term với LyricsIndex.add)
+    song_lines = array("Q", [0])
+    line_time, line_text, line_folded, line_slot, line_no = array("d"), [], [], array("I"), array("I")
+    postings = {}
+    for slot, song_id in enumerate(ids):
+        doc = lyrics_docs.get(song_id)
+        for number, (time_, text) in enumerate((doc or {}).get("lines") or []):
+            line_id = len(line_text)
+            line_time.append(float(time_))
+            line_text.append(text)
+            folded = fold_text(text)
+            line_folded.append(f" {folded} " if folded else "")
+            line_slot.append(slot)
+            line_no.append(number)
+            for term in set(folded.split()):
+                postings.setdefault(term, array("I")).append(line_id)
+        song_lines.append(len(line_text))
+    terms = sorted(postings)
+    postings_offsets = array("Q", [0])
+    all_postings = array("I")
+    for term in terms:
+        all_postings.extend(postings[term])
+        postings_offsets.append(len(all_postings))
+
+    sections["song_lines"] = song_lines
+    sections["line_time"] = line_time
+    add_strings("line_text", line_text)
+    add_strings("line_folded", line_folded)
+    sections["line_slot"] = line_slot
+    sections["line_no"] = line_no
+    add_strings("terms", terms)
+    sections["postings"] = all_postings
+    sections["postings_offsets"] = postings_offsets
+
+    layout, chunks, position = {}, [], 0
+    for name, value in sections.items():
+        if isinstance(value, array):
+            if sys.byteorder != "little":
+                value = array(value.typecode, value)
+                value.byteswap()
+            fmt, data = value.typecode, value.tobytes()
+        else:
+            fmt, data = "B", value
+        layout[name] = [position, len(data), fmt]
+        padding = -len(data) % ALIGN
+        chunks.append(data + b"\0" * padding)
+        position += len(data) + padding
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "id": uuid.uuid4().hex,
+        "created_at": created_at or time.time(),
+        "songs": len(ids),
+        "lines": len(line_text),
+        "terms": len(terms),
+        "sections": layout,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % ALIGN)
+    return prefix + b"".join(chunks)
+
+
+def write_snapshot(path, data):
+    """Ghi atomic (file tạm cùng thư mục, fsync, os.replace): mapping đang mở vẫn đọc bản cũ."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_snapshot(path, fetch_missing=True):
+    """
+    Export danh sách bài + lyrics_lines từ MongoDB (hai query) ra `path`.
+    fetch_missing: bài có lyrics nhưng chưa có lyrics_lines thì tải LRC từ GCS (như backfill).
+    Returns header của snapshot.
+    """
+    from backend.utils.mongodb import get_all_lyrics_lines, get_song_list
+
+    # Thời điểm trước khi đọc: thay đổi sau mốc này chưa chắc có trong snapshot (SnapshotOverlay.rebase)
+    created_at = time.time()
+    songs = get_song_list()
+    lyrics_docs = {str(doc["_id"]): doc for doc in get_all_lyrics_lines()}
+    if fetch_missing:
+        from backend.utils.gcs import GCS_BUCKET_NAME, download_text
+        from backend.utils.utils import parse_lrc_content
+
+        for song in songs:
+            if song["_id"] in lyrics_docs or not song.get("has_lyrics") or not song.get("gcs_lrc_blob"):
+                continue
+            try:
+                lines = lyrics_lines(parse_lrc_content(download_text(GCS_BUCKET_NAME, song["gcs_lrc_blob"])))
+                lyrics_docs[song["_id"]] = {"_id": song["_id"], "lines": lines, "version": 0.0}
+            except Exception as e:
+                print(f"Warning: Could not load lyrics of {song['_id']} for the snapshot: {e}")
+    write_snapshot(path, build_snapshot(songs, lyrics_docs, created_at))
+    return read_header(path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC) + 4)
+        if len(head) < len(MAGIC) + 4 or head[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{path} is not a catalog snapshot")
+        (length,) = struct.unpack("<I", head[len(MAGIC):])
+        header = json.loads(f.read(length))
+    if header.get("format") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {header.get('format')}")
+    header["data_offset"] = len(head) + length + (-(len(head) + length) % ALIGN)
+    return header
+
+
+# ---------------------------------------------------------------------------
+# Đọc
+# ---------------------------------------------------------------------------
+
+class _Strings:
+    """Bảng chuỗi trong file: strings[i] decode khi được đọc. Hỗ trợ slice (dùng cho prefix search)."""
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        # Đường nhanh cho index int (search() đọc line_folded của mọi dòng ứng viên); index không âm
+        offsets = self._offsets
+        try:
+            return str(self._data[offsets[i]:offsets[i + 1]], "utf-8")
+        except TypeError:
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+
+class _Postings:
+    """term -> postings (memoryview các line id), tìm term bằng bisect trên bảng terms đã sort."""
+
+    def __init__(self, terms, postings, offsets):
+        self._terms = terms
+        self._postings = postings
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._terms)
+
+    def get(self, term, default=None):
+        i = bisect.bisect_left(self._terms, term)
+        if i == len(self._terms) or self._terms[i] != term:
+            return default
+        return self._postings[self._offsets[i]:self._offsets[i + 1]]
+
+    def __getitem__(self, term):
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+
+class SnapshotLyricsIndex(LyricsIndex):
+    """LyricsIndex chỉ đọc trên dữ liệu của snapshot: search() của LyricsIndex chạy trên các view."""
+
+    def __init__(self, snapshot):
+        self._lock = threading.RLock()
+        self._snapshot = snapshot
+        self._postings = _Postings(snapshot.terms, snapshot.section("postings"), snapshot.section("postings_offsets"))
+        self._vocab = snapshot.terms
+        self._line_slot = snapshot.section("line_slot")
+        self._line_no = snapshot.section("line_no")
+        self._line_time = snapshot.section("line_time")
+        self._line_text = snapshot.line_text
+        self._line_folded = snapshot.line_folded
+        # search() đọc slot_song cho mọi dòng ứng viên: decode id một lần thay vì mỗi lần đọc
+        self._slot_song = list(snapshot.ids[:])
+
+    def __len__(self):
+        return self._snapshot.header["songs"]
+
+    def version(self, song_id):
+        return self._snapshot.lyrics_version(song_id)
+
+    def stats(self):
+        return {
+            "songs": self._snapshot.header["songs"],
+            "lines": self._snapshot.header["lines"],
+            "dead_lines": 0,
+            "terms": self._snapshot.header["terms"],
+            "postings": len(self._postings._postings),
+            "snapshot": self._snapshot.id,
+        }
+
+    def add(self, song_id, lines, version=None):
+        raise TypeError("Snapshot lyrics index is read-only")
+
+    def remove(self, song_id):
+        raise TypeError("Snapshot lyrics index is read-only")
+
+    def load(self, docs):
+        raise TypeError("Snapshot lyrics index is read-only")
+
+
+class CatalogSnapshot:
+    """Một snapshot đã mmap. Chỉ đọc, dùng được từ nhiều thread."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise SnapshotError("Catalog snapshots can only be mapped on little-endian hosts")
+        self.path = path
+        self.header = read_header(path)
+        self.id = self.header["id"]
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            # Không close mmap: view của request đang chạy vẫn trỏ vào; GC giải phóng khi hết tham chiếu
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self._sections = {}
+        self._songs = None
+        self._lyrics_index = None
+        self.ids = self._strings("id")
+        self.line_text = self._strings("line_text")
+        self.line_folded = self._strings("line_folded")
+        self.terms = self._strings("terms")
+        self._fields = {field: self._strings(field) for field in SONG_STRING_FIELDS}
+        self._flags = self.section("flags")
+        self._song_lines = self.section("song_lines")
+        self._id_order = self.section("id_order")
+        self._ids_sorted = _SortedIds(self.ids, self._id_order)
+
+    def section(self, name):
+        view = self._sections.get(name)
+        if view is None:
+            offset, length, fmt = self.header["sections"][name]
+            start = self.header["data_offset"] + offset
+            view = self._sections[name] = self._view[start:start + length].cast(fmt)
+        return view
+
+    def _strings(self, name):
+        return _Strings(self.section(f"{name}.offsets"), self.section(f"{name}.data"))
+
+    def __len__(self):
+        return self.header["songs"]
+
+    def slot(self, song_id):
+        """Vị trí của bài trong snapshot, hoặc None."""
+        i = bisect.bisect_left(self._ids_sorted, song_id)
+        if i < len(self._ids_sorted) and self._ids_sorted[i] == song_id:
+            return self._id_order[i]
+        return None
+
+    def song(self, slot):
+        """Bài ở vị trí slot, cùng dạng với một phần tử của get_song_list."""
+        flags = self._flags[slot]
+        song = {"_id": self.ids[slot]}
+        for field in SONG_STRING_FIELDS:
+            song[field] = None if flags & NULL_FLAGS[field] else self._fields[field][slot]
+        song["has_lyrics"] = bool(flags & HAS_LYRICS)
+        if flags & HAS_HLS:
+            song["hls"] = {"duration": self.section("hls_duration")[slot]}
+        return song
+
+    def songs(self):
+        """Danh sách bài (decode một lần rồi giữ lại cho snapshot này)."""
+        if self._songs is None:
+            self._songs = [self.song(slot) for slot in range(len(self))]
+        return self._songs
+
+    def has_lines(self, song_id):
+        slot = self.slot(song_id)
+        return slot is not None and bool(self._flags[slot] & HAS_LINES)
+
+    def lyrics(self, song_id):
+        """Lyrics đã parse (như parse_lrc_content) của bài, hoặc None nếu snapshot không có."""
+        slot = self.slot(song_id)
+        if slot is None or not self._flags[slot] & HAS_LINES:
+            return None
+        times = self.section("line_time")
+        start, end = self._song_lines[slot], self._song_lines[slot + 1]
+        lyrics = [{"time": times[i], "text": self.line_text[i]} for i in range(start, end)]
+        lyrics.append({"time": LYRICS_END_SENTINEL, "text": ""})
+        return lyrics
+
+    def lyrics_version(self, song_id):
+        slot = self.slot(song_id)
+        if slot is None or not self._flags[slot] & HAS_LINES:
+            return None
+        return self.section("lyrics_version")[slot]
+
+    def lyrics_index(self):
+        if self._lyrics_index is None:
+            self._lyrics_index = SnapshotLyricsIndex(self)
+        return self._lyrics_index
+
+    def info(self):
+        return {
+            "id": self.id,
+            "path": self.path,
+            "bytes": self.stat[1],
+            "created_at": self.header["created_at"],
+            "songs": self.header["songs"],
+            "lines": self.header["lines"],
+            "terms": self.header["terms"],
+        }
+
+
+class _SortedIds:
+    """ids theo thứ tự đã sort (qua id_order) để bisect."""
+
+    def __init__(self, ids, order):
+        self._ids = ids
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, i):
+        return self._ids[self._order[i]]
+
+
+def changed_songs(old, new):
+    """Id các bài thêm / xoá / đổi (metadata hoặc lyrics) giữa hai snapshot."""
+    before = {song["_id"]: (song, old.lyrics_version(song["_id"])) for song in old.songs()}
+    changed = set()
+    for song in new.songs():
+        if before.pop(song["_id"], None) != (song, new.lyrics_version(song["_id"])):
+            changed.add(song["_id"])
+    return changed | set(before)
+
+
+def song_entry(song):
+    """Document bài hát (từ watcher) -> cùng dạng với một phần tử của CatalogSnapshot.songs()."""
+    entry = {"_id": song["_id"]}
+    for field in SONG_STRING_FIELDS:
+        entry[field] = song.get(field)
+    entry["has_lyrics"] = bool(song.get("has_lyrics"))
+    duration = (song.get("hls") or {}).get("duration")
+    if duration:
+        entry["hls"] = {"duration": duration}
+    return entry
+
+
+class SnapshotOverlay:
+    """
+    Thay đổi của thư viện chưa có trong snapshot đang map, đè lên snapshot.songs().
+    Mỗi bài chỉ giữ thay đổi mới nhất (bài dạng song_entry, hoặc None nếu đã xoá).
+    """
+
+    # Chênh lệch đồng hồ giữa máy export và worker: giữ dư thay đổi thì vô hại (vẫn là bản mới nhất)
+    CLOCK_MARGIN = 60.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changes = {}   # song id -> (thời điểm nhận, bài | None)
+        self._version = 0
+        self._merged = None  # (snapshot, version, danh sách) của lần songs() gần nhất
+        self.stale = False
+
+    def __len__(self):
+        return len(self._changes)
+
+    def __contains__(self, song_id):
+        return song_id in self._changes
+
+    def record(self, song_id, song, now=None):
+        with self._lock:
+            self._changes[song_id] = (now or time.time(), song)
+            self._version += 1
+
+    def mark_stale(self):
+        """Watcher mất dấu: overlay không còn đủ, đọc từ MongoDB tới snapshot kế tiếp."""
+        with self._lock:
+            self.stale = True
+            self._version += 1
+
+    def rebase(self, snapshot):
+        """Snapshot mới được map: bỏ các thay đổi xảy ra trước lúc export (snapshot đã có)."""
+        cutoff = snapshot.header["created_at"] - self.CLOCK_MARGIN
+        with self._lock:
+            self._changes = {song_id: change for song_id, change in self._changes.items() if change[0] >= cutoff}
+            self.stale = False
+            self._version += 1
+
+    def songs(self, snapshot):
+        """snapshot.songs() với các thay đổi đã đè lên (bài mới ở cuối), giữ lại tới thay đổi kế tiếp."""
+        merged = self._merged
+        if merged is not None and merged[0] is snapshot and merged[1] == self._version:
+            return merged[2]
+        with self._lock:
+            version, changes = self._version, dict(self._changes)
+        songs = snapshot.songs()
+        if changes:
+            base, songs = songs, []
+            for song in base:
+                change = changes.pop(song["_id"], None)
+                if change is None:
+                    songs.append(song)
+                elif change[1] is not None:
+                    songs.append(change[1])
+            songs.extend(song for _, song in changes.values() if song is not None)
+        self._merged = (snapshot, version, songs)
+        return songs
+
+    def stats(self):
+        return {"songs": len(self._changes), "stale": self.stale}
+
+
+# ---------------------------------------------------------------------------
+# Snapshot hiện tại + refresh
+# ---------------------------------------------------------------------------
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Snapshot đang dùng, hoặc None (chưa bật / chưa có file)."""
+    return _snapshot
+
+
+def load_snapshot(path=None):
+    """
+    Map `path` (mặc định CATALOG_SNAPSHOT) nếu file khác với snapshot đang dùng.
+    Returns (snapshot cũ, snapshot mới) khi đã đổi, None khi không đổi / không có file.
+    """
+    global _snapshot
+    path = path or CATALOG_SNAPSHOT
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    with _snapshot_lock:
+        old = _snapshot
+        if old is not None and old.path == path and old.stat == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return None
+        _snapshot = CatalogSnapshot(path)
+        return old, _snapshot
+
+
+def unload_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+class SnapshotRefresher:
+    """
+    Background thread: mỗi `interval` giây export lại (export=True) hoặc tải bản mới từ GCS (blob),
+    rồi map file nếu đã đổi. on_reload(old, new) được gọi sau mỗi lần đổi snapshot.
+    """
+
+    def __init__(self, path=CATALOG_SNAPSHOT, on_reload=None, interval=CATALOG_SNAPSHOT_REFRESH,
+                 export=CATALOG_SNAPSHOT_EXPORT, blob=CATALOG_SNAPSHOT_BLOB):
+        self.path = path
+        self.on_reload = on_reload
+        self.interval = interval
+        self.export = export
+        self.blob = blob
+        self.generation = None
+        self.refreshes = 0
+        self.reloads = 0
+        self.errors = 0
+        self.last_refresh_ms = None
+        self.last_reload_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def refresh_once(self):
+        from backend.utils import gcs
+
+        started = time.perf_counter()
+        try:
+            if self.export:
+                export_snapshot(self.path)
+                if self.blob:
+                    gcs.upload_file(gcs.GCS_BUCKET_NAME, self.path, self.blob)
+            elif self.blob:
+                generation = gcs.download_if_changed(gcs.GCS_BUCKET_NAME, self.blob, self.path, self.generation)
+                if generation is not None:
+                    self.generation = generation
+            self.reload()
+        except Exception as e:
+            self.errors += 1
+            print(f"Warning: Catalog snapshot refresh failed: {e}")
+        finally:
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def reload(self):
+        changed = load_snapshot(self.path)
+        if changed is None:
+            return False
+        self.reloads += 1
+        self.last_reload_at = time.time()
+        old, new = changed
+        print(f"Catalog snapshot {new.id}: {new.header['songs']} songs, {new.header['lines']} lines")
+        if self.on_reload is not None:
+            self.on_reload(old, new)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh_once()
+            self._stop.wait(self.interval * random.uniform(0.9, 1.1))
+
+    def stats(self):
+        snapshot = get_snapshot()
+        return {
+            "running": self.running,
+            "interval_s": self.interval,
+            "export": self.export,
+            "blob": self.blob or None,
+            "snapshot": snapshot.info() if snapshot is not None else None,
+            "refreshes": self.refreshes,
+            "reloads": self.reloads,
+            "last_refresh_ms": self.last_refresh_ms,
+            "errors": self.errors,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export or inspect the memory-mapped catalog snapshot")
+    parser.add_argument("path", nargs="?", default=CATALOG_SNAPSHOT or "catalog.tsnap")
+    parser.add_argument("--export", action="store_true", help="Export songs + lyrics from MongoDB")
+    parser.add_argument("--upload", action="store_true", help="Upload the exported file to CATALOG_SNAPSHOT_BLOB")
+    parser.add_argument("--info", action="store_true")
+    parser.add_argument("--search", help="Search lyrics in the snapshot")
+    args = parser.parse_args()
+
+    if args.export:
+        started = time.perf_counter()
+        header = export_snapshot(args.path)
+        print(f"Exported {header['songs']} songs, {header['lines']} lyric lines, {header['terms']} terms "
+              f"({os.path.getsize(args.path) / 1e6:.1f} MB) in {(time.perf_counter() - started) * 1000:.0f} ms")
+        if args.upload:
+            from backend.utils.gcs import GCS_BUCKET_NAME, upload_file
+            upload_file(GCS_BUCKET_NAME, args.path, CATALOG_SNAPSHOT_BLOB or "snapshots/catalog.tsnap")
+    if args.info or args.search:
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot(args.path)
+        opened_ms = (time.perf_counter() - started) * 1000
+        if args.info:
+            print(json.dumps({**snapshot.info(), "open_ms": round(opened_ms, 2)}, indent=2))
+        if args.search:
+            titles = {song["_id"]: song["title"] for song in snapshot.songs()}
+            for result in snapshot.lyrics_index().search(args.search):
+                hit = result["hits"][0]
+                print(f"{titles.get(result['song_id'])}  [{hit['time']:.1f}s] {hit['text']}")
+    if not (args.export or args.info or args.search):
+        parser.print_help()
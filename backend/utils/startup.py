@@ -0,0 +1,168 @@
+"""
+Startup-time report cho backend.
+
+- Import-time breakdown: chạy `python -X importtime -c "import backend.core.main"`
+  trong subprocess và gom thời gian theo package.
+- Time-to-first-byte: khởi động uvicorn trong subprocess và đo thời gian từ lúc
+  spawn process đến khi nhận được response đầu tiên.
+
+Usage:
+    uv run python -m backend.utils.startup
+    uv run python -m backend.utils.startup --ttfb --path /api/songs --json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+APP_MODULE = "backend.core.main"
+
+
+def parse_importtime(stderr: str):
+    """
+    Parse `-X importtime` output into a list of
+    {"module", "self_us", "cumulative_us", "depth"} in import order.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, raw_name = parts
+        depth = (len(raw_name) - len(raw_name.lstrip(" "))) // 2
+        rows.append({
+            "module": raw_name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": depth,
+        })
+    return rows
+
+
+def import_time_report(module: str = APP_MODULE, top: int = 15):
+    """Run a fresh interpreter with -X importtime and summarize where the time goes."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(result.stderr)
+    target = next((r for r in rows if r["module"] == module), None)
+
+    # Gom self time theo top-level package (fastapi, pydantic, google, ...)
+    by_package = {}
+    for row in rows:
+        package = row["module"].split(".")[0]
+        by_package[package] = by_package.get(package, 0) + row["self_us"]
+
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode != 0 and result.stderr else None,
+        "total_ms": round(target["cumulative_us"] / 1000, 1) if target else None,
+        "modules_imported": len(rows),
+        "top_packages_ms": [
+            {"package": name, "self_ms": round(us / 1000, 1)}
+            for name, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        ],
+        "top_modules_ms": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 1)}
+            for r in sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)[:top]
+        ],
+    }
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_byte(path: str = "/", timeout: float = 60.0, env: dict = None):
+    """
+    Spawn `uvicorn backend.core.main:app` and measure, from process spawn,
+    how long it takes until `path` answers with any HTTP response.
+    """
+    import httpx
+
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{APP_MODULE}:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                return {"path": path, "ok": False, "error": process.stderr.read().decode(errors="replace")[-500:]}
+            try:
+                response = httpx.get(url, timeout=timeout)
+                return {
+                    "path": path,
+                    "ok": True,
+                    "status_code": response.status_code,
+                    "ttfb_ms": round((time.perf_counter() - start) * 1000, 1),
+                }
+            except httpx.TransportError:
+                time.sleep(0.005)
+        return {"path": path, "ok": False, "error": "timeout"}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report backend import time and time-to-first-byte")
+    parser.add_argument("--module", default=APP_MODULE, help="Module to import for the import-time breakdown")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--ttfb", action="store_true", help="Also measure time-to-first-byte of a fresh server")
+    parser.add_argument("--path", action="append", help="Path(s) to request for --ttfb (default: /)")
+    parser.add_argument("--prewarm", action="store_true", help="Set PREWARM_CLIENTS=true for the --ttfb server")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    report = {"import_time": import_time_report(args.module, args.top)}
+    if args.ttfb:
+        env = {"PREWARM_CLIENTS": "true" if args.prewarm else "false"}
+        report["ttfb"] = [time_to_first_byte(path, env=env) for path in (args.path or ["/"])]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    imports = report["import_time"]
+    if not imports["ok"]:
+        print(f"❌ import {imports['module']} failed: {imports['error']}")
+    print(f"Import {imports['module']}: {imports['total_ms']} ms ({imports['modules_imported']} modules)")
+    print("\nTop packages (self time):")
+    for row in imports["top_packages_ms"]:
+        print(f"  {row['self_ms']:>9.1f} ms  {row['package']}")
+    print("\nTop modules (cumulative):")
+    for row in imports["top_modules_ms"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    for row in report.get("ttfb", []):
+        if row["ok"]:
+            print(f"\nTime to first byte {row['path']}: {row['ttfb_ms']} ms (HTTP {row['status_code']})")
+        else:
+            print(f"\nTime to first byte {row['path']}: failed ({row['error']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Request ID và tracing span nhẹ cho từng request, export theo định dạng OTLP/JSON.
+
+- TracingMiddleware: mỗi request có một request ID (lấy từ header X-Request-ID hoặc tạo mới,
+  trả lại trong response) và một trace ID (lấy từ header W3C `traceparent` nếu có). Khi bật
+  export, request được ghi thành root span (kind SERVER).
+- span(name): context manager tạo span con của span hiện tại (contextvars, nên đi theo cả
+  run_in_threadpool). Mọi call qua circuit breaker (MongoDB, GCS, Gemini) đã có span riêng
+  (kind CLIENT); exception đi qua span được ghi thành event `exception`.
+- Sampling ở cuối request: trace được export khi request lỗi (5xx, span lỗi), chậm hơn
+  TRACE_SLOW_MS, client gửi `traceparent` có cờ sampled, hoặc theo tỉ lệ TRACE_SAMPLE_RATE.
+
+Mỗi trace là một dòng JSON (ExportTraceServiceRequest của OTLP/JSON) trong TRACE_EXPORT:
+đọc được bằng OpenTelemetry Collector (otlpjsonfile receiver) hoặc bằng CLI bên dưới.
+Ngoài request (thread nền, CLI) span() không làm gì.
+
+Cấu hình:
+    TRACE_EXPORT=                (trống: tắt; `stdout` hoặc đường dẫn file .jsonl)
+    TRACE_SAMPLE_RATE=0.01
+    TRACE_SLOW_MS=1000
+    TRACE_SERVICE_NAME=tunify-backend
+
+CLI (cây span và critical path của các request chậm nhất):
+    uv run python -m backend.utils.tracing traces.jsonl --slowest 5
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from backend.utils.metrics import route_template
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "tunify-backend")
+MAX_SPANS_PER_TRACE = 256
+
+# OTLP SpanKind / StatusCode
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+REQUEST_ID_RE = re.compile(r"^[\w.:-]{1,128}$")
+
+_current_span = contextvars.ContextVar("tracing_span", default=None)
+_current_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def tracing_enabled():
+    return bool(TRACE_EXPORT)
+
+
+def current_request_id():
+    return _current_request_id.get()
+
+
+class Trace:
+    def __init__(self, trace_id, request_id, sampled=False):
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.sampled = sampled
+        self.error = False
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status",
+                 "events")
+
+    def __init__(self, trace, name, kind=INTERNAL, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = (STATUS_UNSET, "")
+        self.events = []
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = (STATUS_ERROR, message)
+        self.trace.error = True
+
+    def record_exception(self, exc):
+        self.events.append((time.time_ns(), "exception", {
+            "exception.type": type(exc).__name__,
+            "exception.message": str(exc),
+        }))
+        self.set_error(f"{type(exc).__name__}: {exc}")
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            self.trace.spans.append(self)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status[0], "message": self.status[1]} if self.status[0] else {},
+        }
+        if self.events:
+            span["events"] = [
+                {"timeUnixNano": str(at), "name": name, "attributes": _otlp_attributes(attributes)}
+                for at, name, attributes in self.events
+            ]
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """Span con của span hiện tại; không làm gì khi request không được trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, kind, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def traced(name, kind=INTERNAL):
+    """Decorator: chạy function trong span(name)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attribute(key, value):
+    """Gắn attribute vào span hiện tại (nếu có)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+def mark_error(message):
+    """Đánh dấu span hiện tại lỗi (ví dụ HTTPException 5xx không đi qua span nào)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_error(message)
+
+
+_export_lock = threading.Lock()
+_export_file = None
+
+
+def export(trace, destination=None):
+    """Ghi một trace (một dòng OTLP/JSON) vào TRACE_EXPORT."""
+    global _export_file
+    destination = destination or TRACE_EXPORT
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{
+                "scope": {"name": "backend.utils.tracing"},
+                "spans": [s.to_otlp() for s in trace.spans],
+            }],
+        }],
+    }, ensure_ascii=False, separators=(",", ":"), default=str)
+    with _export_lock:
+        if destination == "stdout":
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+            return
+        if _export_file is None or _export_file.name != destination:
+            _export_file = open(destination, "a", encoding="utf-8", buffering=1)
+        _export_file.write(line + "\n")
+
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TracingMiddleware:
+    """ASGI middleware: request ID cho mọi request, root span + export khi TRACE_EXPORT được đặt."""
+
+    def __init__(self, app, sample_rate=TRACE_SAMPLE_RATE, slow_ms=TRACE_SLOW_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _header(scope, b"x-request-id")
+        if not request_id or not REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        parent = TRACEPARENT_RE.match(_header(scope, b"traceparent") or "")
+        trace = Trace(
+            parent.group(1) if parent else os.urandom(16).hex(),
+            request_id,
+            sampled=bool(parent and int(parent.group(3), 16) & 1) or random.random() < self.sample_rate,
+        )
+        root = Span(trace, f"{scope['method']} {scope['path']}", SERVER, parent.group(2) if parent else None, {
+            "http.request.method": scope["method"],
+            "url.path": scope["path"],
+            "request.id": request_id,
+        })
+        request_token = _current_request_id.set(request_id)
+        span_token = _current_span.set(root) if tracing_enabled() else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                root.set_attribute("http.response.status_code", status)
+                if status >= 500 and root.status[0] != STATUS_ERROR:
+                    root.set_error(f"HTTP {status}")
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode()),
+                    (b"traceparent", f"00-{trace.trace_id}-{root.span_id}-{'01' if trace.sampled else '00'}".encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.record_exception(e)
+            raise
+        finally:
+            _current_request_id.reset(request_token)
+            if span_token is not None:
+                _current_span.reset(span_token)
+                route = route_template(scope)
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+                root.end()
+                duration_ms = (root.end_ns - root.start_ns) / 1e6
+                if trace.sampled or trace.error or duration_ms >= self.slow_ms:
+                    try:
+                        export(trace)
+                    except Exception as e:
+                        print(f"Warning: Could not export trace {trace.trace_id}: {e}")
+
+
+def load_traces(path):
+    """Đọc file TRACE_EXPORT: mỗi dòng -> list span (dict OTLP)."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                request = json.loads(line)
+                yield [s for rs in request["resourceSpans"] for ss in rs["scopeSpans"] for s in ss["spans"]]
+
+
+def critical_path(spans):
+    """
+    Span IDs trên critical path: từ root, đi lùi từ lúc span kết thúc, lấy span con kết thúc
+    muộn nhất trước thời điểm đó rồi tiếp tục từ lúc span con bắt đầu.
+    """
+    children = {}
+    for s in spans:
+        children.setdefault(s["parentSpanId"], []).append(s)
+    ids = {s["spanId"] for s in spans}
+    roots = [s for s in spans if s["parentSpanId"] not in ids]
+    path = set()
+
+    def walk(node):
+        path.add(node["spanId"])
+        cursor = int(node["endTimeUnixNano"])
+        for child in sorted(children.get(node["spanId"], []), key=lambda c: int(c["endTimeUnixNano"]), reverse=True):
+            if int(child["endTimeUnixNano"]) <= cursor:
+                walk(child)
+                cursor = int(child["startTimeUnixNano"])
+
+    for root in roots:
+        walk(root)
+    return path
+
+
+def format_trace(spans):
+    """Cây span (thời điểm bắt đầu / thời lượng tính theo ms), `*` đánh dấu critical path."""
+    children = {}
+    for s in spans:
+        children.setdefault(s["parentSpanId"], []).append(s)
+    ids = {s["spanId"] for s in spans}
+    roots = [s for s in spans if s["parentSpanId"] not in ids]
+    start = min(int(s["startTimeUnixNano"]) for s in spans)
+    critical = critical_path(spans)
+    lines = []
+
+    def walk(node, depth):
+        begin = (int(node["startTimeUnixNano"]) - start) / 1e6
+        duration = (int(node["endTimeUnixNano"]) - int(node["startTimeUnixNano"])) / 1e6
+        status = node.get("status") or {}
+        error = f"  ERROR {status.get('message', '')}" if status.get("code") == STATUS_ERROR else ""
+        mark = "*" if node["spanId"] in critical else " "
+        lines.append(f"{mark} {begin:8.1f} {duration:8.1f} ms  {'  ' * depth}{node['name']}{error}")
+        for child in sorted(children.get(node["spanId"], []), key=lambda c: int(c["startTimeUnixNano"])):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show span trees and critical paths of exported traces")
+    parser.add_argument("file", help="TRACE_EXPORT file (OTLP/JSON lines)")
+    parser.add_argument("--slowest", type=int, default=5, help="Show the N slowest traces")
+    parser.add_argument("--route", help="Only traces whose root span name contains this")
+    args = parser.parse_args()
+
+    def root_duration(spans):
+        root = next((s for s in spans if s["kind"] == SERVER), spans[0])
+        return (int(root["endTimeUnixNano"]) - int(root["startTimeUnixNano"])) / 1e6, root
+
+    traces = [spans for spans in load_traces(args.file) if spans]
+    if args.route:
+        traces = [spans for spans in traces if args.route in root_duration(spans)[1]["name"]]
+    traces.sort(key=lambda spans: root_duration(spans)[0], reverse=True)
+    for spans in traces[:args.slowest]:
+        duration, root = root_duration(spans)
+        request_id = next((a["value"].get("stringValue") for a in root["attributes"] if a["key"] == "request.id"), "")
+        print(f"{root['name']}  {duration:.1f} ms  trace {root['traceId']}  request {request_id}")
+        print("    start(ms) duration")
+        print(format_trace(spans))
+        print()
@@ -0,0 +1,239 @@
+"""
+Transcoding ladder cho audio.
+
+Sau khi import, mỗi track được transcode nền (process pool dùng chung với HLS)
+thành vài rendition nhỏ hơn bản gốc, lưu cạnh file gốc trên GCS và ghi vào song
+document (field `renditions`). /api/audio/{id} chọn rendition theo `quality`,
+header `Accept` và `Save-Data`.
+
+Cần ffmpeg (libopus / aac); không có ffmpeg thì không tạo rendition nào và
+client luôn nhận file gốc.
+
+Layout trên storage:
+    renditions/{song_id}/{package_id}/{name}.{ext}
+
+Usage (backfill các bài đã có):
+    uv run python -m backend.utils.transcode --all
+"""
+
+import os
+import shutil
+import subprocess
+import uuid
+
+RENDITION_PREFIX = "renditions"
+
+# Thứ tự từ nhỏ tới lớn
+RENDITION_LADDER = [
+    {
+        "name": "low",
+        "codec": "opus",
+        "bitrate": 48,
+        "ext": "ogg",
+        "mime": "audio/ogg",
+        "ffmpeg_args": ["-c:a", "libopus", "-b:a", "48k", "-vbr", "on", "-application", "audio"],
+    },
+    {
+        "name": "medium",
+        "codec": "aac",
+        "bitrate": 96,
+        "ext": "m4a",
+        "mime": "audio/mp4",
+        "ffmpeg_args": ["-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart"],
+    },
+]
+
+TRANSCODE_RENDITIONS = [
+    name.strip() for name in os.getenv("TRANSCODE_RENDITIONS", "low,medium").split(",") if name.strip()
+]
+
+# Mime của file gốc theo audio_format (SUPPORTED_AUDIO_FORMATS)
+ORIGINAL_MIME = {"mp3": "audio/mpeg", "m4a": "audio/mp4"}
+
+QUALITIES = ("auto", "low", "medium", "high", "original")
+
+
+def transcoding_available():
+    """True khi có ffmpeg và ít nhất một rendition được bật."""
+    return bool(ladder()) and shutil.which("ffmpeg") is not None
+
+
+def ladder(names=None):
+    names = names if names is not None else TRANSCODE_RENDITIONS
+    return [r for r in RENDITION_LADDER if r["name"] in names]
+
+
+def transcode_ladder(source_path, out_dir, names=None):
+    """
+    Transcode source_path into every rendition of the ladder. Chạy trong process pool.
+    Returns [{"name", "codec", "bitrate", "mime", "file", "bytes"}].
+    """
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("Cần ffmpeg để transcode")
+    results = []
+    for rendition in ladder(names):
+        out_path = os.path.join(out_dir, f"{rendition['name']}.{rendition['ext']}")
+        subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+             "-i", source_path, "-vn", "-map", "0:a:0", "-ac", "2",
+             *rendition["ffmpeg_args"], out_path],
+            check=True,
+            capture_output=True,
+        )
+        results.append({
+            "name": rendition["name"],
+            "codec": rendition["codec"],
+            "bitrate": rendition["bitrate"],
+            "mime": rendition["mime"],
+            "file": os.path.basename(out_path),
+            "bytes": os.path.getsize(out_path),
+        })
+    return results
+
+
+def publish_renditions(song_id, out_dir, results, bucket_name=None):
+    """Upload transcoded files and return the `renditions` field for the song document."""
+    from backend.utils import gcs
+
+    bucket_name = bucket_name or gcs.GCS_BUCKET_NAME
+    prefix = f"{RENDITION_PREFIX}/{song_id}/{uuid.uuid4().hex[:12]}"
+    renditions = []
+    for result in results:
+        blob_name = f"{prefix}/{result['file']}"
+        gcs.upload_file(bucket_name, os.path.join(out_dir, result["file"]), blob_name)
+        renditions.append({
+            "name": result["name"],
+            "codec": result["codec"],
+            "bitrate": result["bitrate"],
+            "mime": result["mime"],
+            "bytes": result["bytes"],
+            "blob": blob_name,
+        })
+    return renditions
+
+
+def delete_renditions(renditions, bucket_name=None):
+    """Delete every rendition blob. Returns the number of blobs that failed."""
+    from backend.utils import gcs
+
+    bucket_name = bucket_name or gcs.GCS_BUCKET_NAME
+    return sum(1 for r in renditions or [] if not gcs.delete_file(bucket_name, r["blob"]))
+
+
+# ---------------------------------------------------------------------------
+# Negotiation
+# ---------------------------------------------------------------------------
+
+def parse_accept(header):
+    """Parse an Accept header into [(media_type, q)], highest q first."""
+    accepted = []
+    for part in (header or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted.append((media_type.lower(), q))
+    return sorted(accepted, key=lambda item: item[1], reverse=True)
+
+
+def accept_quality(accepted, mime):
+    """q value of mime under a parsed Accept list (1.0 when no Accept header was sent)."""
+    if not accepted:
+        return 1.0
+    major = mime.split("/")[0]
+    # Khớp cụ thể nhất thắng: audio/ogg > audio/* > */*
+    for pattern in (mime, f"{major}/*", "*/*"):
+        matches = [q for media_type, q in accepted if media_type == pattern]
+        if matches:
+            return matches[0]
+    return 0.0
+
+
+def choose_rendition(renditions, audio_format, quality="auto", accept=None, save_data=False):
+    """
+    Chọn rendition cho một request. Returns the rendition dict, or None for the original file.
+
+    - quality=original|high: luôn trả file gốc
+    - quality=low|medium: rendition đó nếu client nhận được định dạng, không thì rendition
+      gần nhất phía dưới, cuối cùng là file gốc
+    - quality=auto: Save-Data => low; Accept không nhận định dạng gốc => rendition tốt nhất
+      client nhận được; còn lại trả file gốc
+    """
+    if quality in ("original", "high"):
+        return None
+
+    accepted = parse_accept(accept)
+    playable = [r for r in renditions or [] if accept_quality(accepted, r["mime"]) > 0]
+
+    if quality in ("low", "medium"):
+        order = [r["name"] for r in RENDITION_LADDER]
+        wanted = order.index(quality)
+        candidates = [r for r in playable if r["name"] in order and order.index(r["name"]) <= wanted]
+        if candidates:
+            return max(candidates, key=lambda r: order.index(r["name"]))
+        return min(playable, key=lambda r: r["bitrate"]) if playable else None
+
+    if save_data and playable:
+        return min(playable, key=lambda r: r["bitrate"])
+
+    original_mime = ORIGINAL_MIME.get(audio_format or "mp3", "audio/mpeg")
+    if accept_quality(accepted, original_mime) > 0:
+        return None
+    if playable:
+        return max(playable, key=lambda r: (accept_quality(accepted, r["mime"]), r["bitrate"]))
+    return None
+
+
+def transcode_song(song_id, source_path, names=None):
+    """Transcode + publish + lưu vào MongoDB, đồng bộ (dùng cho backfill CLI)."""
+    import tempfile
+    from backend.utils.mongodb import update_song_metadata
+
+    out_dir = tempfile.mkdtemp(prefix="tunify-transcode-")
+    try:
+        renditions = publish_renditions(song_id, out_dir, transcode_ladder(source_path, out_dir, names))
+        update_song_metadata(song_id, {"renditions": renditions})
+        return renditions
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def main():
+    import argparse
+    from backend.utils.hls import download_original
+    from backend.utils.mongodb import get_all_songs, get_song_by_id
+
+    parser = argparse.ArgumentParser(description="Transcode existing songs into the rendition ladder")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--song-id", action="append", help="Song id to transcode (repeatable)")
+    group.add_argument("--all", action="store_true", help="Transcode every song that has no renditions yet")
+    parser.add_argument("--force", action="store_true", help="Re-transcode songs that already have renditions")
+    args = parser.parse_args()
+
+    songs = [get_song_by_id(i) for i in args.song_id] if args.song_id else get_all_songs()
+    for song in songs:
+        if not song or not song.get("gcs_audio_blob"):
+            continue
+        if song.get("renditions") and not args.force:
+            print(f"⏭️  {song['title']}: đã có renditions")
+            continue
+        source_path = download_original(song)
+        try:
+            renditions = transcode_song(song["_id"], source_path)
+            delete_renditions(song.get("renditions"))
+            sizes = ", ".join(f"{r['name']} {r['bytes'] // 1024}KB" for r in renditions)
+            print(f"✅ {song['title']}: {sizes}")
+        except Exception as e:
+            print(f"❌ {song['title']}: {e}")
+        finally:
+            os.unlink(source_path)
+
+
+if __name__ == "__main__":
+    main()
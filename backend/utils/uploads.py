@@ -0,0 +1,294 @@
+"""
+Resumable upload cho file audio lớn: tạo session, PUT từng chunk theo offset, hỏi offset đã nhận,
+finalize; sau đó /api/import-track và PUT /api/track/{id} dùng file này qua `sound_upload_id`
+thay cho `sound_file` (một request multipart, mất kết nối ở gần cuối là phải gửi lại từ đầu).
+
+Mỗi session là một file spool trong UPLOAD_DIR (kích thước file = số byte đã nhận, nên chunk sau
+có thể tới worker khác) cạnh một file .json metadata. Chunk được hash (SHA-256) khi đang nhận và
+được đẩy tiếp vào GCS resumable upload session theo từng đoạn bội số 256 KiB ở nền, nên lúc
+finalize file đã gần như nằm trên GCS; fingerprint (phát hiện bài trùng) chạy ngay khi đủ byte.
+
+Protocol:
+    POST /api/uploads                   {"filename": "x.m4a", "size": 12345678}
+        -> {"upload_id", "offset": 0, "size", "chunk_size"}
+    PUT  /api/uploads/{id}?offset=N     body: bytes của chunk bắt đầu ở offset N
+        -> {"offset"}. offset > số byte đã nhận: 409 kèm offset hiện tại. Gửi lại chunk đã nhận
+           (mất response) vẫn được: phần đã có bị bỏ qua. Mất kết nối giữa chunk: phần đã nhận được giữ.
+    GET  /api/uploads/{id}              -> {"offset", "size", "complete", "finalized"}
+    POST /api/uploads/{id}/finalize     {"sha256": "..."} (optional, kiểm tra toàn vẹn)
+        -> {"upload_id", "sha256", "size"}
+    Session không nhận thêm chunk trong UPLOAD_SESSION_TTL giây (last_activity_at) bị xoá.
+
+Cấu hình:
+    UPLOAD_DIR=...                  (mặc định <tmp>/tunify-uploads)
+    UPLOAD_CHUNK_SIZE=8388608       (chunk gợi ý cho client)
+    MAX_UPLOAD_SIZE=314572800
+    UPLOAD_SESSION_TTL=86400
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "tunify-uploads"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(300 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+
+# GCS resumable upload: mọi đoạn trừ đoạn cuối phải là bội số của 256 KiB
+STORAGE_QUANTUM = 256 * 1024
+STORAGE_PIECE = 8 * STORAGE_QUANTUM   # 2 MiB mỗi PUT lên GCS
+HASH_BLOCK = 1024 * 1024
+
+_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadNotFoundError(Exception):
+    pass
+
+
+class UploadOffsetError(Exception):
+    """Chunk không khớp với số byte đã nhận; client hỏi lại offset rồi gửi tiếp."""
+
+    def __init__(self, offset, message):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadBusyError(Exception):
+    pass
+
+
+def _path(upload_id, suffix):
+    if not _ID_PATTERN.match(upload_id or ""):
+        raise UploadNotFoundError(upload_id)
+    return os.path.join(UPLOAD_DIR, upload_id + suffix)
+
+
+def spool_path(session):
+    """File chứa các byte đã nhận (giữ đuôi file gốc cho decoder / ffmpeg)."""
+    return _path(session["upload_id"], session["ext"])
+
+
+def clean_filename(filename):
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name or "upload.mp3"
+
+
+def save_session(session):
+    path = _path(session["upload_id"], ".json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    os.replace(tmp_path, path)
+
+
+def load_session(upload_id):
+    try:
+        with open(_path(upload_id, ".json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadNotFoundError(upload_id)
+
+
+def touch(upload_id):
+    """
+    Ghi last_activity_at. Đọc lại file thay vì ghi dict của caller: không đè `stored` mà
+    push_to_storage vừa lưu (load + save không có await ở giữa).
+    """
+    session = load_session(upload_id)
+    session["last_activity_at"] = time.time()
+    save_session(session)
+    return session["last_activity_at"]
+
+
+def received(session):
+    try:
+        return os.path.getsize(spool_path(session))
+    except FileNotFoundError:
+        raise UploadNotFoundError(session["upload_id"])
+
+
+def create_session(filename, size):
+    """Tạo session (chưa có GCS session URL: caller gán `session_url` rồi save_session)."""
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        raise ValueError(f"size must be between 1 and {MAX_UPLOAD_SIZE} bytes")
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    filename = clean_filename(filename)
+    upload_id = uuid.uuid4().hex
+    _, ext = os.path.splitext(filename)
+    session = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "ext": ext.lower() or ".mp3",
+        "size": size,
+        # Blob riêng cho mỗi upload: không ghi đè file của bài khác trùng tên
+        "blob": f"sounds/{upload_id[:12]}-{filename}",
+        "session_url": None,
+        "stored": 0,
+        "sha256": None,
+        "finalized": False,
+        "created_at": time.time(),
+    }
+    session["last_activity_at"] = session["created_at"]
+    open(spool_path(session), "wb").close()
+    save_session(session)
+    return session
+
+
+def status(session):
+    offset = received(session)
+    return {
+        "upload_id": session["upload_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "offset": offset,
+        "complete": offset == session["size"],
+        "finalized": session["finalized"],
+    }
+
+
+# Trong process: hash đang tính dở và lock của từng session
+_hashers = {}
+_write_locks = {}
+_storage_locks = {}
+
+
+async def write_chunk(session, offset, stream):
+    """
+    Ghi body của một PUT (async iterator các đoạn bytes) vào spool từ `offset`, hash khi đang ghi.
+    Phần đã nhận trước đó (client gửi lại chunk) bị bỏ qua. Returns số byte đã nhận.
+    """
+    upload_id = session["upload_id"]
+    lock = _write_locks.setdefault(upload_id, asyncio.Lock())
+    if lock.locked():
+        raise UploadBusyError("Another chunk of this upload is being received")
+    async with lock:
+        if session["finalized"]:
+            raise UploadOffsetError(session["size"], "Upload already finalized")
+        position = received(session)
+        if offset > position:
+            raise UploadOffsetError(position, f"Expected offset <= {position}")
+        skip = position - offset
+
+        hashed = _hashers.get(upload_id)
+        if position == 0:
+            hashed = (0, hashlib.sha256())
+        elif hashed is None or hashed[0] != position:
+            hashed = None   # chunk trước nhận ở worker khác: finalize hash lại từ file
+        with open(spool_path(session), "ab") as f:
+            try:
+                async for data in stream:
+                    if skip:
+                        dropped = min(skip, len(data))
+                        data, skip = data[dropped:], skip - dropped
+                    if not data:
+                        continue
+                    if position + len(data) > session["size"]:
+                        raise UploadOffsetError(position, "Chunk goes past the declared size")
+                    f.write(data)
+                    position += len(data)
+                    if hashed is not None:
+                        hashed[1].update(data)
+            finally:
+                # Mất kết nối giữa chừng: phần đã ghi được giữ, lần sau resume từ đây
+                f.flush()
+                if hashed is not None:
+                    _hashers[upload_id] = (position, hashed[1])
+                else:
+                    _hashers.pop(upload_id, None)
+                session["last_activity_at"] = touch(upload_id)
+        return position
+
+
+def file_sha256(session):
+    """SHA-256 của spool: dùng hash đã tính khi nhận chunk, hoặc đọc lại file."""
+    hashed = _hashers.get(session["upload_id"])
+    if hashed is not None and hashed[0] == session["size"]:
+        return hashed[1].hexdigest()
+    digest = hashlib.sha256()
+    with open(spool_path(session), "rb") as f:
+        while block := f.read(HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def push_to_storage(upload_id, send):
+    """
+    Đẩy các byte đã nhận nhưng chưa lên GCS, theo đoạn bội số STORAGE_QUANTUM (đoạn cuối thì
+    không cần). send(session_url, data, offset, total) -> số byte GCS đã lưu.
+    Returns số byte đã lên GCS.
+    """
+    lock = _storage_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        session = load_session(upload_id)
+        size = session["size"]
+        while True:
+            position = received(session)
+            stored = session["stored"]
+            end = size if position == size else stored + (position - stored) // STORAGE_QUANTUM * STORAGE_QUANTUM
+            if end <= stored:
+                return stored
+            length = min(end - stored, STORAGE_PIECE)
+            with open(spool_path(session), "rb") as f:
+                f.seek(stored)
+                data = f.read(length)
+            committed = await send(session["session_url"], data, stored, size)
+            if committed <= stored:
+                raise RuntimeError(f"Storage did not accept bytes {stored}-{stored + length - 1}")
+            # Đọc lại file sau await (như touch): finalize / write_chunk có thể đã lưu session trong lúc chờ
+            session = load_session(upload_id)
+            session["stored"] = committed
+            session["last_activity_at"] = time.time()
+            save_session(session)
+
+
+def finalize(session, sha256=None):
+    """Kiểm tra đủ byte (và sha256 nếu client gửi), đánh dấu session dùng được cho import."""
+    position = received(session)
+    if position != session["size"]:
+        raise UploadOffsetError(position, f"Upload is incomplete ({position}/{session['size']} bytes)")
+    digest = file_sha256(session)
+    if sha256 and sha256.lower() != digest:
+        raise ValueError("sha256 does not match the uploaded bytes")
+    session["sha256"] = digest
+    session["finalized"] = True
+    save_session(session)
+    return session
+
+
+def discard(session, keep_spool=False):
+    """Xoá session (sau khi import xong hoặc hết hạn). keep_spool: file spool được giao cho job khác."""
+    upload_id = session["upload_id"]
+    for path in [_path(upload_id, ".json")] + ([] if keep_spool else [spool_path(session)]):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    for table in (_hashers, _write_locks, _storage_locks):
+        table.pop(upload_id, None)
+
+
+def expired_sessions(ttl=UPLOAD_SESSION_TTL):
+    """Các session không có hoạt động (chunk, đẩy lên GCS) trong ttl giây (caller xoá blob đã lên GCS rồi discard)."""
+    if not os.path.isdir(UPLOAD_DIR):
+        return []
+    cutoff = time.time() - ttl
+    sessions = []
+    for name in os.listdir(UPLOAD_DIR):
+        upload_id, ext = os.path.splitext(name)
+        if ext != ".json" or not _ID_PATTERN.match(upload_id):
+            continue
+        try:
+            session = load_session(upload_id)
+        except (UploadNotFoundError, ValueError):
+            continue
+        # Session tạo trước khi có last_activity_at: tính từ created_at
+        if session.get("last_activity_at", session["created_at"]) < cutoff:
+            sessions.append(session)
+    return sessions
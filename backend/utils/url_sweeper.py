@@ -0,0 +1,176 @@
+"""
+Ký lại hàng loạt các signed URL lưu trong MongoDB trước khi chúng hết hạn.
+
+Signed URL trong song document (gcs_audio_path, gcs_lrc_path) chỉ sống 15 phút. Không có
+sweeper thì request đầu tiên sau khi URL hết hạn phải ký lại và ghi MongoDB (một update_one
+mỗi bài). SignedUrlSweeper định kỳ tìm các URL hết hạn trong URL_SWEEP_HORIZON giây (qua index
+`<url field>_expires_at`), ký lại local, ghi về bằng một bulk_write không thứ tự rồi gọi
+on_refresh để đưa URL mới vào cache: request chỉ còn đọc cache.
+
+Mỗi update lọc theo cả blob path và `<url field>_expires_at` đã đọc: bài vừa đổi file trong lúc
+sweep không bị ghi đè URL của file cũ, và URL đã được worker khác (hoặc request) ký lại sau lúc đọc
+thì không bị ghi lần nữa, nên nhiều worker cùng chạy sweeper không ghi trùng.
+
+STORE_SIGNED_URLS=false: không lưu signed URL vào MongoDB nữa (cache là nguồn duy nhất, URL được
+ký lúc cần) và sweeper không chạy. `--clear` xoá các URL đã lưu.
+
+Cấu hình:
+    STORE_SIGNED_URLS=true|false   (default: true)
+    URL_SWEEPER=true|false         (default: true)
+    URL_SWEEP_INTERVAL=60          (giây)
+    URL_SWEEP_HORIZON=300          (ký lại URL còn dưới số giây này)
+
+CLI:
+    uv run python -m backend.utils.url_sweeper --once
+    uv run python -m backend.utils.url_sweeper --clear
+"""
+
+import os
+import random
+import threading
+import time
+
+from backend.utils.gcs import GCS_BUCKET_NAME, SIGNED_URL_EXPIRATION, generate_signed_url, signed_url_expires_at
+from backend.utils.mongodb import (
+    SIGNED_URL_BLOB_FIELDS, expires_field, find_expiring_urls, update_many_song_metadata
+)
+
+STORE_SIGNED_URLS = os.getenv("STORE_SIGNED_URLS", "true").lower() in ("1", "true", "yes")
+URL_SWEEPER = os.getenv("URL_SWEEPER", "true").lower() in ("1", "true", "yes")
+URL_SWEEP_INTERVAL = float(os.getenv("URL_SWEEP_INTERVAL", "60"))
+URL_SWEEP_HORIZON = float(os.getenv("URL_SWEEP_HORIZON", "300"))
+
+
+def signed_url_fields(url_field, url):
+    """Fields ghi vào song document cho một signed URL mới ký (URL = None khi STORE_SIGNED_URLS tắt)."""
+    if not STORE_SIGNED_URLS or url is None:
+        return {url_field: None, expires_field(url_field): None}
+    expires_at = signed_url_expires_at(url) or time.time() + SIGNED_URL_EXPIRATION.total_seconds()
+    return {url_field: url, expires_field(url_field): expires_at}
+
+
+def stored_signed_url(url_field, blob_path):
+    """signed_url_fields cho blob vừa upload; chỉ ký khi URL được lưu."""
+    return signed_url_fields(url_field, generate_signed_url(GCS_BUCKET_NAME, blob_path) if STORE_SIGNED_URLS else None)
+
+
+def sweep(horizon=URL_SWEEP_HORIZON, on_refresh=None):
+    """
+    Ký lại các signed URL đã lưu sẽ hết hạn trong `horizon` giây, ghi về bằng một bulk_write.
+    on_refresh(song_id, url_field, url, expires_at) được gọi cho mỗi URL sau khi ghi xong.
+    Returns số URL đã ký lại.
+    """
+    cutoff = time.time() + horizon
+    updates, refreshed = [], []
+    for song in find_expiring_urls(cutoff):
+        for url_field, blob_field in SIGNED_URL_BLOB_FIELDS.items():
+            blob_path = song.get(blob_field)
+            if not blob_path or (song.get(expires_field(url_field)) or 0) >= cutoff:
+                continue
+            fields = signed_url_fields(url_field, generate_signed_url(GCS_BUCKET_NAME, blob_path))
+            expires = expires_field(url_field)
+            updates.append((
+                {"_id": _object_id(song["_id"]), blob_field: blob_path, expires: song.get(expires)},
+                fields,
+            ))
+            refreshed.append((song["_id"], url_field, fields[url_field], fields[expires_field(url_field)]))
+
+    update_many_song_metadata(updates)
+    if on_refresh is not None:
+        for item in refreshed:
+            on_refresh(*item)
+    return len(refreshed)
+
+
+def clear_stored_urls():
+    """Xoá mọi signed URL đã lưu (sau khi tắt STORE_SIGNED_URLS). Returns số document đã sửa."""
+    from backend.utils.mongodb import get_collection
+
+    fields = {field: None for url_field in SIGNED_URL_BLOB_FIELDS for field in (url_field, expires_field(url_field))}
+    result = get_collection().update_many(
+        {"$or": [{url_field: {"$ne": None}} for url_field in SIGNED_URL_BLOB_FIELDS]},
+        {"$set": fields},
+    )
+    return result.modified_count
+
+
+def _object_id(song_id):
+    from bson import ObjectId
+    return ObjectId(song_id) if ObjectId.is_valid(song_id) else song_id
+
+
+class SignedUrlSweeper:
+    """Background thread running sweep() every `interval` seconds (với jitter nhỏ giữa các worker)."""
+
+    def __init__(self, on_refresh=None, interval=URL_SWEEP_INTERVAL, horizon=URL_SWEEP_HORIZON):
+        self.on_refresh = on_refresh
+        self.interval = interval
+        self.horizon = horizon
+        self.sweeps = 0
+        self.refreshed = 0
+        self.errors = 0
+        self.last_sweep_ms = None
+        self.last_refreshed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="url-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def sweep_once(self):
+        started = time.perf_counter()
+        try:
+            self.last_refreshed = sweep(self.horizon, self.on_refresh)
+            self.refreshed += self.last_refreshed
+        except Exception as e:
+            self.errors += 1
+            print(f"Warning: Signed URL sweep failed: {e}")
+        finally:
+            self.sweeps += 1
+            self.last_sweep_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sweep_once()
+            self._stop.wait(self.interval * random.uniform(0.9, 1.1))
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "interval_s": self.interval,
+            "horizon_s": self.horizon,
+            "sweeps": self.sweeps,
+            "refreshed": self.refreshed,
+            "last_refreshed": self.last_refreshed,
+            "last_sweep_ms": self.last_sweep_ms,
+            "errors": self.errors,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-sign stored signed URLs that are about to expire")
+    parser.add_argument("--once", action="store_true", help="Run one sweep and exit")
+    parser.add_argument("--clear", action="store_true", help="Remove every stored signed URL (STORE_SIGNED_URLS=false)")
+    parser.add_argument("--horizon", type=float, default=URL_SWEEP_HORIZON)
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"Cleared signed URLs from {clear_stored_urls()} song(s)")
+    elif args.once:
+        started = time.perf_counter()
+        count = sweep(args.horizon)
+        print(f"Re-signed {count} URL(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
+    else:
+        parser.print_help()
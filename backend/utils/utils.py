@@ -20,6 +20,84 @@ def normalize_song_name(name):
     
     return normalized
 
+class _FoldTable(dict):
+    """Bảng cho str.translate: mỗi ký tự được tính một lần (bỏ dấu, lowercase, dấu câu -> space)."""
+
+    def __missing__(self, codepoint):
+        import unicodedata
+
+        char = chr(codepoint)
+        if char in 'đĐ':
+            folded = 'd'
+        else:
+            folded = ''.join(c for c in unicodedata.normalize('NFD', char) if unicodedata.category(c) != 'Mn')
+            folded = ''.join(c if c.isalnum() else ' ' for c in folded.lower())
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def fold_text(text):
+    """
+    Chuẩn hoá text để so khớp: bỏ dấu tiếng Việt như normalize_song_name (thêm đ -> d),
+    lowercase, bỏ dấu câu. "Em ơi, Hà Nội!" -> "em oi ha noi"
+    """
+    return ' '.join(text.translate(_FOLD_TABLE).split())
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của text (~3 ký tự / token: tiếng Việt có dấu tốn token hơn tiếng Anh)"""
+    return (len(text) + 2) // 3
+
+
+def lyrics_digest(lyrics, max_tokens):
+    """
+    Bản rút gọn của lời bài hát để đưa vào prompt, tối đa max_tokens (theo estimate_tokens).
+
+    Bỏ dòng trống và dòng lặp lại (so khớp bằng fold_text): điệp khúc chỉ giữ lần đầu, thêm
+    "(x3)" nếu lặp 3 lần. Không đủ chỗ thì giữ các dòng lặp nhiều nhất (điệp khúc) trước, rồi
+    các dòng còn lại từ đầu bài; kết quả vẫn theo thứ tự trong bài.
+    lyrics: kết quả parse_lrc_content, list các dòng text, hoặc một chuỗi nhiều dòng.
+    """
+    if isinstance(lyrics, str):
+        lyrics = lyrics.splitlines()
+    lines, counts, order = {}, {}, []
+    for line in lyrics:
+        text = ' '.join((line["text"] if isinstance(line, dict) else line).split())
+        key = fold_text(text)
+        if not key:
+            continue
+        if key not in lines:
+            lines[key] = text
+            counts[key] = 0
+            order.append(key)
+        counts[key] += 1
+
+    rendered = {
+        key: f"{lines[key]} (x{counts[key]})" if counts[key] > 1 else lines[key]
+        for key in order
+    }
+    budget = max_tokens * 3 - 2   # số ký tự tương ứng với max_tokens, chừa chỗ cho "\n…"
+    chosen = set()
+    used = 0
+    for key in sorted(order, key=lambda key: -counts[key]):   # sort ổn định: cùng số lần thì theo thứ tự bài
+        size = len(rendered[key]) + 1
+        if used + size > budget:
+            continue
+        chosen.add(key)
+        used += size
+
+    if not chosen and order:
+        # Dòng đầu tiên đã dài hơn cả budget (ví dụ lyrics không xuống dòng): cắt ngắn
+        return rendered[order[0]][:max(budget - 1, 0)] + "…"
+    digest = '\n'.join(rendered[key] for key in order if key in chosen)
+    if len(chosen) < len(order):
+        digest += "\n…"
+    return digest
+
+
 def parse_lrc(path):
     data = []
     if not os.path.exists(path): return [{"time": 0, "text": "Thiếu file .lrc"}]
@@ -49,4 +127,82 @@ def parse_lrc_content(content: str):
             data.append({"time": t, "text": match.group(3).strip()})
     
     data.append({"time": 9999, "text": ""})
-    return data
\ No newline at end of file
+    return data
+
+# Enhanced LRC: <mm:ss.xx> trước mỗi từ, ví dụ "[00:12.00]<00:12.00>Anh <00:12.45>yêu <00:12.90>em"
+WORD_TIMESTAMP_PATTERN = re.compile(r'<(\d+):(\d+(?:\.\d+)?)>')
+LYRICS_END_SENTINEL = 9999
+LAST_LINE_SECONDS = 5.0
+
+
+def split_word_timings(text: str):
+    """Tách timestamp từng từ của enhanced LRC. Returns (plain_text, [(time, word)]) hoặc (text, None)."""
+    matches = list(WORD_TIMESTAMP_PATTERN.finditer(text))
+    if not matches:
+        return text, None
+    timed = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        word = text[match.end():end].strip()
+        if word:
+            timed.append((int(match.group(1)) * 60 + float(match.group(2)), word))
+    return " ".join(word for _, word in timed), timed
+
+
+def _estimated_offsets(words, duration):
+    """Chia thời gian dòng cho từng từ theo số ký tự (tính cả dấu cách sau mỗi từ)."""
+    total = sum(len(w) + 1 for w in words) or 1
+    offsets, chars = [], 0
+    for word in words:
+        offsets.append(round(duration * chars / total, 3))
+        chars += len(word) + 1
+    return offsets
+
+
+def build_lyric_schedule(lyrics, duration=None):
+    """
+    Precompute timing từ kết quả parse_lrc_content để client không phải tính lại mỗi frame.
+
+    Mỗi dòng có start / end / duration (giây), wordOffsets: thời điểm bắt đầu của từng từ
+    trong text.split(" ") tính từ start của dòng (từ enhanced LRC nếu có, không thì ước
+    lượng theo số ký tự, `estimated`), và vị trí tích lũy charStart / wordStart.
+    Client binary search `start` rồi nội suy (time - start) / duration; hiện từng ký tự
+    thì nội suy trong từ hiện tại (từ kết thúc ở offset của từ sau, hoặc duration).
+    """
+    entries = [l for l in lyrics if l["time"] < LYRICS_END_SENTINEL]
+    lines = []
+    char_start = word_start = 0
+    for i, entry in enumerate(entries):
+        start = entry["time"]
+        if i + 1 < len(entries):
+            end = entries[i + 1]["time"]
+        elif duration and duration > start:
+            end = duration
+        else:
+            end = start + LAST_LINE_SECONDS
+        end = max(end, start)
+
+        text, timed = split_word_timings(entry["text"])
+        if timed:
+            offsets = [round(min(max(time - start, 0.0), end - start), 3) for time, _ in timed]
+            word_count = len(timed)
+        else:
+            words = text.split()
+            text = " ".join(words)
+            offsets = _estimated_offsets(words, end - start)
+            word_count = len(words)
+
+        lines.append({
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3),
+            "text": text,
+            "wordOffsets": offsets,
+            "estimated": not timed,
+            "charStart": char_start,
+            "wordStart": word_start,
+        })
+        char_start += len(text)
+        word_start += word_count
+
+    return {"lines": lines, "totalChars": char_start, "totalWords": word_start}
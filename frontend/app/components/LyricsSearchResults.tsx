@@ -0,0 +1,56 @@
+'use client';
+
+import { Mic2 } from 'lucide-react';
+
+export interface LyricHit {
+  line: number;
+  time: number;
+  text: string;
+}
+
+export interface LyricSearchResult {
+  id: string;
+  title: string;
+  matches: number;
+  hits: LyricHit[];
+}
+
+interface LyricsSearchResultsProps {
+  results: LyricSearchResult[];
+  onHitSelect: (songId: string, time: number) => void;
+}
+
+const formatTime = (seconds: number) => {
+  const m = Math.floor(seconds / 60);
+  const s = Math.floor(seconds % 60);
+  return `${m}:${s.toString().padStart(2, '0')}`;
+};
+
+// Kết quả tìm theo lời bài hát: bấm vào một dòng để phát bài và nhảy tới đúng dòng đó
+export default function LyricsSearchResults({ results, onHitSelect }: LyricsSearchResultsProps) {
+  if (results.length === 0) return null;
+
+  return (
+    <div className="mt-3 bg-[#1a1a1a] border border-white/5 rounded-2xl p-3 max-h-64 overflow-y-auto shadow-2xl">
+      <div className="flex items-center gap-2 px-2 pb-2 text-zinc-500 text-[10px] font-bold uppercase tracking-[0.2em]">
+        <Mic2 className="w-3 h-3" />
+        Trong lời bài hát
+      </div>
+      {results.map(result => (
+        <div key={result.id} className="px-2 py-1.5">
+          <div className="text-white text-sm font-semibold truncate">{result.title}</div>
+          {result.hits.map(hit => (
+            <button
+              key={hit.line}
+              onClick={() => onHitSelect(result.id, hit.time)}
+              className="w-full flex items-baseline gap-3 text-left px-2 py-1 rounded-lg hover:bg-white/5 transition-colors"
+            >
+              <span className="text-blue-400 text-xs tabular-nums flex-none">{formatTime(hit.time)}</span>
+              <span className="text-zinc-400 text-sm truncate">{hit.text}</span>
+            </button>
+          ))}
+        </div>
+      ))}
+    </div>
+  );
+}
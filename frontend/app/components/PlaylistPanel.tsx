@@ -3,6 +3,7 @@
 import { useState, useRef, useEffect } from 'react';
 import { Mic2, PlayCircle, ListMusic, Plus, X, Upload, Music, FileText, Lock, Eye, EyeOff, MoreVertical, Pencil, Trash2 } from 'lucide-react';
 import { API_URL } from '../lib/config';
+import { RESUMABLE_THRESHOLD, uploadResumable, forgetUpload } from '../lib/uploads';
 
 interface Song {
   id: string;
@@ -19,6 +20,14 @@ interface PlaylistPanelProps {
   onReorder?: (fromIndex: number, toIndex: number) => void;
 }
 
+// Bài đã có trong thư viện trùng bản thu với file vừa upload (409 từ backend)
+interface DuplicateTrack {
+  id: string;
+  title: string;
+  similarity: number;
+  offsetSeconds: number;
+}
+
 interface ImportFormData {
   title: string;
   soundFile: File | null;
@@ -47,6 +56,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
   const [isUpdating, setIsUpdating] = useState(false);
   const [updateError, setUpdateError] = useState('');
   const [updateSuccess, setUpdateSuccess] = useState(false);
+  const [updateDuplicates, setUpdateDuplicates] = useState<DuplicateTrack[]>([]);
   const [formData, setFormData] = useState<ImportFormData>({
     title: '',
     soundFile: null,
@@ -201,6 +211,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
     setIsUpdateModalOpen(false);
     setUpdateFormData({ title: '', soundFile: null, lyricsFile: null });
     setUpdateError('');
+    setUpdateDuplicates([]);
     setUpdateSuccess(false);
     setUpdateTrackId(null);
     if (updateSoundInputRef.current) {
@@ -249,11 +260,12 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
     }
   };
 
-  const handleUpdate = async () => {
+  const handleUpdate = async (allowDuplicate = false) => {
     if (!updateTrackId) return;
 
     setIsUpdating(true);
     setUpdateError('');
+    setUpdateDuplicates([]);
 
     try {
       const formDataToSend = new FormData();
@@ -263,8 +275,10 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
         formDataToSend.append('title', updateFormData.title);
       }
 
-      // Append sound file if provided
-      if (updateFormData.soundFile) {
+      // Append sound file if provided (file lớn: resumable upload)
+      if (updateFormData.soundFile && updateFormData.soundFile.size > RESUMABLE_THRESHOLD) {
+        formDataToSend.append('sound_upload_id', await uploadResumable(updateFormData.soundFile));
+      } else if (updateFormData.soundFile) {
         formDataToSend.append('sound_file', updateFormData.soundFile);
       }
 
@@ -273,6 +287,10 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
         formDataToSend.append('lyrics_file', updateFormData.lyricsFile);
       }
 
+      if (allowDuplicate) {
+        formDataToSend.append('allow_duplicate', 'true');
+      }
+
       const response = await fetch(`${API_URL}/api/track/${updateTrackId}`, {
         method: 'PUT',
         body: formDataToSend,
@@ -281,6 +299,9 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
       if (response.ok) {
         const result = await response.json();
         console.log('Update successful:', result);
+        if (updateFormData.soundFile) {
+          forgetUpload(updateFormData.soundFile);
+        }
         setUpdateSuccess(true);
         // Refresh playlist after update
         if (onRefresh) {
@@ -292,10 +313,16 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
         }, 1500);
       } else {
         const error = await response.json();
-        setUpdateError(error.detail || 'Update failed. Please try again.');
+        if (response.status === 409 && error.detail?.duplicates) {
+          setUpdateDuplicates(error.detail.duplicates);
+          setUpdateError(error.detail.message);
+        } else {
+          setUpdateError(error.detail || 'Update failed. Please try again.');
+        }
       }
     } catch (error) {
-      setUpdateError('Connection error. Please try again.');
+      // Lỗi do server trả về khi upload từng chunk (ví dụ file quá lớn) thì hiện nguyên văn
+      setUpdateError(error instanceof Error && !(error instanceof TypeError) ? error.message : 'Connection error. Please try again.');
     } finally {
       setIsUpdating(false);
     }
@@ -353,6 +380,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
     setIsModalOpen(false);
     setFormData({ title: '', soundFile: null, lyricsFile: null });
     setImportError('');
+    setImportDuplicates([]);
     setImportSuccess(false);
     // Reset input values
     if (soundInputRef.current) {
@@ -406,25 +434,35 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
   const [isImporting, setIsImporting] = useState(false);
   const [importError, setImportError] = useState('');
   const [importSuccess, setImportSuccess] = useState(false);
+  const [importDuplicates, setImportDuplicates] = useState<DuplicateTrack[]>([]);
 
-  const handleImport = async () => {
+  const handleImport = async (allowDuplicate = false) => {
     if (!formData.title.trim() || !formData.soundFile) return;
 
     setIsImporting(true);
     setImportError('');
+    setImportDuplicates([]);
 
     try {
       const formDataToSend = new FormData();
       formDataToSend.append('title', formData.title);
 
-      // Append sound file
-      formDataToSend.append('sound_file', formData.soundFile);
+      // File lớn: upload từng chunk (resume được khi mất kết nối), rồi chỉ gửi upload id
+      if (formData.soundFile.size > RESUMABLE_THRESHOLD) {
+        formDataToSend.append('sound_upload_id', await uploadResumable(formData.soundFile));
+      } else {
+        formDataToSend.append('sound_file', formData.soundFile);
+      }
 
       // Append lyrics file if exists
       if (formData.lyricsFile) {
         formDataToSend.append('lyrics_file', formData.lyricsFile);
       }
 
+      if (allowDuplicate) {
+        formDataToSend.append('allow_duplicate', 'true');
+      }
+
       const response = await fetch(`${API_URL}/api/import-track`, {
         method: 'POST',
         body: formDataToSend,
@@ -433,6 +471,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
       if (response.ok) {
         const result = await response.json();
         console.log('Import successful:', result);
+        forgetUpload(formData.soundFile);
         setImportSuccess(true);
         // Refresh playlist sau khi import thành công
         if (onRefresh) {
@@ -444,15 +483,42 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
         }, 1500);
       } else {
         const error = await response.json();
-        setImportError(error.detail || 'Import failed. Please try again.');
+        if (response.status === 409 && error.detail?.duplicates) {
+          setImportDuplicates(error.detail.duplicates);
+          setImportError(error.detail.message);
+        } else {
+          setImportError(error.detail || 'Import failed. Please try again.');
+        }
       }
     } catch (error) {
-      setImportError('Connection error. Please try again.');
+      // Lỗi do server trả về khi upload từng chunk (ví dụ file quá lớn) thì hiện nguyên văn
+      setImportError(error instanceof Error && !(error instanceof TypeError) ? error.message : 'Connection error. Please try again.');
     } finally {
       setIsImporting(false);
     }
   };
 
+  // Danh sách bài trùng kèm nút bỏ qua cảnh báo (gửi lại với allow_duplicate=true)
+  const renderDuplicates = (duplicates: DuplicateTrack[], onConfirm: () => void, busy: boolean) => (
+    <div className="mt-3 space-y-2">
+      {duplicates.map(duplicate => (
+        <div key={duplicate.id} className="flex items-center justify-between gap-3 text-sm">
+          <span className="text-white truncate">{duplicate.title}</span>
+          <span className="text-slate-400 text-xs tabular-nums flex-none">
+            {Math.round(duplicate.similarity * 100)}% giống
+          </span>
+        </div>
+      ))}
+      <button
+        onClick={onConfirm}
+        disabled={busy}
+        className="mt-1 px-3 py-1.5 text-xs font-bold text-white bg-white/10 hover:bg-white/20 rounded-lg transition-all disabled:opacity-50"
+      >
+        Vẫn import
+      </button>
+    </div>
+  );
+
   return (
     <div className="h-full w-full bg-[#020617] rounded-[32px] border border-white/10 flex flex-col relative overflow-hidden shadow-2xl">
       {/* GIẢI THÍCH:
@@ -743,6 +809,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
               <div className="px-6 pb-4">
                 <div className="p-3 bg-red-500/10 border border-red-500/20 rounded-xl">
                   <p className="text-sm text-red-400">{importError}</p>
+                  {importDuplicates.length > 0 && renderDuplicates(importDuplicates, () => handleImport(true), isImporting)}
                 </div>
               </div>
             )}
@@ -765,7 +832,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
                 Cancel
               </button>
               <button
-                onClick={handleImport}
+                onClick={() => handleImport()}
                 disabled={!formData.title.trim() || !formData.soundFile || isImporting}
                 className="px-5 py-2.5 text-sm font-bold text-white bg-blue-500 hover:bg-blue-600 rounded-xl transition-all disabled:opacity-50 disabled:cursor-not-allowed flex items-center gap-2"
               >
@@ -900,6 +967,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
               <div className="px-6 pb-4">
                 <div className="p-3 bg-red-500/10 border border-red-500/20 rounded-xl">
                   <p className="text-sm text-red-400">{updateError}</p>
+                  {updateDuplicates.length > 0 && renderDuplicates(updateDuplicates, () => handleUpdate(true), isUpdating)}
                 </div>
               </div>
             )}
@@ -922,7 +990,7 @@ export default function PlaylistPanel({ songs, currentSongIndex, onSongSelect, o
                 Cancel
               </button>
               <button
-                onClick={handleUpdate}
+                onClick={() => handleUpdate()}
                 disabled={isUpdating || (!updateFormData.title.trim() && !updateFormData.soundFile && !updateFormData.lyricsFile)}
                 className="px-5 py-2.5 text-sm font-bold text-white bg-blue-500 hover:bg-blue-600 rounded-xl transition-all disabled:opacity-50 disabled:cursor-not-allowed flex items-center gap-2"
               >
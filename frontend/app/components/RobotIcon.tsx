@@ -38,17 +38,11 @@ const chatTailPositions: Record<Corner, string> = {
   'bottom-right': 'left-full bottom-4 border-l-white',
 };
 
-interface LyricLine {
-  time: number;
-  text: string;
-}
-
 interface RobotIconProps {
   currentTime: number;
   duration: number;
-  songId?: string; // Để detect khi đổi bài
+  songId?: string; // Để detect khi đổi bài; server tự lấy lời bài hát theo id
   songTitle?: string; // Để gửi lên API
-  lyrics?: LyricLine[]; // Lời bài hát để gửi lên API
 }
 
 // Export handle type để parent có thể gọi showRobot
@@ -56,7 +50,7 @@ export interface RobotIconHandle {
   showRobot: () => void;
 }
 
-const RobotIcon = forwardRef<RobotIconHandle, RobotIconProps>(({ currentTime, duration, songId, songTitle, lyrics }, ref) => {
+const RobotIcon = forwardRef<RobotIconHandle, RobotIconProps>(({ currentTime, duration, songId, songTitle }, ref) => {
   const [corner, setCorner] = useState<Corner>('top-right');
   const [isVisible, setIsVisible] = useState(false);
   const [hasShownAtOneThird, setHasShownAtOneThird] = useState(false);
@@ -74,17 +68,15 @@ const RobotIcon = forwardRef<RobotIconHandle, RobotIconProps>(({ currentTime, du
 
     setIsLoadingMessage(true);
     try {
-      // Chuyển lyrics array thành text
-      const lyricsText = lyrics?.map(line => line.text).join('\n') || null;
-      
       const response = await fetch(`${API_URL}/api/robot-comment`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
+        // Chỉ gửi id: server dựng prompt từ bản rút gọn lời bài hát đã cache
         body: JSON.stringify({
+          song_id: songId || null,
           song_title: songTitle || null,
-          lyrics: lyricsText,
         }),
       });
       const data = await response.json();
@@ -100,7 +92,7 @@ const RobotIcon = forwardRef<RobotIconHandle, RobotIconProps>(({ currentTime, du
     } finally {
       setIsLoadingMessage(false);
     }
-  }, [songTitle, lyrics]);
+  }, [songId, songTitle]);
 
   // Reset state khi đổi bài
   useEffect(() => {
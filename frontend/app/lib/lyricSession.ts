@@ -0,0 +1,164 @@
+import { API_URL } from './config';
+
+// Karaoke session qua /ws/session/{id}: host gửi vị trí phát, follower nhận event đổi dòng
+// và hiển thị đúng lúc theo đồng hồ server (bù độ lệch đồng hồ bằng ping/pong).
+// Host đầu tiên nhận host_token (lưu trong sessionStorage): reload / reconnect gửi kèm token để
+// giữ vai host; máy khác mở role=host mà không có token thì vào làm follower.
+
+export type SessionRole = 'host' | 'follower';
+
+export interface SessionState {
+  song_id: string;
+  position: number;
+  playing: boolean;
+  server_time: number;
+}
+
+export interface LineEvent {
+  song_id: string;
+  index: number;
+  text: string;
+  time: number;
+  at: number;
+}
+
+type SessionMessage =
+  | { type: 'pong'; t0: number; server_time: number }
+  | { type: 'welcome'; role: SessionRole; host_token?: string; state: SessionState | null; line: LineEvent | null }
+  | { type: 'resync'; state: SessionState | null; line: LineEvent | null }
+  | { type: 'state'; state: SessionState }
+  | ({ type: 'line' } & LineEvent)
+  | { type: 'role'; role: SessionRole };
+
+interface SessionHandlers {
+  onState?: (state: SessionState) => void;
+  onLine?: (line: LineEvent) => void;
+  onRoleChange?: (role: SessionRole) => void;
+}
+
+const PING_BURST = 5;
+const PING_BURST_INTERVAL_MS = 200;
+const PING_INTERVAL_MS = 10_000;
+const CLOCK_SAMPLES = 8;
+const RECONNECT_MAX_MS = 10_000;
+
+const hostTokenKey = (sessionId: string) => `karaoke-host-token:${sessionId}`;
+
+// URL ws:// hoặc wss:// theo API_URL (rỗng = cùng origin)
+const sessionUrl = (sessionId: string, role: SessionRole) => {
+  const base = API_URL || window.location.origin;
+  const url = `${base.replace(/^http/, 'ws')}/ws/session/${encodeURIComponent(sessionId)}?role=${role}`;
+  const token = role === 'host' ? sessionStorage.getItem(hostTokenKey(sessionId)) : null;
+  return token ? `${url}&token=${encodeURIComponent(token)}` : url;
+};
+
+export class LyricSession {
+  private socket: WebSocket | null = null;
+  private closed = false;
+  private reconnectDelay = 500;
+  private pingTimer: ReturnType<typeof setTimeout> | null = null;
+  private lineTimer: ReturnType<typeof setTimeout> | null = null;
+  private samples: { offset: number; rtt: number }[] = [];
+  private pingsSent = 0;
+
+  role: SessionRole;
+
+  constructor(private sessionId: string, role: SessionRole, private handlers: SessionHandlers) {
+    this.role = role;
+    this.connect();
+  }
+
+  // Độ lệch đồng hồ server - client (ms), lấy mẫu có RTT nhỏ nhất (ít nhiễu nhất)
+  get clockOffset() {
+    if (this.samples.length === 0) return 0;
+    return this.samples.reduce((best, s) => (s.rtt < best.rtt ? s : best)).offset;
+  }
+
+  get rtt() {
+    if (this.samples.length === 0) return 0;
+    return Math.min(...this.samples.map(s => s.rtt));
+  }
+
+  // Host: gửi vị trí hiện tại (giây, đã cộng offset lyric)
+  publish(songId: string, position: number, playing: boolean) {
+    if (this.role !== 'host' || this.socket?.readyState !== WebSocket.OPEN) return;
+    this.socket.send(JSON.stringify({ type: 'position', song_id: songId, position, playing, rtt: this.rtt }));
+  }
+
+  close() {
+    this.closed = true;
+    if (this.pingTimer) clearTimeout(this.pingTimer);
+    if (this.lineTimer) clearTimeout(this.lineTimer);
+    this.socket?.close();
+  }
+
+  private connect() {
+    const socket = new WebSocket(sessionUrl(this.sessionId, this.role));
+    this.socket = socket;
+
+    socket.onopen = () => {
+      this.reconnectDelay = 500;
+      this.pingsSent = 0;
+      this.ping();
+    };
+    socket.onmessage = (e) => this.handleMessage(JSON.parse(e.data));
+    socket.onclose = () => {
+      if (this.pingTimer) clearTimeout(this.pingTimer);
+      if (this.closed) return;
+      setTimeout(() => !this.closed && this.connect(), this.reconnectDelay);
+      this.reconnectDelay = Math.min(this.reconnectDelay * 2, RECONNECT_MAX_MS);
+    };
+  }
+
+  private ping() {
+    if (this.socket?.readyState !== WebSocket.OPEN) return;
+    this.socket.send(JSON.stringify({ type: 'ping', t0: Date.now() }));
+    this.pingsSent += 1;
+    // Vài ping liên tiếp lúc mới kết nối để có offset nhanh, sau đó thưa hơn
+    const delay = this.pingsSent < PING_BURST ? PING_BURST_INTERVAL_MS : PING_INTERVAL_MS;
+    this.pingTimer = setTimeout(() => this.ping(), delay);
+  }
+
+  private scheduleLine(line: LineEvent) {
+    if (this.lineTimer) clearTimeout(this.lineTimer);
+    const delay = line.at - this.clockOffset - Date.now();
+    if (delay <= 0) this.handlers.onLine?.(line);
+    else this.lineTimer = setTimeout(() => this.handlers.onLine?.(line), delay);
+  }
+
+  private handleMessage(message: SessionMessage) {
+    switch (message.type) {
+      case 'pong': {
+        const now = Date.now();
+        const rtt = now - message.t0;
+        this.samples = [...this.samples, { offset: message.server_time - (message.t0 + now) / 2, rtt }]
+          .slice(-CLOCK_SAMPLES);
+        break;
+      }
+      case 'welcome':
+        if (message.host_token) sessionStorage.setItem(hostTokenKey(this.sessionId), message.host_token);
+        if (message.role !== this.role) {
+          // Session đã có host khác: server cho vào làm follower
+          this.role = message.role;
+          this.handlers.onRoleChange?.(message.role);
+        }
+        if (message.state) this.handlers.onState?.(message.state);
+        if (message.line) this.scheduleLine(message.line);
+        break;
+      case 'resync':
+        if (message.state) this.handlers.onState?.(message.state);
+        if (message.line) this.scheduleLine(message.line);
+        break;
+      case 'state':
+        this.handlers.onState?.(message.state);
+        break;
+      case 'line':
+        this.scheduleLine(message);
+        break;
+      case 'role':
+        this.role = message.role;
+        this.handlers.onRoleChange?.(message.role);
+        break;
+    }
+  }
+}
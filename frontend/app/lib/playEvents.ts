@@ -0,0 +1,65 @@
+import { API_URL } from './config';
+
+// Event play / skip / seek gửi lên /api/events theo lô: gom trong bộ nhớ, gửi mỗi FLUSH_INTERVAL_MS
+// hoặc khi đủ FLUSH_SIZE event, và khi tab bị ẩn / đóng (fetch keepalive). Server bận (429 / 503)
+// hay mất mạng thì giữ lại gửi lượt sau; hàng đợi tối đa MAX_QUEUED event (bỏ event cũ nhất).
+
+export type PlayEventType = 'play' | 'skip' | 'seek';
+
+interface PlayEvent {
+  type: PlayEventType;
+  song_id: string;
+  position: number;
+}
+
+const FLUSH_INTERVAL_MS = 15000;
+const FLUSH_SIZE = 50;
+const MAX_BATCH = 200;
+const MAX_QUEUED = 1000;
+
+let queue: PlayEvent[] = [];
+let timer: ReturnType<typeof setTimeout> | null = null;
+let sending = false;
+
+const schedule = () => {
+  if (timer) return;
+  timer = setTimeout(() => {
+    timer = null;
+    void flushPlayEvents();
+  }, FLUSH_INTERVAL_MS);
+};
+
+export async function flushPlayEvents(keepalive = false) {
+  if (sending || queue.length === 0) return;
+  const batch = queue.splice(0, MAX_BATCH);
+  sending = true;
+  try {
+    const response = await fetch(`${API_URL}/api/events`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ events: batch }),
+      keepalive,
+    });
+    // 4xx khác (event không hợp lệ, tính năng tắt): bỏ lô, gửi lại cũng không được
+    if (response.status === 429 || response.status >= 500) throw new Error(`HTTP ${response.status}`);
+  } catch {
+    queue = [...batch, ...queue].slice(-MAX_QUEUED);
+  } finally {
+    sending = false;
+  }
+  if (queue.length > 0) schedule();
+}
+
+export function trackPlayEvent(type: PlayEventType, songId: string, position = 0) {
+  queue.push({ type, song_id: songId, position: Math.max(0, Math.round(position * 10) / 10) });
+  if (queue.length > MAX_QUEUED) queue = queue.slice(-MAX_QUEUED);
+  if (queue.length >= FLUSH_SIZE) void flushPlayEvents();
+  else schedule();
+}
+
+if (typeof window !== 'undefined') {
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') void flushPlayEvents(true);
+  });
+  window.addEventListener('pagehide', () => void flushPlayEvents(true));
+}
@@ -0,0 +1,101 @@
+import { API_URL } from './config';
+
+// Resumable upload qua /api/uploads cho file audio lớn: gửi từng chunk, mất kết nối thì hỏi lại
+// offset server đã nhận rồi gửi tiếp. Upload id được lưu trong localStorage (theo tên, kích thước,
+// lastModified của file) nên chọn lại cùng file sau khi tải lại trang cũng resume được.
+
+export const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+
+const MAX_RETRIES = 8;
+const RETRY_BASE_MS = 500;
+const STORAGE_PREFIX = 'tunify-upload:';
+
+interface UploadStatus {
+  upload_id: string;
+  offset: number;
+  size: number;
+}
+
+const fileKey = (file: File) => `${STORAGE_PREFIX}${file.name}:${file.size}:${file.lastModified}`;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+const errorDetail = async (response: Response) => {
+  const error = await response.json().catch(() => null);
+  return typeof error?.detail === 'string' ? error.detail : error?.detail?.message || `HTTP ${response.status}`;
+};
+
+async function startOrResume(file: File): Promise<{ status: UploadStatus; chunkSize: number }> {
+  const saved = localStorage.getItem(fileKey(file));
+  if (saved) {
+    const response = await fetch(`${API_URL}/api/uploads/${saved}`);
+    if (response.ok) {
+      const status: UploadStatus = await response.json();
+      return { status, chunkSize: 0 };
+    }
+    localStorage.removeItem(fileKey(file));
+  }
+
+  const response = await fetch(`${API_URL}/api/uploads`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  if (!response.ok) throw new Error(await errorDetail(response));
+  const created = await response.json();
+  localStorage.setItem(fileKey(file), created.upload_id);
+  return { status: created, chunkSize: created.chunk_size };
+}
+
+// Upload file, trả về upload id để gửi kèm sound_upload_id cho /api/import-track hoặc PUT /api/track/{id}
+export async function uploadResumable(file: File, onProgress?: (fraction: number) => void): Promise<string> {
+  const { status, chunkSize } = await startOrResume(file);
+  const uploadId = status.upload_id;
+  const size = chunkSize || 8 * 1024 * 1024;
+  let offset = status.offset;
+  let failures = 0;
+
+  while (offset < file.size) {
+    onProgress?.(offset / file.size);
+    try {
+      const response = await fetch(`${API_URL}/api/uploads/${uploadId}?offset=${offset}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: file.slice(offset, offset + size),
+      });
+      if (response.status === 409) {
+        // Offset lệch (chunk trước tới một phần): gửi tiếp từ offset server báo
+        const error = await response.json();
+        offset = error.detail?.offset ?? offset;
+        await sleep(RETRY_BASE_MS);
+        continue;
+      }
+      if (!response.ok && response.status < 500 && response.status !== 429) {
+        throw new Error(await errorDetail(response));
+      }
+      if (!response.ok) throw new TypeError(`HTTP ${response.status}`);
+      offset = (await response.json()).offset;
+      failures = 0;
+    } catch (error) {
+      if (!(error instanceof TypeError) || ++failures > MAX_RETRIES) throw error;
+      // Mất kết nối: chờ rồi hỏi server đã nhận tới đâu
+      await sleep(RETRY_BASE_MS * 2 ** Math.min(failures, 5));
+      const response = await fetch(`${API_URL}/api/uploads/${uploadId}`).catch(() => null);
+      if (response?.ok) offset = (await response.json()).offset;
+    }
+  }
+  onProgress?.(1);
+
+  for (let attempt = 0; ; attempt++) {
+    const response = await fetch(`${API_URL}/api/uploads/${uploadId}/finalize`, { method: 'POST' });
+    if (response.ok) break;
+    if (response.status !== 503 || attempt >= MAX_RETRIES) throw new Error(await errorDetail(response));
+    await sleep(Number(response.headers.get('Retry-After') || 2) * 1000);
+  }
+  return uploadId;
+}
+
+// Gọi sau khi import / update thành công (upload id đã được dùng)
+export function forgetUpload(file: File) {
+  localStorage.removeItem(fileKey(file));
+}
@@ -2,6 +2,7 @@
 
 import { useState, useEffect, useRef } from 'react';
 import SearchBar from './components/SearchBar';
+import LyricsSearchResults, { LyricSearchResult } from './components/LyricsSearchResults';
 import LyricsViewer from './components/LyricsViewer';
 import PlaylistPanel from './components/PlaylistPanel';
 import PlayerControls from './components/PlayerControls';
@@ -9,12 +10,22 @@ import SongHeader from './components/SongHeader';
 import RobotIcon, { RobotIconHandle } from './components/RobotIcon';
 import { ROBOT_CONFIG } from './components/configs/robotConfig';
 import { API_URL } from './lib/config';
+import { LyricSession, SessionRole } from './lib/lyricSession';
+import { trackPlayEvent } from './lib/playEvents';
 
 interface Song {
   id: string;
   title: string;
   audioUrl: string;
   hasLyrics: boolean;
+  hlsUrl?: string | null;
+}
+
+// Event từ /api/songs/events (Server-Sent Events)
+interface LibraryEvent {
+  type: 'add' | 'update' | 'remove' | 'reset' | 'resync';
+  id?: string;
+  song?: Song;
 }
 
 interface Lyric {
@@ -22,24 +33,141 @@ interface Lyric {
   text: string;
 }
 
+// Timing đã tính sẵn từ /api/lyrics/{id}?schedule=1
+interface ScheduledLine {
+  start: number;
+  end: number;
+  duration: number;
+  text: string;
+  wordOffsets: number[];
+  estimated: boolean;
+  charStart: number;
+  wordStart: number;
+}
+
+// Dòng cuối cùng có start <= time (binary search), -1 nếu chưa tới dòng đầu
+const findLineIndex = (starts: number[], time: number) => {
+  let lo = 0;
+  let hi = starts.length - 1;
+  let found = -1;
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1;
+    if (starts[mid] <= time) {
+      found = mid;
+      lo = mid + 1;
+    } else {
+      hi = mid - 1;
+    }
+  }
+  return found;
+};
+
+// Schedule tối thiểu khi chỉ có {time, text} (lyrics prefetch từ session bundle)
+const scheduleFromLyrics = (lyrics: Lyric[]): ScheduledLine[] => {
+  const lines = lyrics.filter(l => l.time < 9999);
+  return lines.map((line, i) => {
+    const end = i + 1 < lines.length ? lines[i + 1].time : line.time;
+    return {
+      start: line.time, end, duration: end - line.time, text: line.text,
+      wordOffsets: [], estimated: true, charStart: 0, wordStart: 0,
+    };
+  });
+};
+
+// Bài tiếp theo đã prefetch từ /api/session/next
+interface SessionTrack extends Song {
+  signedAudioUrl: string | null;
+  signedAudioUrlExpiresAt: number | null;
+  lyrics: Lyric[] | null;
+}
+
+// Số bài prefetch trước và khoảng an toàn trước khi signed URL hết hạn
+const SESSION_PREFETCH_COUNT = 3;
+const SIGNED_URL_SAFETY_MS = 60_000;
+
+// Karaoke session (?session=<id>&role=host|follower): host gửi lại vị trí định kỳ để follower không trôi
+const KARAOKE_PUBLISH_INTERVAL_MS = 5_000;
+
+// Tìm theo lời bài hát: chỉ gọi API khi query đủ dài, chờ người dùng ngừng gõ
+const LYRICS_SEARCH_MIN_LENGTH = 3;
+const LYRICS_SEARCH_DEBOUNCE_MS = 250;
+const LYRICS_SEARCH_LIMIT = 5;
+
+// Autoplay: hết playlist thì phát bài giống bài vừa nghe nhất (title + lyrics), bỏ qua các bài vừa phát
+const AUTOPLAY_HISTORY_SIZE = 20;
+
+// Safari / iOS phát HLS native; trình duyệt khác vẫn dùng file gốc
+let nativeHlsSupport: boolean | null = null;
+const supportsNativeHls = () => {
+  if (nativeHlsSupport === null) {
+    nativeHlsSupport = typeof document !== 'undefined'
+      && document.createElement('audio').canPlayType('application/vnd.apple.mpegurl') !== '';
+  }
+  return nativeHlsSupport;
+};
+
+// Kết nối chậm / bật tiết kiệm dữ liệu: xin rendition bitrate thấp từ backend
+const prefersLowQuality = () => {
+  if (typeof navigator === 'undefined') return false;
+  const connection = (navigator as Navigator & {
+    connection?: { saveData?: boolean; effectiveType?: string };
+  }).connection;
+  return !!connection && (!!connection.saveData || ['slow-2g', '2g', '3g'].includes(connection.effectiveType ?? ''));
+};
+
 export default function MusicPlayer() {
   const [songs, setSongs] = useState<Song[]>([]);
   const [currentSongIndex, setCurrentSongIndex] = useState<number>(0);
   const [lyrics, setLyrics] = useState<Lyric[]>([]);
+  const [schedule, setSchedule] = useState<ScheduledLine[]>([]);
   const [currentLyricIndex, setCurrentLyricIndex] = useState<number>(0);
   const [lyricProgress, setLyricProgress] = useState<number>(0);
   const [isPlaying, setIsPlaying] = useState<boolean>(false);
   const [offset, setOffset] = useState<number>(0);
   const [searchQuery, setSearchQuery] = useState<string>('');
+  const [lyricResults, setLyricResults] = useState<LyricSearchResult[]>([]);
   const [currentTime, setCurrentTime] = useState<number>(0);
   const [duration, setDuration] = useState<number>(0);
   const [isShuffleOn, setIsShuffleOn] = useState<boolean>(false);
+  const [karaokeRole, setKaraokeRole] = useState<SessionRole | null>(null);
+  const [karaokeSongId, setKaraokeSongId] = useState<string | null>(null);
 
   const audioRef = useRef<HTMLAudioElement>(null);
   const robotRef = useRef<RobotIconHandle>(null);
   const requestRef = useRef<number>(null);
   const playTimeoutRef = useRef<NodeJS.Timeout | null>(null);
   const isFirstSongInitialized = useRef<boolean>(false);
+  const songsRef = useRef<Song[]>([]);
+  const liveConnectedRef = useRef<boolean>(false);
+  const prefetchRef = useRef<Map<string, SessionTrack>>(new Map());
+  const preloadAudioRef = useRef<HTMLAudioElement | null>(null);
+  const audioSrcRef = useRef<{ id: string; src: string } | null>(null);
+  const karaokeRef = useRef<LyricSession | null>(null);
+  const pendingSeekRef = useRef<number | null>(null);
+  const playedRef = useRef<string[]>([]);
+  const playLoggedRef = useRef<HTMLAudioElement | null>(null);
+
+  songsRef.current = songs;
+
+  // HLS nếu có, rendition thấp khi mạng chậm, rồi đến signed URL đã prefetch (nếu còn hạn), cuối cùng là URL redirect của backend
+  const getAudioSrc = (song: Song) => {
+    if (song.hlsUrl && supportsNativeHls()) return song.hlsUrl;
+    if (prefersLowQuality()) return `${song.audioUrl}?quality=low`;
+    const track = prefetchRef.current.get(song.id);
+    if (track?.signedAudioUrl && track.signedAudioUrlExpiresAt
+        && track.signedAudioUrlExpiresAt * 1000 - Date.now() > SIGNED_URL_SAFETY_MS) {
+      return track.signedAudioUrl;
+    }
+    return song.audioUrl;
+  };
+
+  // Chốt src cho bài đang phát để re-render không làm audio load lại giữa chừng
+  const getCurrentAudioSrc = (song: Song) => {
+    if (audioSrcRef.current?.id !== song.id) {
+      audioSrcRef.current = { id: song.id, src: getAudioSrc(song) };
+    }
+    return audioSrcRef.current.src;
+  };
 
   // Hàm fetch danh sách bài hát (tách riêng để có thể gọi lại)
   const fetchSongs = () => {
@@ -49,47 +177,236 @@ export default function MusicPlayer() {
       .catch(err => console.error('Error fetching songs:', err));
   };
 
+  // Chỉ fetch lại toàn bộ khi không có kết nối live (SSE đã tự patch state)
+  const refreshSongs = () => {
+    if (!liveConnectedRef.current) fetchSongs();
+  };
+
+  // Patch danh sách bài hát theo event add/update/remove
+  const applyLibraryEvent = (event: LibraryEvent) => {
+    if (event.type === 'add' && event.song) {
+      const song = event.song;
+      setSongs(prev => (prev.some(s => s.id === song.id) ? prev : [...prev, song]));
+    } else if (event.type === 'update' && event.song) {
+      const song = event.song;
+      setSongs(prev => prev.map(s => (s.id === song.id ? { ...s, ...song } : s)));
+    } else if (event.type === 'remove' && event.id) {
+      const removedIndex = songsRef.current.findIndex(s => s.id === event.id);
+      if (removedIndex === -1) return;
+      const remaining = songsRef.current.length - 1;
+      setSongs(prev => prev.filter(s => s.id !== event.id));
+      setCurrentSongIndex(prevIndex => {
+        if (removedIndex < prevIndex) return prevIndex - 1;
+        return Math.max(0, Math.min(prevIndex, remaining - 1));
+      });
+    } else {
+      // reset / resync: đồng bộ lại toàn bộ
+      fetchSongs();
+    }
+  };
+
   // 1. Fetch danh sách bài hát lần đầu
   useEffect(() => {
     fetchSongs();
   }, []);
 
+  // 1b. Nhận thay đổi thư viện realtime từ backend
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return;
+
+    const source = new EventSource(`${API_URL}/api/songs/events`);
+    let hasConnected = false;
+
+    source.onopen = () => {
+      liveConnectedRef.current = true;
+      // Kết nối lại sau khi bị ngắt: có thể đã lỡ event nên đồng bộ lại một lần
+      if (hasConnected) fetchSongs();
+      hasConnected = true;
+    };
+    source.onerror = () => {
+      liveConnectedRef.current = false;
+    };
+    source.addEventListener('song', (e) => {
+      applyLibraryEvent(JSON.parse((e as MessageEvent).data));
+    });
+
+    return () => {
+      source.close();
+      liveConnectedRef.current = false;
+    };
+  }, []);
+
+  // 1c. Tìm theo lời bài hát (debounce, chỉ khi query đủ dài)
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (query.length < LYRICS_SEARCH_MIN_LENGTH) {
+      setLyricResults([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(() => {
+      fetch(`${API_URL}/api/search/lyrics?q=${encodeURIComponent(query)}&limit=${LYRICS_SEARCH_LIMIT}`, { signal: controller.signal })
+        .then(res => (res.ok ? res.json() : { results: [] }))
+        .then(data => setLyricResults(data.results || []))
+        .catch(err => {
+          if (err.name !== 'AbortError') console.error('Error searching lyrics:', err);
+        });
+    }, LYRICS_SEARCH_DEBOUNCE_MS);
+
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchQuery]);
+
   // 2. Load lyrics khi đổi bài
   useEffect(() => {
     if (songs.length > 0 && songs[currentSongIndex]) {
       const songId = songs[currentSongIndex].id;
-      fetch(`${API_URL}/api/lyrics/${songId}`)
+      const prefetched = prefetchRef.current.get(songId);
+      if (prefetched?.lyrics) {
+        setLyrics(prefetched.lyrics);
+        setSchedule(scheduleFromLyrics(prefetched.lyrics));
+        setCurrentLyricIndex(0);
+        setLyricProgress(0);
+        return;
+      }
+      fetch(`${API_URL}/api/lyrics/${songId}?schedule=1`)
         .then(res => res.json())
         .then(data => {
           setLyrics(data.lyrics || []);
+          setSchedule(data.schedule?.lines || scheduleFromLyrics(data.lyrics || []));
           setCurrentLyricIndex(0);
           setLyricProgress(0);
         })
-        .catch(() => setLyrics([]));
+        .catch(() => {
+          setLyrics([]);
+          setSchedule([]);
+        });
     }
   }, [currentSongIndex, songs]);
 
+  // 2b. Prefetch session bundle cho các bài tiếp theo (signed URL + lyrics) và preload audio bài kế
+  useEffect(() => {
+    const song = songs[currentSongIndex];
+    if (!song) return;
+
+    let cancelled = false;
+    fetch(`${API_URL}/api/session/next?after=${encodeURIComponent(song.id)}&n=${SESSION_PREFETCH_COUNT}`)
+      .then(res => (res.ok ? res.json() : { tracks: [] }))
+      .then(data => {
+        if (cancelled) return;
+        const tracks: SessionTrack[] = data.tracks || [];
+        const prefetch = prefetchRef.current;
+        // Giữ lại bài đang phát, thay phần còn lại bằng bundle mới
+        for (const id of Array.from(prefetch.keys())) {
+          if (id !== song.id) prefetch.delete(id);
+        }
+        tracks.forEach(track => prefetch.set(track.id, track));
+
+        if (!isShuffleOn && tracks[0]) {
+          const preload = preloadAudioRef.current ?? new Audio();
+          preload.preload = 'auto';
+          preload.src = getAudioSrc(tracks[0]);
+          preloadAudioRef.current = preload;
+        }
+      })
+      .catch(err => console.error('Error prefetching session:', err));
+
+    return () => {
+      cancelled = true;
+    };
+  }, [currentSongIndex, songs, isShuffleOn]);
+
+  // 2c. Karaoke session: tham gia qua ?session=<id>&role=host|follower
+  useEffect(() => {
+    const params = new URLSearchParams(window.location.search);
+    const sessionId = params.get('session');
+    if (!sessionId || typeof WebSocket === 'undefined') return;
+
+    const role: SessionRole = params.get('role') === 'host' ? 'host' : 'follower';
+    const session = new LyricSession(sessionId, role, {
+      // Follower: theo bài của host, dòng lyric do server lên lịch (không tự tính từ audio)
+      onState: state => {
+        if (session.role === 'follower') setKaraokeSongId(state.song_id);
+      },
+      onLine: line => {
+        if (session.role !== 'follower') return;
+        setCurrentLyricIndex(line.index);
+        setLyricProgress(0);
+      },
+      onRoleChange: setKaraokeRole,
+    });
+    karaokeRef.current = session;
+    setKaraokeRole(role);
+
+    return () => {
+      session.close();
+      karaokeRef.current = null;
+    };
+  }, []);
+
+  useEffect(() => {
+    if (karaokeRole !== 'follower' || !karaokeSongId) return;
+    const index = songs.findIndex(s => s.id === karaokeSongId);
+    if (index !== -1) setCurrentSongIndex(index);
+  }, [karaokeRole, karaokeSongId, songs]);
+
+  // Thống kê nghe (/api/events): một event play cho mỗi lần chọn bài, resume sau pause không tính
+  useEffect(() => {
+    const audio = audioRef.current;
+    const song = songs[currentSongIndex];
+    if (!audio || !song) return;
+
+    const onPlay = () => {
+      if (playLoggedRef.current === audio) return;
+      playLoggedRef.current = audio;
+      trackPlayEvent('play', song.id, audio.currentTime);
+    };
+    audio.addEventListener('play', onPlay);
+    return () => audio.removeEventListener('play', onPlay);
+  }, [currentSongIndex, songs]);
+
+  // Host: gửi vị trí khi play / pause / seek / đổi bài và định kỳ khi đang phát
+  useEffect(() => {
+    const audio = audioRef.current;
+    const session = karaokeRef.current;
+    const song = songs[currentSongIndex];
+    if (karaokeRole !== 'host' || !audio || !session || !song) return;
+
+    const publish = () => session.publish(song.id, audio.currentTime + offset, !audio.paused);
+    const timer = setInterval(() => {
+      if (!audio.paused) publish();
+    }, KARAOKE_PUBLISH_INTERVAL_MS);
+    audio.addEventListener('play', publish);
+    audio.addEventListener('pause', publish);
+    audio.addEventListener('seeked', publish);
+    publish();
+
+    return () => {
+      clearInterval(timer);
+      audio.removeEventListener('play', publish);
+      audio.removeEventListener('pause', publish);
+      audio.removeEventListener('seeked', publish);
+    };
+  }, [karaokeRole, currentSongIndex, songs, offset]);
+
   // 3. Logic đồng bộ hóa 60fps (Mượt như Spotify)
+  // Mỗi frame chỉ binary search trên start của schedule rồi nội suy progress
   useEffect(() => {
+    const starts = schedule.map(line => line.start);
+
     const sync = () => {
       if (audioRef.current && isPlaying) {
         const time = audioRef.current.currentTime + offset;
         setCurrentTime(audioRef.current.currentTime);
 
-        // Tìm lyric hiện tại
-        let foundIndex = 0;
-        for (let i = 0; i < lyrics.length; i++) {
-          if (lyrics[i].time <= time) foundIndex = i;
-          else break;
-        }
+        const foundIndex = Math.max(0, findLineIndex(starts, time));
         setCurrentLyricIndex(foundIndex);
 
-        // Tính progress mượt mà giữa 2 dòng
-        if (lyrics[foundIndex] && lyrics[foundIndex + 1]) {
-          const start = lyrics[foundIndex].time;
-          const end = lyrics[foundIndex + 1].time;
-          const progress = Math.max(0, Math.min((time - start) / (end - start), 1));
-          setLyricProgress(progress);
+        const line = schedule[foundIndex];
+        if (line && line.duration > 0 && time >= line.start) {
+          setLyricProgress(Math.min((time - line.start) / line.duration, 1));
         } else {
           setLyricProgress(0);
         }
@@ -101,15 +418,24 @@ export default function MusicPlayer() {
     else if (requestRef.current) cancelAnimationFrame(requestRef.current);
 
     return () => { if (requestRef.current) cancelAnimationFrame(requestRef.current); };
-  }, [isPlaying, lyrics, offset]);
+  }, [isPlaying, schedule, offset]);
 
   // Cập nhật duration khi audio load - thêm currentSong để effect chạy khi audio element được tạo lần đầu
   useEffect(() => {
     const audio = audioRef.current;
     if (!audio) return;
 
+    // Seek chờ sẵn từ kết quả tìm lyrics (bài vừa được chọn, audio mới load metadata)
+    const applyPendingSeek = () => {
+      if (pendingSeekRef.current === null) return;
+      audio.currentTime = pendingSeekRef.current;
+      setCurrentTime(pendingSeekRef.current);
+      pendingSeekRef.current = null;
+    };
+
     const handleLoadedMetadata = () => {
       setDuration(audio.duration);
+      applyPendingSeek();
     };
 
     const handleCanPlay = () => {
@@ -122,6 +448,7 @@ export default function MusicPlayer() {
     // Nếu audio đã có metadata (readyState >= 1), set duration ngay lập tức
     if (audio.readyState >= 1) {
       setDuration(audio.duration);
+      applyPendingSeek();
     }
 
     // Khởi tạo audio cho bài hát đầu tiên
@@ -162,6 +489,19 @@ export default function MusicPlayer() {
       clearTimeout(playTimeoutRef.current);
     }
 
+    // Đổi bài khi bài hiện tại chưa phát hết: skip (kèm vị trí)
+    const current = songsRef.current[currentSongIndex];
+    const audio = audioRef.current;
+    if (current && audio && !audio.ended && audio.currentTime > 0 && songsRef.current[index]?.id !== current.id) {
+      trackPlayEvent('skip', current.id, audio.currentTime);
+    }
+    playLoggedRef.current = null;
+
+    const song = songsRef.current[index];
+    if (song) {
+      playedRef.current = [...playedRef.current.filter(id => id !== song.id), song.id].slice(-AUTOPLAY_HISTORY_SIZE);
+    }
+
     setCurrentSongIndex(index);
     setCurrentLyricIndex(0);
     setLyricProgress(0);
@@ -214,6 +554,8 @@ export default function MusicPlayer() {
     if (!audioRef.current) return;
 
     const audio = audioRef.current;
+    const song = songsRef.current[currentSongIndex];
+    if (song) trackPlayEvent('seek', song.id, time);
 
     // Nếu audio chưa sẵn sàng để seek (readyState < 1), phải đợi
     if (audio.readyState < 1) {
@@ -231,6 +573,20 @@ export default function MusicPlayer() {
     }
   };
 
+  // Bấm vào một dòng trong kết quả tìm lyrics: phát bài đó từ đúng dòng (trừ offset lyric)
+  const handleLyricHitSelect = (songId: string, time: number) => {
+    const index = songs.findIndex(s => s.id === songId);
+    if (index === -1) return;
+    const target = Math.max(0, time - offset);
+    if (index === currentSongIndex) {
+      handleSeek(target);
+      if (!isPlaying) handlePlayPause();
+      return;
+    }
+    pendingSeekRef.current = target;
+    handleSongSelect(index);
+  };
+
   // Hàm lấy index bài hát ngẫu nhiên (khác bài hiện tại)
   const getRandomSongIndex = () => {
     if (songs.length <= 1) return 0;
@@ -252,12 +608,29 @@ export default function MusicPlayer() {
     }
   };
 
+  // Hết playlist: hỏi backend bài tương tự chưa phát gần đây, lỗi / không có thì quay lại bài đầu
+  const playSimilarOrWrap = (song: Song) => {
+    const exclude = playedRef.current.join(',');
+    fetch(`${API_URL}/api/songs/${song.id}/similar?k=1&exclude=${encodeURIComponent(exclude)}`)
+      .then(res => (res.ok ? res.json() : { results: [] }))
+      .then(data => {
+        const next: Song | undefined = data.results?.[0];
+        const index = next ? songsRef.current.findIndex(s => s.id === next.id) : -1;
+        handleSongSelect(index === -1 ? 0 : index);
+      })
+      .catch(err => {
+        console.error('Error fetching similar songs:', err);
+        handleSongSelect(0);
+      });
+  };
+
   // Xử lý khi bài hát kết thúc
   const handleSongEnded = () => {
     if (isShuffleOn) {
       handleSongSelect(getRandomSongIndex());
+    } else if (currentSongIndex === songs.length - 1 && songs[currentSongIndex]) {
+      playSimilarOrWrap(songs[currentSongIndex]);
     } else {
-      // Loop back to start if at the end
       const nextIndex = (currentSongIndex + 1) % songs.length;
       handleSongSelect(nextIndex);
     }
@@ -318,6 +691,7 @@ export default function MusicPlayer() {
       <div className="relative z-10 flex-none px-8 pb-6">
         <div className="max-w-4xl mx-auto">
           <SearchBar searchQuery={searchQuery} onSearchChange={setSearchQuery} />
+          <LyricsSearchResults results={lyricResults} onHitSelect={handleLyricHitSelect} />
         </div>
       </div>
 
@@ -346,7 +720,7 @@ export default function MusicPlayer() {
               songs={filteredSongs}
               currentSongIndex={currentSongIndex}
               onSongSelect={(i) => handleSongSelect(songs.findIndex(s => s.id === filteredSongs[i].id))}
-              onRefresh={fetchSongs}
+              onRefresh={refreshSongs}
               onReorder={(fromIndex, toIndex) => {
                 // Tìm index thực trong songs array từ filteredSongs
                 const fromRealIndex = songs.findIndex(s => s.id === filteredSongs[fromIndex].id);
@@ -380,7 +754,7 @@ export default function MusicPlayer() {
         </div>
       </footer>
 
-      {currentSong && <audio ref={audioRef} key={currentSong.id} src={currentSong.audioUrl} preload="metadata" onEnded={handleSongEnded} />}
+      {currentSong && <audio ref={audioRef} key={currentSong.id} src={getCurrentAudioSrc(currentSong)} preload="metadata" onEnded={handleSongEnded} />}
 
       {/* Robot Icon - xuất hiện tại 1/3 và 2/3 thời gian bài hát */}
       <RobotIcon
@@ -389,7 +763,6 @@ export default function MusicPlayer() {
         duration={duration}
         songId={currentSong?.id}
         songTitle={currentSong?.title}
-        lyrics={lyrics}
       />
 
       {/* CSS Animation cho cột nhạc (Thêm vào global.css hoặc dùng style tag) */}
@@ -7,12 +7,14 @@ from PyQt6.QtCore import QTimer, Qt, QRect
 from PyQt6.QtGui import QPainter, QColor, QFont
 
 class KaraokeApp(QWidget):
-    def __init__(self, playlist):
+    def __init__(self, playlist, library=None):
         super().__init__()
         
-        # Khởi tạo playlist
+        # Khởi tạo playlist: tên bài (file local) hoặc song item của /api/songs khi có library
         self.playlist = playlist
+        self.library = library
         self.current_song_index = 0
+        self.played = []  # id các bài vừa phát (library mode), autoplay không chọn lại
         
         self.setFixedSize(1400, 600)
         self.setStyleSheet("background-color: #1a1a1a;")
@@ -45,23 +47,42 @@ class KaraokeApp(QWidget):
         if index < 0 or index >= len(self.playlist):
             return False
         
-        song_name = self.playlist[index]
-        normalized_name = self.normalize_song_name(song_name)
+        song_name = self.song_title(index)
         
         # Cập nhật tiêu đề cửa sổ
         self.setWindowTitle(f"Song Player - Made by vinhngba2704 🤟 - ({song_name}) [{index+1}/{len(self.playlist)}]")
         
-        # Đường dẫn file
-        self.mp3_path = f"backend/sounds/{normalized_name}.mp3"
-        self.lrc_path = f"backend/lyrics/{normalized_name}.lrc"
+        if self.library:
+            # Remote library: tải vào cache trên đĩa (hoặc lấy bản đã có / đã prefetch)
+            song = self.playlist[index]
+            try:
+                self.mp3_path = self.library.audio_path(song)
+                lyrics = self.library.lyrics(song)
+            except Exception as e:
+                print(f"Không tải được bài {song_name}: {e}")
+                return False
+            self.lyrics = lyrics or [{"time": 0, "text": "Thiếu file .lrc"}, {"time": 9999, "text": ""}]
+            self.played = [s for s in self.played if s != song["id"]][-19:] + [song["id"]]
+            # Tải trước các bài tiếp theo để chuyển bài không phải chờ
+            upcoming = [self.playlist[(index + i) % len(self.playlist)] for i in range(self.library.prefetch_count + 1)]
+            self.library.prefetch(upcoming)
+        else:
+            normalized_name = self.normalize_song_name(song_name)
+            
+            # Đường dẫn file
+            self.mp3_path = f"backend/sounds/{normalized_name}.mp3"
+            self.lrc_path = f"backend/lyrics/{normalized_name}.lrc"
 
-        # self.mp3_path = f"sounds/{normalized_name}.mp3"
-        # self.lrc_path = f"lyrics/{normalized_name}.lrc"
-        
-        # Kiểm tra file tồn tại
-        if not os.path.exists(self.mp3_path):
-            print(f"Không tìm thấy file nhạc: {self.mp3_path}")
-            return False
+            # self.mp3_path = f"sounds/{normalized_name}.mp3"
+            # self.lrc_path = f"lyrics/{normalized_name}.lrc"
+            
+            # Kiểm tra file tồn tại
+            if not os.path.exists(self.mp3_path):
+                print(f"Không tìm thấy file nhạc: {self.mp3_path}")
+                return False
+            
+            # Load lyrics
+            self.lyrics = self.parse_lrc(self.lrc_path)
         
         # Reset các biến
         self.current_line_idx = 0
@@ -69,18 +90,23 @@ class KaraokeApp(QWidget):
         self.scroll_offset = 0.0
         self.target_scroll = 0.0
         
-        # Load lyrics
-        self.lyrics = self.parse_lrc(self.lrc_path)
-        
         # Load và phát nhạc
         pygame.mixer.music.load(self.mp3_path)
         
         return True
 
+    def song_title(self, index):
+        song = self.playlist[index]
+        return song["title"] if self.library else song
+
     def next_song(self):
         """Chuyển sang bài tiếp theo"""
         if self.current_song_index < len(self.playlist) - 1:
             self.current_song_index += 1
+        elif self.library and (index := self.similar_song_index()) is not None:
+            # Hết playlist: phát bài giống bài vừa nghe nhất (chưa phát gần đây)
+            self.current_song_index = index
+            print("🔀 Playlist đã hết, phát bài tương tự")
         else:
             # Quay lại bài đầu tiên khi hết playlist
             self.current_song_index = 0
@@ -89,7 +115,16 @@ class KaraokeApp(QWidget):
         if self.load_song(self.current_song_index):
             pygame.mixer.music.play()
             self.is_paused = False
-            print(f"▶ Chuyển sang bài: {self.playlist[self.current_song_index]}")
+            print(f"▶ Chuyển sang bài: {self.song_title(self.current_song_index)}")
+
+    def similar_song_index(self):
+        """Index trong playlist của bài tương tự nhất với bài đang phát, None nếu không có."""
+        song = self.playlist[self.current_song_index]
+        for result in self.library.similar(song, exclude=self.played):
+            for index, item in enumerate(self.playlist):
+                if item["id"] == result["id"]:
+                    return index
+        return None
 
     def previous_song(self):
         """Quay lại bài trước"""
@@ -98,7 +133,7 @@ class KaraokeApp(QWidget):
             if self.load_song(self.current_song_index):
                 pygame.mixer.music.play()
                 self.is_paused = False
-                print(f"▶ Quay lại bài: {self.playlist[self.current_song_index]}")
+                print(f"▶ Quay lại bài: {self.song_title(self.current_song_index)}")
         else:
             print("⏹ Đã ở bài đầu tiên")
 
@@ -285,13 +320,37 @@ class KaraokeApp(QWidget):
                 painter.drawText(text_rect, Qt.AlignmentFlag.AlignCenter, text)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Desktop karaoke player")
+    parser.add_argument("--remote", metavar="BACKEND_URL", help="Phát thư viện của backend (/api/songs) thay vì file local")
+    parser.add_argument("--song", action="append", help="Chỉ phát các bài có tên này (lặp lại được)")
+    parser.add_argument("--cache-dir", help="Thư mục cache (default: LIBRARY_CACHE_DIR hoặc ~/.cache/tunify)")
+    parser.add_argument("--cache-mb", type=float, help="Dung lượng cache tối đa (MB)")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
     
-    # Định nghĩa playlist
-    playlist = [
-        "Cause I Love You"
-    ]
+    library = None
+    if args.remote:
+        from backend.utils.library_cache import LIBRARY_CACHE_DIR, LIBRARY_CACHE_MB, DiskCache, RemoteLibrary
+
+        cache = DiskCache(args.cache_dir or LIBRARY_CACHE_DIR, (args.cache_mb or LIBRARY_CACHE_MB) * 1024 * 1024)
+        library = RemoteLibrary(args.remote, cache)
+        playlist = library.songs()
+        if args.song:
+            playlist = [song for song in playlist if song["title"] in args.song]
+        if not playlist:
+            sys.exit("Thư viện không có bài nào")
+    else:
+        # Định nghĩa playlist
+        playlist = args.song or [
+            "Cause I Love You"
+        ]
     
-    ex = KaraokeApp(playlist)
+    ex = KaraokeApp(playlist, library)
     ex.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    code = app.exec()
+    if library:
+        library.close()
+    sys.exit(code)
\ No newline at end of file